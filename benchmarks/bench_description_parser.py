@@ -0,0 +1,82 @@
+"""
+Benchmark: parseo de Description con BeautifulSoup por fila vs extractor de una sola pasada.
+
+Uso:
+    python benchmarks/bench_description_parser.py --tamanos 1000 10000 50000
+"""
+import argparse
+import os
+import random
+import re
+import sys
+import time
+
+import pandas as pd
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.fixtures import generar_descripcion
+from pipelines.mass_movements.description_parser import COLUMNAS_HTML, extraer_descripciones
+
+
+def parsear_legado(descripciones):
+    """Copia del bucle BeautifulSoup + gdf.at que usaba procesar_movimientos_masa."""
+    from bs4 import BeautifulSoup
+
+    html_map = {
+        "Municipio": "Municipio", "Área_texto": "Area_Texto",
+        "Vereda": "Vereda", "Comuna": "Comuna", "Barrio": "Barrio",
+        "Área_num": "Area_Numerica", "Acu_7": "Acu_7", "Acu_90_7": "Acu_90_7"
+    }
+    gdf = pd.DataFrame({"Description": descripciones})
+    for col in html_map.values():
+        gdf[col] = None
+    for idx, row in gdf.iterrows():
+        html = row["Description"]
+        if isinstance(html, str):
+            soup = BeautifulSoup(html, 'html.parser')
+            for tr in soup.find_all('tr'):
+                cells = tr.find_all('td')
+                if len(cells) == 2:
+                    key = re.sub(r'[^a-zA-Z0-9_]', '', cells[0].get_text(strip=True).replace(" ", "_"))
+                    val = cells[1].get_text(strip=True)
+                    if key == "rea":
+                        if gdf.at[idx, "Area_Texto"] is None: gdf.at[idx, "Area_Texto"] = val
+                        else: gdf.at[idx, "Area_Numerica"] = val
+                    elif key in html_map:
+                        gdf.at[idx, html_map[key]] = val
+    return gdf
+
+
+def parsear_nuevo(descripciones):
+    gdf = pd.DataFrame({"Description": descripciones})
+    for col, valores in extraer_descripciones(gdf["Description"]).items():
+        gdf[col] = pd.Series(valores, index=gdf.index, dtype=object)
+    return gdf
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--tamanos", type=int, nargs="+", default=[1_000, 10_000, 50_000])
+    args = parser.parse_args()
+
+    rng = random.Random(0)
+    print(f"{'filas':>8} {'bs4 (s)':>10} {'extractor (s)':>14} {'aceleración':>12}")
+    for n in args.tamanos:
+        descripciones = [generar_descripcion(rng) if i % 50 else None for i in range(n)]
+
+        inicio = time.perf_counter()
+        legado = parsear_legado(descripciones)
+        t_legado = time.perf_counter() - inicio
+
+        inicio = time.perf_counter()
+        nuevo = parsear_nuevo(descripciones)
+        t_nuevo = time.perf_counter() - inicio
+
+        for col in COLUMNAS_HTML:
+            assert legado[col].tolist() == nuevo[col].tolist(), col
+        print(f"{n:>8} {t_legado:>10.3f} {t_nuevo:>14.3f} {t_legado / t_nuevo:>11.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,148 @@
+"""
+Benchmark: codificación GeoDataFrame -> Esri JSON.
+
+Compara la conversión fila por fila (objetos shapely uno a uno, como hacía el
+benchmark antes de utils/esri_encoder.py), GeoAccessor de arcgis (si está
+instalado) y el codificador por columnas. Mide tiempo, pico de memoria
+(tracemalloc) y el tamaño del payload con json, orjson y gzip.
+
+Uso:
+    python benchmarks/bench_esri_encoder.py --tamanos 10000 100000 --vertices 24
+"""
+import argparse
+import gzip
+import json
+import os
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils.esri_encoder import features_esri, orjson, serializar
+
+
+def generar_gdf(n, vertices=24, semilla=0):
+    """Polígonos tipo susceptibilidad (algunos multipolígonos con hueco) y sus atributos."""
+    import geopandas as gpd
+    import shapely
+
+    rng = np.random.default_rng(semilla)
+    angulos = np.linspace(0, 2 * np.pi, vertices, endpoint=False)
+    centros = np.column_stack([rng.uniform(-76.0, -75.2, n), rng.uniform(5.8, 6.8, n)])
+    radios = 0.002 * rng.uniform(0.6, 1.0, (n, vertices))
+    x = centros[:, :1] + radios * np.cos(angulos)
+    y = centros[:, 1:] + radios * np.sin(angulos)
+    anillos = np.stack([x, y], axis=2)
+    anillos = np.concatenate([anillos, anillos[:, :1]], axis=1)
+    poligonos = shapely.polygons(anillos)
+    # Uno de cada diez: multipolígono con un hueco en la primera parte
+    for i in range(0, n, 10):
+        cx, cy = centros[i]
+        hueco = shapely.box(cx - 0.0003, cy - 0.0003, cx + 0.0003, cy + 0.0003)
+        otra = shapely.box(cx + 0.003, cy, cx + 0.004, cy + 0.001)
+        poligonos[i] = shapely.multipolygons([shapely.difference(poligonos[i], hueco), otra])
+    return gpd.GeoDataFrame({
+        "Name": rng.choice(["Alta", "Media", "Baja"], n),
+        "SymbolID": rng.integers(0, 3, n),
+        "area": np.where(rng.random(n) < 0.05, np.nan, rng.uniform(1, 100, n)),
+    }, geometry=poligonos, crs="EPSG:4326")
+
+
+def _valor(v):
+    if hasattr(v, "item"):
+        v = v.item()
+    if isinstance(v, float) and v != v:
+        return None
+    return v
+
+
+def _geometria_esri(geom):
+    """Esri JSON desde shapely, objeto por objeto."""
+    if geom is None or geom.is_empty:
+        return None
+    tipo = geom.geom_type
+    if tipo == "Point":
+        return {"x": geom.x, "y": geom.y, "spatialReference": {"wkid": 4326}}
+    poligonos = list(geom.geoms) if tipo in ("MultiPolygon", "GeometryCollection") else [geom]
+    anillos = []
+    for p in poligonos:
+        if p.geom_type != "Polygon":
+            continue
+        anillos.append([list(c) for c in p.exterior.coords])
+        anillos.extend([list(c) for c in i.coords] for i in p.interiors)
+    return {"rings": anillos, "spatialReference": {"wkid": 4326}}
+
+
+def features_por_filas(gdf):
+    columnas = [c for c in gdf.columns if c != gdf.geometry.name]
+    valores = gdf[columnas].to_dict("records")
+    return [
+        {"attributes": {k: _valor(v) for k, v in atributos.items()}, "geometry": _geometria_esri(g)}
+        for atributos, g in zip(valores, gdf.geometry)
+    ]
+
+
+def features_geoaccessor(gdf):
+    from arcgis.features import GeoAccessor
+
+    sdf = GeoAccessor.from_geodataframe(gdf)
+    return [dict(f.as_dict) for f in sdf.spatial.to_featureset().features]
+
+
+def medir(funcion, *args):
+    """
+    (segundos, pico de memoria en MB, resultado). El tiempo se toma en una corrida
+    aparte: tracemalloc frena mucho las asignaciones y lo distorsionaría.
+    """
+    inicio = time.perf_counter()
+    funcion(*args)
+    segundos = time.perf_counter() - inicio
+    tracemalloc.start()
+    resultado = funcion(*args)
+    _, pico = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return segundos, pico / 1e6, resultado
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--tamanos", type=int, nargs="+", default=[10_000, 100_000])
+    parser.add_argument("--vertices", type=int, default=24)
+    args = parser.parse_args()
+
+    codificadores = {"filas": features_por_filas, "columnas": features_esri}
+    try:
+        import arcgis  # noqa: F401
+        codificadores["geoaccessor"] = features_geoaccessor
+    except ImportError:
+        pass
+
+    print(f"{'filas':>9} {'codificador':>12} {'s':>8} {'pico MB':>9}")
+    for n in args.tamanos:
+        gdf = generar_gdf(n, args.vertices)
+        resultados = {}
+        for nombre, funcion in codificadores.items():
+            segundos, pico, resultados[nombre] = medir(funcion, gdf)
+            print(f"{n:>9} {nombre:>12} {segundos:>8.3f} {pico:>9.1f}")
+        assert len(resultados["columnas"]) == len(resultados["filas"])
+
+        features = resultados["columnas"]
+        inicio = time.perf_counter()
+        texto = json.dumps(features, default=str).encode("utf-8")
+        t_json = time.perf_counter() - inicio
+        inicio = time.perf_counter()
+        datos = serializar(features)
+        t_serializar = time.perf_counter() - inicio
+        comprimido = len(gzip.compress(datos, compresslevel=5))
+        print(
+            f"{'':>9} payload: json {len(texto) / 1e6:.1f} MB en {t_json:.3f}s | "
+            f"{'orjson' if orjson else 'json compacto'} {len(datos) / 1e6:.1f} MB en {t_serializar:.3f}s | "
+            f"gzip {comprimido / 1e6:.1f} MB"
+        )
+
+
+if __name__ == "__main__":
+    main()
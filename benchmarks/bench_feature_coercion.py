@@ -0,0 +1,116 @@
+"""
+Benchmark: constructor de features por filas (gdf.iterrows) vs conversión por columnas.
+
+Uso:
+    python benchmarks/bench_feature_coercion.py --tamanos 10000 100000 1000000
+"""
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from utils.feature_coercion import construir_features
+
+# Esquema parecido al de la capa operacional
+ARCGIS_FIELD_TYPES = {
+    "Tipo_de_Alerta": "esriFieldTypeString",
+    "Municipio": "esriFieldTypeString",
+    "Año": "esriFieldTypeInteger",
+    "Mes": "esriFieldTypeSmallInteger",
+    "Aumento": "esriFieldTypeDouble",
+    "Fecha": "esriFieldTypeDate",
+}
+ARCGIS_FIELD_LENGTHS = {"Tipo_de_Alerta": 50, "Municipio": 20}
+
+
+def generar_df(n, semilla=0):
+    """DataFrame sintético con las mismas formas de dato que el CSV de la hoja."""
+    rng = np.random.default_rng(semilla)
+    fechas = pd.Timestamp("2024-01-01") + pd.to_timedelta(rng.integers(0, 365 * 24 * 60, n), unit="min")
+    df = pd.DataFrame({
+        "Tipo_de_Alerta": rng.choice(["Naranja", "Roja", "Amarilla - preventiva por lluvias intensas"], n),
+        "Municipio": rng.choice(["Medellín", "Bello", "Itagüí", "La Estrella", "Caldas"], n),
+        "Año": fechas.year.astype(str),
+        "Mes": fechas.month.astype(float),
+        "Aumento": rng.normal(1.0, 0.5, n).round(3).astype(str),
+        "Fecha": fechas.strftime("%Y-%m-%d %H:%M:%S"),
+        "Longitud": rng.uniform(-75.7, -75.3, n),
+        "Latitud": rng.uniform(6.0, 6.5, n),
+    })
+    # Algunos vacíos, como en la hoja real
+    df.loc[rng.random(n) < 0.05, "Aumento"] = None
+    return df
+
+
+def construir_features_legado(df, arcgis_field_types, arcgis_field_lengths, campo_x, campo_y):
+    """Copia del bucle por filas que usaba main_operacional.py antes de la conversión por columnas."""
+    import geopandas as gpd
+
+    gdf = gpd.GeoDataFrame(df, geometry=gpd.points_from_xy(df[campo_x], df[campo_y]), crs="EPSG:4326")
+    csv_fields = [col for col in df.columns if col not in [campo_x, campo_y]]
+    features = []
+    for index, row in gdf.iterrows():
+        attributes = {}
+        for field in csv_fields:
+            value = row[field]
+            if pd.notna(value) and field in arcgis_field_types:
+                field_type = arcgis_field_types[field]
+                try:
+                    if field_type in ['esriFieldTypeInteger', 'esriFieldTypeSmallInteger']:
+                        attributes[field] = int(float(value)) if value not in ['', ' '] else None
+                    elif field_type in ['esriFieldTypeDouble', 'esriFieldTypeSingle']:
+                        attributes[field] = float(value) if value not in ['', ' '] else None
+                    elif field_type == 'esriFieldTypeString':
+                        attributes[field] = str(value)[:arcgis_field_lengths.get(field, 255)]
+                    elif field_type == 'esriFieldTypeDate':
+                        if isinstance(value, (int, float)):
+                            attributes[field] = int(value)
+                        else:
+                            try:
+                                date_obj = pd.to_datetime(value, errors='raise')
+                                attributes[field] = int(date_obj.timestamp() * 1000)
+                            except ValueError:
+                                attributes[field] = None
+                    else:
+                        attributes[field] = value
+                except Exception:
+                    attributes[field] = None
+        geometry = None
+        if not row.geometry.is_empty:
+            geometry = {'x': row.geometry.x, 'y': row.geometry.y, 'spatialReference': {'wkid': 4326}}
+        features.append({'attributes': attributes, 'geometry': geometry})
+    return features
+
+
+def medir(funcion, *args):
+    inicio = time.perf_counter()
+    resultado = funcion(*args)
+    return time.perf_counter() - inicio, resultado
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--tamanos", type=int, nargs="+", default=[10_000, 100_000, 1_000_000])
+    parser.add_argument("--sin-legado", action="store_true", help="No ejecutar el bucle por filas")
+    args = parser.parse_args()
+
+    print(f"{'filas':>10} {'legado (s)':>12} {'columnas (s)':>13} {'aceleración':>12}")
+    for n in args.tamanos:
+        df = generar_df(n)
+        params = (df, ARCGIS_FIELD_TYPES, ARCGIS_FIELD_LENGTHS, "Longitud", "Latitud")
+        t_nuevo, nuevas = medir(construir_features, *params)
+        if args.sin_legado:
+            print(f"{n:>10} {'-':>12} {t_nuevo:>13.3f} {'-':>12}")
+            continue
+        t_legado, legadas = medir(construir_features_legado, *params)
+        assert len(nuevas) == len(legadas)
+        print(f"{n:>10} {t_legado:>12.3f} {t_nuevo:>13.3f} {t_legado / t_nuevo:>11.1f}x")
+
+
+if __name__ == "__main__":
+    main()
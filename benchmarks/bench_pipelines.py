@@ -0,0 +1,270 @@
+"""
+Benchmark de extremo a extremo de los pipelines, sin red, contra una capa falsa.
+
+Para cada pipeline y tamaño genera (o reutiliza) una entrada sintética y ejecuta
+sus etapas reales: parseo en streaming, validación, transformación, codificación,
+comparación y subida por lotes contra utils.fake_layer.FakeFeatureLayer. Cada
+corrida se hace dos veces sobre la misma capa: 'inicial' (capa vacía, todo son
+altas) y 'sin_cambios' (mismos datos, el caso diario más común).
+
+Cada combinación corre en un proceso propio para que el pico de memoria sea suyo.
+Los resultados se agregan a output/benchmarks/historial.jsonl y se comparan con
+la corrida anterior del mismo escenario.
+
+Uso:
+    python benchmarks/bench_pipelines.py --tamanos 1000 10000 100000
+    python benchmarks/bench_pipelines.py --pipelines incendios --tamanos 1000000
+"""
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+from datetime import datetime, timezone
+from types import SimpleNamespace
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(ROOT_DIR)
+
+RUTA_HISTORIAL = os.path.join(ROOT_DIR, "output", "benchmarks", "historial.jsonl")
+PIPELINES = ["incendios", "mov_masa", "operacional"]
+FASES = ["inicial", "sin_cambios"]
+
+
+# --- Ejecución dentro del proceso hijo ---
+
+def _codificador():
+    """El mismo codificador que usan los pipelines (utils/esri_encoder.py, sin arcgis)."""
+    from utils.layer_sync import features_desde_gdf
+
+    return "esri_encoder", features_desde_gdf
+
+
+def _cronometrar(lotes, latencias):
+    """Guarda cuánto tarda cada lote desde que se pide hasta que se pide el siguiente."""
+    inicio = time.perf_counter()
+    for lote in lotes:
+        yield lote
+        ahora = time.perf_counter()
+        latencias.append(ahora - inicio)
+        inicio = ahora
+
+
+def _capa_cronometrada(campos, latencias):
+    from utils.fake_layer import FakeFeatureLayer
+    from utils.layer_sync import DEFINICION_CAMPO_HASH
+
+    # Capa ya migrada: con el campo del hash de lo publicado (ver layer_sync.agregar_campo_hash)
+    capa = FakeFeatureLayer(fields=campos + [DEFINICION_CAMPO_HASH])
+    editar = capa.edit_features
+
+    def edit_features(**kwargs):
+        inicio = time.perf_counter()
+        try:
+            return editar(**kwargs)
+        finally:
+            latencias.append(time.perf_counter() - inicio)
+
+    capa.edit_features = edit_features
+    return capa
+
+
+def _correr_kml(modulo, ruta, capa, codificar, latencias_lote, procesos=1):
+    from utils.kml_stream import leer_kml_por_lotes
+    from utils.layer_sync import sincronizar_capa_por_lotes
+
+    with open(ruta, "rb") as fuente:
+        gdfs = (
+            gdf
+            for gdf in leer_kml_por_lotes(fuente, modulo.TAMANO_LOTE_KML, transformar=modulo.transformacion(),
+                                          procesos=procesos)
+            if not gdf.empty
+        )
+        # Mismo paso opcional de reducción de geometrías que el pipeline (solo incendios)
+        if getattr(modulo, "REDUCCION_GEOMETRIA", None):
+            from utils.geometry_reduction import reducir_lotes
+
+            gdfs = reducir_lotes(gdfs, tamano_lote=modulo.TAMANO_LOTE_KML, **modulo.REDUCCION_GEOMETRIA)
+        lotes = (codificar(gdf) for gdf in gdfs if not gdf.empty)
+        return sincronizar_capa_por_lotes(capa, _cronometrar(lotes, latencias_lote), opciones_subida=modulo.OPCIONES_SUBIDA)
+
+
+def _percentiles(valores):
+    import numpy as np
+
+    if not valores:
+        return {"p50_ms": None, "p95_ms": None, "p99_ms": None}
+    p50, p95, p99 = np.percentile(np.array(valores) * 1000, [50, 95, 99])
+    return {"p50_ms": round(p50, 2), "p95_ms": round(p95, 2), "p99_ms": round(p99, 2)}
+
+
+def _campos_operacional():
+    from pipelines.operational.main_operacional import COLUMN_MAPPING_PESTAÑA_3
+
+    tipos = {"Latitud": "esriFieldTypeDouble", "Longitud": "esriFieldTypeDouble", "Año": "esriFieldTypeInteger",
+             "Mes": "esriFieldTypeSmallInteger", "Día": "esriFieldTypeSmallInteger", "Fecha": "esriFieldTypeDate"}
+    return [{"name": c, "type": tipos.get(c, "esriFieldTypeString"), "length": 255}
+            for c in COLUMN_MAPPING_PESTAÑA_3.values()]
+
+
+def correr_escenario(pipeline, n, semilla, procesos=1):
+    """Ejecuta las dos fases de un escenario y devuelve una lista de resultados (uno por fase)."""
+    # Imports pesados antes de medir: el arranque en frío lo mide bench_startup.py
+    import geopandas  # noqa: F401
+    import pandas  # noqa: F401
+
+    from benchmarks.fixtures import obtener_fixture
+    from utils.metrics import ejecucion, rss_pico_mb
+
+    inicio = time.perf_counter()
+    ruta = obtener_fixture(pipeline, n, semilla)
+    t_fixture = time.perf_counter() - inicio
+    nombre_codificador, codificar = _codificador()
+    latencias_edicion = []
+
+    if pipeline == "incendios":
+        from pipelines.fire_susceptibility import main_fire_susceptibility as modulo
+        capa = _capa_cronometrada([{"name": "Name", "type": "esriFieldTypeString"}, {"name": "SymbolID", "type": "esriFieldTypeInteger"}], latencias_edicion)
+    elif pipeline == "mov_masa":
+        from pipelines.mass_movements import main_mass_movements as modulo
+        from pipelines.mass_movements.description_parser import COLUMNAS_HTML
+        campos = [{"name": c, "type": "esriFieldTypeString"} for c in COLUMNAS_HTML + ["Name"]]
+        campos += [{"name": c, "type": "esriFieldTypeInteger"} for c in ("SymbolID", "categoria")]
+        capa = _capa_cronometrada(campos, latencias_edicion)
+    else:
+        from pipelines.operational import main_operacional as modulo
+        capa = _capa_cronometrada(_campos_operacional(), latencias_edicion)
+        gis = SimpleNamespace(content=SimpleNamespace(get=lambda item_id: SimpleNamespace(layers=[capa])))
+        procesado = ruta.replace(".csv", "_procesado.csv")
+
+    resultados = []
+    for fase in FASES:
+        latencias_lote = []
+        latencias_edicion.clear()
+        with ejecucion(pipeline, escribir=False) as metricas:
+            inicio = time.perf_counter()
+            if pipeline == "operacional":
+                inicio_lote = time.perf_counter()
+                modulo.limpiar_csv_pestana_3(ruta, procesado)
+                ok = modulo.cargar_csv_a_capa(gis, procesado, "benchmark", modulo.COLUMN_MAPPING_PESTAÑA_3)
+                latencias_lote.append(time.perf_counter() - inicio_lote)
+            else:
+                ok = _correr_kml(modulo, ruta, capa, codificar, latencias_lote, procesos)["exito"]
+            segundos = time.perf_counter() - inicio
+            metricas.estado = "ok" if ok else "fallo"
+
+        resultados.append({
+            "pipeline": pipeline,
+            "n": n,
+            "fase": fase,
+            "ok": bool(ok),
+            "segundos": round(segundos, 4),
+            "filas_por_s": round(n / segundos, 1) if segundos else None,
+            "lotes": len(latencias_lote),
+            "lote": _percentiles(latencias_lote),
+            "edit_features": _percentiles(latencias_edicion),
+            "features_capa": len(capa.features),
+            "rss_pico_mb": rss_pico_mb(),
+            "etapas": {e.nombre: round(e.duracion_s, 4) for e in metricas.etapas.values()},
+            "codificador": nombre_codificador,
+            "procesos": procesos,
+            "fixture_s": round(t_fixture, 2),
+        })
+    return resultados
+
+
+# --- Proceso principal ---
+
+def _commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT_DIR,
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def leer_historial(ruta=RUTA_HISTORIAL):
+    if not os.path.exists(ruta):
+        return []
+    with open(ruta, "r", encoding="utf-8") as f:
+        return [json.loads(linea) for linea in f if linea.strip()]
+
+
+def _anterior(historial, resultado):
+    for previo in reversed(historial):
+        escenario = ("pipeline", "n", "fase")
+        if all(previo[c] == resultado[c] for c in escenario) and previo.get("procesos", 1) == resultado["procesos"]:
+            return previo
+    return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--pipelines", nargs="+", choices=PIPELINES, default=PIPELINES)
+    parser.add_argument("--tamanos", type=int, nargs="+", default=[1_000, 10_000, 100_000])
+    parser.add_argument("--semilla", type=int, default=0)
+    parser.add_argument("--etiqueta", default=None, help="Texto libre para identificar la corrida en el historial")
+    parser.add_argument("--no-guardar", action="store_true", help="No agregar los resultados al historial")
+    parser.add_argument("--procesos", type=int, nargs="+", default=[1],
+                        help="Procesos de transformación de los KML (p. ej. 1 2 4 8 para medir la escala)")
+    parser.add_argument("--interno", nargs=2, metavar=("PIPELINE", "N"), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.interno:
+        # Proceso hijo: un escenario, resultados en JSON por stdout
+        pipeline, n = args.interno[0], int(args.interno[1])
+        print(json.dumps(correr_escenario(pipeline, n, args.semilla, args.procesos[0])))
+        return
+
+    historial = leer_historial()
+    comunes = {
+        "fecha": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "commit": _commit(),
+        "etiqueta": args.etiqueta,
+        "python": platform.python_version(),
+        "maquina": platform.node(),
+    }
+    nuevos = []
+    print(f"{'pipeline':<12} {'n':>8} {'fase':<12} {'s':>8} {'filas/s':>10} {'lote p50/p95 ms':>17} "
+          f"{'edit p95 ms':>11} {'RSS MB':>7} {'vs. anterior':>13}")
+    escenarios = [
+        (pipeline, n, procesos)
+        for pipeline in args.pipelines
+        for n in args.tamanos
+        # La hoja operacional no tiene transformación en procesos: se mide una sola vez
+        for procesos in (args.procesos if pipeline != "operacional" else args.procesos[:1])
+    ]
+    for pipeline, n, procesos in escenarios:
+        proceso = subprocess.run(
+            [sys.executable, os.path.abspath(__file__), "--interno", pipeline, str(n), "--semilla", str(args.semilla),
+             "--procesos", str(procesos)],
+            cwd=ROOT_DIR, capture_output=True, text=True,
+        )
+        if proceso.returncode != 0:
+            print(f"❌ {pipeline} n={n} procesos={procesos} falló:\n{proceso.stderr[-2000:]}")
+            continue
+        for resultado in json.loads(proceso.stdout.strip().splitlines()[-1]):
+            resultado = dict(comunes, **resultado)
+            previo = _anterior(historial, resultado)
+            comparacion = f"{previo['segundos'] / resultado['segundos']:.2f}x" if previo and resultado["segundos"] else "-"
+            lote = resultado["lote"]
+            etiqueta = pipeline if procesos == 1 else f"{pipeline}×{procesos}"
+            print(
+                f"{etiqueta:<12} {n:>8} {resultado['fase']:<12} {resultado['segundos']:>8.2f} "
+                f"{resultado['filas_por_s']:>10.0f} {lote['p50_ms']:>8}/{lote['p95_ms']:<8} "
+                f"{str(resultado['edit_features']['p95_ms']):>11} {str(resultado['rss_pico_mb']):>7} {comparacion:>13}"
+            )
+            nuevos.append(resultado)
+
+    if nuevos and not args.no_guardar:
+        os.makedirs(os.path.dirname(RUTA_HISTORIAL), exist_ok=True)
+        with open(RUTA_HISTORIAL, "a", encoding="utf-8") as f:
+            for resultado in nuevos:
+                f.write(json.dumps(resultado, ensure_ascii=False) + "\n")
+        print(f"📁 Resultados agregados a {RUTA_HISTORIAL}")
+
+
+if __name__ == "__main__":
+    main()
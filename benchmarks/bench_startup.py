@@ -0,0 +1,98 @@
+"""
+Benchmark: arranque en frío de los runners de serve/ con `python -X importtime`.
+
+Cada runner se carga en un intérprete nuevo sin ejecutar su bloque __main__,
+y lo mismo con los módulos de pipeline (lo que se paga antes de saber si la
+fuente cambió). Falla (código 1) si algún objetivo importa una librería pesada
+de las prohibidas o supera --max-ms, para atrapar regresiones.
+
+Uso:
+    python benchmarks/bench_startup.py --repeticiones 5 --max-ms 400
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+RUNNERS = ["Run_incendios.py", "Run_mov_masa.py", "Run_operational.py", "Run_todos.py"]
+MODULOS = [
+    "pipelines.fire_susceptibility.main_fire_susceptibility",
+    "pipelines.mass_movements.main_mass_movements",
+    "pipelines.operational.main_operacional",
+]
+# Librerías que no deben cargarse hasta que un pipeline tenga datos nuevos
+PROHIBIDOS = ["arcgis", "geopandas", "pandas", "numpy", "shapely", "pyproj", "bs4"]
+
+
+def _codigo(objetivo):
+    if objetivo.endswith(".py"):
+        ruta = os.path.join(ROOT_DIR, "serve", objetivo)
+        return f"import runpy; runpy.run_path({ruta!r}, run_name='__bench__')"
+    return f"import {objetivo}"
+
+
+def medir(objetivo):
+    """
+    Ejecuta un intérprete con -X importtime para un objetivo.
+    Returns:
+        (total_ms, {modulo_raiz: acumulado_ms}, nombres) con los imports de primer nivel
+        y los nombres de todos los módulos importados, a cualquier profundidad.
+    """
+    proceso = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", _codigo(objetivo)],
+        cwd=ROOT_DIR, capture_output=True, text=True,
+        env={**os.environ, "PYTHONDONTWRITEBYTECODE": "1"},
+    )
+    if proceso.returncode != 0:
+        raise RuntimeError(f"{objetivo} falló al importar:\n{proceso.stderr[-2000:]}")
+
+    raiz = {}
+    nombres = set()
+    for linea in proceso.stderr.splitlines():
+        if not linea.startswith("import time:") or "cumulative" in linea:
+            continue
+        _, acumulado, nombre = linea[len("import time:"):].split("|")
+        nombres.add(nombre.strip())
+        # Los imports anidados llevan sangría; solo se suman los de primer nivel
+        if nombre.startswith(" ") and not nombre.startswith("  "):
+            modulo = nombre.strip()
+            raiz[modulo] = raiz.get(modulo, 0) + int(acumulado) / 1000
+    return sum(raiz.values()), raiz, nombres
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repeticiones", type=int, default=3)
+    parser.add_argument("--max-ms", type=float, default=None, help="Umbral de la mediana por objetivo")
+    parser.add_argument("--top", type=int, default=5, help="Imports más lentos a mostrar por objetivo")
+    args = parser.parse_args()
+
+    errores = []
+    print(f"{'objetivo':<58} {'mediana_ms':>10} {'min_ms':>8}")
+    for objetivo in RUNNERS + MODULOS:
+        mediciones = [medir(objetivo) for _ in range(args.repeticiones)]
+        totales = [total for total, _, _ in mediciones]
+        mediana = statistics.median(totales)
+        print(f"{objetivo:<58} {mediana:>10.1f} {min(totales):>8.1f}")
+
+        _, modulos, nombres = mediciones[-1]
+        for nombre, ms in sorted(modulos.items(), key=lambda x: -x[1])[:args.top]:
+            print(f"    {nombre:<54} {ms:>10.1f}")
+
+        # Se miran todos los módulos, no solo los de primer nivel: lo pesado suele llegar indirectamente
+        pesados = sorted({m.split(".")[0] for m in nombres} & set(PROHIBIDOS))
+        if pesados:
+            errores.append(f"{objetivo} importa al arrancar: {', '.join(pesados)}")
+        if args.max_ms is not None and mediana > args.max_ms:
+            errores.append(f"{objetivo} tarda {mediana:.1f} ms (> {args.max_ms} ms)")
+
+    for error in errores:
+        print(f"❌ {error}")
+    sys.exit(1 if errores else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,103 @@
+"""
+Benchmark de la subida por lotes (utils.batch_upload) contra el FeatureServer local.
+
+Levanta utils.mock_feature_server en este proceso con la latencia, límites y fallos
+indicados, y recorre la grilla tamano_inicial × max_workers × reintentos subiendo
+las mismas features a un servicio nuevo en cada combinación. Sirve para elegir
+OPCIONES_SUBIDA sin tocar las capas de producción.
+
+Uso:
+    python benchmarks/bench_upload.py --features 20000 --latencia-ms 200 --limite-por-s 20
+    python benchmarks/bench_upload.py --tamanos 100 500 --workers 2 4 8 --prob-fallo 0.05
+"""
+import argparse
+import hashlib
+import logging
+import os
+import random
+import sys
+import time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.fixtures import LAT_MAX, LAT_MIN, LON_MAX, LON_MIN, MUNICIPIOS
+from utils import batch_upload
+from utils.layer_sync import CAMPO_HASH
+from utils.mock_feature_server import ConfigMock, servidor_mock
+from utils.rest_layer import CapaREST
+
+
+def generar_features(n, semilla=0, vertices=16):
+    """Polígonos Esri JSON con atributos parecidos a los de las capas de alertas."""
+    rng = random.Random(semilla)
+    features = []
+    for i in range(n):
+        lon, lat = rng.uniform(LON_MIN, LON_MAX), rng.uniform(LAT_MIN, LAT_MAX)
+        anillo = [[round(lon + 0.003 * rng.uniform(-1, 1), 7), round(lat + 0.003 * rng.uniform(-1, 1), 7)] for _ in range(vertices)]
+        anillo.append(anillo[0])
+        features.append({
+            "attributes": {"Name": f"Alerta - {rng.randint(1, 3)}", "SymbolID": rng.randint(0, 2), "Municipio": rng.choice(MUNICIPIOS),
+                           # Como en layer_sync: permite verificar las altas de un lote que quedó sin respuesta
+                           CAMPO_HASH: hashlib.sha1(f"{semilla}-{i}".encode()).hexdigest()},
+            "geometry": {"rings": [anillo], "spatialReference": {"wkid": 4326}},
+        })
+    return features
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--features", type=int, default=5000)
+    parser.add_argument("--tamanos", type=int, nargs="+", default=[100, 500, 2000], help="tamano_inicial de lote")
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 4, 8], help="max_workers")
+    parser.add_argument("--reintentos", type=int, nargs="+", default=[3])
+    parser.add_argument("--espera-base", type=float, default=0.2)
+    parser.add_argument("--latencia-ms", type=float, default=100)
+    parser.add_argument("--latencia-por-feature-ms", type=float, default=0.05)
+    parser.add_argument("--max-bytes", type=int, default=None)
+    parser.add_argument("--limite-por-s", type=int, default=None)
+    parser.add_argument("--prob-fallo", type=float, default=0.0)
+    parser.add_argument("--prob-timeout", type=float, default=0.0)
+    parser.add_argument("--prob-fallo-feature", type=float, default=0.0)
+    parser.add_argument("--timeout-s", type=float, default=10.0, help="Timeout HTTP del cliente")
+    parser.add_argument("--semilla", type=int, default=0)
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.WARNING, format='%(asctime)s - %(levelname)s - %(message)s')
+
+    features = generar_features(args.features, args.semilla)
+    config = ConfigMock(
+        latencia_ms=args.latencia_ms, latencia_por_feature_ms=args.latencia_por_feature_ms,
+        max_bytes=args.max_bytes, limite_por_s=args.limite_por_s, prob_fallo=args.prob_fallo,
+        prob_timeout=args.prob_timeout, duracion_timeout_s=args.timeout_s * 1.5,
+        prob_fallo_feature=args.prob_fallo_feature, semilla=args.semilla,
+    )
+    # El tope por capa no debe esconder el efecto de max_workers en la grilla
+    batch_upload.MAX_LOTES_POR_CAPA = max(args.workers)
+
+    print(f"{'lote':>6} {'workers':>8} {'reint.':>7} {'tiempo (s)':>11} {'feat/s':>9} {'lotes':>6} "
+          f"{'reintentos':>11} {'fallidas':>9} {'429':>5} {'inyect.':>8}")
+    with servidor_mock(config) as servidor:
+        combinacion = 0
+        for tamano in args.tamanos:
+            for workers in args.workers:
+                for reintentos in args.reintentos:
+                    combinacion += 1
+                    antes = dict(servidor.estadisticas)
+                    capa = CapaREST(f"{servidor.url_servicios}/bench_{combinacion}/FeatureServer/0", timeout=args.timeout_s)
+                    inicio = time.perf_counter()
+                    reporte = batch_upload.subir_por_lotes(
+                        capa, features, tamano_inicial=tamano, max_workers=workers,
+                        reintentos=reintentos, espera_base=args.espera_base, campo_hash=CAMPO_HASH,
+                    )
+                    duracion = time.perf_counter() - inicio
+                    rechazos = servidor.estadisticas["rechazadas_429"] - antes["rechazadas_429"]
+                    inyectados = (servidor.estadisticas["fallos_inyectados"] + servidor.estadisticas["timeouts_inyectados"]
+                                  - antes["fallos_inyectados"] - antes["timeouts_inyectados"])
+                    print(f"{tamano:>6} {workers:>8} {reintentos:>7} {duracion:>11.2f} {len(features) / duracion:>9.0f} "
+                          f"{reporte['lotes']:>6} {reporte['reintentos']:>11} {reporte['fallidos']:>9} {rechazos:>5} {inyectados:>8}")
+                    en_capa = len(servidor.capas[f"bench_{combinacion}"].features)
+                    if en_capa != reporte["exitosos"]:
+                        print(f"   ⚠️ El servidor tiene {en_capa} features y el reporte dice {reporte['exitosos']} exitosas")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,165 @@
+"""
+Entradas sintéticas con la forma de las fuentes reales, para los benchmarks sin red:
+KML de susceptibilidad a incendios, KML de movimientos en masa (con las tablas HTML
+de Description) y el CSV de la pestaña 3 de la Google Sheet (4 filas de encabezado).
+
+Los archivos se escriben en streaming (sirven para 1M de registros) y se guardan en
+data/benchmarks/ para reutilizarlos entre corridas con el mismo tamaño y semilla.
+"""
+import csv
+import math
+import os
+import random
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+FIXTURES_DIR = os.path.join(ROOT_DIR, "data", "benchmarks")
+
+# Caja aproximada del Valle de Aburrá
+LON_MIN, LON_MAX = -75.72, -75.22
+LAT_MIN, LAT_MAX = 6.0, 6.55
+
+MUNICIPIOS = ["Medellín", "Bello", "Itagüí", "Envigado", "Sabaneta", "Girardota", "Barbosa"]
+
+CABECERA_KML = '<?xml version="1.0" encoding="UTF-8"?>\n<kml xmlns="http://www.opengis.net/kml/2.2"><Document>\n'
+PIE_KML = "</Document></kml>\n"
+
+
+def ruta_fixture(tipo, n, semilla=0):
+    extension = "csv" if tipo == "operacional" else "kml"
+    return os.path.join(FIXTURES_DIR, f"{tipo}_{n}_{semilla}.{extension}")
+
+
+def _anillo(rng, vertices, radio):
+    """Anillo cerrado alrededor de un centro aleatorio (ordenado por ángulo: siempre simple)."""
+    lon = rng.uniform(LON_MIN, LON_MAX)
+    lat = rng.uniform(LAT_MIN, LAT_MAX)
+    puntos = []
+    for i in range(vertices):
+        angulo = 2 * math.pi * i / vertices
+        r = radio * rng.uniform(0.6, 1.0)
+        puntos.append(f"{lon + r * math.cos(angulo):.7f},{lat + r * math.sin(angulo):.7f},0")
+    puntos.append(puntos[0])
+    return " ".join(puntos)
+
+
+def _poligono(rng, vertices, radio, invalido=False):
+    if invalido:
+        # Corbatín: se cruza a sí mismo y la validación lo debe descartar
+        lon, lat = rng.uniform(LON_MIN, LON_MAX), rng.uniform(LAT_MIN, LAT_MAX)
+        coords = f"{lon},{lat},0 {lon + radio},{lat + radio},0 {lon + radio},{lat},0 {lon},{lat + radio},0 {lon},{lat},0"
+    else:
+        coords = _anillo(rng, vertices, radio)
+    return (
+        "<Polygon><outerBoundaryIs><LinearRing><coordinates>"
+        f"{coords}"
+        "</coordinates></LinearRing></outerBoundaryIs></Polygon>"
+    )
+
+
+def generar_descripcion(rng):
+    """HTML con la misma estructura que las tablas de los Placemarks de SIATA."""
+    filas = [
+        ("Municipio", rng.choice(MUNICIPIOS)),
+        ("Área", rng.choice(["Urbana", "Rural"])),
+        ("Área", f"{rng.uniform(0.01, 5):.4f}"),
+        ("Vereda", rng.choice(["El Manzanillo", "La Cuchilla", "", "San José"])),
+        ("Comuna", str(rng.randint(1, 16))),
+        ("Barrio", rng.choice(["Robledo", "Santo Domingo", "El Poblado", ""])),
+        ("Acu_7", f"{rng.uniform(0, 250):.2f}"),
+        ("Acu_90_7", f"{rng.uniform(0, 1):.3f}"),
+    ]
+    cuerpo = "".join(f"<tr><td>{k}</td><td> {v} </td></tr>" for k, v in filas)
+    return f"<html><body><table border=\"1\"><tr><th colspan=\"2\">Alerta</th></tr>{cuerpo}</table></body></html>"
+
+
+def escribir_kml_incendios(ruta, n, semilla=0, vertices=24, fraccion_invalidos=0.005):
+    """Polígonos de susceptibilidad con Name 'Susc: 1'..'Susc: 3' (algunos multiparte o inválidos)."""
+    rng = random.Random(semilla)
+    with open(ruta, "w", encoding="utf-8") as f:
+        f.write(CABECERA_KML)
+        for i in range(n):
+            if rng.random() < 0.05:
+                geometria = "<MultiGeometry>" + _poligono(rng, vertices, 0.004) + _poligono(rng, vertices, 0.004) + "</MultiGeometry>"
+            else:
+                geometria = _poligono(rng, vertices, 0.006, invalido=rng.random() < fraccion_invalidos)
+            f.write(f"<Placemark><name>Susc: {rng.randint(1, 3)}</name>{geometria}</Placemark>\n")
+        f.write(PIE_KML)
+
+
+def escribir_kml_mov_masa(ruta, n, semilla=0, vertices=16):
+    """Polígonos de alerta con Name 'Alerta - N' y la tabla HTML en Description."""
+    rng = random.Random(semilla)
+    with open(ruta, "w", encoding="utf-8") as f:
+        f.write(CABECERA_KML)
+        for i in range(n):
+            f.write(
+                f"<Placemark><name>Alerta - {rng.randint(1, 3)}</name>"
+                f"<description><![CDATA[{generar_descripcion(rng)}]]></description>"
+                f"{_poligono(rng, vertices, 0.003)}</Placemark>\n"
+            )
+        f.write(PIE_KML)
+
+
+def columnas_pestana_3():
+    """Encabezados reales de la pestaña 3 (los de COLUMN_MAPPING_PESTAÑA_3 sin las columnas vacías)."""
+    from pipelines.operational.main_operacional import COLUMN_MAPPING_PESTAÑA_3
+
+    return [c for c in COLUMN_MAPPING_PESTAÑA_3 if not c.startswith("Unnamed")]
+
+
+def escribir_csv_pestana_3(ruta, n, semilla=0, fraccion_vacias=0.02):
+    """CSV como lo exporta la hoja: 4 filas de título, encabezados y filas con coma decimal a veces."""
+    rng = random.Random(semilla)
+    columnas = columnas_pestana_3()
+    with open(ruta, "w", encoding="utf-8", newline="") as f:
+        escritor = csv.writer(f)
+        escritor.writerow(["REGISTRO DE ALERTAS TEMPRANAS"] + [""] * (len(columnas) - 1))
+        escritor.writerow(["Sistema de Alerta Temprana del Valle de Aburrá - SIATA"] + [""] * (len(columnas) - 1))
+        escritor.writerow([""] * len(columnas))
+        escritor.writerow(["Actualizado automáticamente"] + [""] * (len(columnas) - 1))
+        escritor.writerow(columnas)
+        for i in range(n):
+            if rng.random() < fraccion_vacias:
+                # Filas de relleno casi vacías que la limpieza debe quitar
+                escritor.writerow([""] * len(columnas))
+                continue
+            dia = rng.randint(1, 28)
+            mes = rng.randint(1, 12)
+            lat = f"{rng.uniform(LAT_MIN, LAT_MAX):.6f}"
+            lon = f"{rng.uniform(LON_MIN, LON_MAX):.6f}"
+            if rng.random() < 0.3:
+                lat, lon = lat.replace(".", ","), lon.replace(".", ",")
+            valores = {
+                "Hora (00:00)": f"{rng.randint(0, 23):02d}:{rng.randint(0, 59):02d}",
+                "Tipo de Alerta": rng.choice(["Naranja", "Roja", "Amarilla"]),
+                "Municipio": rng.choice(MUNICIPIOS),
+                "Latitud": lat,
+                "Longitud": lon,
+                "Año": "2025",
+                "Mes": str(mes),
+                "Día": str(dia),
+                "Fecha": f"2025-{mes:02d}-{dia:02d}",
+                "Verificado": rng.choice(["Sí", "No"]),
+                "¿Se activó sirena?": rng.choice(["Sí", "No", ""]),
+                "Canal": rng.choice(["WhatsApp", "Radio", "Llamada"]),
+                "Evento": rng.choice(["Creciente", "Movimiento en masa", "Inundación"]),
+            }
+            escritor.writerow([valores.get(c, f"dato {rng.randint(1, 500)}") for c in columnas])
+
+
+GENERADORES = {
+    "incendios": escribir_kml_incendios,
+    "mov_masa": escribir_kml_mov_masa,
+    "operacional": escribir_csv_pestana_3,
+}
+
+
+def obtener_fixture(tipo, n, semilla=0):
+    """Ruta de la entrada sintética; se genera solo si no existe todavía."""
+    ruta = ruta_fixture(tipo, n, semilla)
+    if not os.path.exists(ruta):
+        os.makedirs(FIXTURES_DIR, exist_ok=True)
+        tmp = ruta + ".tmp"
+        GENERADORES[tipo](tmp, n, semilla)
+        os.replace(tmp, ruta)
+    return ruta
@@ -0,0 +1,387 @@
+"""
+Pipelines declarativos: una capa nueva se describe en pipelines/specs/<nombre>.toml
+(o .yaml) en lugar de copiar un script.
+
+Cada spec dice de dónde viene el dato (KML o CSV por URL), cómo se renombran los
+campos, cómo se calcula la simbología y a qué capa va (ver specs/_ejemplo.toml).
+El motor usa los mismos caminos que los pipelines escritos a mano: descarga
+condicional (utils.fetch_cache), KML en streaming (utils.kml_stream), conversión
+por columnas contra el esquema (utils.field_mapping / utils.feature_coercion),
+sincronización por lotes o transaccional, snapshots y detección de cambios.
+
+Las specs se leen y validan una vez por proceso, al primer uso (ver
+pipelines.pipelines.pipelines_registrados), y quedan registradas como
+'procesar:<nombre>'; las que traen [programacion] también en el planificador. Los archivos que empiezan con '_' no se cargan.
+
+Uso:
+    python -m pipelines.declarative validar
+"""
+import argparse
+import logging
+import os
+import re
+import sys
+import threading
+
+import requests
+
+from utils.change_detection import registrar_cambios
+from utils.fetch_cache import descargar_condicional
+from utils.field_mapping import compilar_mapeo, invalidar_esquema, obtener_esquema
+from utils.layer_sync import features_desde_gdf, sincronizar_capa, sincronizar_capa_por_lotes
+from utils.metrics import etapa, instrumentar
+from utils.rest_layer import obtener_capa
+from utils.snapshot_store import Snapshot, buscar_snapshot, registrar_snapshot, republicar_snapshot
+# pandas, geopandas y utils.kml_stream se importan solo si la fuente cambió.
+
+# --- CONFIGURACIÓN ---
+CURRENT_DIR = os.path.dirname(os.path.abspath(__file__))
+DIRECTORIO_SPECS = os.path.join(CURRENT_DIR, "specs")
+# Valores por defecto de lo que una spec no indique
+TIMEOUT_S = 600
+TIMEOUT_DESCARGA_S = 60
+OPCIONES_SUBIDA = {"tamano_inicial": 100, "max_workers": 4, "reintentos": 3}
+TAMANO_LOTE_KML = 5000
+OPCIONES_CSV = {
+    "filas_omitidas": 0,
+    "separador": ",",
+    "codificacion": "utf-8",
+    "motor": "c",
+    "campo_x": "Longitud",
+    "campo_y": "Latitud",
+}
+# Secciones y claves que acepta una spec: cualquier otra es un error (atrapa erratas).
+# [campos] es libre: {columna de la fuente: campo de la capa}.
+CLAVES_SPEC = {
+    "": {"nombre", "timeout", "fuente", "destino", "kml", "csv", "campos", "simbologia", "cambios", "programacion"},
+    "fuente": {"tipo", "url", "headers", "timeout"},
+    "destino": {"item_id", "capa_snapshot", "columnas", "transaccional", "opciones_subida"},
+    "kml": {"tamano_lote", "procesos", "reduccion"},
+    "csv": set(OPCIONES_CSV),
+    "simbologia": {"campo", "destino", "valores", "patron", "defecto"},
+    "cambios": {"claves", "niveles", "item_id"},
+    "programacion": {"intervalo_s", "cron", "jitter_s"},
+}
+
+_lock = threading.Lock()
+_especificaciones = None
+
+
+class Transformacion:
+    """
+    Renombres, simbología y selección de columnas de una spec, aplicados a cada
+    lote con operaciones de columna. Solo guarda dicts, listas y un patrón
+    compilado, así que se puede picklear a los procesos de utils.parallel_transform.
+    """
+
+    def __init__(self, campos=None, simbologia=None, columnas=None, conservar=()):
+        simbologia = dict(simbologia or {})
+        self.campos = dict(campos or {})
+        self.campo_simbolo = simbologia.get("campo")
+        self.destino_simbolo = simbologia.get("destino", "SymbolID")
+        self.valores = simbologia.get("valores")
+        self.patron = re.compile(simbologia["patron"]) if simbologia.get("patron") else None
+        self.defecto = simbologia.get("defecto", -1)
+        self.columnas = list(columnas) if columnas else None
+        self.conservar = tuple(conservar)
+        if simbologia and not self.campo_simbolo:
+            raise ValueError("[simbologia] necesita 'campo'")
+        if simbologia and (self.valores is None) == (self.patron is None):
+            raise ValueError("[simbologia] lleva 'valores' o 'patron' (solo uno)")
+        if self.patron is not None and self.patron.groups != 1:
+            raise ValueError("[simbologia] 'patron' debe tener exactamente un grupo")
+
+    def __call__(self, df):
+        with etapa("transform", filas=len(df)):
+            return self._aplicar(df)
+
+    def _aplicar(self, df):
+        import pandas as pd
+
+        df = df.rename(columns=self.campos)
+        if self.campo_simbolo:
+            if self.campo_simbolo not in df.columns:
+                raise ValueError(f"No se encontró la columna '{self.campo_simbolo}' para la simbología")
+            texto = df[self.campo_simbolo].astype("string").str.strip()
+            if self.valores is not None:
+                simbolo = texto.map(self.valores)
+            else:
+                simbolo = texto.str.extract(self.patron, expand=False)
+            df[self.destino_simbolo] = pd.to_numeric(simbolo, errors="coerce").fillna(self.defecto).astype(int)
+        if self.columnas:
+            # Solo las columnas que se publican (y la geometría o las coordenadas)
+            df = df[[c for c in dict.fromkeys([*self.columnas, *self.conservar]) if c in df.columns]]
+        return df
+
+
+class EspecPipeline:
+    """Spec validada de un pipeline, con la transformación ya compilada."""
+
+    def __init__(self, datos, nombre=None, ruta=None):
+        _validar_claves(datos)
+        fuente = datos.get("fuente") or {}
+        destino = datos.get("destino") or {}
+        kml = datos.get("kml") or {}
+        self.nombre = datos.get("nombre") or nombre
+        self.ruta = ruta
+        self.tipo = fuente.get("tipo")
+        if self.tipo not in PUBLICADORES:
+            raise ValueError(f"[fuente] 'tipo' debe ser uno de {', '.join(PUBLICADORES)} (no {self.tipo!r})")
+        if not fuente.get("url") or not destino.get("item_id"):
+            raise ValueError("Faltan [fuente] 'url' o [destino] 'item_id'")
+        self.url = fuente["url"]
+        self.headers = dict(fuente.get("headers") or {})
+        self.timeout_descarga = fuente.get("timeout", TIMEOUT_DESCARGA_S)
+        self.item_id = destino["item_id"]
+        self.capa_snapshot = destino.get("capa_snapshot", self.nombre)
+        self.transaccional = destino.get("transaccional", False)
+        self.opciones_subida = {**OPCIONES_SUBIDA, **(destino.get("opciones_subida") or {})}
+        self.tamano_lote = kml.get("tamano_lote", TAMANO_LOTE_KML)
+        self.procesos = kml.get("procesos", 1)
+        self.reduccion = kml.get("reduccion")
+        self.csv = {**OPCIONES_CSV, **(datos.get("csv") or {})}
+        self.cambios = datos.get("cambios")
+        self.timeout = datos.get("timeout", TIMEOUT_S)
+        self.programacion = datos.get("programacion")
+        conservar = ("geometry",) if self.tipo == "kml" else (self.csv["campo_x"], self.csv["campo_y"])
+        self.transformacion = Transformacion(
+            datos.get("campos"), datos.get("simbologia"), destino.get("columnas"), conservar
+        )
+
+
+def _validar_claves(datos):
+    desconocidas = [k for k in datos if k not in CLAVES_SPEC[""]]
+    for seccion, claves in CLAVES_SPEC.items():
+        if seccion and isinstance(datos.get(seccion), dict):
+            desconocidas += [f"{seccion}.{k}" for k in datos[seccion] if k not in claves]
+    if desconocidas:
+        raise ValueError(f"Claves desconocidas: {', '.join(desconocidas)}")
+
+
+def _leer_toml(ruta):
+    import tomllib
+
+    with open(ruta, "rb") as f:
+        return tomllib.load(f)
+
+
+def _leer_yaml(ruta):
+    import yaml
+
+    with open(ruta, encoding="utf-8") as f:
+        return yaml.safe_load(f) or {}
+
+
+LECTORES = {".toml": _leer_toml, ".yaml": _leer_yaml, ".yml": _leer_yaml}
+
+
+def cargar_specs(directorio=None, estricto=False):
+    """
+    Lee y valida las specs de pipelines/specs.
+    Args:
+        estricto: Si es True, una spec inválida es un error; si no, se deja en el
+            log y se sigue con las demás (un archivo roto no frena al resto).
+    Returns:
+        dict {nombre: EspecPipeline}.
+    """
+    directorio = directorio or DIRECTORIO_SPECS
+    specs = {}
+    if not os.path.isdir(directorio):
+        return specs
+    for archivo in sorted(os.listdir(directorio)):
+        base, extension = os.path.splitext(archivo)
+        if archivo.startswith(("_", ".")) or extension not in LECTORES:
+            continue
+        ruta = os.path.join(directorio, archivo)
+        try:
+            spec = EspecPipeline(LECTORES[extension](ruta), base, ruta)
+            if spec.nombre in specs:
+                raise ValueError(f"el nombre '{spec.nombre}' ya lo usa {specs[spec.nombre].ruta}")
+        except Exception as e:
+            if estricto:
+                raise ValueError(f"{archivo}: {e}") from e
+            logging.error(f"❌ Spec de pipeline inválida {archivo}: {e}")
+            continue
+        specs[spec.nombre] = spec
+    return specs
+
+
+def especificaciones():
+    """Specs de pipelines/specs, leídas y compiladas una sola vez por proceso."""
+    global _especificaciones
+    with _lock:
+        if _especificaciones is None:
+            _especificaciones = cargar_specs()
+        return _especificaciones
+
+
+def _descargar(spec, forzar):
+    logging.info(f"⬇️ Descargando {spec.tipo.upper()} desde: {spec.url}")
+    try:
+        return descargar_condicional(spec.url, headers=spec.headers, timeout=spec.timeout_descarga, forzar=forzar)
+    except requests.RequestException as e:
+        logging.error(f"❌ Fallo descarga de {spec.nombre}: {e}")
+        return None
+
+
+def _publicar_kml(spec, gis, descarga, dry_run, snapshot):
+    """KML en streaming -> transformación por lotes -> sincronización por lotes."""
+    from utils.kml_stream import leer_kml_por_lotes
+
+    layer = obtener_capa(gis, spec.item_id)
+    with descarga.abrir() as fuente:
+        gdfs = (
+            gdf
+            for gdf in leer_kml_por_lotes(fuente, spec.tamano_lote, transformar=spec.transformacion,
+                                          procesos=spec.procesos)
+            if not gdf.empty
+        )
+        if spec.reduccion:
+            from utils.geometry_reduction import reducir_lotes
+
+            gdfs = reducir_lotes(gdfs, tamano_lote=spec.tamano_lote, **spec.reduccion)
+        lotes = (features_desde_gdf(gdf) for gdf in snapshot.envolver(gdfs) if not gdf.empty)
+        return sincronizar_capa_por_lotes(
+            layer, lotes, dry_run=dry_run, opciones_subida=spec.opciones_subida,
+            journal=spec.capa_snapshot if spec.transaccional else None,
+        )
+
+
+def _publicar_csv(spec, gis, descarga, dry_run, snapshot):
+    """CSV de puntos -> conversión por columnas contra el esquema de la capa -> sincronización."""
+    import geopandas as gpd
+    import pandas as pd
+
+    from utils.feature_coercion import construir_features
+
+    opciones = spec.csv
+    campo_x, campo_y = opciones["campo_x"], opciones["campo_y"]
+    with etapa("parse") as registro:
+        with descarga.abrir() as fuente:
+            df = pd.read_csv(fuente, skiprows=opciones["filas_omitidas"], sep=opciones["separador"],
+                             encoding=opciones["codificacion"], engine=opciones["motor"])
+        registro.filas += len(df)
+    with etapa("validate", filas=len(df)):
+        # Coordenadas con coma decimal o vacías: las filas sin ambas no se pueden ubicar
+        for campo in (campo_x, campo_y):
+            if campo not in df.columns:
+                raise ValueError(f"No se encontró la columna de coordenadas '{campo}'")
+            df[campo] = pd.to_numeric(df[campo].astype("string").str.replace(",", ".").str.strip(), errors="coerce")
+        df = df[df[[campo_x, campo_y]].notna().all(axis=1)]
+    if df.empty:
+        # Sincronizar una tabla vacía borraría la capa entera
+        logging.error(f"❌ {spec.nombre}: el CSV no trae filas con coordenadas")
+        return None
+    df = spec.transformacion(df)
+
+    layer = obtener_capa(gis, spec.item_id)
+    if layer is None:
+        logging.error(f"❌ No se encontró Feature Layer ID: {spec.item_id} (o el ítem no tiene capas)")
+        return None
+    esquema = obtener_esquema(layer, spec.item_id)
+    conservar = (campo_x, campo_y)
+    # Los renombres de [campos] ya se aplicaron: el plan solo resuelve tipos y longitudes
+    plan = compilar_mapeo({}, esquema, list(df.columns), conservar=conservar)
+    df = plan.aplicar(df, conservar=conservar)
+    with etapa("encode", filas=len(df)):
+        features = construir_features(df, plan.tipos, plan.longitudes, campo_x=campo_x, campo_y=campo_y)
+
+    geometria = gpd.points_from_xy(df[campo_x], df[campo_y], crs="EPSG:4326")
+    # Texto como 'string' de pandas: las columnas object con tipos mezclados no van a Parquet
+    texto = {c: "string" for c in df.columns if df[c].dtype == object}
+    snapshot.agregar(gpd.GeoDataFrame(df.astype(texto), geometry=geometria))
+
+    reporte = sincronizar_capa(
+        layer, features, dry_run=dry_run, opciones_subida=spec.opciones_subida, esquema=esquema,
+        journal=spec.capa_snapshot if spec.transaccional else None,
+    )
+    if not reporte["exito"]:
+        # Puede ser un cambio de esquema dentro del TTL: la próxima ejecución lo vuelve a pedir
+        invalidar_esquema(spec.item_id)
+    return reporte
+
+
+# Tipo de fuente -> función que la lee, la transforma y la publica
+PUBLICADORES = {"kml": _publicar_kml, "csv": _publicar_csv}
+
+
+def _procesar(spec, gis, dry_run, forzar, desde_snapshot):
+    logging.info(f"🧾 Iniciando pipeline declarativo {spec.nombre}")
+    if desde_snapshot:
+        return republicar_snapshot(
+            obtener_capa(gis, spec.item_id), spec.capa_snapshot, desde_snapshot, dry_run, spec.opciones_subida
+        )
+
+    descarga = _descargar(spec, forzar)
+    if descarga is None:
+        return False
+    snapshot = None
+    try:
+        if descarga.sin_cambios:
+            logging.info(f"♻️ {spec.nombre}: la fuente no cambió desde la última publicación. Nada que hacer.")
+            return True
+
+        snapshot = Snapshot(spec.capa_snapshot)
+        logging.info(f"🌐 Actualizando capa de {spec.nombre} en ArcGIS Online...")
+        reporte = PUBLICADORES[spec.tipo](spec, gis, descarga, dry_run, snapshot)
+        if reporte is None:
+            return False
+
+        if reporte['exito']:
+            if not dry_run:
+                descarga.confirmar()
+                anterior = buscar_snapshot(spec.capa_snapshot)
+                entrada = registrar_snapshot(snapshot, fuente=spec.url)
+                if spec.cambios is not None:
+                    cambios = dict(spec.cambios)
+                    item_id_cambios = cambios.pop("item_id", None)
+                    capa_cambios = obtener_capa(gis, item_id_cambios) if item_id_cambios else None
+                    registrar_cambios(spec.capa_snapshot, anterior, entrada, capa_cambios=capa_cambios, **cambios)
+            logging.info(f"🎉 {spec.nombre}: {reporte['adds'] + reporte['updates'] + reporte['sin_cambios']} registros publicados.")
+        return reporte['exito']
+
+    except Exception as e:
+        logging.error(f"❌ Error procesando/actualizando {spec.nombre}: {e}")
+        return False
+    finally:
+        # Si no se confirmó, la copia temporal se borra y la próxima ejecución vuelve a intentarlo
+        descarga.descartar()
+        if snapshot is not None:
+            snapshot.descartar()
+
+
+def procesar(nombre, gis, dry_run=False, forzar=False, desde_snapshot=None):
+    """
+    Ejecuta un pipeline declarativo (misma firma que procesar_incendios y los demás).
+    Args:
+        nombre: Nombre de la spec en pipelines/specs.
+        gis: Objeto GIS autenticado (desde utils).
+        dry_run: Si es True, solo informa los cambios que se harían en la capa.
+        forzar: Si es True, ignora la caché de descargas y publica igualmente.
+        desde_snapshot: ID de un snapshot guardado ('ultimo' para el más reciente) que
+            se publica en lugar de descargar la fuente.
+    """
+    spec = especificaciones()[nombre]
+    return instrumentar(nombre)(_procesar)(spec, gis, dry_run, forzar, desde_snapshot)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Specs de pipelines declarativos (pipelines/specs).")
+    parser.add_argument("comando", choices=["validar"])
+    parser.add_argument("--directorio", default=None, help="Carpeta de specs (por defecto pipelines/specs)")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+    try:
+        specs = cargar_specs(args.directorio, estricto=True)
+    except ValueError as e:
+        print(f"❌ {e}")
+        sys.exit(1)
+    for spec in specs.values():
+        programacion = spec.programacion or "sin programación"
+        print(f"{spec.nombre:<20} {spec.tipo:<4} {spec.item_id}  snapshot={spec.capa_snapshot}  {programacion}")
+    print(f"{len(specs)} specs válidas")
+
+
+if __name__ == "__main__":
+    main()
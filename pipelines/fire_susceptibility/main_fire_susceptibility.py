@@ -1,83 +1,134 @@
 import requests
-import geopandas as gpd
-from arcgis.features import GeoAccessor
-import io
-import datetime
 import logging
-
-# Configuración de Logs local para este módulo
-logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+import functools
+from utils.change_detection import registrar_cambios
+from utils.fetch_cache import descargar_condicional
+from utils.layer_sync import features_desde_gdf, sincronizar_capa_por_lotes
+from utils.metrics import etapa, instrumentar
+from utils.rest_layer import obtener_capa
+from utils.snapshot_store import Snapshot, buscar_snapshot, registrar_snapshot, republicar_snapshot
+# utils.kml_stream (geopandas/shapely) se importa solo si el KML cambió.
+# Los logs los configura el runner de serve/, no este módulo.
 
 # --- CONFIGURACIÓN ---
 URL_DATOS_KML = "https://siata.gov.co/hidrologia/incendios_forestales/Mapa_diario_AMVA/susceptibilidad_IF.kml"
 ITEM_ID = "49294579c5f341b8b78b066a705ca7c3" 
+# Lotes pequeños al inicio: los polígonos de susceptibilidad son pesados
+OPCIONES_SUBIDA = {"tamano_inicial": 50, "max_workers": 4, "reintentos": 3}
+# Placemarks por lote al leer el KML en streaming
+TAMANO_LOTE_KML = 2000
+# Procesos para validar/reproyectar/transformar los lotes del KML: 1 en serie, None uno
+# por núcleo (utils.parallel_transform). Los KML pequeños corren en serie igualmente.
+PROCESOS_TRANSFORMACION = 1
+MAPEO_SIMBOLOGIA = {"Susc: 1": 2, "Susc: 2": 1, "Susc: 3": 0}
+# Reducción de geometrías antes de subir (None para subir los vértices tal cual).
+# tolerancia en grados (~5 m), decimales de las coordenadas y columna para disolver
+# polígonos vecinos de la misma clase (None para no disolver).
+REDUCCION_GEOMETRIA = {"tolerancia": 0.00005, "decimales": 6, "disolver_por": None}
+# Nombre de la capa en output/snapshots
+CAPA_SNAPSHOT = "incendios"
+# True: ediciones con applyEdits(rollbackOnFailure) por bloques y journal en data/journal
+# (ver utils.transactional_publish). Junta todas las ediciones en memoria antes de enviarlas
+# y solo es atómico dentro de cada bloque de 1000 ediciones / 8 MB. False (por defecto) las
+# envía en streaming con el cargador por lotes concurrente
+PUBLICACION_TRANSACCIONAL = False
+# Cambios respecto a la publicación anterior en output/cambios (utils.change_detection), None
+# para no calcularlos. En la simbología de MAPEO_SIMBOLOGIA un SymbolID mayor es más susceptible.
+DETECCION_CAMBIOS = {"claves": [], "niveles": {"SymbolID": 1}}
+# Capa opcional donde se publican los cambios de la última ejecución (None: solo el archivo)
+ITEM_ID_CAMBIOS = None
+
+@etapa("transform")
+def transformar_lote(gdf, mapeo=None):
+    """
+    Aplica la simbología a un lote del KML.
+    Args:
+        gdf: GeoDataFrame validado y en EPSG:4326 (desde leer_kml_por_lotes).
+        mapeo: {Name: SymbolID} (por defecto MAPEO_SIMBOLOGIA).
+    """
+    if 'Name' not in gdf.columns:
+        raise ValueError("No se encontró la columna 'Name' en el KML.")
+    
+    gdf = gdf.copy()
+    mapeo = MAPEO_SIMBOLOGIA if mapeo is None else mapeo
+    gdf['SymbolID'] = gdf['Name'].str.strip().map(mapeo).fillna(-1).astype(int)
+    return gdf
+
+def transformacion():
+    """Simbología con el MAPEO_SIMBOLOGIA vigente ahora, no el que vería un proceso del pool al reimportar."""
+    return functools.partial(transformar_lote, mapeo=MAPEO_SIMBOLOGIA)
 
-def procesar_incendios(gis):
+@instrumentar("incendios")
+def procesar_incendios(gis, dry_run=False, forzar=False, desde_snapshot=None):
     """
     Ejecuta la actualización de la capa de Incendios.
+    El KML se descarga de forma condicional (ETag/Last-Modified + hash) y, si
+    cambió, se parsea en streaming y cada lote se sincroniza con la capa.
     Args:
         gis: Objeto GIS autenticado (desde utils).
+        dry_run: Si es True, solo informa los cambios que se harían en la capa.
+        forzar: Si es True, ignora la caché de descargas y publica igualmente.
+        desde_snapshot: ID de un snapshot guardado ('ultimo' para el más reciente) que
+            se publica en lugar de descargar el KML.
     """
     logging.info("🔥 Iniciando pipeline de Susceptibilidad de Incendios")
+    if desde_snapshot:
+        return republicar_snapshot(obtener_capa(gis, ITEM_ID), CAPA_SNAPSHOT, desde_snapshot, dry_run, OPCIONES_SUBIDA)
     
-    # --- PASO A: Descargar y Leer Datos KML (Con Cache Busting) ---
+    # --- PASO A: Descarga condicional (sin cache busting: se revalida con la caché local) ---
     try:
         logging.info("🔗 Descargando datos KML desde SIATA...")
-        
-        # Cache Busting
-        timestamp = int(datetime.datetime.now().timestamp())
-        cache_busting_url = f"{URL_DATOS_KML}?v={timestamp}"
-        
         headers = {'Cache-Control': 'no-cache', 'Pragma': 'no-cache'}
-        buffer = io.BytesIO()
-        
-        with requests.get(cache_busting_url, timeout=60, stream=True, headers=headers) as response:
-            response.raise_for_status()
-            for chunk in response.iter_content(chunk_size=8192):
-                buffer.write(chunk)
-        
-        buffer.seek(0)
-        gdf = gpd.read_file(buffer)
-
-        if gdf.empty:
-            logging.warning("⚠️ El KML descargado está vacío.")
-            return False
-        
-        # Limpieza geometría
-        gdf = gdf[gdf.geometry.notna() & gdf.geometry.is_valid].to_crs(epsg=4326)
-        
-    except Exception as e:
-        logging.error(f"❌ Error en descarga/lectura KML: {e}")
+        descarga = descargar_condicional(URL_DATOS_KML, headers=headers, timeout=60, forzar=forzar)
+    except requests.RequestException as e:
+        logging.error(f"❌ Error en descarga KML: {e}")
         return False
-
-    # --- PASO B: Transformación ---
+    
+    snapshot = None
     try:
-        if 'Name' not in gdf.columns:
-            logging.error("❌ No se encontró la columna 'Name' en el KML.")
-            return False
-        
-        mapeo_simbologia = {"Susc: 1": 2, "Susc: 2": 1, "Susc: 3": 0}
-        gdf['SymbolID'] = gdf['Name'].str.strip().map(mapeo_simbologia).fillna(-1).astype(int)
-        
-    except Exception as e:
-        logging.error(f"❌ Error en transformación: {e}")
-        return False
+        if descarga.sin_cambios:
+            logging.info("♻️ El KML no cambió desde la última publicación. Nada que hacer.")
+            return True
 
-    # --- PASO C: Carga a ArcGIS ---
-    try:
-        logging.info("🌐 Actualizando capa en ArcGIS Online...")
-        target_layer = gis.content.get(ITEM_ID).layers[0]
-        
-        # Truncate (Borrar todo)
-        target_layer.delete_features(where='1=1')
+        from utils.kml_stream import leer_kml_por_lotes
+        from utils.geometry_reduction import reducir_lotes
+        target_layer = obtener_capa(gis, ITEM_ID)
+        snapshot = Snapshot(CAPA_SNAPSHOT)
         
-        # Append (Agregar nuevos)
-        sdf = GeoAccessor.from_geodataframe(gdf)
-        target_layer.edit_features(adds=sdf)
+        # --- PASO B: Leer y Transformar por lotes ---
+        # --- PASO C: Carga a ArcGIS (cada lote se sincroniza al llegar) ---
+        with descarga.abrir() as fuente:
+            gdfs = (
+                gdf
+                for gdf in leer_kml_por_lotes(fuente, TAMANO_LOTE_KML, transformar=transformacion(),
+                                              procesos=PROCESOS_TRANSFORMACION)
+                if not gdf.empty
+            )
+            if REDUCCION_GEOMETRIA:
+                gdfs = reducir_lotes(gdfs, tamano_lote=TAMANO_LOTE_KML, **REDUCCION_GEOMETRIA)
+            lotes = (features_desde_gdf(gdf) for gdf in snapshot.envolver(gdfs) if not gdf.empty)
+            logging.info("🌐 Actualizando capa en ArcGIS Online...")
+            reporte = sincronizar_capa_por_lotes(
+                target_layer, lotes, dry_run=dry_run, opciones_subida=OPCIONES_SUBIDA,
+                journal=CAPA_SNAPSHOT if PUBLICACION_TRANSACCIONAL else None,
+            )
         
-        logging.info("🎉 Capa de Incendios actualizada correctamente.")
-        return True
-
+        if reporte['exito']:
+            if not dry_run:
+                descarga.confirmar()
+                anterior = buscar_snapshot(CAPA_SNAPSHOT)
+                entrada = registrar_snapshot(snapshot, fuente=URL_DATOS_KML)
+                if DETECCION_CAMBIOS:
+                    capa_cambios = obtener_capa(gis, ITEM_ID_CAMBIOS) if ITEM_ID_CAMBIOS else None
+                    registrar_cambios(CAPA_SNAPSHOT, anterior, entrada, capa_cambios=capa_cambios, **DETECCION_CAMBIOS)
+            logging.info("🎉 Capa de Incendios actualizada correctamente.")
+        return reporte['exito']
+    
     except Exception as e:
-        logging.error(f"❌ Error actualizando ArcGIS: {e}")
-        return False
\ No newline at end of file
+        logging.error(f"❌ Error procesando/actualizando Incendios: {e}")
+        return False
+    finally:
+        # Si no se confirmó, la copia temporal se borra y la próxima ejecución vuelve a intentarlo
+        descarga.descartar()
+        if snapshot is not None:
+            snapshot.descartar()
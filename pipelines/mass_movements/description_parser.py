@@ -0,0 +1,63 @@
+import html
+import re
+import unicodedata
+
+# --- CONFIGURACIÓN ---
+# Mapeo: Clave HTML (normalizada, sin tildes) -> Campo ArcGIS
+HTML_MAP = {
+    "Municipio": "Municipio", "Area_texto": "Area_Texto",
+    "Vereda": "Vereda", "Comuna": "Comuna", "Barrio": "Barrio",
+    "Area_num": "Area_Numerica", "Acu_7": "Acu_7", "Acu_90_7": "Acu_90_7"
+}
+COLUMNAS_HTML = list(dict.fromkeys(HTML_MAP.values()))
+
+# Claves de la fila "Área" repetida: la primera es el texto y la segunda el valor numérico.
+# 'rea' es lo que quedaba cuando la limpieza antigua borraba la 'Á' sin normalizar la tilde.
+CLAVES_AREA = {"Area", "rea"}
+
+# Patrones compilados una sola vez
+_RE_FILA = re.compile(r"<tr\b[^>]*>(.*?)</tr\s*>", re.IGNORECASE | re.DOTALL)
+_RE_CELDA = re.compile(r"<td\b[^>]*>(.*?)</td\s*>", re.IGNORECASE | re.DOTALL)
+_RE_ETIQUETA = re.compile(r"<[^>]+>")
+_RE_NO_CLAVE = re.compile(r"[^a-zA-Z0-9_]")
+
+
+def _texto(celda):
+    """Equivalente a get_text(strip=True): quita etiquetas y une los fragmentos recortados."""
+    return "".join(f.strip() for f in html.unescape(_RE_ETIQUETA.sub("\x00", celda)).split("\x00"))
+
+
+def normalizar_clave(texto):
+    """'Área texto' -> 'Area_texto' (quita tildes antes de eliminar caracteres no válidos)."""
+    sin_tildes = unicodedata.normalize("NFKD", texto).encode("ascii", "ignore").decode("ascii")
+    return _RE_NO_CLAVE.sub("", sin_tildes.replace(" ", "_"))
+
+
+def extraer_descripciones(descripciones):
+    """
+    Extrae en una sola pasada las tablas HTML de Description de todos los Placemarks.
+    Args:
+        descripciones: Iterable con el HTML de cada fila (None/NaN si no tiene).
+    Returns:
+        dict {columna ArcGIS: lista de valores}, con una posición por descripción.
+    """
+    columnas = {col: [] for col in COLUMNAS_HTML}
+    for descripcion in descripciones:
+        fila = dict.fromkeys(COLUMNAS_HTML)
+        if isinstance(descripcion, str):
+            for tr in _RE_FILA.finditer(descripcion):
+                celdas = _RE_CELDA.findall(tr.group(1))
+                if len(celdas) != 2:
+                    continue
+                clave = normalizar_clave(_texto(celdas[0]))
+                valor = _texto(celdas[1])
+                if clave in CLAVES_AREA:
+                    if fila["Area_Texto"] is None:
+                        fila["Area_Texto"] = valor
+                    else:
+                        fila["Area_Numerica"] = valor
+                elif clave in HTML_MAP:
+                    fila[HTML_MAP[clave]] = valor
+        for col, valor in fila.items():
+            columnas[col].append(valor)
+    return columnas
@@ -1,85 +1,110 @@
 import os
 import requests
 import datetime
+import functools
+import shutil
 import re
-import json
 import logging
-import pandas as pd
-import geopandas as gpd
-import numpy as np
-from bs4 import BeautifulSoup
-from arcgis.features import GeoAccessor
-
-# Configuración de Logs
-logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+from pipelines.mass_movements.description_parser import COLUMNAS_HTML, extraer_descripciones
+from utils.change_detection import registrar_cambios
+from utils.fetch_cache import descargar_condicional
+from utils.layer_sync import features_desde_gdf, sincronizar_capa_por_lotes
+from utils.metrics import etapa, instrumentar
+from utils.resumable_download import descargar_fechas, rango_fechas
+from utils.rest_layer import obtener_capa
+from utils.snapshot_store import Snapshot, buscar_snapshot, registrar_snapshot, republicar_snapshot
+# pandas y utils.kml_stream (geopandas/shapely) se importan solo si el KML cambió.
+# Los logs los configura el runner de serve/, no este módulo.
 
 # --- CONFIGURACIÓN ---
-BASE_URL_DIR_TEMPLATE = "https://siata.gov.co/geotecnia/COE_{year}/modelos/{yyyymmdd}/AM/"
+# SIATA_BASE_URL permite apuntar a un espejo o al servidor de pruebas (utils.mock_file_server)
+BASE_URL = "https://siata.gov.co"
+BASE_URL_DIR_TEMPLATE = "{base}/geotecnia/COE_{year}/modelos/{yyyymmdd}/AM/"
 FILE_NAME_TEMPLATE = "alertas_7d_{yyyy_mm_dd}.kml"
 ITEM_ID = "c69debbaa88047c394f1c1eff4922143"
+OPCIONES_SUBIDA = {"tamano_inicial": 100, "max_workers": 4, "reintentos": 3}
+# Placemarks por lote al leer el KML en streaming
+TAMANO_LOTE_KML = 5000
+# Nombre de la capa en output/snapshots
+CAPA_SNAPSHOT = "mov_masa"
+# True: ediciones con applyEdits(rollbackOnFailure) por bloques y journal en data/journal
+# (ver utils.transactional_publish). Junta todas las ediciones en memoria antes de enviarlas
+# y solo es atómico dentro de cada bloque de 1000 ediciones / 8 MB. False (por defecto) las
+# envía en streaming con el cargador por lotes concurrente
+PUBLICACION_TRANSACCIONAL = False
+# Cambios respecto a la publicación anterior en output/cambios (utils.change_detection), None
+# para no calcularlos: alertas nuevas, eliminadas y las que suben o bajan de categoría (SymbolID)
+DETECCION_CAMBIOS = {"claves": [], "niveles": {"SymbolID": 1}}
+# Capa opcional donde se publican los cambios de la última ejecución (None: solo el archivo)
+ITEM_ID_CAMBIOS = None
+# Municipio/Comuna/Barrio/Vereda por cruce con los límites de data/limites (utils.admin_boundaries):
+# 'completar' llena los vacíos del HTML, 'validar' además corrige los que no coinciden, None no cruza
+LIMITES_ADMINISTRATIVOS = "completar"
+# Procesos para validar/reproyectar/transformar los lotes del KML: 1 en serie, None uno
+# por núcleo (utils.parallel_transform). Los KML pequeños corren en serie igualmente.
+PROCESOS_TRANSFORMACION = 1
+# Días hacia atrás que se prueban si el modelo de hoy todavía no está publicado
+DIAS_RETROCESO = 3
+# Descargas simultáneas al rellenar un rango de fechas
+MAX_DESCARGAS = 4
+HEADERS = {'User-Agent': 'Mozilla/5.0'}
 
 # Definir ruta de descarga dentro del proyecto (carpeta 'data' en la raíz)
 CURRENT_DIR = os.path.dirname(os.path.abspath(__file__))
 ROOT_DIR = os.path.dirname(os.path.dirname(CURRENT_DIR)) # Subir 2 niveles
 LOCAL_DOWNLOAD_PATH = os.path.join(ROOT_DIR, "data", "mov_masa")
 
-def descargar_siata_diario():
-    """Descarga el KML del día actual."""
+def url_siata_diario(fecha):
+    """URL del KML de alertas a 7 días publicado por SIATA para una fecha."""
+    return BASE_URL_DIR_TEMPLATE.format(
+        base=os.environ.get("SIATA_BASE_URL", BASE_URL).rstrip("/"),
+        year=fecha.strftime("%Y"), 
+        yyyymmdd=fecha.strftime("%Y%m%d")
+    ) + FILE_NAME_TEMPLATE.format(yyyy_mm_dd=fecha.strftime("%Y-%m-%d"))
+
+def ruta_local_siata(fecha):
+    """Ruta en data/mov_masa donde se guarda la copia cruda del KML de una fecha."""
     if not os.path.exists(LOCAL_DOWNLOAD_PATH):
         os.makedirs(LOCAL_DOWNLOAD_PATH)
+    return os.path.join(LOCAL_DOWNLOAD_PATH, f"alertas_siata_{fecha.strftime('%Y-%m-%d')}.kml")
 
-    hoy = datetime.date.today()
-    url_completa = BASE_URL_DIR_TEMPLATE.format(
-        year=hoy.strftime("%Y"), 
-        yyyymmdd=hoy.strftime("%Y%m%d")
-    ) + FILE_NAME_TEMPLATE.format(yyyy_mm_dd=hoy.strftime("%Y-%m-%d"))
-    
-    nombre_archivo = f"alertas_siata_{hoy.strftime('%Y-%m-%d')}.kml"
-    ruta_local = os.path.join(LOCAL_DOWNLOAD_PATH, nombre_archivo)
-    
-    logging.info(f"⬇️ Descargando KML desde: {url_completa}")
-    try:
-        response = requests.get(url_completa, headers={'User-Agent': 'Mozilla/5.0'}, stream=True, timeout=60)
-        if response.status_code == 200:
-            with open(ruta_local, 'wb') as f:
-                for chunk in response.iter_content(chunk_size=8192):
-                    f.write(chunk)
-            return ruta_local
-        else:
-            logging.error(f"❌ Error HTTP: {response.status_code}")
-            return None
-    except Exception as e:
-        logging.error(f"❌ Fallo descarga: {e}")
-        return None
+def fechas_candidatas(hoy=None, dias_retroceso=DIAS_RETROCESO):
+    """Hoy y, por si el modelo del día aún no se publicó, los días anteriores."""
+    hoy = hoy or datetime.date.today()
+    return [hoy - datetime.timedelta(days=i) for i in range(dias_retroceso + 1)]
 
-def procesar_movimientos_masa(gis):
+def rellenar_historico(desde, hasta=None, max_workers=MAX_DESCARGAS):
     """
-    Pipeline completo: Descarga -> ETL (BeautifulSoup + GeoPandas) -> Carga ArcGIS
+    Descarga en data/mov_masa los KML de un rango de fechas (p. ej. los días en que
+    no corrió el pipeline), reanudando los que queden cortados. Solo guarda el
+    histórico crudo; no publica nada. La ejecución diaria no pasa por aquí: usa
+    descargar_condicional, que revalida el KML del día con ETag/Last-Modified.
+    Args:
+        desde: Primera fecha (datetime.date).
+        hasta: Última fecha (por defecto hoy).
+        max_workers: Descargas simultáneas.
+    Returns:
+        dict {fecha: registro | None | ErrorDescarga} (ver utils.resumable_download).
     """
-    logging.info("⛰️ Iniciando pipeline Movimientos en Masa")
+    fechas = rango_fechas(desde, hasta or datetime.date.today())
+    logging.info(f"🗓️ Rellenando {len(fechas)} días de KML ({desde} a {hasta or 'hoy'}) con {max_workers} descargas a la vez")
+    return descargar_fechas(fechas, url_siata_diario, ruta_local_siata, max_workers=max_workers,
+                            headers=HEADERS, timeout=60)
 
-    # 1. Descargar Datos
-    ruta_kml = descargar_siata_diario()
-    if not ruta_kml or not os.path.exists(ruta_kml):
-        logging.error("❌ No hay archivo KML para procesar.")
-        return False
-
-    # 2. Habilitar Drivers KML y Leer
-    gpd.io.file.fiona.drvsupport.supported_drivers['KML'] = 'rw'
-    gpd.io.file.fiona.drvsupport.supported_drivers['LIBKML'] = 'rw'
-    
-    try:
-        gdf = gpd.read_file(ruta_kml, driver='LIBKML')
-    except Exception:
-        try:
-            gdf = gpd.read_file(ruta_kml)
-        except Exception as e:
-            logging.error(f"❌ Error leyendo KML: {e}")
-            return False
+@etapa("transform")
+def transformar_lote(gdf, limites=None):
+    """
+    Limpieza de columnas, parseo de HTML y simbología de un lote del KML.
+    Args:
+        gdf: GeoDataFrame validado y en EPSG:4326 (desde leer_kml_por_lotes).
+        limites: Modo del cruce con los límites administrativos (ver LIMITES_ADMINISTRATIVOS);
+            None no cruza.
+    Returns:
+        GeoDataFrame solo con las columnas que se publican en ArcGIS.
+    """
+    import pandas as pd
 
-    if gdf.empty:
-        logging.warning("⚠️ KML vacío.")
-        return False
+    gdf = gdf.copy()
 
     # 3. Limpieza de Columnas
     cols_limpias = []
@@ -92,44 +117,21 @@ def procesar_movimientos_masa(gis):
     col_name = next((c for c in gdf.columns if "Name" in c), None)
     col_desc = next((c for c in gdf.columns if "Description" in c), None)
 
-    # 4. Parseo de HTML (BeautifulSoup)
-    # Mapeo: Clave HTML -> Campo ArcGIS
-    html_map = {
-        "Municipio": "Municipio", "Área_texto": "Area_Texto", 
-        "Vereda": "Vereda", "Comuna": "Comuna", "Barrio": "Barrio",
-        "Área_num": "Area_Numerica", "Acu_7": "Acu_7", "Acu_90_7": "Acu_90_7"
-    }
-    
-    # Inicializar columnas
-    for col in html_map.values():
-        gdf[col] = None
-
-    if col_desc:
-        for idx, row in gdf.iterrows():
-            html = row[col_desc]
-            if isinstance(html, str):
-                soup = BeautifulSoup(html, 'html.parser')
-                rows = soup.find_all('tr')
-                for tr in rows:
-                    cells = tr.find_all('td')
-                    if len(cells) == 2:
-                        key = re.sub(r'[^a-zA-Z0-9_]', '', cells[0].get_text(strip=True).replace(" ", "_"))
-                        val = cells[1].get_text(strip=True)
-                        
-                        # Lógica específica para mapear keys del HTML a columnas del DF
-                        if key == "rea": # A veces 'Área' pierde tilde
-                            if gdf.at[idx, "Area_Texto"] is None: gdf.at[idx, "Area_Texto"] = val
-                            else: gdf.at[idx, "Area_Numerica"] = val
-                        elif key in html_map:
-                             gdf.at[idx, html_map[key]] = val
-                        elif key == "Acu_7": gdf.at[idx, "Acu_7"] = val
-                        elif key == "Acu_90_7": gdf.at[idx, "Acu_90_7"] = val
-
-    # 5. Geometría y Proyección
-    gdf = gdf[gdf.geometry.notnull() & gdf.geometry.is_valid]
-    if gdf.crs and gdf.crs.to_epsg() != 4326:
-        gdf = gdf.to_crs("EPSG:4326")
-    
+    # 4. Parseo de HTML (una sola pasada con patrones compilados)
+    # Las columnas se asignan una vez al GeoDataFrame en lugar de celda a celda
+    descripciones = gdf[col_desc] if col_desc else [None] * len(gdf)
+    with etapa("parse_html", filas=len(gdf)):
+        extraidas = extraer_descripciones(descripciones)
+    for col, valores in extraidas.items():
+        gdf[col] = pd.Series(valores, index=gdf.index, dtype=object)
+    if limites:
+        from utils.admin_boundaries import completar_administrativos
+
+        with etapa("join_admin", filas=len(gdf)):
+            gdf = completar_administrativos(gdf, limites)
+
+    # 5. Geometría y Proyección (validación y reproyección ya hechas por lote al leer)
+
     # 6. Preparar atributos para ArcGIS
     # Lógica para SymbolID y Name
     gdf['SymbolID'] = 0
@@ -139,23 +141,102 @@ def procesar_movimientos_masa(gis):
         gdf['Name'] = gdf[col_name] # Simplificado para el ejemplo
         gdf['categoria'] = gdf['SymbolID'] # Según tu script original
 
-    # 7. Carga a ArcGIS (Usando GeoAccessor que es más rápido que el bucle for manual)
+    # Seleccionamos solo las columnas que nos interesan para evitar errores de esquema
+    cols_finales = COLUMNAS_HTML + ['Name', 'SymbolID', 'categoria', 'geometry']
+    cols_existentes = [c for c in cols_finales if c in gdf.columns]
+    return gdf[cols_existentes]
+
+def transformacion():
+    """
+    transformar_lote con la configuración actual del módulo. Los procesos de
+    PROCESOS_TRANSFORMACION reimportan el módulo: lo que se cambie en tiempo de
+    ejecución solo les llega si viaja con la función.
+    """
+    return functools.partial(transformar_lote, limites=LIMITES_ADMINISTRATIVOS)
+
+@instrumentar("mov_masa")
+def procesar_movimientos_masa(gis, dry_run=False, forzar=False, desde_snapshot=None):
+    """
+    Pipeline completo: Descarga -> ETL (Parseo HTML + GeoPandas) -> Carga ArcGIS
+    El KML se descarga de forma condicional (ETag/Last-Modified + hash); si no
+    cambió desde la última publicación, el pipeline termina sin parsear ni
+    consultar ArcGIS. Si cambió, se parsea en streaming por lotes.
+    Args:
+        gis: Objeto GIS autenticado (desde utils).
+        dry_run: Si es True, solo informa los cambios que se harían en la capa.
+        forzar: Si es True, ignora la caché de descargas y publica igualmente.
+        desde_snapshot: ID de un snapshot guardado ('ultimo' para el más reciente) que
+            se publica en lugar de descargar el KML.
+    """
+    logging.info("⛰️ Iniciando pipeline Movimientos en Masa")
+    if desde_snapshot:
+        return republicar_snapshot(obtener_capa(gis, ITEM_ID), CAPA_SNAPSHOT, desde_snapshot, dry_run, OPCIONES_SUBIDA)
+
+    # 1. Descargar Datos (condicional). Si el modelo de hoy aún no está, se usa el último publicado.
+    descarga = None
+    for fecha in fechas_candidatas():
+        url_completa = url_siata_diario(fecha)
+        logging.info(f"⬇️ Descargando KML desde: {url_completa}")
+        try:
+            descarga = descargar_condicional(url_completa, headers=HEADERS, timeout=60, forzar=forzar)
+            break
+        except requests.HTTPError as e:
+            if e.response is None or e.response.status_code != 404:
+                logging.error(f"❌ Fallo descarga: {e}")
+                return False
+            logging.info(f"⏳ Sin publicar todavía: {fecha}")
+        except requests.RequestException as e:
+            logging.error(f"❌ Fallo descarga: {e}")
+            return False
+    if descarga is None:
+        logging.error(f"❌ No hay KML publicado en los últimos {DIAS_RETROCESO} días")
+        return False
+
+    snapshot = None
     try:
-        logging.info("🌐 Actualizando ArcGIS Online...")
-        layer = gis.content.get(ITEM_ID).layers[0]
-        layer.delete_features(where="1=1")
-        
-        # Convertir a SDF y subir
-        # Seleccionamos solo las columnas que nos interesan para evitar errores de esquema
-        cols_finales = list(html_map.values()) + ['Name', 'SymbolID', 'categoria', 'geometry']
-        cols_existentes = [c for c in cols_finales if c in gdf.columns]
-        
-        sdf = GeoAccessor.from_geodataframe(gdf[cols_existentes])
-        layer.edit_features(adds=sdf)
-        
-        logging.info(f"🎉 Éxito. {len(gdf)} registros cargados.")
-        return True
-        
+        if descarga.sin_cambios:
+            logging.info("♻️ El KML no cambió desde la última publicación. Nada que hacer.")
+            return True
+
+        # Copia cruda del día en data/mov_masa
+        shutil.copyfile(descarga.ruta, ruta_local_siata(fecha))
+
+        from utils.kml_stream import leer_kml_por_lotes
+
+        # 2-6. Leer en streaming y transformar por lotes
+        # 7. Carga a ArcGIS (Sincronización por diferencias en lugar de borrar y recargar)
+        layer = obtener_capa(gis, ITEM_ID)
+        snapshot = Snapshot(CAPA_SNAPSHOT)
+        with descarga.abrir() as fuente:
+            gdfs = (
+                gdf
+                for gdf in leer_kml_por_lotes(fuente, TAMANO_LOTE_KML, transformar=transformacion(),
+                                              procesos=PROCESOS_TRANSFORMACION)
+                if not gdf.empty
+            )
+            lotes = (features_desde_gdf(gdf) for gdf in snapshot.envolver(gdfs))
+            logging.info("🌐 Actualizando ArcGIS Online...")
+            reporte = sincronizar_capa_por_lotes(
+                layer, lotes, dry_run=dry_run, opciones_subida=OPCIONES_SUBIDA,
+                journal=CAPA_SNAPSHOT if PUBLICACION_TRANSACCIONAL else None,
+            )
+
+        if reporte['exito']:
+            if not dry_run:
+                descarga.confirmar()
+                anterior = buscar_snapshot(CAPA_SNAPSHOT)
+                entrada = registrar_snapshot(snapshot, fuente=url_completa)
+                if DETECCION_CAMBIOS:
+                    capa_cambios = obtener_capa(gis, ITEM_ID_CAMBIOS) if ITEM_ID_CAMBIOS else None
+                    registrar_cambios(CAPA_SNAPSHOT, anterior, entrada, capa_cambios=capa_cambios, **DETECCION_CAMBIOS)
+            logging.info(f"🎉 Éxito. {reporte['adds'] + reporte['updates'] + reporte['sin_cambios']} registros publicados.")
+        return reporte['exito']
+
     except Exception as e:
-        logging.error(f"❌ Error en carga a ArcGIS: {e}")
-        return False
\ No newline at end of file
+        logging.error(f"❌ Error procesando/cargando a ArcGIS: {e}")
+        return False
+    finally:
+        # Si no se confirmó, la copia temporal se borra y la próxima ejecución vuelve a intentarlo
+        descarga.descartar()
+        if snapshot is not None:
+            snapshot.descartar()
@@ -1,9 +1,16 @@
 import requests
 import os
 import datetime
-import pandas as pd
-import pytz
-from datetime import timedelta
+import shutil
+from utils.fetch_cache import descargar_condicional
+from utils.field_mapping import compilar_mapeo, invalidar_esquema, obtener_esquema
+from utils.layer_sync import sincronizar_capa
+from utils.metrics import etapa, instrumentar
+from utils.rest_layer import obtener_capa
+from utils.sheet_watermark import COLUMNA_HUELLA, MarcaAgua
+from utils.snapshot_store import Snapshot, buscar_snapshot, leer_snapshot, registrar_snapshot
+# pandas y utils.feature_coercion se importan dentro de las funciones que los usan:
+# si ninguna pestaña cambió, el pipeline termina sin cargarlos.
 
 # --- Configuración ---
 # ID de tu Google Sheet
@@ -12,6 +19,9 @@ SHEET_ID = "1YzhR91pyj-gCmv9DWhot7Y9nkBPdhnag13HzlhADsSU"
 # gid de la pestaña número 3 (reemplaza con el valor real)
 GID_PESTAÑA_3 = "1508274810"
 
+# gid de la pestaña de Aumentos
+GID_PESTAÑA_AUMENTOS = "834984775"
+
 # URL para exportar como CSV
 EXPORT_URL_TEMPLATE = (
     "https://docs.google.com/spreadsheets/d/{sheet_id}"
@@ -20,7 +30,7 @@ EXPORT_URL_TEMPLATE = (
 
 # Carpeta donde se guardarán los archivos
 LOCAL_DOWNLOAD_PATH = (
-    "E:\PRACTICAS_2025_1\EMERGENCIA\datos"
+    r"E:\PRACTICAS_2025_1\EMERGENCIA\datos"
 )
 
 # Encabezado para simular un navegador
@@ -31,17 +41,136 @@ HEADERS = {
         "Chrome/91.0.4472.124 Safari/537.36"
     )
 }
+
+# ID de los Feature Layers en ArcGIS Online
+ITEM_ID_PESTAÑA_3 = "13e98e0ed80c4f45b0d5a8d4f742ef72"
+ITEM_ID_AUMENTOS = "9b7bf773686848bc8bb41402098573e2"
+
+# Nombres de las capas en output/snapshots
+CAPA_SNAPSHOT_PESTAÑA_3 = "operacional_pestana_3"
+CAPA_SNAPSHOT_AUMENTOS = "operacional_aumentos"
+
+# Campos de coordenadas en el CSV
+CSV_LONGITUDE_FIELD = "Longitud"   # Campo que contiene la longitud (X)
+CSV_LATITUDE_FIELD = "Latitud"     # Campo que contiene la latitud (Y)
+
+# Carga incremental de las pestañas (ver utils.sheet_watermark); False para recargarlas completas siempre
+CARGA_INCREMENTAL = True
+# Filas antes de los datos en la exportación de la pestaña 3 (4 de título + encabezados)
+FILAS_ENCABEZADO_PESTAÑA_3 = 5
+
+# Motor de pandas para leer los CSV ('c' o 'pyarrow'; el de Python es mucho más lento)
+MOTOR_CSV = "c"
+
+# Carga por lotes concurrentes (el tamaño se ajusta solo según la latencia observada)
+OPCIONES_SUBIDA = {"tamano_inicial": 100, "max_workers": 4, "reintentos": 3}
+
+# Mapeo de nombres de columnas del CSV a los campos de ArcGIS (pestaña 3)
+COLUMN_MAPPING_PESTAÑA_3 = {
+    "Hora (00:00)": "Hora__00_00_",
+    "Tipo de Alerta": "Tipo_de_Alerta",
+    "Municipio": "Municipio",
+    "Estación de Nivel Asociada N°1": "Estación_de_Nivel_Asociada_N_1",
+    "Estación de Nivel Asociada N°2": "Estación_de_Nivel_Asociada_N_2",
+    "Latitud": "Latitud",
+    "Longitud": "Longitud",
+    "Código Estación de Nivel Asociada N°1": "Código_Estación_de_Nivel_Asocia",
+    "Código Estación de Nivel Asociada N°2": "Código_Estación_de_Nivel_Asoc_1",
+    "Códigos Estaciones\xa0": "Códigos_Estaciones_Asociadas",
+    "SATC": "SATC",
+    "Institución": "Institución",
+    "Canal": "Canal",
+    "Mensaje_Retroalimentación_Tiempo_Pasado": "Mensaje___Retroalimentación__Ti",
+    "Persona_contactada_o_que_contactó": "Persona_contactada_o_que_contac",
+    "¿Se activó sirena?": "F_Se_activó_sirena_",
+    "Código_Sirena_Asociada": "Código_Sirena_Asociada",
+    "La comunidad o el organismo de gestión de riesgo respondieron la llamada": "La_comunidad_o_el_organismo_de_",
+    "La sirena sonó?": "La_sirena_sonó_",
+    "Responsable de hacer recibir la interacción": "Responsable_de_hacer_recibir_la",
+    "Verificado": "Verificado",
+    "Evento": "Evento",
+    "Año": "Año",
+    "Mes": "Mes",
+    "Día": "Día",
+    "Fecha": "Fecha",
+    "Unnamed_25": "Unnamed__25",
+    "Unnamed_26": "Unnamed__26",
+    "Unnamed_28": "Unnamed__28",
+    # Añade aquí el resto de tus columnas y su correspondiente nombre en ArcGIS Online si faltan
+}
+
+# Mapeo de nombres de columnas del CSV a los campos de ArcGIS (Aumentos)
+COLUMN_MAPPING_AUMENTOS = {
+    "Código Estación": "Código_Estación",
+    "Nombre Estación": "Nombre_Estación",
+    "Aumento": "Aumento",
+    "Latitud": "Latitud",
+    "Longitud": "Longitud",
+    "Año": "Año",
+    "Mes": "Mes",
+    "Día": "Día",
+    "Fecha": "Fecha",
+    # Añade aquí el resto de tus columnas y su correspondiente nombre en ArcGIS Online si faltan
+}
 # --- Fin Configuración ---
- 
-def descargar_y_procesar_pestana_csv():
+
+def _ahora():
+    return f"{datetime.datetime.now():%Y-%m-%d %H:%M:%S}"
+
+def _recarga_completa(marca):
+    """Una carga completa no puede saltarse la descarga aunque la pestaña no haya cambiado."""
+    return marca is not None and marca.modo == "completo"
+
+def limpiar_csv_pestana_3(archivo_bruto, archivo_procesado):
+    """
+    Limpia el CSV bruto de la pestaña 3: quita las 4 filas de encabezado de la hoja
+    y las filas casi vacías, combina Fecha y Hora y lo guarda en UTF-8.
+    Returns:
+        Número de filas del CSV procesado.
+    """
+    import pandas as pd
+
+    with etapa("parse") as registro:
+        # Procesar el CSV con pandas: eliminar primeras 4 filas
+        df = pd.read_csv(
+            archivo_bruto,
+            skiprows=4,
+            encoding='utf-8',
+            engine=MOTOR_CSV
+        )
+
+        # ++++ NUEVO: Eliminar filas con 7 o más columnas vacías ++++
+        umbral_vacios = 20
+        filas_a_eliminar = df[df.isnull().sum(axis=1) >= umbral_vacios].index
+        df.drop(filas_a_eliminar, inplace=True)
+        print(f"[{_ahora()}] Filas después de eliminar con {umbral_vacios} o más vacíos: {len(df)}")
+        registro.filas += len(df)
+
+        # Asegúrate de que las columnas 'Fecha' y 'Hora' existan en el DataFrame
+        if 'Fecha' in df.columns and 'Hora (00:00)' in df.columns:
+            df['Fecha'] = df['Fecha'].astype(str)
+            df['Hora (00:00)'] = df['Hora (00:00)'].astype(str)
+            df['Fecha'] = (pd.to_datetime(df['Fecha'] + ' ' + df['Hora (00:00)'], errors='coerce')) + pd.Timedelta(hours=5)
+        else:
+            print("Las columnas 'Fecha' y/o 'Hora' no se encuentran en el DataFrame.")
+
+        df.to_csv(archivo_procesado, index=False, encoding='utf-8') # Asegurar codificación UTF-8 al guardar
+        print(f"[{_ahora()}] Archivo procesado guardado: {archivo_procesado}")
+    return len(df)
+
+def descargar_y_procesar_pestana_csv(marca=None):
     """
     Descarga la pestaña 3 de la Google Sheet como CSV,
     elimina las primeras 4 filas y las filas que tengan 7 o más columnas vacías,
     y guarda la versión procesada con codificación UTF-8.
+    Args:
+        marca: MarcaAgua de la pestaña (carga incremental) o None para procesarla completa.
+    Returns:
+        (ruta_procesada, descarga): ruta_procesada es None si la pestaña no cambió
+        o hubo un error; descarga es None si hubo un error.
     """
     # Fecha actual para nombrar los archivos
-    hoy = datetime.date.today()
-    fecha_str = hoy.strftime("%Y-%m-%d")  # e.g. "2025-05-19"
+    fecha_str = datetime.date.today().strftime("%Y-%m-%d")  # e.g. "2025-05-19"
 
     # Construir la URL de exportación
     url_csv = EXPORT_URL_TEMPLATE.format(
@@ -60,567 +189,349 @@ def descargar_y_procesar_pestana_csv():
         f"sheet3_bruto_{fecha_str}.csv"
     )
 
-    print(f"[{datetime.datetime.now():%Y-%m-%d %H:%M:%S}] Descargando CSV desde: {url_csv}")
+    print(f"[{_ahora()}] Descargando CSV desde: {url_csv}")
     try:
-        resp = requests.get(
-            url_csv, headers=HEADERS, stream=True, timeout=60
-        )
-        resp.raise_for_status()
-        with open(archivo_bruto, "wb") as f:
-            for chunk in resp.iter_content(chunk_size=8192):
-                f.write(chunk)
-        print(f"[{datetime.datetime.now():%Y-%m-%d %H:%M:%S}] Archivo bruto guardado: {archivo_bruto}")
-
-        # Procesar el CSV con pandas: eliminar primeras 4 filas
-        df = pd.read_csv(
-            archivo_bruto,
-            skiprows=4,
-            encoding='utf-8',
-            engine='python'
-        )
-
-        # ++++ NUEVO: Eliminar filas con 7 o más columnas vacías ++++
-        umbral_vacios = 20
-        filas_a_eliminar = df[df.isnull().sum(axis=1) >= umbral_vacios].index
-        df.drop(filas_a_eliminar, inplace=True)
-        print(f"[{datetime.datetime.now():%Y-%m-%d %H:%M:%S}] Filas después de eliminar con {umbral_vacios} o más vacíos: {len(df)}")
-        
-        # Asegúrate de que las columnas 'Fecha' y 'Hora' existan en el DataFrame
-        if 'Fecha' in df.columns and 'Hora (00:00)' in df.columns:
-            df['Fecha'] = df['Fecha'].astype(str)
-            df['Hora (00:00)'] = df['Hora (00:00)'].astype(str)
-            df['Fecha'] = (pd.to_datetime(df['Fecha'] + ' ' + df['Hora (00:00)'], errors='coerce')) + pd.Timedelta(hours=5)	
-
-	   
-        else:
-            print("Las columnas 'Fecha' y/o 'Hora' no se encuentran en el DataFrame.")
+        # Descarga condicional: si la pestaña no cambió desde la última vez, no se procesa nada
+        descarga = descargar_condicional(url_csv, headers=HEADERS, timeout=60, forzar=_recarga_completa(marca))
+        if descarga.sin_cambios:
+            print(f"[{_ahora()}] ♻️ La pestaña no cambió. No hay nada que procesar.")
+            return None, descarga
+        shutil.copyfile(descarga.ruta, archivo_bruto)
+        print(f"[{_ahora()}] Archivo bruto guardado: {archivo_bruto}")
+
+        # Carga incremental: solo las filas nuevas pasan a pandas
+        archivo_entrada = archivo_bruto
+        if marca is not None:
+            archivo_delta = os.path.join(LOCAL_DOWNLOAD_PATH, f"sheet3_delta_{fecha_str}.csv")
+            archivo_entrada = marca.filtrar_csv(archivo_bruto, archivo_delta, FILAS_ENCABEZADO_PESTAÑA_3)
+            if marca.sin_cambios:
+                print(f"[{_ahora()}] ♻️ No hay filas nuevas ni eliminadas en la pestaña.")
+                return None, descarga
 
         # Guardar archivo procesado
         archivo_procesado = os.path.join(
             LOCAL_DOWNLOAD_PATH,
             f"sheet3_procesado_{fecha_str}.csv"
         )
-        df.to_csv(archivo_procesado, index=False, encoding='utf-8') # Asegurar codificación UTF-8 al guardar
-        print(f"[{datetime.datetime.now():%Y-%m-%d %H:%M:%S}] Archivo procesado guardado: {archivo_procesado}")
+        limpiar_csv_pestana_3(archivo_entrada, archivo_procesado)
+        return archivo_procesado, descarga
 
     except requests.exceptions.Timeout:
-        print(f"[{datetime.datetime.now():%Y-%m-%d %H:%M:%S}] Error: Tiempo de espera agotado.")
+        print(f"[{_ahora()}] Error: Tiempo de espera agotado.")
     except requests.exceptions.RequestException as e:
-        print(f"[{datetime.datetime.now():%Y-%m-%d %H:%M:%S}] Error en la solicitud: {e}")
+        print(f"[{_ahora()}] Error en la solicitud: {e}")
     except Exception as e:
-        print(f"[{datetime.datetime.now():%Y-%m-%d %H:%M:%S}] Error inesperado: {e}")
-
-if __name__ == "__main__":
-    descargar_y_procesar_pestana_csv()
-    print(f"[{datetime.datetime.now():%Y-%m-%d %H:%M:%S}] Proceso de descarga y procesamiento finalizado.")
-    from arcgis.gis import GIS
-import pandas as pd
-import geopandas as gpd
-import os
-from shapely.geometry import Point
-import numpy as np
-import datetime
-hoy = datetime.date.today()
-fecha_str = hoy.strftime("%Y-%m-%d")
-
-# === CONFIGURACIÓN ===
-
-# ID del Feature Layer en ArcGIS Online
-item_id = "13e98e0ed80c4f45b0d5a8d4f742ef72"  # Reemplaza con el ID de tu item
-
-# Ruta local al archivo CSV
-nombre_csv = f"sheet3_procesado_{fecha_str}.csv" # Reemplaza con tu nombre de archivo
-ruta_csv = os.path.join("E:\PRACTICAS_2025_1\EMERGENCIA\datos", nombre_csv)
-
-# Campos de coordenadas en el CSV (reemplaza con los nombres correctos)
-csv_longitude_field = "Longitud"   # Campo que contiene la longitud (X)
-csv_latitude_field = "Latitud"     # Campo que contiene la latitud (Y)
+        print(f"[{_ahora()}] Error inesperado: {e}")
+    return None, None
 
-# === 1. VERIFICAR Y LEER ARCHIVO CSV ===
-if not os.path.exists(ruta_csv):
-    print(f"❌ No se encontró el archivo CSV: {ruta_csv}")
-    exit()
+def descargar_y_procesar_pestana_nueva(marca=None):
+    """
+    Descarga la pestaña de Aumentos, combina Fecha y Hora (00:00) y guarda el CSV.
+    Args:
+        marca: MarcaAgua de la pestaña (carga incremental) o None para procesarla completa.
+    Returns:
+        (ruta_procesada, descarga), con la misma convención que descargar_y_procesar_pestana_csv.
+    """
+    os.makedirs(LOCAL_DOWNLOAD_PATH, exist_ok=True)
+    date_str = datetime.date.today().strftime("%Y-%m-%d")
+    export_url = EXPORT_URL_TEMPLATE.format(sheet_id=SHEET_ID, gid=GID_PESTAÑA_AUMENTOS)
 
-print(f"📄 Leyendo archivo CSV: {ruta_csv}")
-try:
-    # Leer CSV
+    # Descarga condicional: si la pestaña no cambió desde la última vez, no se procesa nada
+    raw_path = os.path.join(LOCAL_DOWNLOAD_PATH, f"Aumentos_{date_str}.csv")
+    print(f"Descargando nueva pestaña desde: {export_url}")
     try:
-        df = pd.read_csv(ruta_csv, encoding='utf-8')
-    except UnicodeDecodeError:
-        try:
-            df = pd.read_csv(ruta_csv, encoding='latin1')
-        except UnicodeDecodeError:
-            df = pd.read_csv(ruta_csv, encoding='ISO-8859-1')
-
-    # ++++ NUEVO: Mapeo de nombres de columnas del CSV a los campos de ArcGIS ++++
-    column_mapping = {
-        "Hora (00:00)": "Hora__00_00_",
-        "Tipo de Alerta": "Tipo_de_Alerta",
-        "Municipio": "Municipio",
-        "Estación de Nivel Asociada N°1": "Estación_de_Nivel_Asociada_N_1",
-        "Estación de Nivel Asociada N°2": "Estación_de_Nivel_Asociada_N_2",
-        "Latitud": "Latitud",
-        "Longitud": "Longitud",
-        "Código Estación de Nivel Asociada N°1": "Código_Estación_de_Nivel_Asocia",
-        "Código Estación de Nivel Asociada N°2": "Código_Estación_de_Nivel_Asoc_1",
-        "Códigos Estaciones\xa0": "Códigos_Estaciones_Asociadas",
-        "SATC": "SATC",
-        "Institución": "Institución",
-        "Canal": "Canal",
-        "Mensaje_Retroalimentación_Tiempo_Pasado": "Mensaje___Retroalimentación__Ti",
-        "Persona_contactada_o_que_contactó": "Persona_contactada_o_que_contac",
-        "¿Se activó sirena?": "F_Se_activó_sirena_",
-        "Código_Sirena_Asociada": "Código_Sirena_Asociada",
-        "La comunidad o el organismo de gestión de riesgo respondieron la llamada": "La_comunidad_o_el_organismo_de_",
-        "La sirena sonó?": "La_sirena_sonó_",
-        "Responsable de hacer recibir la interacción": "Responsable_de_hacer_recibir_la",
-        "Verificado": "Verificado",
-        "Evento": "Evento",
-        "Año": "Año",
-        "Mes": "Mes",
-        "Día": "Día",
-        "Fecha": "Fecha",
-        "Unnamed_25": "Unnamed__25",
-        "Unnamed_26": "Unnamed__26",
-        "Unnamed_28": "Unnamed__28",
-        # Añade aquí el resto de tus columnas y su correspondiente nombre en ArcGIS Online si faltan
-    }
-
-    # Renombrar las columnas del DataFrame para que coincidan con los campos de ArcGIS
-    df = df.rename(columns=column_mapping)
-
-    print(f"📋 Columnas después de renombrar: {df.columns.tolist()}")
-
-except Exception as e_csv:
-    print(f"❌ Error fatal al leer CSV: {e_csv}")
-    exit()
-
-if df.empty:
-    print("❌ El archivo CSV está vacío o no se pudo leer correctamente.")
-    exit()
-
-print(f"📊 Filas en DataFrame después de leer CSV: {len(df)}")
-print(f"📋 Columnas en el CSV: {df.columns.tolist()}")
-
-# === 2. FILTRAR REGISTROS ===
-# Convertir comas a puntos y manejar vacíos
-df[csv_longitude_field] = (
-    df[csv_longitude_field]
-    .astype(str)
-    .str.replace(',', '.')
-    .str.strip()
-    .replace(['', 'nan', 'None'], 0)
-    .astype(float)
-)
-
-df[csv_latitude_field] = (
-    df[csv_latitude_field]
-    .astype(str)
-    .str.replace(',', '.')
-    .str.strip()
-    .replace(['', 'nan', 'None'],0)
-    .astype(float)
-)
-
-# Mantener filas aunque alguna coordenada falte (pero al menos una debe estar presente)
-df = df[~df[[csv_longitude_field, csv_latitude_field]].isnull().all(axis=1)]  # Filtrar solo si AMBAS son nulas
-print(f"📊 Filas válidas: {len(df)}")
-
-# === 3. GEODATAFRAME ===
-geometry = [
-    Point(xy) if not np.isnan(xy[0]) and not np.isnan(xy[1]) else None
-    for xy in zip(df[csv_longitude_field], df[csv_latitude_field])
-]
-gdf = gpd.GeoDataFrame(df, geometry=geometry, crs="EPSG:4326")
-
-# === 4. OBTENER FEATURE LAYER DE ARCGIS ===
-layer_item = gis.content.get(item_id)
-if not layer_item:
-    print(f"❌ No se encontró Feature Layer ID: {item_id}")
-    exit()
-if not layer_item.layers:
-    print(f"❌ Ítem {item_id} no tiene capas.")
-    exit()
-
-arcgis_layer = layer_item.layers[0]
-print(f"🎯 Feature Layer obtenido: {arcgis_layer.properties.name}")
-layer_properties = arcgis_layer.properties
-arcgis_field_names = [field['name'] for field in layer_properties.fields]
-print(f"📜 Campos existentes en ArcGIS: {arcgis_field_names}")
-
-# === 5. ELIMINAR DATOS EXISTENTES DE LA CAPA ARCGIS ===
-print("🗑️ Intentando eliminar datos existentes de ArcGIS...")
-try:
-    if "Delete" in layer_properties.capabilities:
-        delete_result = arcgis_layer.delete_features(where="1=1")
-        if delete_result and delete_result.get('success', False):
-            print(f"🧹 Datos anteriores eliminados: {delete_result.get('deleteResults', 'OK')}")
-        else:
-            print(f"⚠️ No se pudieron eliminar datos o respuesta no exitosa: {delete_result}")
-    else:
-        print("⚠️ Capa ArcGIS no soporta eliminación o sin permisos.")
-except Exception as e_delete:
-    print(f"Error al eliminar datos: {e_delete}")
-
-# === 6. PREPARAR Y CARGAR NUEVOS DATOS A ARCGIS ===
-features_to_add_to_arcgis = []
-
-# Obtener los tipos de datos de los campos de ArcGIS para la conversión
-arcgis_field_types = {field['name']: field['type'] for field in layer_properties.fields}
-arcgis_field_lengths = {field['name']: field.get('length') for field in layer_properties.fields if field.get('length') is not None}
-
-# Incluir TODOS los campos del DataFrame (ahora con los nombres correctos de ArcGIS)
-csv_fields = [col for col in df.columns if col not in [csv_longitude_field, csv_latitude_field]]
-
-for index, row in gdf.iterrows():
-    attributes = {}
-    for field in csv_fields:  # Incluir todos los campos del DataFrame (renombrados)
-        value = row[field]
-        if pd.notna(value):
-            # Convertir tipos de datos según corresponda
-            if field in arcgis_field_types:
-                field_type = arcgis_field_types[field]
-                try:
-                    if field_type in ['esriFieldTypeInteger', 'esriFieldTypeSmallInteger']:
-                        attributes[field] = int(float(value)) if value not in ['', ' '] else None
-                    elif field_type in ['esriFieldTypeDouble', 'esriFieldTypeSingle']:
-                        attributes[field] = float(value) if value not in ['', ' '] else None
-                    elif field_type == 'esriFieldTypeString':
-                        attributes[field] = str(value)[:arcgis_field_lengths.get(field, 255)]
-                    elif field_type == 'esriFieldTypeDate':
-                        # Intentar convertir a timestamp (milisegundos desde epoch)
-                        if isinstance(value, (int, float)):
-                            attributes[field] = int(value)
-                        else:
-                            try:
-                                # Probar diferentes formatos de fecha
-                                date_obj = pd.to_datetime(value, errors='raise')
-                                attributes[field] = int(date_obj.timestamp() * 1000)
-                            except ValueError:
-                                attributes[field] = None # Si no se puede parsear, asignar None
-                    else:
-                        attributes[field] = value
-                except:
-                    attributes[field] = None
-            else:
-                # Si el campo no existe en ArcGIS, se ignora (opcional: imprimir advertencia)
-                pass
-
-    # Manejar geometría (incluso si está vacía)
-    geometry = None
-    if not row.geometry.is_empty:
-        geometry = {'x': row.geometry.x, 'y': row.geometry.y, 'spatialReference': {'wkid': 4326}}
-
-    features_to_add_to_arcgis.append({'attributes': attributes, 'geometry': geometry})
-
-# === 7. CARGAR FEATURES A ARCGIS POR LOTES ===
-if not features_to_add_to_arcgis:
-    print("⚠️ No hay features válidos para agregar.")
-else:
-    chunk_size = 100  # Reducir tamaño de lote para evitar timeouts
-    total_added = 0
-    total_failed = 0
-
-    for i in range(0, len(features_to_add_to_arcgis), chunk_size):
-        feature_chunk = features_to_add_to_arcgis[i:i + chunk_size]
-        print(f"📦 Enviando lote {i//chunk_size + 1} ({len(feature_chunk)} features)...")
-
-        try:
-            add_results = arcgis_layer.edit_features(adds=feature_chunk)
-            if not add_results.get('addResults'):
-                print(f"❌ Error en el lote: Respuesta inválida de ArcGIS.")
-                total_failed += len(feature_chunk)
-                continue
-
-            # Contar éxitos y errores
-            succeeded = sum(1 for res in add_results['addResults'] if res.get('success', False))
-            failed = len(feature_chunk) - succeeded
-            total_added += succeeded
-            total_failed += failed
-
-            # Mostrar errores detallados
-            for res in add_results['addResults']:
-                if not res.get('success'):
-                    print(f"  ⚠️ Error en feature ID {res.get('objectId', '?')}: {res.get('error', 'Sin detalles')}")
-
-        except Exception as e:
-            print(f"🔥 Error crítico en el lote: {str(e)}")
-            total_failed += len(feature_chunk)
+        descarga = descargar_condicional(export_url, headers=HEADERS, timeout=60, forzar=_recarga_completa(marca))
+    except requests.exceptions.RequestException as e:
+        print(f"Error en la solicitud: {e}")
+        return None, None
+    if descarga.sin_cambios:
+        print("♻️ La pestaña no cambió. No hay nada que procesar.")
+        return None, descarga
+    shutil.copyfile(descarga.ruta, raw_path)
+    print(f"Archivo bruto guardado en: {raw_path}")
 
-    print(f"✅ Total cargado: {total_added} | ❌ Fallidos: {total_failed}")
+    # Carga incremental: solo las filas nuevas pasan a pandas
+    entrada_path = raw_path
+    if marca is not None:
+        delta_path = os.path.join(LOCAL_DOWNLOAD_PATH, f"Aumentos_delta_{date_str}.csv")
+        entrada_path = marca.filtrar_csv(raw_path, delta_path, filas_encabezado=1)
+        if marca.sin_cambios:
+            print("♻️ No hay filas nuevas ni eliminadas en la pestaña.")
+            return None, descarga
 
-print("✅ Script completado.")
+    # Procesamiento: combinar Fecha y Hora (00:00)
+    import pandas as pd
 
-import requests
-import os
-import datetime
-import pandas as pd
+    with etapa("parse") as registro:
+        df = pd.read_csv(entrada_path, engine=MOTOR_CSV, encoding='utf-8')
+        registro.filas += len(df)
+        if 'Fecha' in df.columns and 'Hora (00:00)' in df.columns:
+            # Convertir a string y unir
+            df['Fecha'] = (pd.to_datetime(
+                df['Fecha'].astype(str) + ' ' + df['Hora (00:00)'].astype(str),
+                errors='coerce'
+            ))  + pd.Timedelta(hours=5)
+
+            # Opcional: eliminar columna de hora original
+            df.drop(columns=['Hora (00:00)'], inplace=True)
+            print(f"Columnas combinadas: 'Fecha' ahora incluye hora, 'Hora (00:00)' eliminada.")
+        else:
+            print("Columnas 'Fecha' y/o 'Hora (00:00)' no encontradas. No se realizó combinación.")
 
-# --- Configuración ---
-# ID de tu Google Sheet
-tabla_id = "1YzhR91pyj-gCmv9DWhot7Y9nkBPdhnag13HzlhADsSU"
-# gid de la nueva pestaña (reemplaza con el valor real)
-gid_nueva_pestana = "834984775"
-# Carpeta donde se guardará el archivo descargado
-target_folder = r"E:\PRACTICAS_2025_1\EMERGENCIA\datos"
-# Nombre base para el archivo
-date_str = datetime.date.today().strftime("%Y-%m-%d")
-# URL plantilla para exportar CSV
-export_url = (
-    f"https://docs.google.com/spreadsheets/d/{tabla_id}"
-    f"/export?format=csv&gid={gid_nueva_pestana}"
-)
-# Encabezado para simular navegador
-headers = {"User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64)"}
+        # Guardar CSV procesado
+        processed_path = os.path.join(LOCAL_DOWNLOAD_PATH, f"Aumentos_{date_str}.csv")
+        df.to_csv(processed_path, index=False, encoding='utf-8')
+        print(f"Archivo procesado guardado en: {processed_path}")
+    return processed_path, descarga
 
-# --- Función de descarga y procesamiento ---
-def descargar_y_procesar_pestana_nueva():
-    os.makedirs(target_folder, exist_ok=True)
+def cargar_csv_a_capa(gis, ruta_csv, item_id, column_mapping, dry_run=False, capa_snapshot=None, marca=None):
+    """
+    Sincroniza un CSV procesado con un Feature Layer de puntos.
+    Args:
+        gis: Objeto GIS autenticado (desde utils).
+        ruta_csv: Ruta local al CSV procesado.
+        item_id: ID del Feature Layer en ArcGIS Online.
+        column_mapping: Mapeo de columnas del CSV a campos de ArcGIS.
+        dry_run: Si es True, solo se informa lo que cambiaría en la capa (sin editarla).
+        capa_snapshot: Nombre con el que se guarda el snapshot de lo publicado (None para no guardarlo).
+        marca: MarcaAgua de la pestaña si el CSV trae solo las filas nuevas (ver utils.sheet_watermark).
+    Returns:
+        True si la capa quedó sincronizada.
+    """
+    import pandas as pd
 
-    # Descarga
-    raw_path = os.path.join(target_folder, f"Aumentos_{date_str}.csv")
-    print(f"Descargando nueva pestaña desde: {export_url}")
-    response = requests.get(export_url, headers=headers, timeout=60)
-    response.raise_for_status()
-    with open(raw_path, "wb") as f:
-        f.write(response.content)
-    print(f"Archivo bruto guardado en: {raw_path}")
+    # === 1. VERIFICAR Y LEER ARCHIVO CSV ===
+    if not os.path.exists(ruta_csv):
+        print(f"❌ No se encontró el archivo CSV: {ruta_csv}")
+        return False
 
-    # Procesamiento: combinar Fecha y Hora (00:00)
-    df = pd.read_csv(raw_path, engine='python', encoding='utf-8')
-    if 'Fecha' in df.columns and 'Hora (00:00)' in df.columns:
-        # Convertir a string y unir
-        df['Fecha'] = (pd.to_datetime(
-            df['Fecha'].astype(str) + ' ' + df['Hora (00:00)'].astype(str),
-            errors='coerce'
-        ))  + pd.Timedelta(hours=5)	
-
-        # Opcional: eliminar columna de hora original
-        df.drop(columns=['Hora (00:00)'], inplace=True)
-        print(f"Columnas combinadas: 'Fecha' ahora incluye hora, 'Hora (00:00)' eliminada.")
-    else:
-        print("Columnas 'Fecha' y/o 'Hora (00:00)' no encontradas. No se realizó combinación.")
-
-    # Guardar CSV procesado
-    processed_path = os.path.join(target_folder, f"Aumentos_{date_str}.csv")
-    df.to_csv(processed_path, index=False, encoding='utf-8')
-    print(f"Archivo procesado guardado en: {processed_path}")
-
-if __name__ == "__main__":
-    descargar_y_procesar_pestana_nueva()
-from arcgis.gis import GIS
-import pandas as pd
-import geopandas as gpd
-import os
-from shapely.geometry import Point
-import numpy as np
-import datetime
-hoy = datetime.date.today()
-fecha_str = hoy.strftime("%Y-%m-%d")
-# === CONFIGURACIÓN ===
-# ID del Feature Layer en ArcGIS Online
-item_id = "9b7bf773686848bc8bb41402098573e2"  # Reemplaza con el ID de tu item
-
-# Ruta local al archivo CSV
-nombre_csv = f"Aumentos_{fecha_str}.csv" # Reemplaza con tu nombre de archivo
-ruta_csv = os.path.join("E:\PRACTICAS_2025_1\EMERGENCIA\datos", nombre_csv)
-
-# Campos de coordenadas en el CSV (reemplaza con los nombres correctos)
-csv_longitude_field = "Longitud"   # Campo que contiene la longitud (X)
-csv_latitude_field = "Latitud"     # Campo que contiene la latitud (Y)
-
-# === 1. VERIFICAR Y LEER ARCHIVO CSV ===
-if not os.path.exists(ruta_csv):
-    print(f"❌ No se encontró el archivo CSV: {ruta_csv}")
-    exit()
-
-print(f"📄 Leyendo archivo CSV: {ruta_csv}")
-try:
-    # Leer CSV
+    print(f"📄 Leyendo archivo CSV: {ruta_csv}")
     try:
-        df = pd.read_csv(ruta_csv, encoding='utf-8')
-    except UnicodeDecodeError:
-        try:
-            df = pd.read_csv(ruta_csv, encoding='latin1')
-        except UnicodeDecodeError:
-            df = pd.read_csv(ruta_csv, encoding='ISO-8859-1')
-
-    # ++++ NUEVO: Mapeo de nombres de columnas del CSV a los campos de ArcGIS ++++
-    column_mapping = {
-        "Código Estación": "Código_Estación",
-        "Nombre Estación": "Nombre_Estación",
-        "Aumento": "Aumento",
-        "Latitud": "Latitud",
-        "Longitud": "Longitud",
-        "Año": "Año",
-        "Mes": "Mes",
-        "Día": "Día",
-        "Fecha": "Fecha",
-        # Añade aquí el resto de tus columnas y su correspondiente nombre en ArcGIS Online si faltan
-    }
-
-    # Renombrar las columnas del DataFrame para que coincidan con los campos de ArcGIS
-    df = df.rename(columns=column_mapping)
-
-    print(f"📋 Columnas después de renombrar: {df.columns.tolist()}")
-
-except Exception as e_csv:
-    print(f"❌ Error fatal al leer CSV: {e_csv}")
-    exit()
-
-if df.empty:
-    print("❌ El archivo CSV está vacío o no se pudo leer correctamente.")
-    exit()
-
-print(f"📊 Filas en DataFrame después de leer CSV: {len(df)}")
-print(f"📋 Columnas en el CSV: {df.columns.tolist()}")
-
-# === 2. FILTRAR REGISTROS ===
-# Convertir comas a puntos y manejar vacíos
-df[csv_longitude_field] = (
-    df[csv_longitude_field]
-    .astype(str)
-    .str.replace(',', '.')
-    .str.strip()
-    .replace(['', 'nan', 'None'], 0)
-    .astype(float)
-)
+        with etapa("parse") as registro:
+            # El CSV procesado lo escribe este mismo módulo en UTF-8: no hace falta adivinar la codificación
+            df = pd.read_csv(ruta_csv, encoding='utf-8', engine=MOTOR_CSV)
+            registro.filas += len(df)
+
+    except Exception as e_csv:
+        print(f"❌ Error fatal al leer CSV: {e_csv}")
+        return False
+
+    incremental = marca is not None and marca.modo == "incremental"
+    if df.empty and not incremental:
+        print("❌ El archivo CSV está vacío o no se pudo leer correctamente.")
+        return False
+
+    print(f"📊 Filas en DataFrame después de leer CSV: {len(df)}")
+
+    # === 2. FILTRAR REGISTROS ===
+    with etapa("validate", filas=len(df)):
+        # Convertir comas a puntos y manejar vacíos
+        for campo in (CSV_LONGITUDE_FIELD, CSV_LATITUDE_FIELD):
+            df[campo] = (
+                df[campo]
+                .astype(str)
+                .str.replace(',', '.')
+                .str.strip()
+                .replace(['', 'nan', 'None'], 0)
+                .astype(float)
+            )
+
+        # Mantener filas aunque alguna coordenada falte (pero al menos una debe estar presente)
+        df = df[~df[[CSV_LONGITUDE_FIELD, CSV_LATITUDE_FIELD]].isnull().all(axis=1)]  # Filtrar solo si AMBAS son nulas
+        print(f"📊 Filas válidas: {len(df)}")
+
+    return publicar_df(gis, df, item_id, column_mapping, dry_run=dry_run, capa_snapshot=capa_snapshot, marca=marca)
+
+def _guardar_snapshot(df, capa_snapshot):
+    """Guarda lo publicado como puntos en GeoParquet (ver utils.snapshot_store)."""
+    import geopandas as gpd
+
+    snapshot = Snapshot(capa_snapshot)
+    try:
+        geometria = gpd.points_from_xy(df[CSV_LONGITUDE_FIELD], df[CSV_LATITUDE_FIELD], crs="EPSG:4326")
+        # Texto como 'string' de pandas: las columnas object con tipos mezclados no van a Parquet
+        texto = {c: "string" for c in df.columns if df[c].dtype == object}
+        snapshot.agregar(gpd.GeoDataFrame(df.astype(texto), geometry=geometria))
+        registrar_snapshot(snapshot)
+    finally:
+        snapshot.descartar()
+
+def publicar_df(gis, df, item_id, column_mapping=None, dry_run=False, capa_snapshot=None, marca=None):
+    """
+    Sincroniza un DataFrame ya limpio con un Feature Layer de puntos.
+    Args:
+        gis: Objeto GIS autenticado (desde utils).
+        df: DataFrame con las coordenadas en CSV_LONGITUDE_FIELD / CSV_LATITUDE_FIELD.
+        item_id: ID del Feature Layer en ArcGIS Online.
+        column_mapping: Mapeo de columnas del CSV a campos de ArcGIS (None si ya vienen renombradas).
+        dry_run: Si es True, solo se informa lo que cambiaría en la capa (sin editarla).
+        capa_snapshot: Nombre con el que se guarda el snapshot de lo publicado (None para no guardarlo).
+        marca: MarcaAgua de la pestaña. En modo incremental df trae solo las filas nuevas
+            y se publican altas y bajas sin consultar la capa.
+    Returns:
+        True si la capa quedó sincronizada.
+    """
+    from utils.feature_coercion import construir_features
+
+    # === 3. OBTENER FEATURE LAYER DE ARCGIS ===
+    arcgis_layer = obtener_capa(gis, item_id)
+    if arcgis_layer is None:
+        print(f"❌ No se encontró Feature Layer ID: {item_id} (o el ítem no tiene capas)")
+        return False
+
+    # Esquema cacheado en data/esquemas: las properties se piden solo cuando vence la caché
+    esquema = obtener_esquema(arcgis_layer, item_id)
+    print(f"🎯 Feature Layer obtenido: {esquema.name}")
+
+    # === 4. PREPARAR NUEVOS DATOS PARA ARCGIS ===
+    # Plan de conversión compilado una vez por esquema: renombre, tipo y longitud de cada columna.
+    # Las columnas sin campo en ArcGIS se descartan (con un aviso por proceso).
+    # La huella de cada fila (carga incremental) viaja con el df pero no es un campo de la capa
+    conservar = (CSV_LONGITUDE_FIELD, CSV_LATITUDE_FIELD, COLUMNA_HUELLA)
+    plan = compilar_mapeo(column_mapping or {}, esquema, list(df.columns), conservar=conservar)
+    df = plan.aplicar(df, conservar=conservar)
+    huellas = df[COLUMNA_HUELLA].tolist() if COLUMNA_HUELLA in df.columns else []
+    df = df.drop(columns=COLUMNA_HUELLA, errors="ignore")
+    with etapa("transform", filas=len(df)):
+        features_to_add_to_arcgis = construir_features(
+            df, plan.tipos, plan.longitudes,
+            campo_x=CSV_LONGITUDE_FIELD, campo_y=CSV_LATITUDE_FIELD
+        )
 
-df[csv_latitude_field] = (
-    df[csv_latitude_field]
-    .astype(str)
-    .str.replace(',', '.')
-    .str.strip()
-    .replace(['', 'nan', 'None'],0)
-    .astype(float)
-)
+    # === 5. SINCRONIZAR FEATURES CON ARCGIS (SOLO DIFERENCIAS) ===
+    incremental = marca is not None and marca.modo == "incremental"
+    if not features_to_add_to_arcgis and not incremental:
+        print("⚠️ No hay features válidos para publicar.")
+        return False
 
-# Mantener filas aunque alguna coordenada falte (pero al menos una debe estar presente)
-df = df[~df[[csv_longitude_field, csv_latitude_field]].isnull().all(axis=1)]  # Filtrar solo si AMBAS son nulas
-print(f"📊 Filas válidas: {len(df)}")
-
-# === 3. GEODATAFRAME ===
-geometry = [
-    Point(xy) if not np.isnan(xy[0]) and not np.isnan(xy[1]) else None
-    for xy in zip(df[csv_longitude_field], df[csv_latitude_field])
-]
-gdf = gpd.GeoDataFrame(df, geometry=geometry, crs="EPSG:4326")
-
-# === 4. OBTENER FEATURE LAYER DE ARCGIS ===
-layer_item = gis.content.get(item_id)
-if not layer_item:
-    print(f"❌ No se encontró Feature Layer ID: {item_id}")
-    exit()
-if not layer_item.layers:
-    print(f"❌ Ítem {item_id} no tiene capas.")
-    exit()
-
-arcgis_layer = layer_item.layers[0]
-print(f"🎯 Feature Layer obtenido: {arcgis_layer.properties.name}")
-layer_properties = arcgis_layer.properties
-arcgis_field_names = [field['name'] for field in layer_properties.fields]
-print(f"📜 Campos existentes en ArcGIS: {arcgis_field_names}")
-
-# === 5. ELIMINAR DATOS EXISTENTES DE LA CAPA ARCGIS ===
-print("🗑️ Intentando eliminar datos existentes de ArcGIS...")
-try:
-    if "Delete" in layer_properties.capabilities:
-        delete_result = arcgis_layer.delete_features(where="1=1")
-        if delete_result and delete_result.get('success', False):
-            print(f"🧹 Datos anteriores eliminados: {delete_result.get('deleteResults', 'OK')}")
+    try:
+        if incremental:
+            # Solo altas de las filas nuevas y bajas por OBJECTID de las que desaparecieron
+            reporte = marca.publicar(
+                arcgis_layer, features_to_add_to_arcgis, huellas, dry_run=dry_run, opciones_subida=OPCIONES_SUBIDA
+            )
         else:
-            print(f"⚠️ No se pudieron eliminar datos o respuesta no exitosa: {delete_result}")
-    else:
-        print("⚠️ Capa ArcGIS no soporta eliminación o sin permisos.")
-except Exception as e_delete:
-    print(f"❌ Error al eliminar datos: {e_delete}")
-
-# === 6. PREPARAR Y CARGAR NUEVOS DATOS A ARCGIS ===
-features_to_add_to_arcgis = []
-
-# Obtener los tipos de datos de los campos de ArcGIS para la conversión
-arcgis_field_types = {field['name']: field['type'] for field in layer_properties.fields}
-arcgis_field_lengths = {field['name']: field.get('length') for field in layer_properties.fields if field.get('length') is not None}
-
-# Incluir TODOS los campos del DataFrame (ahora con los nombres correctos de ArcGIS)
-csv_fields = [col for col in df.columns if col not in [csv_longitude_field, csv_latitude_field]]
-
-for index, row in gdf.iterrows():
-    attributes = {}
-    for field in csv_fields:  # Incluir todos los campos del DataFrame (renombrados)
-        value = row[field]
-        if pd.notna(value):
-            # Convertir tipos de datos según corresponda
-            if field in arcgis_field_types:
-                field_type = arcgis_field_types[field]
-                try:
-                    if field_type in ['esriFieldTypeInteger', 'esriFieldTypeSmallInteger']:
-                        attributes[field] = int(float(value)) if value not in ['', ' '] else None
-                    elif field_type in ['esriFieldTypeDouble', 'esriFieldTypeSingle']:
-                        attributes[field] = float(value) if value not in ['', ' '] else None
-                    elif field_type == 'esriFieldTypeString':
-                        attributes[field] = str(value)[:arcgis_field_lengths.get(field, 255)]
-                    elif field_type == 'esriFieldTypeDate':
-                        # Intentar convertir a timestamp (milisegundos desde epoch)
-                        if isinstance(value, (int, float)):
-                            attributes[field] = int(value)
-                        else:
-                            try:
-                                # Probar diferentes formatos de fecha
-                                date_obj = pd.to_datetime(value, errors='raise')
-                                attributes[field] = int(date_obj.timestamp() * 1000)
-                            except ValueError:
-                                attributes[field] = None # Si no se puede parsear, asignar None
-                    else:
-                        attributes[field] = value
-                except:
-                    attributes[field] = None
-            else:
-                # Si el campo no existe en ArcGIS, se ignora (opcional: imprimir advertencia)
-                pass
-
-    # Manejar geometría (incluso si está vacía)
-    geometry = None
-    if not row.geometry.is_empty:
-        geometry = {'x': row.geometry.x, 'y': row.geometry.y, 'spatialReference': {'wkid': 4326}}
-
-    features_to_add_to_arcgis.append({'attributes': attributes, 'geometry': geometry})
-
-# === 7. CARGAR FEATURES A ARCGIS POR LOTES ===
-if not features_to_add_to_arcgis:
-    print("⚠️ No hay features válidos para agregar.")
-else:
-    chunk_size = 100  # Reducir tamaño de lote para evitar timeouts
-    total_added = 0
-    total_failed = 0
-
-    for i in range(0, len(features_to_add_to_arcgis), chunk_size):
-        feature_chunk = features_to_add_to_arcgis[i:i + chunk_size]
-        print(f"📦 Enviando lote {i//chunk_size + 1} ({len(feature_chunk)} features)...")
-
-        try:
-            add_results = arcgis_layer.edit_features(adds=feature_chunk)
-            if not add_results.get('addResults'):
-                print(f"❌ Error en el lote: Respuesta inválida de ArcGIS.")
-                total_failed += len(feature_chunk)
-                continue
-
-            # Contar éxitos y errores
-            succeeded = sum(1 for res in add_results['addResults'] if res.get('success', False))
-            failed = len(feature_chunk) - succeeded
-            total_added += succeeded
-            total_failed += failed
-
-            # Mostrar errores detallados
-            for res in add_results['addResults']:
-                if not res.get('success'):
-                    print(f"  ⚠️ Error en feature ID {res.get('objectId', '?')}: {res.get('error', 'Sin detalles')}")
-
-        except Exception as e:
-            print(f"🔥 Error crítico en el lote: {str(e)}")
-            total_failed += len(feature_chunk)
-
-    print(f"✅ Total cargado: {total_added} | ❌ Fallidos: {total_failed}")
+            # Con marca de agua se aprenden los OBJECTID para poder borrar por OID en las cargas incrementales
+            reporte = sincronizar_capa(
+                arcgis_layer, features_to_add_to_arcgis, dry_run=dry_run, opciones_subida=OPCIONES_SUBIDA, esquema=esquema,
+                con_oids=marca is not None,
+            )
+        print(f"✅ Altas: {reporte['adds']} | ✏️ Cambios: {reporte['updates']} | 🗑️ Bajas: {reporte['deletes']} | = Sin cambios: {reporte['sin_cambios']}")
+        if not reporte['exito']:
+            print("⚠️ Algunas ediciones fueron rechazadas por ArcGIS.")
+            # Puede ser un cambio de esquema dentro del TTL: la próxima ejecución lo vuelve a pedir
+            invalidar_esquema(item_id)
+        elif not dry_run:
+            if marca is not None:
+                marca.confirmar(huellas, reporte.get("oids"))
+            # En modo incremental df es solo el delta: el snapshot lo guardan las cargas completas
+            if capa_snapshot and not incremental:
+                _guardar_snapshot(df, capa_snapshot)
+        return reporte['exito']
+    except Exception as e:
+        print(f"🔥 Error crítico sincronizando la capa: {str(e)}")
+        return False
 
+def _actualizar_pestana(gis, descargar, item_id, column_mapping, dry_run, capa_snapshot, completo=False):
+    """
+    Descarga una pestaña y, si cambió, la sincroniza y confirma la caché de descarga.
+    Con CARGA_INCREMENTAL solo se procesan las filas nuevas; completo=True fuerza la
+    recarga de la pestaña entera (y rehace la marca de agua).
+    """
+    marca = MarcaAgua(capa_snapshot, completo=completo) if CARGA_INCREMENTAL else None
+    ruta_csv, descarga = descargar(marca)
+    if descarga is None:
+        return False
+    if ruta_csv is None:
+        # Sin cambios: nada que publicar. Si cambió el archivo pero no las filas, se confirma la descarga
+        if not descarga.sin_cambios and not dry_run:
+            descarga.confirmar()
+        descarga.descartar()
+        return True
+    try:
+        ok = cargar_csv_a_capa(
+            gis, ruta_csv, item_id, column_mapping, dry_run=dry_run, capa_snapshot=capa_snapshot, marca=marca
+        )
+        if ok and not dry_run:
+            descarga.confirmar()
+        return ok
+    finally:
+        descarga.descartar()
+
+def _republicar_pestana(gis, capa_snapshot, item_id, id_snapshot, dry_run):
+    """Publica un snapshot guardado de una pestaña sin descargar la hoja."""
+    import pandas as pd
+
+    entrada = buscar_snapshot(capa_snapshot, id_snapshot)
+    if entrada is None:
+        print(f"❌ No hay snapshot '{id_snapshot}' de {capa_snapshot}")
+        return False
+    marca = MarcaAgua(capa_snapshot) if CARGA_INCREMENTAL else None
+    if marca is not None and not marca.snapshot_vigente(entrada):
+        # Las cargas incrementales no guardan snapshot: el último es anterior a lo que hay en la capa
+        if id_snapshot in (None, "ultimo"):
+            print(
+                f"❌ El último snapshot de {capa_snapshot} ({entrada['fecha']}) es anterior a la carga incremental "
+                f"del {marca.ultima_incremental}: republicarlo revertiría esas filas. "
+                f"Haga una carga completa para tener un snapshot al día o indique el ID explícitamente."
+            )
+            return False
+        print(f"⚠️ El snapshot {entrada['id']} es anterior a la carga incremental del {marca.ultima_incremental}: "
+              f"se revierten las filas publicadas desde entonces.")
+    print(f"⏪ Republicando snapshot {capa_snapshot}/{entrada['id']} ({entrada['filas']} filas)")
+    df = pd.DataFrame(leer_snapshot(entrada).drop(columns="geometry")).astype(object)
+    ok = publicar_df(gis, df.where(df.notna(), None), item_id, dry_run=dry_run)
+    if ok and marca is not None and not dry_run:
+        # La capa ya no corresponde a la marca: la próxima ejecución recarga la pestaña completa
+        marca.invalidar()
+    return ok
+
+def _ids_por_pestana(desde_snapshot):
+    """
+    Separa desde_snapshot en (id pestaña 3, id Aumentos). Cada pestaña tiene sus propios
+    snapshots, así que un ID explícito solo existe en una de ellas: se aceptan 'ultimo'
+    (el más reciente de cada una) o los dos IDs separados por coma.
+    """
+    if desde_snapshot == "ultimo":
+        return "ultimo", "ultimo"
+    ids = [i.strip() for i in str(desde_snapshot).split(",")]
+    if len(ids) != 2 or not all(ids):
+        raise ValueError(
+            f"desde_snapshot='{desde_snapshot}': use 'ultimo' o un ID por pestaña "
+            f"('ID_{CAPA_SNAPSHOT_PESTAÑA_3},ID_{CAPA_SNAPSHOT_AUMENTOS}')"
+        )
+    return ids[0], ids[1]
 
-print("✅ Script completado.")
+@instrumentar("operacional")
+def procesar_datos_operacionales(gis, dry_run=False, desde_snapshot=None, completo=False):
+    """
+    Actualiza las capas del Dashboard Operacional (pestaña 3 y Aumentos).
+    Args:
+        gis: Objeto GIS autenticado (desde utils).
+        dry_run: Si es True, solo informa los cambios que se harían en las capas.
+        desde_snapshot: Snapshots que se publican en lugar de descargar la hoja: 'ultimo'
+            (el más reciente de cada pestaña) o 'ID_PESTAÑA_3,ID_AUMENTOS', uno por pestaña.
+        completo: Si es True, recarga las pestañas enteras aunque haya marca de agua.
+    Returns:
+        True si ambas capas quedaron actualizadas (o no tenían cambios).
+    """
+    if desde_snapshot:
+        try:
+            id_pestana_3, id_aumentos = _ids_por_pestana(desde_snapshot)
+        except ValueError as e:
+            print(f"❌ {e}")
+            return False
+        ok_pestana_3 = _republicar_pestana(gis, CAPA_SNAPSHOT_PESTAÑA_3, ITEM_ID_PESTAÑA_3, id_pestana_3, dry_run)
+        ok_aumentos = _republicar_pestana(gis, CAPA_SNAPSHOT_AUMENTOS, ITEM_ID_AUMENTOS, id_aumentos, dry_run)
+        return ok_pestana_3 and ok_aumentos
+
+    ok_pestana_3 = _actualizar_pestana(
+        gis, descargar_y_procesar_pestana_csv, ITEM_ID_PESTAÑA_3, COLUMN_MAPPING_PESTAÑA_3, dry_run,
+        CAPA_SNAPSHOT_PESTAÑA_3, completo,
+    )
+    ok_aumentos = _actualizar_pestana(
+        gis, descargar_y_procesar_pestana_nueva, ITEM_ID_AUMENTOS, COLUMN_MAPPING_AUMENTOS, dry_run,
+        CAPA_SNAPSHOT_AUMENTOS, completo,
+    )
+    print(f"[{_ahora()}] ✅ Script completado.")
+    return ok_pestana_3 and ok_aumentos
@@ -0,0 +1,120 @@
+import functools
+import importlib
+import logging
+import threading
+import time
+
+from pipelines.declarative import especificaciones
+from utils.layer_sync import iniciar_registro, reportes_registrados
+
+# --- CONFIGURACIÓN ---
+# Nombre -> (módulo, función, timeout en segundos)
+# Los módulos se importan dentro de cada hilo para no pagar el import de los que no se ejecutan.
+PIPELINES = {
+    "incendios": ("pipelines.fire_susceptibility.main_fire_susceptibility", "procesar_incendios", 600),
+    "mov_masa": ("pipelines.mass_movements.main_mass_movements", "procesar_movimientos_masa", 900),
+    "operacional": ("pipelines.operational.main_operacional", "procesar_datos_operacionales", 600),
+}
+
+_lock = threading.Lock()
+_registrados = None
+
+
+def pipelines_registrados():
+    """
+    PIPELINES más las capas descritas en pipelines/specs (ver pipelines.declarative),
+    como 'procesar:<nombre>': la función del motor con el nombre de la spec como
+    primer argumento. Se arma al primer uso y no al importar, para que las specs
+    se lean (y sus avisos se registren) después de configurar el logging.
+    """
+    global _registrados
+    with _lock:
+        if _registrados is None:
+            registrados = dict(PIPELINES)
+            for nombre, spec in especificaciones().items():
+                if nombre in PIPELINES:
+                    logging.warning(f"⚠️ La spec {spec.ruta} usa el nombre de un pipeline existente ({nombre}); se ignora")
+                    continue
+                registrados[nombre] = ("pipelines.declarative", f"procesar:{nombre}", spec.timeout)
+            _registrados = registrados
+        return _registrados
+
+
+def resolver(modulo, funcion):
+    """Función de un pipeline registrado ('funcion:argumento' fija su primer argumento)."""
+    funcion, _, argumento = funcion.partition(":")
+    procesar = getattr(importlib.import_module(modulo), funcion)
+    return functools.partial(procesar, argumento) if argumento else procesar
+
+
+def _ejecutar(nombre, gis, dry_run, resultado):
+    """Cuerpo de cada hilo: importa el pipeline, lo ejecuta y deja el resultado en 'resultado'."""
+    iniciar_registro()
+    inicio = time.perf_counter()
+    try:
+        modulo, funcion, _ = pipelines_registrados()[nombre]
+        procesar = resolver(modulo, funcion)
+        ok = procesar(gis, dry_run=dry_run)
+        resultado["estado"] = "ok" if ok else "fallo"
+    except Exception as e:
+        logging.error(f"💀 Error crítico en {nombre}: {e}")
+        resultado["estado"] = "error"
+        resultado["error"] = str(e)
+    finally:
+        resultado["duracion_s"] = round(time.perf_counter() - inicio, 2)
+        reportes = reportes_registrados()
+        resultado["filas"] = sum(r["adds"] + r["updates"] + r["sin_cambios"] for r in reportes)
+        resultado["ediciones"] = sum(r["adds"] + r["updates"] + r["deletes"] for r in reportes)
+
+
+def ejecutar_pipelines(gis, nombres=None, dry_run=False, timeouts=None):
+    """
+    Ejecuta varios pipelines a la vez compartiendo una misma sesión GIS.
+    Cada pipeline corre en su propio hilo (descarga y parseo se solapan entre
+    pipelines) y las subidas quedan limitadas por capa en utils.batch_upload.
+    Args:
+        gis: Objeto GIS autenticado (una sola vez para todos).
+        nombres: Pipelines a ejecutar (por defecto todos los registrados).
+        dry_run: Si es True, ningún pipeline edita sus capas.
+        timeouts: dict {nombre: segundos} para sobrescribir los registrados.
+    Returns:
+        Lista de dicts con pipeline, estado, filas, ediciones y duracion_s.
+    """
+    registrados = pipelines_registrados()
+    nombres = nombres or list(registrados)
+    timeouts = timeouts or {}
+    hilos = {}
+    resultados = {}
+
+    inicio = time.perf_counter()
+    for nombre in nombres:
+        timeout = registrados[nombre][2]
+        resultados[nombre] = {"pipeline": nombre, "estado": "en_curso", "filas": 0, "ediciones": 0, "duracion_s": None}
+        # Hilos daemon: un pipeline que supera su timeout no impide terminar el proceso
+        hilo = threading.Thread(
+            target=_ejecutar, name=f"pipeline-{nombre}", daemon=True,
+            args=(nombre, gis, dry_run, resultados[nombre]),
+        )
+        hilo.start()
+        hilos[nombre] = (hilo, timeouts.get(nombre, timeout))
+
+    finales = {}
+    for nombre, (hilo, timeout) in hilos.items():
+        restante = max(0.0, timeout - (time.perf_counter() - inicio))
+        hilo.join(restante)
+        # Copia: un hilo que siguió corriendo tras su timeout no altera el resumen
+        finales[nombre] = dict(resultados[nombre])
+        if hilo.is_alive():
+            logging.error(f"⏰ {nombre} superó su timeout de {timeout}s")
+            finales[nombre]["estado"] = "timeout"
+            finales[nombre]["duracion_s"] = round(time.perf_counter() - inicio, 2)
+
+    total = time.perf_counter() - inicio
+    logging.info("📋 Resumen de ejecución")
+    for r in finales.values():
+        logging.info(
+            f"   {r['pipeline']:<12} {r['estado']:<9} filas={r['filas']:<7} "
+            f"ediciones={r['ediciones']:<7} {r['duracion_s']}s"
+        )
+    logging.info(f"⏱️ Tiempo total: {total:.2f}s")
+    return list(finales.values())
@@ -0,0 +1,299 @@
+import datetime
+import json
+import logging
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from pipelines.declarative import especificaciones
+from pipelines.pipelines import _ejecutar, pipelines_registrados
+from utils.metrics import ultimas_metricas
+
+# --- CONFIGURACIÓN ---
+# Cada pipeline corre cada 'intervalo_s' segundos o según una expresión 'cron'
+# (minuto hora día mes día_semana, hora local), más un retardo aleatorio de hasta
+# 'jitter_s' segundos para no pegarle a las fuentes y a ArcGIS todos a la vez.
+PROGRAMACION = {
+    "incendios": {"intervalo_s": 15 * 60, "jitter_s": 60},
+    "mov_masa": {"cron": "20 6-22 * * *", "jitter_s": 120},
+    "operacional": {"intervalo_s": 5 * 60, "jitter_s": 20},
+}
+# Puerto local del endpoint de estado (GET /estado, GET /salud, POST /ejecutar/<pipeline>)
+PUERTO_ESTADO = 8780
+# Cuánto se confía en el índice de cada capa guardado en memoria (ver layer_sync.recordar_indices)
+INDICE_TTL_S = 6 * 3600
+# Espera máxima del bucle principal (para notar a tiempo las ejecuciones pedidas por HTTP)
+ESPERA_MAX_S = 5
+
+_lock = threading.Lock()
+_programacion = None
+
+
+def programacion_registrada():
+    """
+    PROGRAMACION más la de los pipelines declarativos (sección [programacion] de
+    cada spec). Se arma al primer uso, no al importar el módulo.
+    """
+    global _programacion
+    with _lock:
+        if _programacion is None:
+            registrados = pipelines_registrados()
+            _programacion = dict(PROGRAMACION)
+            _programacion.update({
+                nombre: dict(spec.programacion) for nombre, spec in especificaciones().items()
+                if spec.programacion and nombre in registrados and nombre not in PROGRAMACION
+            })
+        return _programacion
+
+
+def _valores_cron(campo, minimo, maximo):
+    """'*', '*/15', '6-22', '6-22/2', '0,30' -> conjunto de valores permitidos."""
+    valores = set()
+    for parte in campo.split(","):
+        rango, _, paso = parte.partition("/")
+        if rango == "*":
+            inicio, fin = minimo, maximo
+        elif "-" in rango:
+            inicio, fin = (int(v) for v in rango.split("-"))
+        else:
+            inicio = fin = int(rango)
+        if not (minimo <= inicio <= fin <= maximo):
+            raise ValueError(f"Campo cron fuera de rango: {campo}")
+        valores.update(range(inicio, fin + 1, int(paso) if paso else 1))
+    return valores
+
+
+class Cron:
+    """Expresión cron de 5 campos (minuto hora día mes día_semana; domingo = 0 o 7)."""
+
+    def __init__(self, expresion):
+        campos = expresion.split()
+        if len(campos) != 5:
+            raise ValueError(f"Expresión cron inválida (se esperan 5 campos): {expresion}")
+        self.expresion = expresion
+        self.minutos = _valores_cron(campos[0], 0, 59)
+        self.horas = _valores_cron(campos[1], 0, 23)
+        self.dias = _valores_cron(campos[2], 1, 31)
+        self.meses = _valores_cron(campos[3], 1, 12)
+        self.dias_semana = {d % 7 for d in _valores_cron(campos[4], 0, 7)}
+        # Como en cron: si se restringen día del mes y día de la semana, basta con uno
+        self._dia_y_semana = campos[2] != "*" and campos[4] != "*"
+
+    def _coincide_dia(self, fecha):
+        dia = fecha.day in self.dias
+        semana = (fecha.weekday() + 1) % 7 in self.dias_semana
+        return fecha.month in self.meses and ((dia or semana) if self._dia_y_semana else (dia and semana))
+
+    def siguiente(self, desde):
+        """Primer minuto estrictamente posterior a 'desde' (datetime) que cumple la expresión."""
+        inicio = desde.replace(second=0, microsecond=0) + datetime.timedelta(minutes=1)
+        for dias in range(366 * 4 + 1):
+            fecha = inicio.date() + datetime.timedelta(days=dias)
+            if not self._coincide_dia(fecha):
+                continue
+            for hora in sorted(self.horas):
+                for minuto in sorted(self.minutos):
+                    candidato = datetime.datetime.combine(fecha, datetime.time(hora, minuto))
+                    if candidato >= inicio:
+                        return candidato
+        raise ValueError(f"La expresión cron nunca se cumple: {self.expresion}")
+
+
+class Tarea:
+    """Un pipeline programado y el estado de sus ejecuciones."""
+
+    def __init__(self, nombre, intervalo_s=None, cron=None, jitter_s=0, timeout=None):
+        if (intervalo_s is None) == (cron is None):
+            raise ValueError(f"{nombre}: indique 'intervalo_s' o 'cron' (solo uno)")
+        self.nombre = nombre
+        timeout_defecto = pipelines_registrados()[nombre][2]
+        self.timeout = timeout or timeout_defecto
+        self.intervalo_s = intervalo_s
+        self.cron = Cron(cron) if cron else None
+        self.jitter_s = jitter_s
+        self.proxima = None
+        self._base = None
+        self.hilo = None
+        self.resultado = None
+        self.inicio = None
+        self.ultima = None
+        self.ejecuciones = 0
+        self.fallos = 0
+        self.saltadas = 0
+
+    @property
+    def en_curso(self):
+        return self.hilo is not None and self.hilo.is_alive()
+
+    def programar(self, ahora, rng, inmediata=False):
+        """Calcula la próxima ejecución (epoch) a partir de 'ahora'."""
+        if inmediata:
+            base = ahora
+        elif self.cron:
+            base = self.cron.siguiente(datetime.datetime.fromtimestamp(ahora)).timestamp()
+        else:
+            # Ritmo fijo desde la ejecución anterior (sin su jitter), sin acumular atraso
+            base = max(ahora, (self._base or ahora) + self.intervalo_s)
+        self._base = base
+        self.proxima = base + rng.uniform(0, self.jitter_s)
+
+    def como_dict(self):
+        return {
+            "programacion": self.cron.expresion if self.cron else f"cada {self.intervalo_s}s",
+            "en_curso": self.en_curso,
+            "inicio_en_curso": _iso(self.inicio) if self.en_curso else None,
+            "proxima": _iso(self.proxima),
+            "ejecuciones": self.ejecuciones,
+            "fallos": self.fallos,
+            "saltadas": self.saltadas,
+            "ultima": self.ultima,
+        }
+
+
+def _iso(epoch):
+    return datetime.datetime.fromtimestamp(epoch).isoformat(timespec="seconds") if epoch else None
+
+
+class Planificador:
+    """
+    Ejecuta los pipelines en un proceso que no termina: el GIS, los módulos
+    importados, los esquemas y los índices de las capas quedan en memoria entre
+    ejecuciones. Un pipeline nunca se solapa consigo mismo; si le toca mientras
+    sigue corriendo, esa vuelta se salta.
+    """
+
+    def __init__(self, gis, programacion=None, dry_run=False, semilla=None):
+        self.gis = gis
+        self.dry_run = dry_run
+        self.rng = random.Random(semilla)
+        self.tareas = {
+            nombre: Tarea(nombre, **opciones) for nombre, opciones in (programacion or programacion_registrada()).items()
+        }
+        self.inicio = time.time()
+        self._despertar = threading.Event()
+        self._lock = threading.Lock()
+
+    def ejecutar_ahora(self, nombre):
+        """Adelanta la próxima ejecución de un pipeline (p. ej. desde POST /ejecutar/<pipeline>)."""
+        with self._lock:
+            self.tareas[nombre].proxima = time.time()
+        self._despertar.set()
+
+    def estado(self):
+        with self._lock:
+            tareas = {nombre: tarea.como_dict() for nombre, tarea in self.tareas.items()}
+        return {
+            "inicio": _iso(self.inicio),
+            "activo_s": round(time.time() - self.inicio),
+            "dry_run": self.dry_run,
+            "pipelines": tareas,
+            "metricas": ultimas_metricas(),
+        }
+
+    def _lanzar(self, tarea, ahora):
+        tarea.resultado = {"pipeline": tarea.nombre, "estado": "en_curso", "filas": 0, "ediciones": 0, "duracion_s": None}
+        tarea.inicio = ahora
+        tarea.hilo = threading.Thread(
+            target=_ejecutar, name=f"pipeline-{tarea.nombre}", daemon=True,
+            args=(tarea.nombre, self.gis, self.dry_run, tarea.resultado),
+        )
+        tarea.hilo.start()
+        tarea.ejecuciones += 1
+
+    def _revisar(self, tarea, ahora):
+        """Cierra la ejecución terminada de una tarea y avisa si superó su timeout."""
+        if tarea.hilo is None:
+            return
+        if tarea.en_curso:
+            if ahora - tarea.inicio > tarea.timeout and tarea.resultado["estado"] == "en_curso":
+                logging.error(f"⏰ {tarea.nombre} superó su timeout de {tarea.timeout}s; no se relanza hasta que termine")
+                tarea.resultado["estado"] = "timeout"
+            return
+        resultado = dict(tarea.resultado, fin=_iso(ahora))
+        if resultado["estado"] != "ok":
+            tarea.fallos += 1
+        tarea.ultima = resultado
+        tarea.hilo = None
+        logging.info(
+            f"📋 {tarea.nombre}: {resultado['estado']} filas={resultado['filas']} "
+            f"ediciones={resultado['ediciones']} {resultado['duracion_s']}s (próxima {_iso(tarea.proxima)})"
+        )
+
+    def correr(self, detener):
+        """
+        Bucle principal hasta que se active 'detener' (threading.Event).
+        Todas las tareas corren una vez al arrancar y luego según su programación.
+        """
+        ahora = time.time()
+        for tarea in self.tareas.values():
+            tarea.programar(ahora, self.rng, inmediata=True)
+        logging.info(f"🕰️ Planificador iniciado con {', '.join(self.tareas)}")
+
+        while not detener.is_set():
+            ahora = time.time()
+            with self._lock:
+                for tarea in self.tareas.values():
+                    self._revisar(tarea, ahora)
+                    if tarea.proxima > ahora:
+                        continue
+                    if tarea.en_curso:
+                        tarea.saltadas += 1
+                        logging.warning(f"⏭️ {tarea.nombre} sigue en curso: se salta esta vuelta")
+                    else:
+                        self._lanzar(tarea, ahora)
+                    tarea.programar(ahora, self.rng)
+                espera = min(t.proxima for t in self.tareas.values()) - time.time()
+            self._despertar.wait(min(max(espera, 0.1), ESPERA_MAX_S))
+            self._despertar.clear()
+
+    def esperar_en_curso(self, espera_s):
+        """Al apagar: espera hasta espera_s a que terminen las ejecuciones en curso."""
+        limite = time.time() + espera_s
+        for tarea in self.tareas.values():
+            if tarea.en_curso:
+                logging.info(f"⏳ Esperando a que termine {tarea.nombre}...")
+                tarea.hilo.join(max(0.0, limite - time.time()))
+
+
+class _ManejadorEstado(BaseHTTPRequestHandler):
+    def log_message(self, formato, *args):
+        logging.debug("estado: " + formato % args)
+
+    def _responder(self, cuerpo, estado=200):
+        datos = json.dumps(cuerpo, ensure_ascii=False, default=str).encode("utf-8")
+        self.send_response(estado)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(datos)))
+        self.end_headers()
+        self.wfile.write(datos)
+
+    def do_GET(self):
+        if self.path.rstrip("/") in ("", "/estado"):
+            self._responder(self.server.planificador.estado())
+        elif self.path == "/salud":
+            self._responder({"ok": True})
+        else:
+            self._responder({"error": "Ruta desconocida"}, 404)
+
+    def do_POST(self):
+        nombre = self.path.rstrip("/").rsplit("/", 1)[-1]
+        if not self.path.startswith("/ejecutar/") or nombre not in self.server.planificador.tareas:
+            self._responder({"error": "Pipeline desconocido"}, 404)
+            return
+        self.server.planificador.ejecutar_ahora(nombre)
+        self._responder({"pipeline": nombre, "programado": True}, 202)
+
+
+def servir_estado(planificador, puerto=PUERTO_ESTADO):
+    """
+    Levanta el endpoint de estado en 127.0.0.1:puerto en un hilo aparte.
+    Returns:
+        El servidor (llamar a shutdown() al terminar).
+    """
+    servidor = ThreadingHTTPServer(("127.0.0.1", puerto), _ManejadorEstado)
+    servidor.daemon_threads = True
+    servidor.planificador = planificador
+    threading.Thread(target=servidor.serve_forever, name="estado-http", daemon=True).start()
+    logging.info(f"📡 Estado en http://127.0.0.1:{servidor.server_address[1]}/estado")
+    return servidor
@@ -0,0 +1,53 @@
+import sys
+import os
+import argparse
+import logging
+import signal
+import threading
+
+# Configuración de rutas para encontrar 'pipelines' y 'utils'
+current_dir = os.path.dirname(os.path.abspath(__file__))
+project_root = os.path.dirname(current_dir)
+sys.path.append(project_root)
+
+from utils.arcgis_auth import autenticar_arcgis
+from utils.layer_sync import recordar_indices
+from pipelines.scheduler import INDICE_TTL_S, PUERTO_ESTADO, Planificador, programacion_registrada, servir_estado
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(threadName)s - %(levelname)s - %(message)s')
+    # Después de configurar el logging: aquí se leen las specs y se registran sus avisos
+    registrada = programacion_registrada()
+    parser = argparse.ArgumentParser(
+        description="Modo daemon: un solo proceso que ejecuta cada pipeline según su programación (pipelines/scheduler.py)."
+    )
+    parser.add_argument("pipelines", nargs="*", help=f"Pipelines a programar: {', '.join(registrada)} (por defecto todos)")
+    parser.add_argument("--dry-run", action="store_true", help="Solo informar los cambios, sin editar capas")
+    parser.add_argument("--puerto", type=int, default=PUERTO_ESTADO, help="Puerto local del endpoint de estado")
+    parser.add_argument("--espera-apagado", type=float, default=120, help="Segundos para terminar lo que esté en curso al apagar")
+    args = parser.parse_args()
+    desconocidos = [p for p in args.pipelines if p not in registrada]
+    if desconocidos:
+        parser.error(f"Pipelines desconocidos: {', '.join(desconocidos)}")
+
+    logging.info("🚀 Iniciando daemon de Dashboards")
+    # Una sola sesión GIS para toda la vida del proceso (el token se renueva en segundo plano)
+    gis = autenticar_arcgis(diferido=True)
+    if not gis:
+        logging.error(" Falló la autenticación en ArcGIS")
+        sys.exit(1)
+
+    recordar_indices(INDICE_TTL_S)
+    programacion = {n: registrada[n] for n in (args.pipelines or registrada)}
+    planificador = Planificador(gis, programacion, dry_run=args.dry_run)
+    servidor = servir_estado(planificador, args.puerto)
+
+    detener = threading.Event()
+    for senal in (signal.SIGINT, signal.SIGTERM):
+        signal.signal(senal, lambda *_: detener.set())
+    try:
+        planificador.correr(detener)
+    finally:
+        logging.info("🛑 Apagando daemon")
+        servidor.shutdown()
+        planificador.esperar_en_curso(args.espera_apagado)
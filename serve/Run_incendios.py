@@ -1,4 +1,4 @@
-serve/run_incendios.py
+# serve/run_incendios.py
 import sys
 import os
 import logging
@@ -9,13 +9,14 @@ project_root = os.path.dirname(current_dir)
 sys.path.append(project_root)
 
 from utils.arcgis_auth import autenticar_arcgis
-from pipelines.fire_susceptibility.main_fire_susceptibility import procesar_incendios
-
-logging.basicConfig(level=logging.INFO)
 
 if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
     try:
-        gis = autenticar_arcgis()
+        # El pipeline se importa aquí y el GIS se crea al primer uso:
+        # si el KML no cambió, no se cargan arcgis ni geopandas
+        from pipelines.fire_susceptibility.main_fire_susceptibility import procesar_incendios
+        gis = autenticar_arcgis(diferido=True)
         if gis:
             procesar_incendios(gis)
     except Exception as e:
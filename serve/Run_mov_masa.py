@@ -1,3 +1,5 @@
+import argparse
+import datetime
 import sys
 import os
 import logging
@@ -7,14 +9,25 @@ project_root = os.path.dirname(current_dir)
 sys.path.append(project_root)
 
 from utils.arcgis_auth import autenticar_arcgis
-from pipelines.mass_movements.main_mass_movements import procesar_movimientos_masa
-
-logging.basicConfig(level=logging.INFO)
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Actualiza la capa de Movimientos en Masa.")
+    parser.add_argument("--rellenar", type=datetime.date.fromisoformat, metavar="AAAA-MM-DD",
+                        help="Solo descargar los KML desde esta fecha (histórico en data/mov_masa), sin publicar")
+    parser.add_argument("--hasta", type=datetime.date.fromisoformat, metavar="AAAA-MM-DD", help="Última fecha a rellenar")
+    parser.add_argument("--max-descargas", type=int, default=4)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    if args.rellenar:
+        from pipelines.mass_movements.main_mass_movements import rellenar_historico
+        rellenar_historico(args.rellenar, args.hasta, max_workers=args.max_descargas)
+        sys.exit(0)
     try:
         logging.info("🚀 Ejecutando orquestador de Movimientos en Masa")
-        gis = autenticar_arcgis()
+        # Import del pipeline y creación del GIS diferidos (ver Run_incendios.py)
+        from pipelines.mass_movements.main_mass_movements import procesar_movimientos_masa
+        gis = autenticar_arcgis(diferido=True)
         if gis:
             procesar_movimientos_masa(gis)
     except Exception as e:
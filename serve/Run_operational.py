@@ -1,3 +1,4 @@
+import argparse
 import sys
 import os
 import logging
@@ -10,22 +11,27 @@ sys.path.append(project_root)
 
 # --- 2. IMPORTACIONES ---
 from utils.arcgis_auth import autenticar_arcgis
-# Asegúrate de importar la función correcta que definiste en pipelines
-from pipelines.operational.main_operacional import procesar_datos_operacionales 
-
-# Configuración básica de logs (Buena práctica en Ciencia de Datos)
-logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Actualiza las capas del Dashboard Operacional.")
+    parser.add_argument("--completo", action="store_true", help="Recargar las pestañas enteras (ignora la marca de agua)")
+    parser.add_argument("--dry-run", action="store_true", help="Solo informar los cambios, sin editar capas")
+    args = parser.parse_args()
+
+    # Configuración básica de logs (Buena práctica en Ciencia de Datos)
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
     logging.info("🚀 Iniciando ejecución del Dashboard Operacional")
     
     try:
+        # El pipeline se importa aquí y el GIS se crea al primer uso (ver Run_incendios.py)
+        from pipelines.operational.main_operacional import procesar_datos_operacionales
+
         # 1. Autenticar (Centralizado)
-        gis = autenticar_arcgis()
+        gis = autenticar_arcgis(diferido=True)
         
         # 2. Ejecutar Lógica (Modularizada)
         if gis:
-            procesar_datos_operacionales(gis)
+            procesar_datos_operacionales(gis, dry_run=args.dry_run, completo=args.completo)
             logging.info("✅ Proceso finalizado exitosamente")
         else:
             logging.error(" Falló la autenticación en ArcGIS")
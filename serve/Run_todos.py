@@ -0,0 +1,39 @@
+import sys
+import os
+import argparse
+import logging
+
+# Configuración de rutas para encontrar 'pipelines' y 'utils'
+current_dir = os.path.dirname(os.path.abspath(__file__))
+project_root = os.path.dirname(current_dir)
+sys.path.append(project_root)
+
+from utils.arcgis_auth import autenticar_arcgis
+from pipelines.pipelines import ejecutar_pipelines, pipelines_registrados
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(threadName)s - %(levelname)s - %(message)s')
+    # Después de configurar el logging: aquí se leen las specs y se registran sus avisos
+    registrados = pipelines_registrados()
+    parser = argparse.ArgumentParser(description="Ejecuta los pipelines de dashboards en paralelo con una sola sesión GIS.")
+    parser.add_argument("pipelines", nargs="*", help=f"Pipelines a ejecutar: {', '.join(registrados)} (por defecto todos)")
+    parser.add_argument("--dry-run", action="store_true", help="Solo informar los cambios, sin editar capas")
+    args = parser.parse_args()
+    desconocidos = [p for p in args.pipelines if p not in registrados]
+    if desconocidos:
+        parser.error(f"Pipelines desconocidos: {', '.join(desconocidos)}")
+
+    try:
+        logging.info("🚀 Ejecutando orquestador de Dashboards")
+        # 1. Autenticar una sola vez para todos los pipelines (el GIS se crea al primer uso)
+        gis = autenticar_arcgis(diferido=True)
+        if not gis:
+            logging.error(" Falló la autenticación en ArcGIS")
+            sys.exit(1)
+
+        # 2. Ejecutar pipelines en paralelo
+        resultados = ejecutar_pipelines(gis, args.pipelines, dry_run=args.dry_run)
+        sys.exit(0 if all(r["estado"] == "ok" for r in resultados) else 1)
+    except Exception as e:
+        logging.error(f"💀 Error crítico en el orquestador: {e}")
+        sys.exit(1)
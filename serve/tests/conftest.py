@@ -0,0 +1,8 @@
+# serve/tests/conftest.py
+import os
+import sys
+
+# Configuración de rutas para encontrar 'pipelines' y 'utils'
+current_dir = os.path.dirname(os.path.abspath(__file__))
+project_root = os.path.dirname(os.path.dirname(current_dir))
+sys.path.append(project_root)
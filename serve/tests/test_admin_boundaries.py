@@ -0,0 +1,39 @@
+# serve/tests/test_admin_boundaries.py
+import geopandas as gpd
+from shapely.geometry import Point, box
+
+from utils import admin_boundaries
+from utils.admin_boundaries import ReferenciaLimites
+
+
+def _referencia(tmp_path):
+    gdf = gpd.GeoDataFrame(
+        {"Municipio": ["Medellín", "Bello"]}, geometry=[box(0, 0, 1, 1), box(1, 0, 2, 1)], crs=4326
+    )
+    gdf.to_parquet(tmp_path / "municipios.parquet", index=False)
+    admin_boundaries._referencia = None
+    return admin_boundaries.cargar_referencia(str(tmp_path))
+
+
+def test_uniones_de_varios_procesos_no_se_pisan(tmp_path, monkeypatch):
+    monkeypatch.setattr(admin_boundaries, "_referencia", None)
+    base = _referencia(tmp_path)
+    # Dos "procesos" con su propia copia en memoria, como los del pool de transformación
+    uno = ReferenciaLimites(base.capas, base.firma, str(tmp_path))
+    otro = ReferenciaLimites(base.capas, base.firma, str(tmp_path))
+    assert uno.unir([Point(0.5, 0.5)]) == {"Municipio": ["Medellín"]}
+    assert otro.unir([Point(1.5, 0.5)]) == {"Municipio": ["Bello"]}
+    uno.guardar()
+    otro.guardar()
+
+    nueva = ReferenciaLimites(base.capas, base.firma, str(tmp_path))
+    assert sorted(v for v, in nueva.uniones.values()) == ["Bello", "Medellín"]
+
+
+def test_uniones_de_otros_limites_se_descartan(tmp_path, monkeypatch):
+    monkeypatch.setattr(admin_boundaries, "_referencia", None)
+    base = _referencia(tmp_path)
+    base.unir([Point(0.5, 0.5)])
+    base.guardar()
+    assert ReferenciaLimites(base.capas, "otra_firma", str(tmp_path)).uniones == {}
+    assert ReferenciaLimites(base.capas, base.firma, str(tmp_path)).uniones == {}
@@ -0,0 +1,118 @@
+# serve/tests/test_arcgis_auth.py
+import time
+
+import pytest
+
+from utils.arcgis_auth import SesionArcGIS
+from utils.mock_feature_server import servidor_mock
+
+
+@pytest.fixture
+def servidor():
+    with servidor_mock() as servidor:
+        yield servidor
+
+
+def _sesion(servidor, ruta_cache, **opciones):
+    return SesionArcGIS(
+        url=servidor.url, usuario="pruebas", password="secreto", ruta_cache=str(ruta_cache),
+        url_token=f"{servidor.url}/sharing/rest/generateToken",
+        fabrica_gis=lambda url, token=None, usuario=None, password=None: {"url": url, "token": token},
+        **opciones,
+    )
+
+
+def _tokens_generados(servidor):
+    return servidor.estadisticas["peticiones"].get("generateToken", 0)
+
+
+def test_token_vigente_se_reutiliza_en_memoria_y_en_disco(servidor, tmp_path):
+    ruta_cache = tmp_path / "token.json"
+    primera = _sesion(servidor, ruta_cache)
+    token = primera.token()
+    assert primera.token() == token
+
+    # Otra ejecución lee el token guardado en disco sin pedir uno nuevo
+    segunda = _sesion(servidor, ruta_cache)
+    assert segunda.token() == token
+    assert _tokens_generados(servidor) == 1
+
+
+def test_token_por_vencer_se_renueva(servidor, tmp_path):
+    ruta_cache = tmp_path / "token.json"
+    # Con 1 minuto de vida y 59.5 s de margen, el token queda "por vencer" casi de inmediato
+    sesion = _sesion(servidor, ruta_cache, expiracion_min=1, margen_s=59.5)
+    token = sesion.token()
+    time.sleep(0.6)
+
+    assert sesion.token() != token
+    assert _tokens_generados(servidor) == 2
+
+
+def test_renovacion_en_segundo_plano(servidor, tmp_path):
+    sesion = _sesion(servidor, tmp_path / "token.json", expiracion_min=1, margen_s=59)
+    token = sesion.token()
+    sesion.iniciar_renovacion()
+    try:
+        limite = time.time() + 5
+        # El servidor cuenta la petición antes de que la sesión guarde el token: se espera al token
+        while sesion._token == token and time.time() < limite:
+            time.sleep(0.1)
+    finally:
+        sesion.detener()
+
+    assert _tokens_generados(servidor) >= 2
+    assert sesion._token != token
+
+
+class _Conexion:
+    def __init__(self, token):
+        self._token = token
+
+
+class _GIS:
+    def __init__(self, url, token=None, usuario=None, password=None):
+        self._con = _Conexion(token)
+
+
+def test_renovacion_llega_al_gis_en_uso(servidor, tmp_path):
+    sesion = _sesion(servidor, tmp_path / "token.json")
+    sesion.fabrica_gis = _GIS
+    gis = sesion.gis
+
+    token = sesion.token(forzar=True)
+
+    assert sesion.gis is gis
+    assert gis._con._token == token
+
+
+def test_autenticar_devuelve_el_gis_vigente(servidor, tmp_path, monkeypatch):
+    from utils import arcgis_auth
+
+    sesion = _sesion(servidor, tmp_path / "token.json")
+    sesion.fabrica_gis = _GIS
+    monkeypatch.setattr(arcgis_auth, "_sesion", sesion)
+    gis = arcgis_auth.autenticar_arcgis()
+    sesion.detener()
+
+    sesion.token(forzar=True)
+
+    assert gis._con._token == sesion.token()
+
+
+def test_conexion_privada_de_otra_version_no_se_toca(monkeypatch):
+    import sys
+    from types import SimpleNamespace
+
+    from utils import arcgis_auth
+
+    gis = _GIS("url", token="viejo")
+    monkeypatch.setitem(sys.modules, "arcgis", SimpleNamespace(__version__="1.9.1"))
+    assert not arcgis_auth._actualizar_token(gis, "nuevo")
+    assert gis._con._token == "viejo"
+
+    monkeypatch.setitem(sys.modules, "arcgis", SimpleNamespace(__version__="2.4.0"))
+    # Sin gis._con._session no hay pool que ampliar, pero el token sí se actualiza
+    assert not arcgis_auth._montar_pool(gis)
+    assert arcgis_auth._actualizar_token(gis, "nuevo")
+    assert gis._con._token == "nuevo"
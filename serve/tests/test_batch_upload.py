@@ -0,0 +1,96 @@
+# serve/tests/test_batch_upload.py
+from utils import batch_upload
+from utils.batch_upload import oids_por_hash, subir_por_lotes
+from utils.fake_layer import FakeFeatureLayer
+from utils.layer_sync import CAMPO_HASH
+
+
+class CapaInestable(FakeFeatureLayer):
+    """Pierde las primeras respuestas (timeout) y rechaza las features marcadas (una vez o siempre)."""
+
+    def __init__(self, timeouts=0, rechazar=(), siempre=False, **kwargs):
+        super().__init__(**kwargs)
+        self.timeouts = timeouts
+        self.rechazar = set(rechazar)
+        self.siempre = siempre
+
+    def _agregar(self, feature):
+        nombre = feature["attributes"]["Name"]
+        if nombre in self.rechazar:
+            if not self.siempre:
+                self.rechazar.discard(nombre)
+            return None
+        return super()._agregar(feature)
+
+    def _editar(self, adds, updates, deletes):
+        resultado = super()._editar(adds, updates, deletes)
+        for r in resultado["addResults"]:
+            r["success"] = r["objectId"] is not None
+        return resultado
+
+    def edit_features(self, *args, **kwargs):
+        resultado = super().edit_features(*args, **kwargs)
+        if self.timeouts:
+            self.timeouts -= 1
+            raise TimeoutError("Read timed out")
+        return resultado
+
+
+def _altas(n, con_hash=True):
+    return [
+        {"attributes": {"Name": str(i), **({CAMPO_HASH: f"h{i}"} if con_hash else {})}, "geometry": {"x": 0, "y": 0}}
+        for i in range(n)
+    ]
+
+
+def _nombres(capa):
+    return sorted(int(f["attributes"]["Name"]) for f in capa.features.values())
+
+
+def test_timeout_de_lote_aplicado_no_duplica():
+    capa = CapaInestable(timeouts=1)
+    reporte = subir_por_lotes(capa, _altas(10), tamano_inicial=5, max_workers=1, espera_base=0, latencia_objetivo=0,
+                              con_ids=True, campo_hash=CAMPO_HASH)
+
+    assert _nombres(capa) == list(range(10))
+    assert reporte["exitosos"] == 10 and reporte["fallidos"] == 0
+    assert sorted(reporte["ids"].values()) == sorted(capa.features)
+    # La verificación solo pide los hashes del lote en duda, no la capa entera
+    consultas = [where for llamada, where in (c[:2] for c in capa.llamadas) if llamada == "query"]
+    assert consultas and all(w.startswith(f"{CAMPO_HASH} IN (") for w in consultas)
+
+
+def test_timeout_sin_hash_no_reenvia_altas():
+    capa = CapaInestable(timeouts=1)
+    reporte = subir_por_lotes(capa, _altas(4, con_hash=False), tamano_inicial=4, max_workers=1, espera_base=0)
+
+    assert len(capa.features) == 4
+    assert reporte["fallidos"] == 4
+
+
+def test_features_rechazadas_se_reintentan():
+    capa = CapaInestable(rechazar={"3", "7"})
+    reporte = subir_por_lotes(capa, _altas(10), tamano_inicial=10, max_workers=1, espera_base=0)
+
+    assert _nombres(capa) == list(range(10))
+    assert reporte["exitosos"] == 10 and reporte["reintentos"] == 1
+
+
+def test_feature_siempre_rechazada_se_aisla():
+    capa = CapaInestable(rechazar={"5"}, siempre=True)
+    reporte = subir_por_lotes(capa, _altas(8), tamano_inicial=8, max_workers=1, espera_base=0, reintentos=1)
+
+    assert _nombres(capa) == [0, 1, 2, 3, 4, 6, 7]
+    assert reporte["fallidos"] == 1 and reporte["errores"][0]["item"]["attributes"]["Name"] == "5"
+
+
+def test_busqueda_por_hash_en_consultas_acotadas(monkeypatch):
+    monkeypatch.setattr(batch_upload, "HASHES_POR_CONSULTA", 2)
+    capa = FakeFeatureLayer()
+    for feature in _altas(6) + _altas(1):
+        capa._agregar(feature)
+
+    encontrados = oids_por_hash(capa, CAMPO_HASH, "OBJECTID", ["h0", "h2", "h4", "h5", "h9"])
+
+    assert encontrados == {"h0": [1, 7], "h2": [3], "h4": [5], "h5": [6]}
+    assert [c[0] for c in capa.llamadas] == ["query"] * 3
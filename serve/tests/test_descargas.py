@@ -0,0 +1,150 @@
+# serve/tests/test_descargas.py
+import hashlib
+import json
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+import requests
+
+from utils import fetch_cache
+from utils.mock_file_server import ConfigArchivos, servidor_archivos
+from utils.resumable_download import descargar_reanudable
+
+CONTENIDO = bytes(range(256)) * 2048  # 512 KB
+RELATIVA = "modelos/20250519/AM/mapa.tif"
+
+
+@pytest.fixture
+def directorio(tmp_path):
+    ruta = tmp_path / "siata" / RELATIVA
+    ruta.parent.mkdir(parents=True)
+    ruta.write_bytes(CONTENIDO)
+    return tmp_path / "siata"
+
+
+@pytest.fixture
+def cache(tmp_path, monkeypatch):
+    carpeta = tmp_path / "fetch_cache"
+    monkeypatch.setattr(fetch_cache, "CACHE_DIR", str(carpeta))
+    monkeypatch.setattr(fetch_cache, "INDEX_PATH", str(carpeta / "index.json"))
+    return carpeta
+
+
+def test_descarga_cortada_se_reanuda_con_range(directorio, tmp_path):
+    config = ConfigArchivos(corte_bytes=100_000, cortes_por_archivo=2)
+    destino = tmp_path / "descargas" / "mapa.tif"
+    with servidor_archivos(directorio, config) as servidor:
+        registro = descargar_reanudable(f"{servidor.url}/{RELATIVA}", str(destino), espera_base=0)
+
+    assert destino.read_bytes() == CONTENIDO
+    assert registro["sha256"] == hashlib.sha256(CONTENIDO).hexdigest()
+    assert servidor.estadisticas["cortes"] == 2
+    assert servidor.estadisticas["parciales"] == 2
+    # Reanudar cuesta menos que volver a bajar todo tras cada corte
+    assert servidor.estadisticas["bytes"] < len(CONTENIDO) + 2 * config.corte_bytes
+
+
+def test_parcial_de_otra_ejecucion_se_completa(directorio, tmp_path):
+    destino = tmp_path / "descargas" / "mapa.tif"
+    destino.parent.mkdir(parents=True)
+    (tmp_path / "descargas" / "mapa.tif.part").write_bytes(CONTENIDO[:300_000])
+    with servidor_archivos(directorio) as servidor:
+        url = f"{servidor.url}/{RELATIVA}"
+        (tmp_path / "descargas" / "mapa.tif.part.json").write_text(json.dumps({"url": url}))
+        descargar_reanudable(url, str(destino), espera_base=0)
+
+    assert destino.read_bytes() == CONTENIDO
+    assert servidor.estadisticas["bytes"] == len(CONTENIDO) - 300_000
+    assert not os.path.exists(str(destino) + ".part")
+
+
+def test_archivo_no_publicado_devuelve_none(directorio, tmp_path):
+    with servidor_archivos(directorio) as servidor:
+        assert descargar_reanudable(f"{servidor.url}/no/existe.tif", str(tmp_path / "x.tif"), espera_base=0) is None
+
+
+def test_segunda_descarga_condicional_recibe_304(directorio, cache):
+    with servidor_archivos(directorio) as servidor:
+        url = f"{servidor.url}/{RELATIVA}"
+        primera = fetch_cache.descargar_condicional(url)
+        assert not primera.sin_cambios
+        primera.confirmar()
+
+        segunda = fetch_cache.descargar_condicional(url)
+
+    assert segunda.sin_cambios
+    assert servidor.estadisticas["no_modificados"] == 1
+    with segunda.abrir() as f:
+        assert f.read() == CONTENIDO
+
+
+def test_sin_confirmar_se_vuelve_a_bajar(directorio, cache):
+    with servidor_archivos(directorio) as servidor:
+        url = f"{servidor.url}/{RELATIVA}"
+        fetch_cache.descargar_condicional(url).descartar()
+
+        segunda = fetch_cache.descargar_condicional(url)
+
+    assert not segunda.sin_cambios
+    assert servidor.estadisticas["no_modificados"] == 0
+
+
+def test_copia_borrada_no_envia_validadores(directorio, cache):
+    with servidor_archivos(directorio) as servidor:
+        url = f"{servidor.url}/{RELATIVA}"
+        primera = fetch_cache.descargar_condicional(url)
+        primera.confirmar()
+        os.remove(fetch_cache.leer_indice()[url]["ruta"])
+
+        segunda = fetch_cache.descargar_condicional(url)
+
+    assert not segunda.sin_cambios
+    assert servidor.estadisticas["no_modificados"] == 0
+    with segunda.abrir() as f:
+        assert f.read() == CONTENIDO
+
+
+def test_descargas_simultaneas_de_la_misma_url_no_se_pisan(directorio, cache):
+    # Ancho de banda limitado para que ambas escriban su temporal a la vez
+    with servidor_archivos(directorio, ConfigArchivos(bytes_por_s=2_000_000)) as servidor:
+        url = f"{servidor.url}/{RELATIVA}"
+        with ThreadPoolExecutor(2) as pool:
+            descargas = list(pool.map(lambda _: fetch_cache.descargar_condicional(url), range(2)))
+
+    for descarga in descargas:
+        with descarga.abrir() as f:
+            assert f.read() == CONTENIDO
+        descarga.descartar()
+    assert not [n for n in os.listdir(cache) if n.endswith(".tmp")]
+
+
+def test_descarga_cortada_no_deja_temporal(directorio, cache):
+    with servidor_archivos(directorio, ConfigArchivos(corte_bytes=100_000)) as servidor:
+        with pytest.raises(requests.RequestException):
+            fetch_cache.descargar_condicional(f"{servidor.url}/{RELATIVA}")
+
+    assert os.listdir(cache) == []
+
+
+def test_rellenar_historico_baja_los_dias_publicados(tmp_path, monkeypatch):
+    import datetime
+
+    from pipelines.mass_movements import main_mass_movements as mov_masa
+
+    publicados = {datetime.date(2025, 5, 18): b"<kml>18</kml>", datetime.date(2025, 5, 20): b"<kml>20</kml>"}
+    for fecha, contenido in publicados.items():
+        ruta = tmp_path / "siata" / f"geotecnia/COE_2025/modelos/{fecha:%Y%m%d}/AM/alertas_7d_{fecha:%Y-%m-%d}.kml"
+        ruta.parent.mkdir(parents=True)
+        ruta.write_bytes(contenido)
+    monkeypatch.setattr(mov_masa, "LOCAL_DOWNLOAD_PATH", str(tmp_path / "mov_masa"))
+
+    with servidor_archivos(tmp_path / "siata") as servidor:
+        monkeypatch.setenv("SIATA_BASE_URL", servidor.url)
+        resultados = mov_masa.rellenar_historico(datetime.date(2025, 5, 18), datetime.date(2025, 5, 20), max_workers=2)
+
+    assert resultados[datetime.date(2025, 5, 19)] is None
+    for fecha, contenido in publicados.items():
+        assert resultados[fecha]["sha256"] == hashlib.sha256(contenido).hexdigest()
+        with open(mov_masa.ruta_local_siata(fecha), "rb") as f:
+            assert f.read() == contenido
@@ -0,0 +1,47 @@
+# serve/tests/test_kml_stream.py
+import io
+import logging
+
+from utils.kml_stream import leer_kml_por_lotes
+
+KML = b"""<?xml version="1.0" encoding="UTF-8"?>
+<kml xmlns="http://www.opengis.net/kml/2.2"><Document>
+  <Placemark><name>A</name><Point><coordinates>-70.5,-33.4,0</coordinates></Point></Placemark>
+  <Placemark><name>B</name><LineString><coordinates>-70.1,-33.1 abc,-33.2 -70.3,-33.3</coordinates></LineString></Placemark>
+  <Placemark><name>C</name><Point><coordinates>-70.2,-33.2</coordinates></Point></Placemark>
+</Document></kml>"""
+
+
+def test_coordenada_invalida_se_salta_y_se_cuenta(caplog):
+    with caplog.at_level(logging.INFO):
+        lotes = list(leer_kml_por_lotes(io.BytesIO(KML), tamano_lote=2))
+    nombres = [n for gdf in lotes for n in gdf["Name"]]
+    assert nombres == ["A", "B", "C"]
+    linea = lotes[0].geometry.iloc[1]
+    assert list(linea.coords) == [(-70.1, -33.1), (-70.3, -33.3)]
+    assert "coordenada_invalida" in caplog.text
+
+
+def _kml_incendios(n):
+    placemarks = "".join(
+        f"<Placemark><name>Susc: {i % 3 + 1}</name><Point><coordinates>-75.{i},6.2</coordinates></Point></Placemark>"
+        for i in range(n)
+    )
+    return f'<kml xmlns="http://www.opengis.net/kml/2.2"><Document>{placemarks}</Document></kml>'.encode()
+
+
+def test_procesos_reciben_la_configuracion_y_devuelven_sus_etapas(monkeypatch):
+    from pipelines.fire_susceptibility import main_fire_susceptibility as incendios
+    from utils import kml_stream
+    from utils.metrics import ejecucion
+
+    monkeypatch.setattr(kml_stream, "MIN_FILAS_PARALELO", 1)
+    # Cambio en tiempo de ejecución: los procesos del pool reimportan el módulo y no lo verían
+    monkeypatch.setattr(incendios, "MAPEO_SIMBOLOGIA", {"Susc: 1": 7, "Susc: 2": 8, "Susc: 3": 9})
+    with ejecucion("prueba", escribir=False) as metricas:
+        lotes = list(kml_stream.leer_kml_por_lotes(
+            io.BytesIO(_kml_incendios(6)), tamano_lote=2, transformar=incendios.transformacion(), procesos=2,
+        ))
+    assert [s for gdf in lotes for s in gdf["SymbolID"]] == [7, 8, 9, 7, 8, 9]
+    assert metricas.etapas["transform"].llamadas == 3
+    assert metricas.etapas["validate"].llamadas == 3
@@ -0,0 +1,148 @@
+# serve/tests/test_layer_sync.py
+import pytest
+
+from utils.fake_layer import FakeFeatureLayer
+from utils.layer_sync import CAMPO_HASH, DEFINICION_CAMPO_HASH, agregar_campo_hash, sincronizar_capa
+from utils.mock_feature_server import servidor_mock
+from utils.rest_layer import CapaREST
+
+CAMPOS = [
+    {"name": "Name", "type": "esriFieldTypeString"},
+    {"name": "Categoria", "type": "esriFieldTypeString"},
+]
+CAMPOS_MIGRADOS = CAMPOS + [DEFINICION_CAMPO_HASH]
+
+
+def _feature(nombre, categoria="Alta", x=-75.5):
+    return {
+        "attributes": {"Name": nombre, "Categoria": categoria},
+        "geometry": {"x": x, "y": 6.25, "spatialReference": {"wkid": 4326}},
+    }
+
+
+def _capas(request, campos):
+    if request.param == "memoria":
+        capa = FakeFeatureLayer(fields=list(campos))
+        yield capa, capa
+        return
+    with servidor_mock() as servidor:
+        interna = servidor.capa("pruebas")
+        interna.properties.fields.extend(campos)
+        yield CapaREST(f"{servidor.url_servicios}/pruebas/FeatureServer/0"), interna
+
+
+@pytest.fixture(params=["memoria", "rest"])
+def capa(request):
+    """La misma capa vacía (ya con el campo del hash), en memoria o detrás del FeatureServer de pruebas."""
+    yield from _capas(request, CAMPOS_MIGRADOS)
+
+
+@pytest.fixture(params=["memoria", "rest"])
+def capa_sin_hash(request):
+    """Capa que todavía no tiene el campo del hash."""
+    yield from _capas(request, CAMPOS)
+
+
+def _contenido(interna):
+    return sorted((f["attributes"]["Name"], f["attributes"]["Categoria"]) for f in interna.features.values())
+
+
+def test_primera_sincronizacion_agrega_todo_y_sella_el_hash(capa):
+    layer, interna = capa
+    resultado = sincronizar_capa(layer, [_feature("a"), _feature("b")], campos_clave=["Name"])
+
+    assert resultado == {"adds": 2, "updates": 0, "deletes": 0, "sin_cambios": 0, "exito": True}
+    assert all(f["attributes"].get(CAMPO_HASH) for f in interna.features.values())
+
+
+def test_sin_campo_hash_no_edita_ni_cambia_el_esquema(capa_sin_hash):
+    layer, interna = capa_sin_hash
+    interna.edit_features(adds=[_feature("a")])
+    llamadas = len(interna.llamadas)
+
+    resultado = sincronizar_capa(layer, [_feature("a"), _feature("b")], campos_clave=["Name"])
+
+    assert not resultado["exito"]
+    assert interna.llamadas[llamadas:] == []
+    assert CAMPO_HASH not in [c["name"] for c in interna.properties.fields]
+
+
+def test_migracion_agrega_el_campo_hash(capa_sin_hash):
+    layer, interna = capa_sin_hash
+    assert agregar_campo_hash(layer)
+    assert CAMPO_HASH in [c["name"] for c in interna.properties.fields]
+    assert sincronizar_capa(layer, [_feature("a")], campos_clave=["Name"])["exito"]
+
+
+def test_sin_cambios_no_edita(capa):
+    layer, interna = capa
+    features = [_feature("a"), _feature("b")]
+    sincronizar_capa(layer, features, campos_clave=["Name"])
+    ediciones = len(interna.llamadas)
+
+    resultado = sincronizar_capa(layer, features, campos_clave=["Name"])
+
+    assert resultado == {"adds": 0, "updates": 0, "deletes": 0, "sin_cambios": 2, "exito": True}
+    assert [c for c in interna.llamadas[ediciones:] if c[0] != "query"] == []
+
+
+def test_eco_del_servidor_no_genera_cambios(capa):
+    """Reproyección, redondeo o cambio de tipos en el servidor no cuentan como diferencias."""
+    layer, interna = capa
+    features = [_feature("a"), _feature("b")]
+    sincronizar_capa(layer, features, campos_clave=["Name"])
+    for f in interna.features.values():
+        f["geometry"] = {"x": -8404000.123, "y": 697000.456, "spatialReference": {"wkid": 102100}}
+
+    resultado = sincronizar_capa(layer, features, campos_clave=["Name"])
+
+    assert resultado["sin_cambios"] == 2 and resultado["adds"] == resultado["deletes"] == 0
+
+
+def test_actualiza_y_borra(capa):
+    layer, interna = capa
+    sincronizar_capa(layer, [_feature("a"), _feature("b"), _feature("c")], campos_clave=["Name"])
+    oids = {f["attributes"]["Name"]: oid for oid, f in interna.features.items()}
+
+    resultado = sincronizar_capa(layer, [_feature("a", "Baja"), _feature("b"), _feature("d")], campos_clave=["Name"])
+
+    assert resultado == {"adds": 1, "updates": 1, "deletes": 1, "sin_cambios": 1, "exito": True}
+    assert _contenido(interna) == [("a", "Baja"), ("b", "Alta"), ("d", "Alta")]
+    # La actualización conserva el OBJECTID de la feature
+    assert {f["attributes"]["Name"]: oid for oid, f in interna.features.items()}["a"] == oids["a"]
+
+
+def test_dry_run_no_toca_la_capa(capa):
+    layer, interna = capa
+    resultado = sincronizar_capa(layer, [_feature("a")], campos_clave=["Name"], dry_run=True)
+
+    assert resultado["adds"] == 1
+    assert interna.features == {}
+
+
+def test_sin_clave_sincroniza_por_hash(capa):
+    """Modo de los pipelines KML: sin campo clave, cada feature se identifica por su hash."""
+    layer, interna = capa
+    sincronizar_capa(layer, [_feature("a"), _feature("b"), _feature("c")])
+    oid_a = next(oid for oid, f in interna.features.items() if f["attributes"]["Name"] == "a")
+    llamadas = len(interna.llamadas)
+
+    assert sincronizar_capa(layer, [_feature("c"), _feature("a"), _feature("b")])["sin_cambios"] == 3
+    assert [c for c in interna.llamadas[llamadas:] if c[0] != "query"] == []
+
+    resultado = sincronizar_capa(layer, [_feature("a"), _feature("b", "Baja"), _feature("d")])
+
+    # Una feature que cambia es otra feature: baja de la vieja y alta de la nueva
+    assert resultado == {"adds": 2, "updates": 0, "deletes": 2, "sin_cambios": 1, "exito": True}
+    assert _contenido(interna) == [("a", "Alta"), ("b", "Baja"), ("d", "Alta")]
+    assert oid_a in interna.features
+
+
+def test_sin_clave_features_repetidas_se_conservan(capa):
+    layer, interna = capa
+    sincronizar_capa(layer, [_feature("a"), _feature("a")])
+
+    resultado = sincronizar_capa(layer, [_feature("a")])
+
+    assert resultado["sin_cambios"] == 1 and resultado["deletes"] == 1
+    assert _contenido(interna) == [("a", "Alta")]
@@ -0,0 +1,37 @@
+# serve/tests/test_operacional.py
+from pipelines.operational import main_operacional
+
+# Sin el decorador de métricas, que escribe en output/metricas.jsonl
+procesar = main_operacional.procesar_datos_operacionales.__wrapped__
+
+
+def _republicadas(monkeypatch):
+    llamadas = []
+
+    def republicar(gis, capa_snapshot, item_id, id_snapshot, dry_run):
+        llamadas.append((capa_snapshot, id_snapshot))
+        return True
+
+    monkeypatch.setattr(main_operacional, "_republicar_pestana", republicar)
+    return llamadas
+
+
+def test_snapshot_con_un_id_por_pestana(monkeypatch):
+    llamadas = _republicadas(monkeypatch)
+    assert procesar(None, desde_snapshot="20250101T000000,20250102T000000")
+    assert llamadas == [
+        (main_operacional.CAPA_SNAPSHOT_PESTAÑA_3, "20250101T000000"),
+        (main_operacional.CAPA_SNAPSHOT_AUMENTOS, "20250102T000000"),
+    ]
+
+
+def test_snapshot_ultimo_para_ambas(monkeypatch):
+    llamadas = _republicadas(monkeypatch)
+    assert procesar(None, desde_snapshot="ultimo")
+    assert [i for _, i in llamadas] == ["ultimo", "ultimo"]
+
+
+def test_un_solo_id_explicito_se_rechaza(monkeypatch):
+    llamadas = _republicadas(monkeypatch)
+    assert not procesar(None, desde_snapshot="20250101T000000")
+    assert llamadas == []
@@ -0,0 +1,96 @@
+# serve/tests/test_sheet_watermark.py
+import csv
+
+from utils.fake_layer import FakeFeatureLayer
+from utils.layer_sync import DEFINICION_CAMPO_HASH, sincronizar_capa
+from utils.sheet_watermark import COLUMNA_HUELLA, MarcaAgua
+
+
+def _escribir_hoja(ruta, filas):
+    with open(ruta, "w", encoding="utf-8", newline="") as f:
+        csv.writer(f).writerows([["Nombre", "Valor"], *filas])
+
+
+def _leer_delta(ruta):
+    with open(ruta, encoding="utf-8", newline="") as f:
+        return list(csv.DictReader(f))
+
+
+def _features(filas):
+    return [{"attributes": {"Nombre": f["Nombre"], "Valor": f["Valor"]}, "geometry": {"x": 1.0, "y": 2.0}} for f in filas]
+
+
+def _cargar(tmp_path, capa, filas, completo=False, opciones_subida=None):
+    hoja, delta = tmp_path / "hoja.csv", tmp_path / "delta.csv"
+    _escribir_hoja(hoja, filas)
+    marca = MarcaAgua("pestana", directorio=str(tmp_path / "marcas"), completo=completo)
+    delta_filas = _leer_delta(marca.filtrar_csv(str(hoja), str(delta)))
+    huellas = [f[COLUMNA_HUELLA] for f in delta_filas]
+    if marca.modo == "incremental":
+        reporte = marca.publicar(capa, _features(delta_filas), huellas, opciones_subida=opciones_subida)
+        oids = None
+    else:
+        reporte = sincronizar_capa(capa, _features(delta_filas), con_oids=True)
+        oids = reporte["oids"]
+    # Como main_operacional: la marca solo se confirma si la publicación salió bien
+    if reporte["exito"]:
+        marca.confirmar(huellas, oids)
+    return marca, reporte
+
+
+def test_carga_completa_aprende_los_objectid(tmp_path):
+    capa = FakeFeatureLayer(fields=[DEFINICION_CAMPO_HASH])
+    marca, _ = _cargar(tmp_path, capa, [["a", "1"], ["b", "2"], ["c", "3"]])
+
+    assert marca.modo == "completo"
+    assert sorted(marca.huellas.values()) == sorted(capa.features)
+
+
+def test_fila_borrada_tras_carga_completa_se_borra_por_oid(tmp_path):
+    capa = FakeFeatureLayer(fields=[DEFINICION_CAMPO_HASH])
+    _cargar(tmp_path, capa, [["a", "1"], ["b", "2"], ["c", "3"]])
+
+    marca, reporte = _cargar(tmp_path, capa, [["a", "1"], ["c", "3"], ["d", "4"]])
+
+    assert marca.modo == "incremental"
+    assert reporte["adds"] == 1 and reporte["deletes"] == 1
+    assert sorted(f["attributes"]["Nombre"] for f in capa.features.values()) == ["a", "c", "d"]
+
+
+def test_snapshot_anterior_a_la_carga_incremental_no_esta_vigente(tmp_path):
+    capa = FakeFeatureLayer(fields=[DEFINICION_CAMPO_HASH])
+    marca, _ = _cargar(tmp_path, capa, [["a", "1"]])
+    entrada = {"fecha": "2000-01-01T00:00:00+00:00"}
+    assert marca.snapshot_vigente(entrada)
+
+    marca, _ = _cargar(tmp_path, capa, [["a", "1"], ["b", "2"]])
+
+    assert not marca.snapshot_vigente(entrada)
+    assert MarcaAgua("pestana", directorio=str(tmp_path / "marcas")).ultima_incremental == marca.ultima_incremental
+    marca.invalidar()
+    assert MarcaAgua("pestana", directorio=str(tmp_path / "marcas")).modo == "completo"
+
+
+def test_altas_aplicadas_se_recuerdan_aunque_fallen_las_bajas(tmp_path):
+    capa = FakeFeatureLayer(fields=[DEFINICION_CAMPO_HASH])
+    _cargar(tmp_path, capa, [["x", "1"], ["w", "0"]])
+    editar = capa.edit_features
+
+    def bajas_rechazadas(adds=None, updates=None, deletes=None, **kwargs):
+        if deletes:
+            return {"addResults": [], "updateResults": [],
+                    "deleteResults": [{"objectId": o, "success": False} for o in str(deletes).split(",")]}
+        return editar(adds=adds, updates=updates, **kwargs)
+
+    capa.edit_features = bajas_rechazadas
+    opciones = {"reintentos": 0, "espera_base": 0}
+    for _ in range(2):
+        _, reporte = _cargar(tmp_path, capa, [["x", "1"], ["y", "2"], ["z", "3"]], opciones_subida=opciones)
+        assert not reporte["exito"]
+
+    capa.edit_features = editar
+    marca, reporte = _cargar(tmp_path, capa, [["x", "1"], ["y", "2"], ["z", "3"]], opciones_subida=opciones)
+
+    assert reporte["exito"] and reporte["adds"] == 0 and reporte["deletes"] == 1
+    assert sorted(f["attributes"]["Nombre"] for f in capa.features.values()) == ["x", "y", "z"]
+    assert sorted(marca.huellas.values()) == sorted(capa.features)
@@ -0,0 +1,95 @@
+# serve/tests/test_transactional_publish.py
+import json
+import time
+from types import SimpleNamespace
+
+import pytest
+
+from utils import transactional_publish
+from utils.fake_layer import FakeFeatureLayer
+from utils.layer_sync import CAMPO_HASH, DEFINICION_CAMPO_HASH, sincronizar_capa
+from utils.transactional_publish import publicar_transaccional, reanudar_plan
+
+
+class CapaSinRespuesta(FakeFeatureLayer):
+    """Aplica las primeras ediciones pero 'pierde' la respuesta, como un timeout."""
+
+    def __init__(self, timeouts=1, **kwargs):
+        super().__init__(**kwargs)
+        self.timeouts = timeouts
+
+    def edit_features(self, *args, **kwargs):
+        resultado = super().edit_features(*args, **kwargs)
+        if self.timeouts:
+            self.timeouts -= 1
+            raise TimeoutError("Read timed out")
+        return resultado
+
+
+def _alta(nombre):
+    return {"attributes": {"Name": nombre, CAMPO_HASH: f"h-{nombre}"}, "geometry": {"x": 1.0, "y": 2.0}}
+
+
+@pytest.fixture(autouse=True)
+def sin_esperas(monkeypatch, tmp_path):
+    monkeypatch.setattr(transactional_publish, "time", SimpleNamespace(time=time.time, sleep=lambda s: None))
+    monkeypatch.setattr(transactional_publish, "RUTA_JOURNAL", str(tmp_path / "journal"))
+
+
+def test_timeout_con_bloque_aplicado_no_duplica_altas():
+    capa = CapaSinRespuesta(timeouts=1)
+    resultado = publicar_transaccional(capa, "capa", adds=[_alta("a"), _alta("b")], campo_hash=CAMPO_HASH)
+
+    assert resultado["exito"]
+    assert sorted(f["attributes"]["Name"] for f in capa.features.values()) == ["a", "b"]
+    assert sorted(resultado["ids"].values()) == sorted(capa.features)
+
+
+def test_timeout_sin_hash_no_reenvia_altas():
+    capa = CapaSinRespuesta(timeouts=1)
+    resultado = publicar_transaccional(capa, "capa", adds=[{"attributes": {"Name": "a"}}])
+
+    assert not resultado["exito"]
+    assert len(capa.features) == 1
+
+
+def test_plan_retomado_verifica_el_bloque_sin_anotar(tmp_path):
+    capa = FakeFeatureLayer()
+    altas = [_alta(str(i)) for i in range(4)]
+    # Ejecución anterior: 2 bloques, el primero aplicado en la capa pero sin anotar en el log
+    capa.edit_features(adds=altas[:2])
+    ruta_plan = tmp_path / "journal" / "capa.plan.json"
+    ruta_plan.parent.mkdir(parents=True)
+    ruta_plan.write_text(json.dumps({
+        "nombre": "capa", "id": "x", "creado": time.time(), "campo_hash": CAMPO_HASH, "oid_field": "OBJECTID",
+        "bloques": transactional_publish.partir_en_bloques(altas, [], [], tamano=2),
+    }))
+
+    reporte = reanudar_plan(capa, "capa")
+
+    assert reporte["exito"]
+    assert sorted(f["attributes"]["Name"] for f in capa.features.values()) == ["0", "1", "2", "3"]
+    assert not ruta_plan.exists()
+
+
+def test_plan_viejo_se_descarta_sin_aplicar(tmp_path):
+    capa = FakeFeatureLayer()
+    ruta_plan = tmp_path / "journal" / "capa.plan.json"
+    ruta_plan.parent.mkdir(parents=True)
+    ruta_plan.write_text(json.dumps({
+        "nombre": "capa", "id": "x", "creado": time.time() - 2 * transactional_publish.VIGENCIA_PLAN_S,
+        "bloques": transactional_publish.partir_en_bloques([_alta("a")], [], []),
+    }))
+
+    assert reanudar_plan(capa, "capa") is None
+    assert capa.features == {} and not ruta_plan.exists()
+
+
+def test_sincronizacion_transaccional_tras_timeout():
+    capa = CapaSinRespuesta(timeouts=1, fields=[{"name": "Name", "type": "esriFieldTypeString"}, DEFINICION_CAMPO_HASH])
+    features = [{"attributes": {"Name": n}, "geometry": {"x": 1.0, "y": 2.0}} for n in "abc"]
+
+    resultado = sincronizar_capa(capa, features, campos_clave=["Name"], journal="capa")
+    assert resultado["exito"] and len(capa.features) == 3
+
+    assert sincronizar_capa(capa, features, campos_clave=["Name"], journal="capa")["sin_cambios"] == 3
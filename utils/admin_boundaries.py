@@ -0,0 +1,291 @@
+# utils/admin_boundaries.py
+"""
+Límites administrativos del Valle de Aburrá para completar o validar Municipio,
+Comuna, Barrio y Vereda de las alertas por cruce espacial, en lugar de fiarse
+solo de lo que trae el HTML de cada Placemark.
+
+Las capas de referencia viven en data/limites/<capa>.parquet (GeoParquet, ver
+'importar'). Se cargan una vez por proceso (se recargan si cambia un archivo) y
+se indexan con un STRtree. El cruce es vectorizado: el punto interior de cada
+alerta contra el índice. El resultado se memoriza por hash de la geometría (WKB)
+en data/limites/uniones.sqlite, así las alertas que se repiten en el KML de 7 días
+no se vuelven a cruzar. Cada lote solo inserta sus uniones nuevas, de modo que los
+procesos de utils.parallel_transform escriben en la misma base sin pisarse.
+
+Uso:
+    python -m utils.admin_boundaries importar barrios.geojson barrios_veredas --campo NOMBRE_BAR=Barrio
+    python -m utils.admin_boundaries estado
+"""
+import argparse
+import contextlib
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import sys
+import threading
+import unicodedata
+
+import numpy as np
+import shapely
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+RUTA_LIMITES = os.path.join(ROOT_DIR, "data", "limites")
+# Capas en orden de generalidad: si varias traen el mismo campo, gana la última (la más detallada)
+CAPAS_LIMITES = ("municipios", "barrios_veredas")
+CAMPOS_ADMIN = ("Municipio", "Comuna", "Barrio", "Vereda")
+NOMBRE_UNIONES = "uniones.sqlite"
+# Segundos que un proceso espera si otro está escribiendo en la base de uniones
+ESPERA_BLOQUEO_S = 30
+# Máximo de geometrías memorizadas (las alertas rotan: se descartan las más viejas)
+MAX_UNIONES = 200_000
+
+_lock = threading.Lock()
+_referencia = None
+_avisado = False
+
+
+def _normalizar(valor):
+    """'  MEDELLÍN ' -> 'medellin' (para comparar el HTML con la referencia)."""
+    if valor is None or valor != valor:
+        return ""
+    texto = unicodedata.normalize("NFKD", str(valor)).encode("ascii", "ignore").decode("ascii")
+    return " ".join(texto.casefold().split())
+
+
+def _vacio(valor):
+    return _normalizar(valor) == ""
+
+
+def hash_geometrias(geometrias):
+    """Hash (hex) del WKB de cada geometría; None para las nulas."""
+    wkbs = shapely.to_wkb(np.asarray(geometrias, dtype=object))
+    return [hashlib.blake2b(w, digest_size=12).hexdigest() if w is not None else None for w in wkbs]
+
+
+class ReferenciaLimites:
+    """Capas de límites cargadas, con su STRtree y las uniones ya calculadas."""
+
+    def __init__(self, capas, firma, directorio):
+        # capas: lista de (nombre, STRtree, {campo: arreglo de valores})
+        self.capas = capas
+        self.firma = firma
+        self.ruta_uniones = os.path.join(directorio, NOMBRE_UNIONES)
+        self.uniones = {}
+        self._nuevas = {}
+        self._lock = threading.Lock()
+        with self._conectar() as con, con:
+            # Si los límites cambiaron, las uniones viejas ya no sirven
+            con.execute("DELETE FROM uniones WHERE firma != ?", (firma,))
+            filas = con.execute("SELECT hash, valores FROM uniones ORDER BY rowid").fetchall()
+        self.uniones = {h: json.loads(v) for h, v in filas}
+
+    def _conectar(self):
+        """Conexión nueva por operación (no se hereda entre procesos del pool)."""
+        con = sqlite3.connect(self.ruta_uniones, timeout=ESPERA_BLOQUEO_S)
+        con.execute(
+            "CREATE TABLE IF NOT EXISTS uniones (hash TEXT PRIMARY KEY, firma TEXT NOT NULL, valores TEXT NOT NULL)"
+        )
+        return contextlib.closing(con)
+
+    @property
+    def campos(self):
+        return [c for c in CAMPOS_ADMIN if any(c in valores for _, _, valores in self.capas)]
+
+    def _cruzar(self, geometrias):
+        """Cruce vectorizado: {campo: arreglo de valores} para cada geometría."""
+        puntos = shapely.point_on_surface(geometrias)
+        resultado = {c: np.full(len(geometrias), None, dtype=object) for c in self.campos}
+        for _, arbol, valores in self.capas:
+            entrada, indice = arbol.query(puntos, predicate="intersects")
+            # Un punto en el borde compartido de dos unidades: se queda con la primera
+            entrada, primera = np.unique(entrada, return_index=True)
+            indice = indice[primera]
+            for campo, columna in valores.items():
+                tomados = columna[indice]
+                con_valor = np.array([not _vacio(v) for v in tomados], dtype=bool)
+                resultado[campo][entrada[con_valor]] = tomados[con_valor]
+        return resultado
+
+    def unir(self, geometrias):
+        """
+        Campos administrativos de cada geometría, memorizados por su hash.
+        Returns:
+            dict {campo: lista de valores (None si cae fuera de los límites)}.
+        """
+        geometrias = np.asarray(geometrias, dtype=object)
+        hashes = hash_geometrias(geometrias)
+        with self._lock:
+            pendientes = [i for i, h in enumerate(hashes) if h is not None and h not in self.uniones]
+        if pendientes:
+            # Una misma geometría puede venir repetida dentro del lote: se cruza una vez
+            unicos = list({hashes[i]: i for i in pendientes}.values())
+            cruce = self._cruzar(geometrias[unicos])
+            with self._lock:
+                for j, i in enumerate(unicos):
+                    self.uniones[hashes[i]] = self._nuevas[hashes[i]] = [cruce[c][j] for c in self.campos]
+        campos = self.campos
+        with self._lock:
+            filas = [self.uniones.get(h) if h is not None else None for h in hashes]
+        return {c: [f[k] if f else None for f in filas] for k, c in enumerate(campos)}
+
+    def guardar(self):
+        """
+        Inserta en data/limites/uniones.sqlite solo las uniones calculadas desde el último
+        guardado. Las de otros procesos que ya estén en la base se respetan.
+        """
+        with self._lock:
+            if not self._nuevas:
+                return
+            nuevas, self._nuevas = self._nuevas, {}
+            if len(self.uniones) > MAX_UNIONES:
+                # dict conserva el orden de inserción: se descartan las más viejas
+                sobrantes = list(self.uniones)[: len(self.uniones) - MAX_UNIONES]
+                for h in sobrantes:
+                    del self.uniones[h]
+        filas = [(h, self.firma, json.dumps(v, ensure_ascii=False)) for h, v in nuevas.items()]
+        with self._conectar() as con, con:
+            con.executemany("INSERT OR IGNORE INTO uniones (hash, firma, valores) VALUES (?, ?, ?)", filas)
+            # rowid crece con cada inserción: se descartan las más viejas
+            con.execute(
+                "DELETE FROM uniones WHERE rowid <= (SELECT MAX(rowid) FROM uniones) - ?", (MAX_UNIONES,)
+            )
+
+
+def _archivos(directorio):
+    rutas = [os.path.join(directorio, f"{capa}.parquet") for capa in CAPAS_LIMITES]
+    return [r for r in rutas if os.path.exists(r)]
+
+
+def _firma(rutas):
+    estados = [(os.path.basename(r), os.path.getsize(r), os.stat(r).st_mtime_ns) for r in rutas]
+    return hashlib.sha1(json.dumps(estados).encode("utf-8")).hexdigest()[:16]
+
+
+def cargar_referencia(directorio=None):
+    """
+    Referencia de límites (cargada una vez por proceso; se recarga si cambió algún archivo).
+    Returns:
+        ReferenciaLimites, o None si no hay capas en data/limites.
+    """
+    global _referencia, _avisado
+    directorio = directorio or RUTA_LIMITES
+    rutas = _archivos(directorio) if os.path.isdir(directorio) else []
+    if not rutas:
+        if not _avisado:
+            _avisado = True
+            logging.warning(f"⚠️ No hay límites administrativos en {directorio}: se usan solo los del HTML")
+        return None
+    firma = _firma(rutas)
+    with _lock:
+        if _referencia is not None and _referencia.firma == firma:
+            return _referencia
+
+        import geopandas as gpd
+
+        capas = []
+        for ruta in rutas:
+            gdf = gpd.read_parquet(ruta)
+            if gdf.crs is not None and gdf.crs.to_epsg() != 4326:
+                gdf = gdf.to_crs(4326)
+            gdf = gdf[gdf.geometry.notna() & ~gdf.geometry.is_empty]
+            valores = {c: gdf[c].to_numpy(dtype=object) for c in CAMPOS_ADMIN if c in gdf.columns}
+            capas.append((os.path.basename(ruta)[:-len(".parquet")], shapely.STRtree(gdf.geometry.array), valores))
+        _referencia = ReferenciaLimites(capas, firma, directorio)
+        logging.info(f"🗺️ Límites administrativos cargados: {', '.join(f'{n} ({len(a)})' for n, a, _ in capas)}")
+        return _referencia
+
+
+def completar_administrativos(gdf, modo="completar", directorio=None):
+    """
+    Completa (o valida) Municipio, Comuna, Barrio y Vereda de un lote de alertas con
+    el cruce espacial contra los límites de referencia.
+    Args:
+        gdf: GeoDataFrame en EPSG:4326 (se modifica y se devuelve).
+        modo: 'completar' llena solo los vacíos; 'validar' además reemplaza los
+            valores del HTML que no coinciden con la referencia.
+    Returns:
+        El mismo GeoDataFrame.
+    """
+    referencia = cargar_referencia(directorio)
+    if referencia is None or gdf.empty:
+        return gdf
+    unidos = referencia.unir(gdf.geometry.array)
+    llenados, corregidos = 0, 0
+    for campo, valores in unidos.items():
+        referencia_col = np.array(valores, dtype=object)
+        if campo not in gdf.columns:
+            gdf[campo] = referencia_col
+            llenados += sum(v is not None for v in valores)
+            continue
+        actuales = gdf[campo].to_numpy(dtype=object)
+        con_referencia = np.array([v is not None for v in valores], dtype=bool)
+        vacios = np.array([_vacio(v) for v in actuales], dtype=bool) & con_referencia
+        reemplazar = vacios
+        if modo == "validar":
+            distintos = np.array(
+                [_normalizar(a) != _normalizar(r) for a, r in zip(actuales, valores)], dtype=bool
+            ) & con_referencia & ~vacios
+            corregidos += int(distintos.sum())
+            reemplazar = vacios | distintos
+        llenados += int(vacios.sum())
+        if reemplazar.any():
+            actuales = actuales.copy()
+            actuales[reemplazar] = referencia_col[reemplazar]
+            gdf[campo] = actuales
+    referencia.guardar()
+    if llenados or corregidos:
+        logging.info(f"🗺️ Límites: {llenados} campos completados y {corregidos} corregidos por cruce espacial")
+    return gdf
+
+
+def importar(origen, capa, renombres=None, directorio=None):
+    """
+    Convierte una capa de límites (GeoJSON, GPKG, Shapefile, GeoParquet...) a
+    data/limites/<capa>.parquet en EPSG:4326, solo con los campos administrativos.
+    Args:
+        renombres: {campo de origen: campo administrativo} (p. ej. {'NOMBRE_BAR': 'Barrio'}).
+    """
+    import geopandas as gpd
+
+    gdf = gpd.read_parquet(origen) if origen.endswith(".parquet") else gpd.read_file(origen)
+    gdf = gdf.rename(columns=renombres or {})
+    if gdf.crs is not None and gdf.crs.to_epsg() != 4326:
+        gdf = gdf.to_crs(4326)
+    campos = [c for c in CAMPOS_ADMIN if c in gdf.columns]
+    if not campos:
+        raise ValueError(f"{origen} no tiene ninguno de los campos {CAMPOS_ADMIN} (use renombres)")
+    gdf = gdf[campos + [gdf.geometry.name]]
+    gdf = gdf[gdf.geometry.notna() & shapely.is_valid(gdf.geometry.array)]
+    directorio = directorio or RUTA_LIMITES
+    os.makedirs(directorio, exist_ok=True)
+    gdf.to_parquet(os.path.join(directorio, f"{capa}.parquet"), index=False)
+    logging.info(f"🗺️ {len(gdf)} unidades de {origen} guardadas como {capa} ({', '.join(campos)})")
+    return gdf
+
+
+def main():
+    sys.path.append(ROOT_DIR)
+    parser = argparse.ArgumentParser(description="Límites administrativos de referencia para las alertas.")
+    sub = parser.add_subparsers(dest="comando", required=True)
+    importar_p = sub.add_parser("importar", help="Convierte una capa de límites a data/limites/<capa>.parquet")
+    importar_p.add_argument("origen")
+    importar_p.add_argument("capa", choices=CAPAS_LIMITES)
+    importar_p.add_argument("--campo", action="append", default=[], metavar="ORIGEN=DESTINO")
+    sub.add_parser("estado", help="Capas cargadas y uniones memorizadas")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+    if args.comando == "importar":
+        importar(args.origen, args.capa, dict(c.split("=", 1) for c in args.campo))
+    else:
+        referencia = cargar_referencia()
+        if referencia:
+            for nombre, arbol, valores in referencia.capas:
+                print(f"{nombre:<16} {len(arbol):>6} unidades  campos: {', '.join(valores)}")
+            print(f"{len(referencia.uniones)} geometrías memorizadas (firma {referencia.firma})")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,285 @@
+# utils/arcgis_auth.py
+import json
+import logging
+import os
+import sys
+import threading
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+
+# Ruta del token cacheado (carpeta 'data' en la raíz, ignorada por git)
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+RUTA_TOKEN = os.path.join(ROOT_DIR, "data", "arcgis_token.json")
+
+URL_PORTAL = "https://www.arcgis.com" # O la URL del portal del AMVA
+EXPIRACION_MIN = 120        # Vida pedida para cada token
+MARGEN_RENOVACION_S = 300   # Se renueva cuando faltan menos de 5 minutos
+TAMANO_POOL_HTTP = 16       # Conexiones reutilizables hacia ArcGIS
+# Desde arcgis 2.0 la conexión del GIS (gis._con) usa una requests.Session en _session y guarda
+# el token en _token. Son atributos privados: solo se tocan a partir de esa versión
+VERSION_MIN_CONEXION = (2, 0)
+
+
+def _credenciales():
+    """
+    Maneja la autenticación centralizada.
+    Intenta usar variables de entorno primero por seguridad.
+    """
+    # Idealmente, usa variables de entorno o un archivo config.yaml
+    # Por ahora, para refactorizar rápido, centraliza aquí tus credenciales
+    # PERO NO LAS SUBAS AL GITHUB. Luego te enseño a usar .env
+    usuario = os.getenv("ARCGIS_USER", "unidad.gestion.riesgo")
+    password = os.getenv("ARCGIS_PASS", "SIG_AMVA_2025#")
+    return usuario, password
+
+
+def _crear_gis(url, token=None, usuario=None, password=None):
+    from arcgis.gis import GIS
+
+    if token:
+        return GIS(url, token=token)
+    return GIS(url, usuario, password)
+
+
+def _conexion_compatible(gis, atributo):
+    """
+    Conexión interna del GIS (gis._con) si tiene 'atributo' y la versión de arcgis es
+    al menos VERSION_MIN_CONEXION; si no, None.
+    """
+    version = getattr(sys.modules.get("arcgis"), "__version__", None)
+    if version:
+        try:
+            if tuple(int(p) for p in version.split(".")[:2]) < VERSION_MIN_CONEXION:
+                return None
+        except ValueError:
+            return None
+    conexion = getattr(gis, "_con", None)
+    return conexion if hasattr(conexion, atributo) else None
+
+
+def _montar_pool(gis, tamano=TAMANO_POOL_HTTP):
+    """Amplía el pool de conexiones de la sesión HTTP del GIS para las subidas concurrentes."""
+    sesion = getattr(_conexion_compatible(gis, "_session"), "_session", None)
+    if not isinstance(sesion, requests.Session):
+        version = getattr(sys.modules.get("arcgis"), "__version__", "?")
+        logging.warning(f"⚠️ arcgis {version} no expone gis._con._session: se usa su pool HTTP por defecto")
+        return False
+    adaptador = HTTPAdapter(pool_connections=tamano, pool_maxsize=tamano)
+    sesion.mount("https://", adaptador)
+    sesion.mount("http://", adaptador)
+    return True
+
+
+def _actualizar_token(gis, token):
+    """
+    Cambia el token de un GIS ya creado, para que las capas obtenidas con él (que
+    guardan su conexión) sigan autenticadas tras la renovación.
+    Returns:
+        True si se pudo; False si esta versión de arcgis no lo permite.
+    """
+    conexion = _conexion_compatible(gis, "_token")
+    if conexion is None:
+        return False
+    conexion._token = token
+    # Con token fijo, algunas versiones lo llevan también en el auth de la sesión
+    auth = getattr(getattr(conexion, "_session", None), "auth", None)
+    if hasattr(auth, "token"):
+        auth.token = token
+    return True
+
+
+class SesionArcGIS:
+    """
+    Sesión ArcGIS reutilizable entre ejecuciones y pipelines.
+    El token se guarda en disco con su expiración; mientras siga vigente no se
+    vuelve a iniciar sesión con usuario y contraseña. Un hilo en segundo plano
+    lo renueva antes de que caduque y lo pasa a la conexión del GIS en uso, de modo
+    que las capas ya obtenidas con ese GIS siguen autenticadas.
+    """
+
+    def __init__(self, url=None, usuario=None, password=None, ruta_cache=RUTA_TOKEN,
+                 url_token=None, expiracion_min=EXPIRACION_MIN, margen_s=MARGEN_RENOVACION_S,
+                 fabrica_gis=_crear_gis):
+        usuario_env, password_env = _credenciales()
+        # ARCGIS_URL / ARCGIS_TOKEN_URL permiten apuntar a un portal o endpoint de pruebas
+        self.url = (url or os.getenv("ARCGIS_URL", URL_PORTAL)).rstrip("/")
+        self.usuario = usuario or usuario_env
+        self.password = password or password_env
+        self.ruta_cache = ruta_cache
+        self.url_token = url_token or os.getenv("ARCGIS_TOKEN_URL") or f"{self.url}/sharing/rest/generateToken"
+        self.expiracion_min = expiracion_min
+        self.margen_s = margen_s
+        self.fabrica_gis = fabrica_gis
+        self.http = requests.Session()
+        self.http.mount("https://", HTTPAdapter(pool_connections=4, pool_maxsize=4))
+        self._token = None
+        self._expira = 0.0
+        self._gis = None
+        self._gis_token = None
+        self._lock = threading.RLock()
+        self._detener = threading.Event()
+        self._hilo = None
+
+    # --- Token ---
+    def _leer_cache(self):
+        try:
+            with open(self.ruta_cache, "r", encoding="utf-8") as f:
+                datos = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if datos.get("url") != self.url or datos.get("usuario") != self.usuario:
+            return None
+        return datos
+
+    def _guardar_cache(self):
+        os.makedirs(os.path.dirname(self.ruta_cache), exist_ok=True)
+        tmp = self.ruta_cache + ".tmp"
+        # El token da acceso a la cuenta: solo lectura/escritura para el dueño
+        fd = os.open(tmp, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            json.dump({"url": self.url, "usuario": self.usuario, "token": self._token, "expira": self._expira}, f)
+        os.replace(tmp, self.ruta_cache)
+
+    def _vigente(self):
+        return self._token is not None and time.time() < self._expira - self.margen_s
+
+    def _generar_token(self):
+        """Pide un token nuevo a generateToken con usuario y contraseña."""
+        respuesta = self.http.post(self.url_token, data={
+            "username": self.usuario,
+            "password": self.password,
+            "client": "requestip",
+            "expiration": self.expiracion_min,
+            "f": "json",
+        }, timeout=30)
+        respuesta.raise_for_status()
+        datos = respuesta.json()
+        if "token" not in datos:
+            raise RuntimeError(f"generateToken no devolvió token: {datos.get('error', datos)}")
+        self._token = datos["token"]
+        # 'expires' viene en milisegundos desde epoch
+        self._expira = datos.get("expires", (time.time() + self.expiracion_min * 60) * 1000) / 1000
+        self._guardar_cache()
+        logging.info(f"🔑 Token nuevo generado, válido hasta {time.strftime('%H:%M:%S', time.localtime(self._expira))}")
+
+    def token(self, forzar=False):
+        """Token vigente: en memoria, en disco o recién generado (en ese orden)."""
+        with self._lock:
+            if not forzar and self._vigente():
+                return self._token
+            if not forzar:
+                datos = self._leer_cache()
+                if datos:
+                    self._token, self._expira = datos["token"], datos["expira"]
+                    if self._vigente():
+                        logging.info("♻️ Reutilizando token de ArcGIS cacheado en disco.")
+                        return self._token
+            self._generar_token()
+            return self._token
+
+    # --- GIS ---
+    @property
+    def gis(self):
+        """
+        GIS autenticado con el token vigente. Si el token cambió, se le pasa al GIS
+        existente; solo se recrea si la versión de arcgis no lo permite.
+        """
+        with self._lock:
+            token = self.token()
+            if self._gis is not None and self._gis_token != token and _actualizar_token(self._gis, token):
+                # Mismo GIS con el token nuevo: las capas que ya lo usan siguen funcionando
+                self._gis_token = token
+                logging.info("🔑 Token renovado en la conexión del GIS existente")
+            if self._gis is None or self._gis_token != token:
+                print(f"Iniciando sesión en {self.url} con usuario {self.usuario}...")
+                try:
+                    self._gis = self.fabrica_gis(self.url, token=token)
+                except Exception as e:
+                    # Último recurso: inicio de sesión clásico con usuario y contraseña
+                    logging.warning(f"⚠️ No se pudo usar el token ({e}); iniciando sesión con contraseña.")
+                    self._gis = self.fabrica_gis(self.url, usuario=self.usuario, password=self.password)
+                if self._gis_token is not None:
+                    logging.warning(
+                        "⚠️ No se pudo renovar el token en el GIS existente: se crea otro; las capas "
+                        "obtenidas antes conservan el token anterior"
+                    )
+                self._gis_token = token
+                _montar_pool(self._gis)
+                print("¡Autenticación exitosa!")
+            return self._gis
+
+    # --- Renovación en segundo plano ---
+    def iniciar_renovacion(self):
+        """Arranca un hilo daemon que renueva el token antes de que caduque."""
+        if self._hilo and self._hilo.is_alive():
+            return
+        self._detener.clear()
+        self._hilo = threading.Thread(target=self._renovar, name="arcgis-token", daemon=True)
+        self._hilo.start()
+
+    def detener(self):
+        self._detener.set()
+
+    def _renovar(self):
+        while not self._detener.is_set():
+            with self._lock:
+                espera = max(1.0, self._expira - self.margen_s - time.time()) if self._token else 1.0
+            if self._detener.wait(espera):
+                return
+            try:
+                self.token(forzar=True)
+                with self._lock:
+                    if self._gis is not None:
+                        # Lleva el token nuevo al GIS (y a las capas) que ya está en uso
+                        self.gis
+            except Exception as e:
+                logging.error(f"❌ Error renovando token de ArcGIS: {e}")
+                self._detener.wait(30)
+
+
+class GISDiferido:
+    """
+    Sustituto del GIS que solo lo construye (e importa arcgis) al primer uso.
+    Un pipeline que termina temprano porque su fuente no cambió nunca paga
+    el import de arcgis. Cada acceso usa el GIS vigente de la sesión, así que
+    también sigue al token renovado en segundo plano.
+    """
+
+    def __init__(self, sesion):
+        self._sesion = sesion
+
+    def __getattr__(self, nombre):
+        return getattr(self._sesion.gis, nombre)
+
+
+_sesion = None
+_lock_sesion = threading.Lock()
+
+
+def obtener_sesion():
+    """Sesión compartida por todo el proceso (se crea la primera vez)."""
+    global _sesion
+    with _lock_sesion:
+        if _sesion is None:
+            _sesion = SesionArcGIS()
+        return _sesion
+
+
+def autenticar_arcgis(diferido=False):
+    """
+    Devuelve un GIS autenticado reutilizando el token cacheado si sigue vigente.
+    Siempre es un GISDiferido: cada acceso usa el GIS vigente de la sesión, que
+    recibe el token renovado en segundo plano.
+    Args:
+        diferido: Si es True, valida las credenciales (token) de inmediato pero
+            el GIS real se crea al primer uso; si es False, se crea ya.
+    """
+    sesion = obtener_sesion()
+    if diferido:
+        sesion.token()
+    else:
+        sesion.gis
+    sesion.iniciar_renovacion()
+    return GISDiferido(sesion)
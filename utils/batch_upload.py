@@ -0,0 +1,286 @@
+# utils/batch_upload.py
+import logging
+import random
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from utils.esri_encoder import serializar
+from utils.metrics import registrar_http
+
+# Claves de resultado que devuelve edit_features para cada tipo de edición
+CLAVES_RESULTADO = {"adds": "addResults", "updates": "updateResults", "deletes": "deleteResults"}
+
+# Máximo de lotes en vuelo por capa, compartido entre pipelines que corren a la vez
+MAX_LOTES_POR_CAPA = 4
+# Hashes por consulta al buscar altas sin respuesta (~4 KB de where, dentro del límite de una URL)
+HASHES_POR_CONSULTA = 100
+
+_semaforos_capa = {}
+_lock_semaforos = threading.Lock()
+
+
+def _semaforo_capa(layer):
+    """Semáforo compartido por todas las subidas a una misma capa (clave: URL de la capa)."""
+    clave = getattr(layer, "url", None) or id(layer)
+    with _lock_semaforos:
+        if clave not in _semaforos_capa:
+            _semaforos_capa[clave] = threading.BoundedSemaphore(MAX_LOTES_POR_CAPA)
+        return _semaforos_capa[clave]
+
+
+def _es_timeout(error):
+    """Detecta timeouts sin depender de la librería HTTP concreta."""
+    texto = f"{type(error).__name__} {error}".lower()
+    return "timeout" in texto or "timed out" in texto
+
+
+def _sin_respuesta(error):
+    """Timeout o conexión cortada: la edición pudo aplicarse aunque no llegó la respuesta."""
+    return _es_timeout(error) or "connection" in type(error).__name__.lower()
+
+
+def oids_por_hash(layer, campo_hash, oid_field, hashes):
+    """
+    Busca en la capa las features cuyo campo_hash está en 'hashes' (consultas sin
+    geometría de OID y hash con "campo_hash IN (...)", de HASHES_POR_CONSULTA en
+    HASHES_POR_CONSULTA; solo se usa cuando una edición quedó en duda).
+    Returns:
+        {hash: [OIDs]} ordenados de menor a mayor.
+    """
+    buscados = sorted(set(hashes))
+    encontrados = {}
+    for inicio in range(0, len(buscados), HASHES_POR_CONSULTA):
+        bloque = buscados[inicio:inicio + HASHES_POR_CONSULTA]
+        lista = ",".join("'" + str(h).replace("'", "''") + "'" for h in bloque)
+        consulta = layer.query(
+            where=f"{campo_hash} IN ({lista})", out_fields=f"{oid_field},{campo_hash}", return_geometry=False
+        )
+        registrar_http()
+        bloque = set(bloque)
+        for feature in consulta.features:
+            atributos = feature.attributes if hasattr(feature, "attributes") else feature["attributes"]
+            if atributos.get(campo_hash) in bloque:
+                encontrados.setdefault(atributos[campo_hash], []).append(atributos[oid_field])
+    return {h: sorted(oids) for h, oids in encontrados.items()}
+
+
+class ControlTamanoLote:
+    """
+    Ajusta el tamaño de lote según la latencia y los bytes observados:
+    crece mientras las respuestas son rápidas y se reduce a la mitad ante
+    respuestas lentas, payloads demasiado grandes o timeouts.
+    """
+
+    def __init__(self, inicial=100, minimo=1, maximo=2000, latencia_objetivo=5.0, max_bytes=8_000_000):
+        self.tamano = inicial
+        self.minimo = minimo
+        self.maximo = maximo
+        self.latencia_objetivo = latencia_objetivo
+        self.max_bytes = max_bytes
+        self.bytes_por_feature = None
+        self._lock = threading.Lock()
+
+    def siguiente(self):
+        """Tamaño del próximo lote, limitado también por el tamaño de payload permitido."""
+        with self._lock:
+            tamano = self.tamano
+            if self.bytes_por_feature:
+                tamano = min(tamano, max(self.minimo, int(self.max_bytes / self.bytes_por_feature)))
+            return tamano
+
+    def registrar(self, n, latencia, n_bytes, timeout=False):
+        with self._lock:
+            if n:
+                media = n_bytes / n
+                previo = self.bytes_por_feature
+                self.bytes_por_feature = media if previo is None else 0.8 * previo + 0.2 * media
+            if timeout or latencia > self.latencia_objetivo or n_bytes > self.max_bytes:
+                self.tamano = max(self.minimo, self.tamano // 2)
+            elif latencia < self.latencia_objetivo / 2 and n >= self.tamano:
+                self.tamano = min(self.maximo, int(self.tamano * 1.5) + 1)
+
+
+def _enviar_lote(layer, tipo, lote, espera):
+    """Envía un lote con edit_features y devuelve (resultado, latencia, bytes)."""
+    if espera:
+        time.sleep(espera)
+    if tipo == "deletes":
+        payload = ",".join(str(oid) for oid in lote)
+    else:
+        payload = lote
+    n_bytes = len(serializar(payload)) if tipo != "deletes" else len(payload)
+    with _semaforo_capa(layer):
+        inicio = time.perf_counter()
+        resultado = layer.edit_features(**{tipo: payload})
+        return resultado, time.perf_counter() - inicio, n_bytes
+
+
+def _buscar_aplicadas(layer, lote, espera, campo_hash, oid_field):
+    """
+    Busca en la capa las altas de un lote que se quedó sin respuesta.
+    Returns:
+        {posición en el lote: OID} de las que ya están.
+    """
+    if espera:
+        # Margen para que el servidor termine de procesar la petición que quedó sin respuesta
+        time.sleep(espera)
+    hashes = [f["attributes"][campo_hash] for f in lote]
+    with _semaforo_capa(layer):
+        encontrados = oids_por_hash(layer, campo_hash, oid_field, hashes)
+    aplicadas = {}
+    for i, h in enumerate(hashes):
+        if encontrados.get(h):
+            aplicadas[i] = encontrados[h].pop()
+    return aplicadas
+
+
+def subir_por_lotes(layer, items, tipo="adds", tamano_inicial=100, tamano_min=1, tamano_max=2000,
+                    max_workers=4, reintentos=3, espera_base=1.0, latencia_objetivo=5.0, max_bytes=8_000_000,
+                    con_ids=False, campo_hash=None, oid_field="OBJECTID"):
+    """
+    Envía ediciones a una capa en lotes concurrentes con tamaño adaptativo.
+    Los lotes que fallan (o las features que ArcGIS rechaza una a una) se
+    reintentan con backoff exponencial y, si siguen fallando, se dividen en dos
+    para aislar las features problemáticas.
+    Un lote de altas que se queda sin respuesta (timeout, conexión cortada) pudo
+    aplicarse: antes de reenviarlo se buscan en la capa los hashes de sus altas y
+    solo se reenvían las que no están. Sin campo_hash no se reenvía y cuenta como fallido.
+    Args:
+        layer: FeatureLayer de destino (o cualquier objeto con edit_features).
+        items: Features (adds/updates) u ObjectIDs (deletes).
+        tipo: 'adds', 'updates' o 'deletes'.
+        max_workers: Número máximo de lotes en vuelo a la vez.
+        reintentos: Intentos adicionales por lote antes de dividirlo.
+        espera_base: Segundos de espera base para el backoff.
+        con_ids: Si es True, el reporte incluye 'ids': {posición en items: objectId}
+            de cada edición exitosa (sirve para saber el OID de las altas).
+        campo_hash: Atributo de las altas con su hash (ver layer_sync.CAMPO_HASH).
+        oid_field: Campo OID de la capa (para la verificación por hash).
+    Returns:
+        dict con 'exitosos', 'fallidos', 'lotes', 'reintentos' y 'errores'.
+    """
+    clave = CLAVES_RESULTADO[tipo]
+    control = ControlTamanoLote(tamano_inicial, tamano_min, tamano_max, latencia_objetivo, max_bytes)
+    reporte = {"exitosos": 0, "fallidos": 0, "lotes": 0, "reintentos": 0, "errores": []}
+    items = list(items)
+    if con_ids:
+        reporte["ids"] = {}
+        # Los lotes se dividen y reintentan: la posición de cada item se recupera por identidad
+        posiciones = {id(item): i for i, item in enumerate(items)}
+    if not items:
+        return reporte
+
+    posicion = 0
+    # (lote, intento, espera, verificaciones, error) listos para reenviar; verificaciones > 0:
+    # el lote quedó sin respuesta y antes hay que buscar sus altas en la capa (n-ésimo intento)
+    pendientes = []
+    en_vuelo = {}
+
+    def exito(item, oid):
+        reporte["exitosos"] += 1
+        if con_ids:
+            reporte["ids"][posiciones[id(item)]] = oid
+
+    def descartar(item, error):
+        reporte["fallidos"] += 1
+        reporte["errores"].append({"item": item, "error": str(error)})
+
+    def reencolar(lote, intento, error):
+        """Reintenta el lote, lo divide si sigue fallando o descarta la feature aislada."""
+        if intento < reintentos:
+            reporte["reintentos"] += 1
+            espera = espera_base * (2 ** intento) * (1 + random.random())
+            pendientes.append((lote, intento + 1, espera, 0, None))
+        elif len(lote) > 1:
+            # Dividir el lote para aislar las features que provocan el fallo.
+            # Las mitades no se reintentan: si fallan se vuelven a dividir.
+            mitad = len(lote) // 2
+            logging.warning(f"✂️ Dividiendo lote de {len(lote)} features que sigue fallando: {error}")
+            pendientes.extend([(lote[:mitad], reintentos, 0, 0, None), (lote[mitad:], reintentos, 0, 0, None)])
+        else:
+            descartar(lote[0], error)
+            logging.error(f"❌ Feature aislada y descartada: {error}")
+
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        while posicion < len(items) or pendientes or en_vuelo:
+            # Llenar el pool: primero reintentos, luego lotes nuevos
+            while len(en_vuelo) < max_workers and (pendientes or posicion < len(items)):
+                if pendientes:
+                    lote, intento, espera, verificaciones, error = pendientes.pop(0)
+                else:
+                    tamano = control.siguiente()
+                    lote, intento, espera, verificaciones, error = items[posicion:posicion + tamano], 0, 0, 0, None
+                    posicion += len(lote)
+                if verificaciones:
+                    futuro = pool.submit(_buscar_aplicadas, layer, lote, espera, campo_hash, oid_field)
+                else:
+                    futuro = pool.submit(_enviar_lote, layer, tipo, lote, espera)
+                en_vuelo[futuro] = (lote, intento, verificaciones, error)
+
+            hechos, _ = wait(list(en_vuelo), return_when=FIRST_COMPLETED)
+            for futuro in hechos:
+                lote, intento, verificaciones, error = en_vuelo.pop(futuro)
+                if verificaciones:
+                    try:
+                        aplicadas = futuro.result()
+                    except Exception as e:
+                        registrar_http()
+                        if verificaciones <= reintentos:
+                            espera = espera_base * (2 ** verificaciones) * (1 + random.random())
+                            pendientes.append((lote, intento, espera, verificaciones + 1, error))
+                            continue
+                        logging.error(f"❌ No se pudo verificar {len(lote)} altas sin respuesta; no se reenvían: {e}")
+                        for item in lote:
+                            descartar(item, f"Sin respuesta ({error}) y sin poder verificarla: {e}")
+                        continue
+                    for i, oid in aplicadas.items():
+                        exito(lote[i], oid)
+                    if aplicadas:
+                        logging.info(f"🔁 {len(aplicadas)} de {len(lote)} altas sin respuesta ya estaban en la capa")
+                    restantes = [item for i, item in enumerate(lote) if i not in aplicadas]
+                    if restantes:
+                        reencolar(restantes, intento, error)
+                    continue
+
+                reporte["lotes"] += 1
+                try:
+                    resultado, latencia, n_bytes = futuro.result()
+                    registrar_http(n_bytes)
+                    control.registrar(len(lote), latencia, n_bytes)
+                    resultados = (resultado or {}).get(clave)
+                    if not resultados:
+                        raise RuntimeError("Respuesta inválida de ArcGIS")
+                except Exception as e:
+                    registrar_http()
+                    if _es_timeout(e):
+                        control.registrar(len(lote), control.latencia_objetivo * 2, 0, timeout=True)
+                    if tipo != "adds" or not _sin_respuesta(e):
+                        reencolar(lote, intento, e)
+                    elif campo_hash and all((f.get("attributes") or {}).get(campo_hash) for f in lote):
+                        # Pudo aplicarse: antes de reenviar se buscan sus altas en la capa, dando al
+                        # servidor el tiempo de una respuesta lenta para terminar la petición
+                        pendientes.append((lote, intento, latencia_objetivo * (1 + random.random()), 1, e))
+                    else:
+                        logging.error(f"❌ {len(lote)} altas sin respuesta y sin hash para verificarlas; no se reenvían: {e}")
+                        for item in lote:
+                            descartar(item, f"Sin respuesta, no se sabe si se aplicó: {e}")
+                    continue
+
+                # Las features rechazadas siguen el mismo camino que un lote fallido
+                rechazadas, error = [], None
+                for item, r in zip(lote, resultados):
+                    if r.get("success", False):
+                        exito(item, r.get("objectId"))
+                    else:
+                        rechazadas.append(item)
+                        error = error or r.get("error", "Sin detalles")
+                rechazadas += lote[len(resultados):]
+                if rechazadas:
+                    reencolar(rechazadas, intento, error or "Sin resultado para la edición")
+
+    logging.info(
+        f"📦 {tipo}: {reporte['exitosos']} exitosos, {reporte['fallidos']} fallidos "
+        f"en {reporte['lotes']} lotes ({reporte['reintentos']} reintentos)"
+    )
+    return reporte
@@ -0,0 +1,185 @@
+# utils/change_detection.py
+"""
+Cambios de cada publicación respecto a la anterior, a partir de los snapshots.
+
+Cada feature se identifica por el hash de su geometría normalizada (más las
+columnas clave que se indiquen). Las identidades de los dos snapshots se cruzan
+de una vez (merge por hash, sin bucles anidados) y cada feature queda como:
+
+    nuevo       está ahora y no estaba
+    eliminado   estaba y ya no está (se guarda la geometría anterior)
+    sube        sigue, con mayor nivel (p. ej. SymbolID/categoria)
+    baja        sigue, con menor nivel
+
+El resultado se guarda en output/cambios/<capa>/<id del snapshot>.parquet (solo
+las features que cambiaron) con una línea de resumen en
+output/cambios/<capa>/resumen.jsonl, y opcionalmente se publica en una capa de
+cambios para los tableros.
+"""
+import json
+import logging
+import os
+from datetime import datetime, timezone
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+RUTA_CAMBIOS = os.path.join(ROOT_DIR, "output", "cambios")
+# Archivos de cambios que se conservan por capa (el resumen no se poda)
+MAX_ARCHIVOS_CAMBIOS = 90
+COLUMNA_CAMBIO = "cambio"
+SUFIJO_ANTERIOR = "_anterior"
+
+
+def identidades(gdf, claves=()):
+    """
+    Hash de 64 bits por feature: geometría normalizada (WKB) y columnas clave.
+    Normalizar hace que el mismo polígono con otro vértice inicial dé el mismo hash.
+    """
+    import pandas as pd
+    import shapely
+
+    wkb = pd.Series(shapely.to_wkb(shapely.normalize(gdf.geometry.array), hex=True))
+    h = pd.util.hash_pandas_object(wkb, index=False).to_numpy()
+    if claves:
+        h = h * 31 + pd.util.hash_pandas_object(gdf[list(claves)].astype(str), index=False).to_numpy()
+    return h
+
+
+def _direccion(anterior, actual, niveles):
+    """
+    +1 si el nivel subió, -1 si bajó, 0 si no cambió. Con varios campos de nivel
+    decide el primero que cambió (en el orden de 'niveles').
+    Args:
+        niveles: {campo: 1 si un valor mayor es más grave, -1 si es al revés}.
+    """
+    import numpy as np
+    import pandas as pd
+
+    direccion = np.zeros(len(actual), dtype=int)
+    for campo, sentido in reversed(list(niveles.items())):
+        antes = pd.to_numeric(anterior[campo], errors="coerce").to_numpy(dtype=float)
+        ahora = pd.to_numeric(actual[campo], errors="coerce").to_numpy(dtype=float)
+        paso = np.sign(np.nan_to_num(ahora - antes)).astype(int) * sentido
+        direccion = np.where(paso != 0, paso, direccion)
+    return direccion
+
+
+def calcular_cambios(anterior, actual, claves=(), niveles=None):
+    """
+    Delta entre dos estados publicados de una capa.
+    Args:
+        anterior, actual: GeoDataFrames (p. ej. leídos de dos snapshots).
+        claves: Columnas que, además de la geometría, identifican una feature.
+        niveles: {campo: sentido} cuyos cambios se reportan como 'sube'/'baja'.
+    Returns:
+        GeoDataFrame solo con las features que cambiaron: columna 'cambio', los
+        niveles actuales y anteriores (<campo>_anterior) y la geometría.
+    """
+    import geopandas as gpd
+    import pandas as pd
+
+    niveles = {c: s for c, s in (niveles or {}).items() if c in actual.columns and c in anterior.columns}
+    columnas = list(dict.fromkeys([*claves, *niveles, *(["Name"] if "Name" in actual.columns else [])]))
+
+    def indexar(gdf):
+        gdf = gdf[[c for c in columnas if c in gdf.columns] + [gdf.geometry.name]].copy()
+        gdf["_id"] = identidades(gdf, claves)
+        # Una geometría repetida en la misma publicación cuenta una sola vez
+        return gdf.drop_duplicates("_id").set_index("_id")
+
+    previos, nuevos = indexar(anterior), indexar(actual)
+    comunes = nuevos.index.intersection(previos.index)
+    partes = []
+
+    altas = nuevos.loc[nuevos.index.difference(previos.index)]
+    partes.append(altas.assign(**{COLUMNA_CAMBIO: "nuevo"}))
+
+    bajas = previos.loc[previos.index.difference(nuevos.index)]
+    bajas = bajas.rename(columns={c: c + SUFIJO_ANTERIOR for c in niveles})
+    partes.append(bajas.assign(**{COLUMNA_CAMBIO: "eliminado"}))
+
+    if niveles and len(comunes):
+        antes, ahora = previos.loc[comunes], nuevos.loc[comunes]
+        direccion = _direccion(antes, ahora, niveles)
+        cambiadas = ahora[direccion != 0].copy()
+        for campo in niveles:
+            cambiadas[campo + SUFIJO_ANTERIOR] = antes.loc[cambiadas.index, campo].to_numpy()
+        cambiadas[COLUMNA_CAMBIO] = ["sube" if d > 0 else "baja" for d in direccion[direccion != 0]]
+        partes.append(cambiadas)
+
+    partes = [p for p in partes if not p.empty]
+    if not partes:
+        return gpd.GeoDataFrame({COLUMNA_CAMBIO: []}, geometry=[], crs=actual.crs)
+    delta = pd.concat(partes).reset_index(drop=True)
+    orden = [COLUMNA_CAMBIO] + [c for c in columnas if c in delta.columns]
+    orden += [c + SUFIJO_ANTERIOR for c in niveles if c + SUFIJO_ANTERIOR in delta.columns]
+    return gpd.GeoDataFrame(delta[orden + [actual.geometry.name]], geometry=actual.geometry.name, crs=actual.crs)
+
+
+def _podar(directorio, maximo=MAX_ARCHIVOS_CAMBIOS):
+    archivos = sorted(f for f in os.listdir(directorio) if f.endswith(".parquet"))
+    for nombre in archivos[:max(len(archivos) - maximo, 0)]:
+        os.remove(os.path.join(directorio, nombre))
+
+
+def registrar_cambios(capa, anterior, actual, claves=(), niveles=None, capa_cambios=None,
+                      directorio_snapshots=None, directorio=None):
+    """
+    Calcula y guarda los cambios entre dos snapshots confirmados de una capa.
+    Un fallo aquí no afecta la publicación: se deja en el log y se sigue.
+    Args:
+        capa: Nombre de la capa en output/snapshots.
+        anterior, actual: Entradas del manifiesto (buscar_snapshot / registrar_snapshot).
+        capa_cambios: FeatureLayer opcional donde se publican los cambios de esta ejecución.
+    Returns:
+        dict de resumen (conteos por tipo de cambio), o None si no se calculó.
+    """
+    from utils.snapshot_store import columnas_snapshot, leer_snapshot
+
+    if actual is None:
+        return None
+    if anterior is None:
+        logging.info(f"🆕 {capa}: sin publicación anterior con la que comparar; no se calculan cambios")
+        return None
+    try:
+        # Solo las columnas que hacen falta (las claves o niveles pueden no estar en snapshots viejos)
+        columnas = list(dict.fromkeys([*claves, *(niveles or {}), "Name", "geometry"]))
+        previo, nuevo = (
+            leer_snapshot(e, directorio_snapshots, [c for c in columnas if c in columnas_snapshot(e, directorio_snapshots)])
+            for e in (anterior, actual)
+        )
+        delta = calcular_cambios(previo, nuevo, claves, niveles)
+
+        conteo = delta[COLUMNA_CAMBIO].value_counts().to_dict() if not delta.empty else {}
+        resumen = {
+            "fecha": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            "capa": capa,
+            "snapshot": actual["id"],
+            "anterior": anterior["id"],
+            "filas": actual["filas"],
+            **{tipo: int(conteo.get(tipo, 0)) for tipo in ("nuevo", "eliminado", "sube", "baja")},
+        }
+        carpeta = os.path.join(directorio or RUTA_CAMBIOS, capa)
+        os.makedirs(carpeta, exist_ok=True)
+        if not delta.empty:
+            resumen["archivo"] = f"{actual['id']}.parquet"
+            delta.to_parquet(os.path.join(carpeta, resumen["archivo"]), index=False)
+            _podar(carpeta)
+        with open(os.path.join(carpeta, "resumen.jsonl"), "a", encoding="utf-8") as f:
+            f.write(json.dumps(resumen, ensure_ascii=False) + "\n")
+        logging.info(
+            f"🔔 Cambios en {capa}: +{resumen['nuevo']} nuevas, -{resumen['eliminado']} eliminadas, "
+            f"▲{resumen['sube']} suben, ▼{resumen['baja']} bajan"
+        )
+    except Exception as e:
+        logging.warning(f"⚠️ No se pudieron calcular los cambios de {capa}: {e}")
+        return None
+
+    if capa_cambios is not None:
+        from utils.layer_sync import features_desde_gdf, sincronizar_capa
+
+        # La capa de cambios muestra solo los de la última ejecución
+        reporte = sincronizar_capa(capa_cambios, features_desde_gdf(delta) if not delta.empty else [])
+        if not reporte["exito"]:
+            logging.warning(f"⚠️ No se pudo publicar la capa de cambios de {capa}")
+    return resumen
+
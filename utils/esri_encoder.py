@@ -0,0 +1,190 @@
+# utils/esri_encoder.py
+"""
+Codificador de GeoDataFrames a features Esri JSON sin pasar por arcgis.
+
+En lugar de GeoAccessor.from_geodataframe(...).spatial.to_featureset() (que crea
+un DataFrame espacial, un objeto Geometry y un Feature por fila), las coordenadas
+se sacan de una vez con shapely.get_coordinates y se reparten por anillo y por
+geometría con los offsets de get_parts / get_rings. Los atributos se convierten
+por columna. La serialización usa orjson si está instalado.
+
+numpy, pandas y shapely se importan dentro de las funciones que los usan:
+batch_upload y layer_sync importan este módulo solo por 'serializar' y no
+deben cargarlos al importar un pipeline.
+"""
+import contextlib
+import gc
+import gzip
+import json
+import threading
+
+try:
+    import orjson
+except ImportError:  # orjson es opcional: json de la librería estándar hace lo mismo, más lento
+    orjson = None
+
+WKID_DEFECTO = 4326
+# Tipos de shapely.get_type_id
+PUNTO, LINEA, ANILLO, POLIGONO, MULTIPUNTO, MULTILINEA, MULTIPOLIGONO = range(7)
+# Origen de las fechas Esri (epoch en ms)
+EPOCA = "1970-01-01"
+
+# Pausas del recolector de ciclos en curso (los pipelines corren en hilos a la vez)
+_pausas = 0
+_lock_gc = threading.Lock()
+
+
+@contextlib.contextmanager
+def _sin_gc():
+    """
+    Pausa el recolector de ciclos mientras se crean las listas de coordenadas:
+    son cientos de miles de objetos sin ciclos y cada pasada del recolector los
+    recorre todos (más de la mitad del tiempo de codificación).
+    """
+    global _pausas
+    with _lock_gc:
+        # Si ya estaba desactivado por otro motivo (y no por nosotros), no se toca
+        propia = _pausas > 0 or gc.isenabled()
+        if propia:
+            _pausas += 1
+            gc.disable()
+    try:
+        yield
+    finally:
+        if propia:
+            with _lock_gc:
+                _pausas -= 1
+                if _pausas == 0:
+                    gc.enable()
+
+
+def serializar(obj, comprimir=False):
+    """Esri JSON en bytes UTF-8 (orjson si está disponible); gzip opcional."""
+    if orjson is not None:
+        datos = orjson.dumps(obj, default=str, option=orjson.OPT_SERIALIZE_NUMPY)
+    else:
+        datos = json.dumps(obj, default=str, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+    return gzip.compress(datos, compresslevel=5) if comprimir else datos
+
+
+def _repartir(valores, indices, n):
+    """Agrupa 'valores' (ordenados por índice) en n listas según 'indices'."""
+    import numpy as np
+
+    cortes = np.cumsum(np.bincount(indices, minlength=n))[:-1].tolist() if n else []
+    grupos, inicio = [], 0
+    for fin in cortes + [len(valores)]:
+        grupos.append(valores[inicio:fin])
+        inicio = fin
+    return grupos
+
+
+def _coordenadas_por(geometrias, decimales):
+    """Lista de listas [[x, y], ...] por cada geometría del arreglo, en una sola pasada."""
+    import shapely
+
+    coordenadas, indices = shapely.get_coordinates(geometrias, return_index=True)
+    if decimales is not None:
+        coordenadas = coordenadas.round(decimales)
+    return _repartir(coordenadas.tolist(), indices, len(geometrias))
+
+
+def _anillos(poligonos, decimales):
+    """
+    Anillos Esri de cada polígono simple: exterior en sentido horario y huecos al revés.
+    Returns:
+        (lista de anillos [[x, y], ...], índice del polígono de cada anillo).
+    """
+    import numpy as np
+    import shapely
+
+    if hasattr(shapely, "orient_polygons"):  # shapely >= 2.1
+        poligonos = shapely.orient_polygons(poligonos, exterior_cw=True)
+    else:
+        from shapely.geometry.polygon import orient
+        poligonos = np.array([orient(p, sign=-1.0) for p in poligonos], dtype=object)
+    anillos, por_poligono = shapely.get_rings(poligonos, return_index=True)
+    return _coordenadas_por(anillos, decimales), por_poligono
+
+
+def geometrias_esri(geometrias, wkid=WKID_DEFECTO, decimales=None):
+    """
+    Convierte un arreglo de geometrías shapely a dicts de geometría Esri JSON.
+    Puntos -> {x, y}; (multi)líneas -> {paths}; (multi)polígonos -> {rings}; multipuntos
+    -> {points}. Las nulas o vacías quedan en None.
+    Args:
+        geometrias: Arreglo o GeoSeries de geometrías.
+        wkid: Referencia espacial que se declara en cada geometría.
+        decimales: Redondeo de las coordenadas (None para dejarlas como están).
+    Returns:
+        Lista de dicts (o None) del mismo largo que la entrada.
+    """
+    import numpy as np
+    import shapely
+
+    geometrias = np.asarray(geometrias, dtype=object)
+    resultado = [None] * len(geometrias)
+    referencia = {"wkid": wkid}
+    tipos = shapely.get_type_id(geometrias)
+    vigentes = ~(shapely.is_missing(geometrias) | shapely.is_empty(geometrias))
+
+    seleccion = np.flatnonzero(vigentes & (tipos == PUNTO))
+    if len(seleccion):
+        coordenadas = shapely.get_coordinates(geometrias[seleccion])
+        if decimales is not None:
+            coordenadas = coordenadas.round(decimales)
+        for i, (x, y) in zip(seleccion.tolist(), coordenadas.tolist()):
+            resultado[i] = {"x": x, "y": y, "spatialReference": referencia}
+
+    for tipos_grupo, clave in (((POLIGONO, MULTIPOLIGONO), "rings"), ((LINEA, MULTILINEA), "paths"),
+                               ((MULTIPUNTO,), "points")):
+        seleccion = np.flatnonzero(vigentes & np.isin(tipos, tipos_grupo))
+        if not len(seleccion):
+            continue
+        # Partes simples (multi -> sus partes) con el índice de la geometría a la que pertenecen
+        partes, por_geometria = shapely.get_parts(geometrias[seleccion], return_index=True)
+        if clave == "rings":
+            # Un multipolígono Esri es la lista plana de los anillos de todas sus partes
+            anillos, por_parte = _anillos(partes, decimales)
+            valores = _repartir(anillos, por_geometria[por_parte], len(seleccion))
+        elif clave == "paths":
+            valores = _repartir(_coordenadas_por(partes, decimales), por_geometria, len(seleccion))
+        else:
+            valores = _coordenadas_por(geometrias[seleccion], decimales)
+        for i, valor in zip(seleccion.tolist(), valores):
+            resultado[i] = {clave: valor, "spatialReference": referencia}
+    return resultado
+
+
+def _columna_a_lista(serie):
+    """Valores Python de una columna: fechas a epoch en ms y NaN/NaT/NA a None."""
+    import pandas as pd
+
+    if pd.api.types.is_datetime64_any_dtype(serie):
+        if getattr(serie.dt, "tz", None) is not None:
+            serie = serie.dt.tz_convert("UTC").dt.tz_localize(None)
+        serie = ((serie - pd.Timestamp(EPOCA)) // pd.Timedelta(milliseconds=1)).astype("Int64")
+    if not serie.hasnans and serie.dtype.kind in "iuf":
+        # Columna numérica sin nulos: numpy -> lista de int/float de Python de una vez
+        return serie.to_numpy().tolist()
+    return serie.astype(object).where(serie.notna(), None).tolist()
+
+
+def features_esri(gdf, wkid=None, decimales=None):
+    """
+    Convierte un GeoDataFrame en una lista de dicts Esri JSON {'attributes', 'geometry'}.
+    Args:
+        gdf: GeoDataFrame (cualquier columna de geometría activa).
+        wkid: Referencia espacial; por defecto la EPSG del CRS del gdf (4326 si no tiene).
+        decimales: Redondeo de coordenadas.
+    """
+    if wkid is None:
+        wkid = (gdf.crs.to_epsg() if gdf.crs is not None else None) or WKID_DEFECTO
+    columnas = [c for c in gdf.columns if c != gdf.geometry.name]
+    with _sin_gc():
+        valores = [_columna_a_lista(gdf[c]) for c in columnas]
+        geometrias = geometrias_esri(gdf.geometry.array, wkid, decimales)
+        return [
+            {"attributes": dict(zip(columnas, fila)), "geometry": geometria}
+            for fila, geometria in zip(zip(*valores) if columnas else [()] * len(gdf), geometrias)
+        ]
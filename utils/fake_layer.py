@@ -0,0 +1,121 @@
+# utils/fake_layer.py
+import copy
+import re
+import threading
+from types import SimpleNamespace
+
+
+class FakeFeatureLayer:
+    """
+    Capa en memoria que imita la parte de FeatureLayer que usan los pipelines
+    (properties, query, delete_features y edit_features).
+    Sirve para probar la sincronización y los benchmarks sin tocar ArcGIS Online.
+    """
+
+    def __init__(self, fields=None, features=None, oid_field="OBJECTID"):
+        self.properties = SimpleNamespace(
+            name="fake_layer",
+            objectIdField=oid_field,
+            fields=[{"name": oid_field, "type": "esriFieldTypeOID"}] + list(fields or []),
+            capabilities="Create,Delete,Query,Update,Editing",
+        )
+        self.oid_field = oid_field
+        self.features = {}
+        self.llamadas = []
+        self._siguiente_oid = 1
+        # El cargador por lotes llama a edit_features desde varios hilos a la vez
+        self._lock = threading.Lock()
+        for feature in features or []:
+            self._agregar(feature)
+
+    def _agregar(self, feature):
+        feature = copy.deepcopy(feature)
+        oid = self._siguiente_oid
+        self._siguiente_oid += 1
+        feature.setdefault("attributes", {})[self.oid_field] = oid
+        self.features[oid] = feature
+        return oid
+
+    def agregar_campos(self, campos):
+        """Como addToDefinition: agrega campos al esquema (los que ya existen se ignoran)."""
+        self.llamadas.append(("agregar_campos", [c["name"] for c in campos]))
+        conocidos = {f["name"] for f in self.properties.fields}
+        self.properties.fields += [dict(c) for c in campos if c["name"] not in conocidos]
+        return {"success": True}
+
+    def filtrar(self, where="1=1"):
+        """
+        OIDs que cumplen el where. Soporta lo que usan los pipelines: '1=1',
+        'OBJECTID IN (...)', 'OBJECTID = n' y "<campo> IN ('a','b',...)".
+        """
+        where = (where or "1=1").strip()
+        if where == "1=1":
+            return list(self.features)
+        coincidencia = re.fullmatch(r"(\w+)\s*(IN\s*\((.*)\)|=\s*(.+))", where, re.IGNORECASE | re.DOTALL)
+        if coincidencia is None:
+            raise ValueError(f"where no soportado por la capa de prueba: {where}")
+        campo, _, lista, valor = coincidencia.groups()
+        valores = [v.strip() for v in (lista.split(",") if lista is not None else [valor]) if v.strip()]
+        if campo.upper() == self.oid_field.upper():
+            return [int(v) for v in valores]
+        buscados = {v.strip("'").replace("''", "'") for v in valores}
+        return [oid for oid, f in self.features.items() if f["attributes"].get(campo) in buscados]
+
+    def query(self, where="1=1", out_fields="*", return_geometry=True, **kwargs):
+        self.llamadas.append(("query", where))
+        campos = None if out_fields in (None, "*") else set(out_fields.split(","))
+        resultado = []
+        for oid in self.filtrar(where):
+            feature = self.features.get(oid)
+            if feature is None:
+                continue
+            atributos = feature["attributes"]
+            if campos is not None:
+                atributos = {k: v for k, v in atributos.items() if k in campos}
+            resultado.append({
+                "attributes": dict(atributos),
+                "geometry": copy.deepcopy(feature.get("geometry")) if return_geometry else None,
+            })
+        return SimpleNamespace(features=resultado)
+
+    def delete_features(self, where=None, deletes=None, **kwargs):
+        self.llamadas.append(("delete_features", where))
+        if where == "1=1":
+            oids = list(self.features)
+        else:
+            oids = [int(o) for o in str(deletes or "").split(",") if o]
+        for oid in oids:
+            self.features.pop(oid, None)
+        return {"success": True, "deleteResults": [{"objectId": o, "success": True} for o in oids]}
+
+    def edit_features(self, adds=None, updates=None, deletes=None, rollback_on_failure=True, **kwargs):
+        with self._lock:
+            # Como applyEdits: con rollback_on_failure, si una edición falla no se aplica ninguna
+            previo = (dict(self.features), self._siguiente_oid)
+            resultado = self._editar(adds, updates, deletes)
+            if rollback_on_failure and any(
+                not r["success"] for clave in ("addResults", "updateResults", "deleteResults") for r in resultado[clave]
+            ):
+                self.features, self._siguiente_oid = previo
+                for clave in ("addResults", "updateResults", "deleteResults"):
+                    resultado[clave] = [dict(r, success=False) for r in resultado[clave]]
+            return resultado
+
+    def _editar(self, adds, updates, deletes):
+        self.llamadas.append(("edit_features", len(adds or []), len(updates or []), deletes))
+        resultado = {"addResults": [], "updateResults": [], "deleteResults": []}
+        for feature in adds or []:
+            oid = self._agregar(feature)
+            resultado["addResults"].append({"objectId": oid, "success": True})
+        for feature in updates or []:
+            oid = feature["attributes"][self.oid_field]
+            ok = oid in self.features
+            if ok:
+                self.features[oid] = copy.deepcopy(feature)
+            resultado["updateResults"].append({"objectId": oid, "success": ok})
+        if isinstance(deletes, str):
+            deletes = [int(o) for o in deletes.split(",") if o]
+        for oid in deletes or []:
+            ok = self.features.pop(oid, None) is not None
+            resultado["deleteResults"].append({"objectId": oid, "success": ok})
+        return resultado
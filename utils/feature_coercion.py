@@ -0,0 +1,115 @@
+# utils/feature_coercion.py
+import numpy as np
+import pandas as pd
+
+TIPOS_ENTEROS = ('esriFieldTypeInteger', 'esriFieldTypeSmallInteger', 'esriFieldTypeBigInteger')
+TIPOS_DECIMALES = ('esriFieldTypeDouble', 'esriFieldTypeSingle')
+LONGITUD_TEXTO_DEFECTO = 255
+
+EPOCA = pd.Timestamp('1970-01-01')
+
+
+def _a_lista(serie):
+    """Convierte una serie a lista de objetos Python, con None en lugar de NaN/NaT."""
+    return serie.astype(object).where(serie.notna(), None).tolist()
+
+
+def _numerico(serie):
+    """Equivalente vectorizado de float(value): vacíos y textos inválidos quedan como NaN."""
+    if pd.api.types.is_numeric_dtype(serie) and not pd.api.types.is_bool_dtype(serie):
+        return serie.astype(float)
+    texto = serie.astype(str).str.strip()
+    return pd.to_numeric(texto.where(serie.notna()), errors='coerce')
+
+
+def _fecha_a_epoch_ms(serie):
+    """
+    Convierte una columna de fechas a milisegundos desde epoch con una sola
+    llamada a to_datetime. Los valores ya numéricos se respetan tal cual.
+    """
+    if pd.api.types.is_numeric_dtype(serie) and not pd.api.types.is_bool_dtype(serie):
+        return serie.astype(float).round().astype('Int64')
+    if pd.api.types.is_datetime64_any_dtype(serie):
+        fechas = serie
+    else:
+        try:
+            fechas = pd.to_datetime(serie, errors='coerce', format='mixed')
+        except (TypeError, ValueError):
+            fechas = pd.to_datetime(serie, errors='coerce')
+    if getattr(fechas.dt, 'tz', None) is not None:
+        fechas = fechas.dt.tz_convert('UTC').dt.tz_localize(None)
+    ms = (fechas - EPOCA) // pd.Timedelta(milliseconds=1)
+    return ms.astype('Int64')
+
+
+def convertir_columna(serie, tipo, longitud=None):
+    """
+    Convierte una columna completa al tipo de campo de ArcGIS.
+    Args:
+        serie: pd.Series con los valores del CSV.
+        tipo: Tipo de campo ArcGIS (p. ej. 'esriFieldTypeString').
+        longitud: Longitud máxima para campos de texto.
+    Returns:
+        pd.Series con los valores convertidos (nulos como NA/NaN).
+    """
+    if tipo in TIPOS_ENTEROS:
+        return np.trunc(_numerico(serie)).astype('Int64')
+    if tipo in TIPOS_DECIMALES:
+        return _numerico(serie)
+    if tipo == 'esriFieldTypeString':
+        return serie.astype(str).str.slice(0, longitud or LONGITUD_TEXTO_DEFECTO).where(serie.notna())
+    if tipo == 'esriFieldTypeDate':
+        return _fecha_a_epoch_ms(serie)
+    return serie
+
+
+def convertir_columnas(df, arcgis_field_types, arcgis_field_lengths=None, excluir=()):
+    """
+    Aplica convertir_columna a cada columna del DataFrame que exista en la capa.
+    Las columnas que no están en el esquema de ArcGIS se ignoran.
+    Returns:
+        dict {campo: lista de valores Python (None para nulos)}.
+    """
+    arcgis_field_lengths = arcgis_field_lengths or {}
+    columnas = {}
+    for campo in df.columns:
+        if campo in excluir or campo not in arcgis_field_types:
+            continue
+        convertida = convertir_columna(df[campo], arcgis_field_types[campo], arcgis_field_lengths.get(campo))
+        columnas[campo] = _a_lista(convertida)
+    return columnas
+
+
+def geometrias_punto(x, y, wkid=4326):
+    """Construye geometrías Esri JSON de punto a partir de dos columnas de coordenadas."""
+    x = pd.to_numeric(pd.Series(x), errors='coerce').astype(float).tolist()
+    y = pd.to_numeric(pd.Series(y), errors='coerce').astype(float).tolist()
+    referencia = {'wkid': wkid}
+    return [
+        {'x': xi, 'y': yi, 'spatialReference': referencia} if xi == xi and yi == yi else None
+        for xi, yi in zip(x, y)
+    ]
+
+
+def construir_features(df, arcgis_field_types, arcgis_field_lengths=None, campo_x=None, campo_y=None, wkid=4326):
+    """
+    Construye en bloque los payloads {'attributes', 'geometry'} para edit_features,
+    convirtiendo cada columna una sola vez según el esquema de la capa.
+    Args:
+        df: DataFrame con columnas ya renombradas a los campos de ArcGIS.
+        arcgis_field_types: dict {campo: tipo ArcGIS}.
+        arcgis_field_lengths: dict {campo: longitud} para campos de texto.
+        campo_x, campo_y: Columnas de longitud y latitud (se excluyen de los atributos).
+        wkid: Referencia espacial de las coordenadas.
+    """
+    columnas = convertir_columnas(df, arcgis_field_types, arcgis_field_lengths, excluir=(campo_x, campo_y))
+    nombres = list(columnas)
+    filas = zip(*columnas.values()) if nombres else ((),) * len(df)
+    atributos = [dict(zip(nombres, valores)) for valores in filas]
+
+    if campo_x and campo_y:
+        geometrias = geometrias_punto(df[campo_x], df[campo_y], wkid)
+    else:
+        geometrias = [None] * len(df)
+
+    return [{'attributes': a, 'geometry': g} for a, g in zip(atributos, geometrias)]
@@ -0,0 +1,159 @@
+# utils/fetch_cache.py
+import hashlib
+import json
+import logging
+import os
+import tempfile
+import threading
+
+import requests
+
+from utils.metrics import etapa, registrar_http
+
+# Caché local dentro de la carpeta 'data' en la raíz del proyecto
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+CACHE_DIR = os.path.join(ROOT_DIR, "data", "fetch_cache")
+INDEX_PATH = os.path.join(CACHE_DIR, "index.json")
+TAMANO_BLOQUE = 64 * 1024
+
+_lock = threading.Lock()
+
+
+def _clave(url):
+    return hashlib.sha1(url.encode("utf-8")).hexdigest()
+
+
+def leer_indice():
+    """Devuelve el índice {url: {etag, last_modified, sha256, bytes, ruta}}."""
+    if not os.path.exists(INDEX_PATH):
+        return {}
+    try:
+        with open(INDEX_PATH, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        logging.warning("⚠️ Índice de caché ilegible, se ignora.")
+        return {}
+
+
+def _guardar_entrada(url, entrada):
+    with _lock:
+        indice = leer_indice()
+        indice[url] = entrada
+        os.makedirs(CACHE_DIR, exist_ok=True)
+        tmp = INDEX_PATH + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(indice, f, indent=2, ensure_ascii=False)
+        os.replace(tmp, INDEX_PATH)
+
+
+class Descarga:
+    """
+    Resultado de una descarga condicional.
+    Atributos:
+        sin_cambios: True si el servidor respondió 304 o el contenido tiene el mismo hash.
+        ruta: Archivo local con el contenido (la versión nueva o la última confirmada).
+        sha256: Hash del contenido.
+    La nueva versión solo queda registrada al llamar a confirmar(), que debe hacerse
+    cuando el pipeline terminó bien; así un fallo posterior no hace que la próxima
+    ejecución crea que ya no hay nada que publicar.
+    """
+
+    def __init__(self, url, sin_cambios, ruta, sha256, entrada=None, ruta_tmp=None):
+        self.url = url
+        self.sin_cambios = sin_cambios
+        self.ruta = ruta
+        self.sha256 = sha256
+        self._entrada = entrada
+        self._ruta_tmp = ruta_tmp
+
+    def abrir(self):
+        return open(self.ruta, "rb")
+
+    def confirmar(self):
+        if self._entrada is None:
+            return
+        if self._ruta_tmp:
+            os.replace(self._ruta_tmp, self._entrada["ruta"])
+            self.ruta = self._entrada["ruta"]
+            self._ruta_tmp = None
+        _guardar_entrada(self.url, self._entrada)
+        self._entrada = None
+
+    def descartar(self):
+        if self._ruta_tmp and os.path.exists(self._ruta_tmp):
+            os.remove(self._ruta_tmp)
+        self._ruta_tmp = None
+
+
+def descargar_condicional(url, headers=None, timeout=60, forzar=False):
+    """
+    Descarga una URL usando los validadores guardados (ETag / Last-Modified).
+    Si el servidor no los soporta, el contenido se compara por SHA-256 con la
+    última versión confirmada antes de devolverlo.
+    Args:
+        url: URL de la fuente (sin parámetros de cache-busting).
+        headers: Encabezados HTTP adicionales.
+        timeout: Timeout en segundos.
+        forzar: Ignora la caché y trata el contenido como nuevo.
+    Returns:
+        Descarga
+    """
+    previa = {} if forzar else leer_indice().get(url, {})
+    en_cache = os.path.exists(previa.get("ruta", ""))
+    encabezados = dict(headers or {})
+    # Los validadores solo sirven si la copia confirmada sigue en disco: un 304 sin ella no tiene contenido
+    if en_cache and previa.get("etag"):
+        encabezados["If-None-Match"] = previa["etag"]
+    if en_cache and previa.get("last_modified"):
+        encabezados["If-Modified-Since"] = previa["last_modified"]
+
+    os.makedirs(CACHE_DIR, exist_ok=True)
+    ruta = os.path.join(CACHE_DIR, _clave(url) + ".bin")
+
+    with etapa("fetch"):
+        response = requests.get(url, headers=encabezados, stream=True, timeout=timeout)
+        registrar_http()
+        if response.status_code == 304:
+            response.close()
+            if os.path.exists(previa.get("ruta", "")):
+                logging.info(f"♻️ Sin cambios (304): {url}")
+                return Descarga(url, True, previa["ruta"], previa.get("sha256"))
+            # La copia se borró entre la lectura del índice y la respuesta: se pide sin validadores
+            logging.warning(f"⚠️ 304 sin copia en caché, se descarga completo: {url}")
+            response = requests.get(url, headers=dict(headers or {}), stream=True, timeout=timeout)
+            registrar_http()
+
+        with response:
+            response.raise_for_status()
+            hasher = hashlib.sha256()
+            n_bytes = 0
+            # Temporal único: dos descargas de la misma URL a la vez no escriben en el mismo archivo
+            fd, ruta_tmp = tempfile.mkstemp(dir=CACHE_DIR, prefix=_clave(url) + ".", suffix=".tmp")
+            try:
+                with os.fdopen(fd, "wb") as f:
+                    for chunk in response.iter_content(chunk_size=TAMANO_BLOQUE):
+                        hasher.update(chunk)
+                        f.write(chunk)
+                        n_bytes += len(chunk)
+            except BaseException:
+                os.remove(ruta_tmp)
+                raise
+            registrar_http(n_bytes, peticiones=0)
+
+            entrada = {
+                "etag": response.headers.get("ETag"),
+                "last_modified": response.headers.get("Last-Modified"),
+                "sha256": hasher.hexdigest(),
+                "bytes": n_bytes,
+                "ruta": ruta,
+            }
+
+    if not forzar and entrada["sha256"] == previa.get("sha256") and os.path.exists(previa.get("ruta", "")):
+        # Mismo contenido: se guardan los validadores nuevos y se descarta la copia
+        os.remove(ruta_tmp)
+        _guardar_entrada(url, entrada)
+        logging.info(f"♻️ Sin cambios (mismo hash): {url}")
+        return Descarga(url, True, ruta, entrada["sha256"])
+
+    logging.info(f"⬇️ Contenido nuevo ({n_bytes} bytes): {url}")
+    return Descarga(url, False, ruta_tmp, entrada["sha256"], entrada=entrada, ruta_tmp=ruta_tmp)
@@ -0,0 +1,164 @@
+# utils/field_mapping.py
+import hashlib
+import json
+import logging
+import os
+import time
+from types import SimpleNamespace
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+RUTA_ESQUEMAS = os.path.join(ROOT_DIR, "data", "esquemas")
+# Cada cuánto se revisa si el esquema de la capa cambió (una petición de properties)
+ESQUEMA_TTL_S = 24 * 3600
+
+# Columnas ya advertidas en este proceso: cada aviso sale una sola vez
+_advertidas = set()
+# Planes compilados por (capa, versión del esquema, mapeo)
+_planes = {}
+# Copia en memoria de data/esquemas/*.json para los procesos que no terminan (daemon)
+_esquemas = {}
+
+
+def _version(propiedades):
+    """
+    Versión del esquema: editingInfo.schemaLastEditDate si la capa lo publica;
+    si no, un hash de la lista de campos.
+    """
+    edicion = propiedades.get("editingInfo") or {}
+    if edicion.get("schemaLastEditDate"):
+        return str(edicion["schemaLastEditDate"])
+    campos = [(f.get("name"), f.get("type"), f.get("length")) for f in propiedades.get("fields") or []]
+    return hashlib.sha1(json.dumps(campos).encode("utf-8")).hexdigest()[:16]
+
+
+def _como_dict(propiedades):
+    if isinstance(propiedades, dict):
+        return propiedades
+    if hasattr(propiedades, "items"):  # PropertyMap de arcgis
+        return dict(propiedades.items())
+    return dict(vars(propiedades))
+
+
+def obtener_esquema(layer, clave, ttl_s=ESQUEMA_TTL_S, directorio=None):
+    """
+    Esquema de la capa (name, objectIdField, fields) cacheado en data/esquemas/<clave>.json.
+    Mientras la copia local tenga menos de ttl_s segundos no se consulta la capa;
+    después se piden las properties y, si la versión cambió, se reemplaza.
+    Args:
+        layer: FeatureLayer (o CapaREST); solo se toca si la caché venció.
+        clave: Nombre del archivo de caché (p. ej. el item_id).
+    Returns:
+        SimpleNamespace con name, objectIdField, fields y version.
+    """
+    ruta = os.path.join(directorio or RUTA_ESQUEMAS, f"{clave}.json")
+    cache = _esquemas.get(ruta)
+    if cache and time.time() - cache["revisado"] < ttl_s:
+        return SimpleNamespace(**cache["esquema"])
+    if cache is None and os.path.exists(ruta):
+        with open(ruta, encoding="utf-8") as f:
+            cache = _esquemas[ruta] = json.load(f)
+        if time.time() - cache.get("revisado", 0) < ttl_s:
+            return SimpleNamespace(**cache["esquema"])
+
+    propiedades = _como_dict(layer.properties)
+    esquema = {
+        "name": propiedades.get("name"),
+        "objectIdField": propiedades.get("objectIdField") or "OBJECTID",
+        "fields": [dict(f) for f in propiedades.get("fields") or []],
+        "version": _version(propiedades),
+    }
+    if cache and cache["esquema"]["version"] != esquema["version"]:
+        logging.warning(f"🔁 El esquema de la capa {esquema['name']} cambió: se recompila el mapeo")
+
+    os.makedirs(os.path.dirname(ruta), exist_ok=True)
+    _esquemas[ruta] = {"revisado": time.time(), "esquema": esquema}
+    tmp = ruta + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(_esquemas[ruta], f, ensure_ascii=False, indent=1)
+    os.replace(tmp, ruta)
+    return SimpleNamespace(**esquema)
+
+
+def invalidar_esquema(clave, directorio=None):
+    """Borra la copia local (p. ej. si ArcGIS rechazó ediciones por un campo inexistente)."""
+    ruta = os.path.join(directorio or RUTA_ESQUEMAS, f"{clave}.json")
+    _esquemas.pop(ruta, None)
+    if os.path.exists(ruta):
+        os.remove(ruta)
+
+
+def _advertir(clave, mensaje):
+    if clave not in _advertidas:
+        _advertidas.add(clave)
+        logging.warning(mensaje)
+
+
+class PlanMapeo:
+    """
+    Plan de conversión compilado una vez por esquema: qué columna del CSV va a
+    qué campo, con qué tipo y longitud, y qué columnas se descartan.
+    """
+
+    def __init__(self, renombres, tipos, longitudes, descartadas):
+        self.renombres = renombres      # {columna CSV: campo ArcGIS}
+        self.tipos = tipos              # {campo: tipo ArcGIS}
+        self.longitudes = longitudes    # {campo: longitud} (texto)
+        self.descartadas = descartadas  # columnas CSV sin campo en la capa
+
+    def aplicar(self, df, conservar=()):
+        """
+        Renombra y selecciona en una sola operación las columnas del plan.
+        Args:
+            conservar: Campos que se mantienen aunque no estén en la capa (p. ej. coordenadas).
+        """
+        columnas = [c for c in df.columns if c in self.renombres or c in conservar]
+        return df[columnas].rename(columns=self.renombres)
+
+
+def compilar_mapeo(column_mapping, esquema, columnas_csv, conservar=()):
+    """
+    Compila el mapeo columna CSV -> campo ArcGIS contra el esquema de la capa.
+    Avisa una sola vez por proceso de las columnas del CSV sin mapeo y de los
+    mapeos que apuntan a campos inexistentes en la capa.
+    Args:
+        column_mapping: dict {columna CSV: campo ArcGIS}. Las columnas que ya se
+            llaman como un campo de la capa no necesitan estar en el mapeo.
+        esquema: Resultado de obtener_esquema.
+        columnas_csv: Encabezados del CSV.
+        conservar: Columnas que se usan aunque no sean campos (p. ej. coordenadas).
+    Returns:
+        PlanMapeo.
+    """
+    clave = (esquema.name, esquema.version, tuple(sorted(column_mapping.items())), tuple(columnas_csv), tuple(conservar))
+    if clave in _planes:
+        return _planes[clave]
+
+    campos = {f["name"]: f for f in esquema.fields}
+    renombres, tipos, longitudes, descartadas = {}, {}, {}, []
+    for columna in columnas_csv:
+        destino = column_mapping.get(columna, columna)
+        if destino in conservar or columna in conservar:
+            renombres[columna] = destino
+            continue
+        if destino not in campos:
+            if columna in column_mapping:
+                _advertir((esquema.name, "campo", destino),
+                          f"⚠️ {esquema.name}: el mapeo '{columna}' -> '{destino}' apunta a un campo que no existe en la capa")
+            else:
+                _advertir((esquema.name, "columna", columna),
+                          f"⚠️ {esquema.name}: la columna '{columna}' del CSV no tiene campo en la capa y se descarta")
+            descartadas.append(columna)
+            continue
+        campo = campos[destino]
+        renombres[columna] = destino
+        tipos[destino] = campo.get("type")
+        if campo.get("length") is not None:
+            longitudes[destino] = campo["length"]
+
+    faltantes = set(column_mapping) - set(columnas_csv)
+    for columna in sorted(faltantes):
+        _advertir((esquema.name, "falta", columna), f"⚠️ {esquema.name}: la columna mapeada '{columna}' no viene en el CSV")
+
+    plan = PlanMapeo(renombres, tipos, longitudes, descartadas)
+    _planes[clave] = plan
+    return plan
@@ -0,0 +1,137 @@
+# utils/geometry_reduction.py
+import json
+import logging
+
+import pandas as pd
+import shapely
+
+from utils.metrics import etapa
+
+# ~5 m en grados cerca del ecuador: no se nota a los zooms del dashboard
+TOLERANCIA_GRADOS = 0.00005
+# 6 decimales en grados son ~0.1 m
+DECIMALES = 6
+
+
+# Coordenadas que se serializan para estimar los bytes (serializarlas todas costaría más que simplificar)
+MUESTRA_BYTES = 20_000
+
+
+def _bytes_coordenadas(geometrias):
+    """Tamaño estimado de las coordenadas en el Esri JSON que se envía (lo que domina el payload)."""
+    coords = shapely.get_coordinates(geometrias)
+    if len(coords) == 0:
+        return 0
+    paso = max(len(coords) // MUESTRA_BYTES, 1)
+    muestra = coords[::paso]
+    return round(len(json.dumps(muestra.tolist(), separators=(",", ":"))) * len(coords) / len(muestra))
+
+
+class ReporteReduccion:
+    """Acumula el ahorro de la reducción entre lotes."""
+
+    def __init__(self):
+        self.features_antes = 0
+        self.features_despues = 0
+        self.vertices_antes = 0
+        self.vertices_despues = 0
+        self.bytes_antes = 0
+        self.bytes_despues = 0
+
+    def sumar(self, antes, despues):
+        self.features_antes += len(antes)
+        self.features_despues += len(despues)
+        self.vertices_antes += int(shapely.get_num_coordinates(antes).sum())
+        self.vertices_despues += int(shapely.get_num_coordinates(despues).sum())
+        self.bytes_antes += _bytes_coordenadas(antes)
+        self.bytes_despues += _bytes_coordenadas(despues)
+
+    def como_dict(self):
+        return dict(vars(self))
+
+    def registrar(self):
+        if not self.vertices_antes:
+            return
+        logging.info(
+            f"✂️ Reducción de geometrías: {self.features_antes} -> {self.features_despues} features, "
+            f"{self.vertices_antes} -> {self.vertices_despues} vértices "
+            f"({self.vertices_antes / max(self.vertices_despues, 1):.1f}x), "
+            f"{self.bytes_antes / 1e6:.1f} -> {self.bytes_despues / 1e6:.1f} MB de coordenadas "
+            f"({self.bytes_antes / max(self.bytes_despues, 1):.1f}x)"
+        )
+
+
+def reducir_geometrias(geometrias, tolerancia=TOLERANCIA_GRADOS, decimales=DECIMALES):
+    """
+    Simplifica sin romper la topología de cada polígono y redondea las coordenadas.
+    El redondeo se hace con set_precision, que ajusta a la grilla y repara lo que
+    se vuelva inválido al colapsar vértices.
+    Args:
+        geometrias: Arreglo de geometrías shapely.
+        tolerancia: Tolerancia de Douglas-Peucker en unidades del CRS (0 para no simplificar).
+        decimales: Decimales que se conservan (None para no redondear).
+    Returns:
+        Arreglo de geometrías reducidas (las que colapsan quedan vacías).
+    """
+    if tolerancia:
+        geometrias = shapely.simplify(geometrias, tolerancia, preserve_topology=True)
+    if decimales is not None:
+        geometrias = shapely.set_precision(geometrias, 10 ** -decimales)
+    return geometrias
+
+
+def disolver(gdf, campo):
+    """
+    Une los polígonos que se tocan y tienen el mismo valor en 'campo'.
+    Los que no se tocan siguen siendo features separadas. Las demás columnas
+    conservan su valor si es el mismo en todo el grupo y quedan vacías si no.
+    """
+    filas = []
+    for _, grupo in gdf.groupby(campo, sort=True):
+        atributos = {
+            c: grupo[c].iloc[0] if grupo[c].nunique(dropna=False) == 1 else None
+            for c in gdf.columns if c != gdf.geometry.name
+        }
+        unido = shapely.unary_union(grupo.geometry.to_numpy())
+        filas.extend(dict(atributos, geometry=parte) for parte in shapely.get_parts(unido))
+    return type(gdf)(filas, columns=gdf.columns, geometry="geometry", crs=gdf.crs)
+
+
+def _partir(gdf, tamano_lote):
+    for inicio in range(0, len(gdf), tamano_lote):
+        yield gdf.iloc[inicio:inicio + tamano_lote]
+
+
+def reducir_lotes(lotes, tolerancia=TOLERANCIA_GRADOS, decimales=DECIMALES, disolver_por=None, tamano_lote=2000, reporte=None):
+    """
+    Aplica la reducción a los lotes de un GeoDataFrame leído en streaming.
+    Para disolver hay que ver todos los polígonos a la vez, así que con
+    'disolver_por' los lotes se juntan, se disuelven y se vuelven a partir
+    en lotes de 'tamano_lote'; sin él, cada lote se reduce al llegar.
+    Args:
+        lotes: Iterable de GeoDataFrames en EPSG:4326 con la geometría en 'geometry'.
+        disolver_por: Columna por la que disolver polígonos vecinos (p. ej. 'SymbolID').
+        reporte: ReporteReduccion donde acumular el ahorro (se crea uno si no se pasa).
+    Yields:
+        GeoDataFrames reducidos.
+    """
+    reporte = reporte if reporte is not None else ReporteReduccion()
+    if disolver_por:
+        lotes = list(lotes)
+        lotes = [pd.concat(lotes, ignore_index=True)] if lotes else []
+    try:
+        for gdf in lotes:
+            with etapa("simplify", filas=len(gdf)):
+                antes = gdf.geometry.to_numpy()
+                if disolver_por:
+                    gdf = disolver(gdf, disolver_por)
+                gdf = gdf.copy()
+                gdf["geometry"] = reducir_geometrias(gdf.geometry.to_numpy(), tolerancia, decimales)
+                gdf = gdf[gdf.geometry.notna() & ~gdf.geometry.is_empty].reset_index(drop=True)
+                reporte.sumar(antes, gdf.geometry.to_numpy())
+            if disolver_por:
+                yield from _partir(gdf, tamano_lote)
+            else:
+                yield gdf
+    finally:
+        reporte.registrar()
@@ -0,0 +1,93 @@
+# utils/geometry_validation.py
+import logging
+from collections import Counter
+
+import numpy as np
+import shapely
+
+# Tipos de shapely.get_type_id
+POLIGONALES = (3, 6)  # Polygon, MultiPolygon
+
+
+def _clase(razon):
+    """'Self-intersection[-75.5 6.2]' -> 'Self-intersection'."""
+    return razon.split("[", 1)[0].strip()
+
+
+def _solo_poligonos(geometrias):
+    """
+    Deja solo la parte poligonal de cada geometría (make_valid puede devolver
+    colecciones con líneas o puntos sueltos). Las que no tienen área quedan en None.
+    """
+    partes, indices = shapely.get_parts(geometrias, return_index=True)
+    # Un segundo nivel: las colecciones pueden traer MultiPolygons adentro
+    partes, sub = shapely.get_parts(partes, return_index=True)
+    indices = indices[sub]
+    es_poligono = shapely.get_type_id(partes) == 3
+    partes, indices = partes[es_poligono], indices[es_poligono]
+
+    resultado = np.full(len(geometrias), None, dtype=object)
+    if len(partes) == 0:
+        return resultado
+    n_partes = np.bincount(indices, minlength=len(geometrias))
+    unicas = n_partes[indices] == 1
+    resultado[indices[unicas]] = partes[unicas]
+    if (~unicas).any():
+        multiples = np.unique(indices[~unicas])
+        # multipolygons agrupa por índice consecutivo: 0..k-1 para las k geometrías con varias partes
+        posicion = np.searchsorted(multiples, indices[~unicas])
+        resultado[multiples] = shapely.multipolygons(partes[~unicas], indices=posicion)
+    return resultado
+
+
+def reparar_geometrias(geometrias, decimales=None):
+    """
+    Valida y repara un arreglo de geometrías con las funciones vectorizadas de shapely 2.
+    - Nulas o vacías: se descartan.
+    - Inválidas: se reparan con make_valid; si eran polígonos se conserva solo la
+      parte con área y se descartan las que no tienen.
+    - Con 'decimales', se ajustan todas a esa grilla con set_precision (que
+      devuelve geometrías válidas) y se descartan las que colapsan.
+    Args:
+        geometrias: Arreglo (o secuencia) de geometrías shapely.
+        decimales: Decimales a conservar en las coordenadas (None para no tocarlas).
+    Returns:
+        (mascara, geometrias, conteo): booleano de las que se conservan, el arreglo
+        reparado (mismo largo que la entrada) y un Counter con cada clase de reparación.
+    """
+    geometrias = np.asarray(geometrias, dtype=object).copy()
+    conteo = Counter()
+
+    ausentes = shapely.is_missing(geometrias) | shapely.is_empty(geometrias)
+    conteo["nula_o_vacia"] += int(ausentes.sum())
+
+    invalidas = ~ausentes & ~shapely.is_valid(geometrias)
+    if invalidas.any():
+        originales = geometrias[invalidas]
+        conteo.update(f"reparada:{_clase(r)}" for r in shapely.is_valid_reason(originales))
+        reparadas = shapely.make_valid(originales)
+        poligonales = np.isin(shapely.get_type_id(originales), POLIGONALES)
+        reparadas[poligonales] = _solo_poligonos(reparadas[poligonales])
+        geometrias[invalidas] = reparadas
+        sin_area = invalidas & (shapely.is_missing(geometrias) | shapely.is_empty(geometrias))
+        conteo["descartada_sin_area"] += int(sin_area.sum())
+        ausentes |= sin_area
+
+    if decimales is not None:
+        vigentes = ~ausentes
+        geometrias[vigentes] = shapely.set_precision(geometrias[vigentes], 10 ** -decimales)
+        colapsadas = vigentes & shapely.is_empty(geometrias)
+        conteo["colapsada_al_redondear"] += int(colapsadas.sum())
+        ausentes |= colapsadas
+
+    return ~ausentes, geometrias, +conteo
+
+
+def registrar_reparaciones(conteo, total):
+    """Resume en el log cuántas geometrías se repararon o descartaron y por qué."""
+    conteo = +conteo
+    if not conteo:
+        logging.info(f"✅ {total} geometrías válidas, sin reparaciones")
+        return
+    detalle = ", ".join(f"{clase}: {n}" for clase, n in conteo.most_common())
+    logging.info(f"🩹 Geometrías revisadas: {total} ({detalle})")
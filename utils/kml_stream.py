@@ -0,0 +1,226 @@
+# utils/kml_stream.py
+import logging
+from collections import Counter
+
+import geopandas as gpd
+import shapely
+from shapely.geometry import GeometryCollection, LineString, MultiPolygon, Point, Polygon
+
+from utils.geometry_validation import registrar_reparaciones, reparar_geometrias
+from utils.metrics import etapa, etapas_de_proceso, sumar_etapas
+from utils.parallel_transform import desempaquetar_gdf, empaquetar_gdf, mapear_en_orden
+
+try:
+    from lxml import etree
+except ImportError:  # ElementTree también hace iterparse en streaming, solo que algo más lento
+    import xml.etree.ElementTree as etree
+
+TAMANO_LOTE = 5000
+# Las coordenadas de KML siempre vienen en WGS84
+EPSG_KML = 4326
+# Con procesos > 1, por debajo de estos Placemarks todo corre en el proceso actual
+MIN_FILAS_PARALELO = 20_000
+
+
+def _nombre(tag):
+    """'{http://www.opengis.net/kml/2.2}Placemark' -> 'Placemark'."""
+    return tag.rsplit("}", 1)[-1] if isinstance(tag, str) else ""
+
+
+def _hijos(elem, nombre):
+    return [h for h in elem if _nombre(h.tag) == nombre]
+
+
+def _hijo(elem, nombre):
+    for h in elem:
+        if _nombre(h.tag) == nombre:
+            return h
+    return None
+
+
+def _coordenadas(elem, conteo):
+    """
+    Lee el texto 'lon,lat[,alt] lon,lat ...' de un nodo <coordinates> como pares 2D.
+    Las tuplas que no son números se saltan y se cuentan en conteo['coordenada_invalida'].
+    """
+    nodo = _hijo(elem, "coordinates")
+    if nodo is None or not nodo.text:
+        return []
+    puntos = []
+    for tupla in nodo.text.split():
+        partes = tupla.split(",")
+        try:
+            if len(partes) < 2:
+                raise ValueError(tupla)
+            puntos.append((float(partes[0]), float(partes[1])))
+        except ValueError:
+            conteo["coordenada_invalida"] += 1
+    return puntos
+
+
+def _anillo(limite, conteo):
+    anillo = _hijo(limite, "LinearRing") if limite is not None else None
+    return _coordenadas(anillo, conteo) if anillo is not None else []
+
+
+def _geometria(elem, conteo):
+    """Convierte un nodo de geometría KML a shapely (Polygon, Point, LineString o multiparte)."""
+    tipo = _nombre(elem.tag)
+    if tipo == "Polygon":
+        exterior = _anillo(_hijo(elem, "outerBoundaryIs"), conteo)
+        if len(exterior) < 3:
+            return None
+        interiores = [_anillo(l, conteo) for l in _hijos(elem, "innerBoundaryIs")]
+        return Polygon(exterior, [i for i in interiores if len(i) >= 3])
+    if tipo == "Point":
+        puntos = _coordenadas(elem, conteo)
+        return Point(puntos[0]) if puntos else None
+    if tipo == "LineString":
+        puntos = _coordenadas(elem, conteo)
+        return LineString(puntos) if len(puntos) >= 2 else None
+    if tipo == "MultiGeometry":
+        partes = [g for g in (_geometria(h, conteo) for h in elem) if g is not None]
+        if not partes:
+            return None
+        if all(isinstance(g, Polygon) for g in partes):
+            return MultiPolygon(partes)
+        return GeometryCollection(partes)
+    return None
+
+
+def _leer_placemark(elem, conteo):
+    """Extrae Name, Description, ExtendedData y geometría de un <Placemark>."""
+    registro = {"Name": None, "Description": None}
+    geometria = None
+    for hijo in elem:
+        nombre = _nombre(hijo.tag)
+        if nombre == "name":
+            registro["Name"] = (hijo.text or "").strip()
+        elif nombre == "description":
+            registro["Description"] = hijo.text
+        elif nombre == "ExtendedData":
+            for dato in hijo.iter():
+                tipo = _nombre(dato.tag)
+                if tipo == "SimpleData":
+                    registro[dato.get("name")] = dato.text
+                elif tipo == "Data":
+                    valor = _hijo(dato, "value")
+                    registro[dato.get("name")] = valor.text if valor is not None else None
+        elif nombre in ("Polygon", "Point", "LineString", "MultiGeometry"):
+            geometria = _geometria(hijo, conteo)
+    return registro, geometria
+
+
+@etapa("validate")
+def _lote_a_gdf(registros, geometrias, crs_destino, conteo, decimales=None):
+    """Arma el GeoDataFrame del lote reparando en bloque las geometrías inválidas (ver geometry_validation)."""
+    conservar, geometrias, conteo_lote = reparar_geometrias(geometrias, decimales)
+    conteo.update(conteo_lote)
+    gdf = gpd.GeoDataFrame(registros, geometry=geometrias, crs=f"EPSG:{EPSG_KML}")
+    if not conservar.all():
+        gdf = gdf[conservar]
+    # Reproyectar solo si hace falta: comparar enteros es gratis, to_crs/to_epsg no
+    if crs_destino and crs_destino != EPSG_KML:
+        gdf = gdf.to_crs(epsg=crs_destino)
+    return gdf
+
+
+def _siguiente_lote(eventos, tamano_lote, conteo):
+    """Avanza el iterparse hasta juntar tamano_lote Placemarks (o agotar el archivo)."""
+    registros, geometrias = [], []
+    for _, elem in eventos:
+        if _nombre(elem.tag) != "Placemark":
+            continue
+        registro, geometria = _leer_placemark(elem, conteo)
+        registros.append(registro)
+        geometrias.append(geometria)
+        elem.clear()
+        # clear() deja el Placemark vacío colgando de su padre: con lxml se sueltan también
+        # los hermanos ya procesados para que el árbol no crezca con el archivo
+        if hasattr(elem, "getprevious"):
+            while elem.getprevious() is not None:
+                del elem.getparent()[0]
+        if len(registros) >= tamano_lote:
+            break
+    return registros, geometrias
+
+
+def _procesar_lote(registros, wkb, crs_destino, decimales, transformar):
+    """
+    Validación, reproyección y transformación de un lote (en un proceso del pool).
+    Returns:
+        (GeoDataFrame empaquetado, conteo de reparaciones, etapas medidas en el proceso).
+    """
+    conteo = Counter()
+    with etapas_de_proceso() as etapas:
+        gdf = _lote_a_gdf(registros, shapely.from_wkb(wkb), crs_destino, conteo, decimales)
+        if transformar is not None and not gdf.empty:
+            gdf = transformar(gdf)
+    return empaquetar_gdf(gdf), conteo, etapas
+
+
+def leer_kml_por_lotes(fuente, tamano_lote=TAMANO_LOTE, crs_destino=EPSG_KML, decimales=None,
+                       transformar=None, procesos=1):
+    """
+    Lee un KML en streaming y produce GeoDataFrames de tamaño fijo.
+    Cada <Placemark> se libera de memoria en cuanto se procesa, así que el
+    consumo se mantiene plano aunque el archivo crezca.
+    Args:
+        fuente: Ruta o archivo binario (p. ej. response.raw de requests).
+        tamano_lote: Número de Placemarks por GeoDataFrame.
+        crs_destino: EPSG al que se reproyecta cada lote (KML siempre viene en 4326).
+        decimales: Si se indica, las coordenadas se ajustan a esa cantidad de decimales.
+        transformar: Función opcional (de nivel de módulo) que se aplica a cada lote no vacío.
+            Con procesos viaja en cada tarea, pero los procesos reimportan los módulos: la
+            configuración que cambie en tiempo de ejecución debe ir en ella (functools.partial
+            u objeto invocable), no leerse de variables globales.
+        procesos: Con más de 1 (o None: uno por núcleo), validación, reproyección y
+            'transformar' corren en un pool de procesos; el parseo del XML sigue aquí.
+    Yields:
+        GeoDataFrame con columnas Name, Description, campos de ExtendedData y geometry
+        (o lo que devuelva 'transformar'), en el orden del archivo.
+    """
+    eventos = etree.iterparse(fuente, events=("end",))
+    total = 0
+    conteo = Counter()
+
+    def lotes_crudos():
+        nonlocal total
+        while True:
+            # El parseo se mide entre yields: el consumidor no cuenta como tiempo de parse
+            with etapa("parse") as registro:
+                registros, geometrias = _siguiente_lote(eventos, tamano_lote, conteo)
+                registro.filas += len(registros)
+            if not registros:
+                return
+            total += len(registros)
+            yield registros, geometrias
+
+    if procesos == 1:
+        for registros, geometrias in lotes_crudos():
+            gdf = _lote_a_gdf(registros, geometrias, crs_destino, conteo, decimales)
+            yield transformar(gdf) if transformar is not None and not gdf.empty else gdf
+    else:
+        # Geometrías como WKB: bastante más barato de picklear que los objetos shapely
+        tareas = (
+            (registros, shapely.to_wkb(geometrias), crs_destino, decimales, transformar)
+            for registros, geometrias in lotes_crudos()
+        )
+        min_tareas = -(-MIN_FILAS_PARALELO // tamano_lote)
+        resultados = mapear_en_orden(_procesar_lote, tareas, procesos, min_tareas=min_tareas)
+        while True:
+            # Tiempo que el lector espera a los procesos; el trabajo en sí llega con cada resultado
+            with etapa("espera_procesos") as registro:
+                siguiente = next(resultados, None)
+                if siguiente is not None:
+                    paquete, conteo_lote, etapas = siguiente
+                    gdf = desempaquetar_gdf(paquete)
+                    registro.filas += len(gdf)
+            if siguiente is None:
+                break
+            conteo.update(conteo_lote)
+            sumar_etapas(etapas)
+            yield gdf
+    logging.info(f"🧩 KML leído en streaming: {total} Placemarks")
+    registrar_reparaciones(conteo, total)
+
@@ -0,0 +1,532 @@
+# utils/layer_sync.py
+import argparse
+import hashlib
+import json
+import logging
+import os
+import sys
+import threading
+import time
+
+from utils.batch_upload import subir_por_lotes
+from utils.esri_encoder import features_esri
+from utils.metrics import etapa, registrar_http
+from utils.transactional_publish import publicar_transaccional, reanudar_plan
+
+# Campos que ArcGIS gestiona por su cuenta y que nunca se comparan
+CAMPOS_SISTEMA = {"OBJECTID", "FID", "GlobalID", "Shape__Area", "Shape__Length"}
+
+# Campo de la capa donde se guarda el hash de lo que se publicó en cada feature.
+# La comparación usa ese valor y no lo que devuelve la capa: el servidor guarda la
+# geometría en Web Mercator y cambia tipos (texto -> double, fechas -> epoch), así
+# que un hash del eco no coincide nunca del todo con el de lo enviado.
+CAMPO_HASH = "sync_hash"
+DEFINICION_CAMPO_HASH = {"name": CAMPO_HASH, "type": "esriFieldTypeString", "alias": CAMPO_HASH,
+                         "length": 40, "nullable": True, "editable": True}
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Decimales usados al normalizar números antes de calcular el hash
+DECIMALES_HASH = 7
+
+# Reportes de sincronización del hilo actual (los usa el orquestador para el resumen)
+_registro = threading.local()
+
+# Índice {clave: [(oid, hash)]} de cada capa tras su última sincronización. En un
+# proceso que no termina (serve/Run_daemon.py) evita volver a consultar la capa
+# entera; None lo desactiva (cada ejecución consulta la capa, como un script suelto).
+INDICE_TTL_S = None
+_indices = {}
+_lock_indices = threading.Lock()
+
+
+def iniciar_registro():
+    """Empieza a acumular los reportes de sincronizar_capa* hechos en este hilo."""
+    _registro.reportes = []
+
+
+def reportes_registrados():
+    """Reportes acumulados en este hilo desde iniciar_registro()."""
+    return list(getattr(_registro, "reportes", []))
+
+
+def recordar_indices(ttl_s):
+    """
+    Guarda en memoria el índice de cada capa sincronizada y lo reutiliza durante ttl_s
+    segundos en lugar de consultarla. Los cambios hechos a la capa por fuera del
+    proceso no se ven hasta que vence el TTL; cualquier fallo de edición lo descarta.
+    """
+    global INDICE_TTL_S
+    INDICE_TTL_S = ttl_s
+    if not ttl_s:
+        _indices.clear()
+
+
+def _clave_capa(layer):
+    # Las capas se vuelven a obtener en cada ejecución: se identifican por su URL
+    return getattr(layer, "url", None) or id(layer)
+
+
+def olvidar_indice(layer):
+    """Descarta el índice recordado de una capa (p. ej. si se editó sin pasar por aquí)."""
+    with _lock_indices:
+        _indices.pop(_clave_capa(layer), None)
+
+
+def _indice_recordado(layer, campos, campos_clave):
+    """(remotas, momento de la consulta original) si hay un índice vigente; si no, None."""
+    if not INDICE_TTL_S:
+        return None
+    with _lock_indices:
+        entrada = _indices.get(_clave_capa(layer))
+    if entrada is None or entrada["campos"] != (campos, campos_clave):
+        return None
+    if time.monotonic() - entrada["consultado"] > INDICE_TTL_S:
+        return None
+    return {clave: list(entradas) for clave, entradas in entrada["remotas"].items()}, entrada["consultado"]
+
+
+def _recordar_indice(layer, campos, campos_clave, emparejadas, consultado):
+    remotas = {}
+    for clave, oid, h in emparejadas:
+        remotas.setdefault(clave, []).append((oid, h))
+    with _lock_indices:
+        _indices[_clave_capa(layer)] = {"campos": (campos, campos_clave), "remotas": remotas, "consultado": consultado}
+
+
+def _como_dict(feature):
+    """Acepta un dict Esri JSON o un objeto Feature de arcgis y devuelve el dict."""
+    if hasattr(feature, "as_dict"):
+        return feature.as_dict
+    return feature
+
+
+def _normalizar(valor, decimales):
+    """
+    Normaliza recursivamente un valor para que el hash sea estable:
+    redondea flotantes, convierte flotantes enteros a int y descarta
+    la referencia espacial de las geometrías.
+    """
+    if isinstance(valor, bool) or valor is None:
+        return valor
+    if isinstance(valor, float):
+        if valor != valor:  # NaN
+            return None
+        valor = round(valor, decimales)
+        return int(valor) if valor.is_integer() else valor
+    if isinstance(valor, int):
+        return valor
+    if isinstance(valor, dict):
+        return {k: _normalizar(v, decimales) for k, v in valor.items() if k != "spatialReference"}
+    if isinstance(valor, (list, tuple)):
+        return [_normalizar(v, decimales) for v in valor]
+    if hasattr(valor, "item"):  # Escalares numpy
+        return _normalizar(valor.item(), decimales)
+    return str(valor)
+
+
+def calcular_hash_feature(feature, campos, decimales=DECIMALES_HASH):
+    """
+    Calcula un hash estable (SHA-1) de los atributos indicados y la geometría.
+    Args:
+        feature: Dict Esri JSON con 'attributes' y 'geometry'.
+        campos: Lista de campos de atributos a incluir en el hash.
+        decimales: Precisión usada para redondear coordenadas y flotantes.
+    """
+    atributos = feature.get("attributes") or {}
+    contenido = {
+        "a": {c: _normalizar(atributos.get(c), decimales) for c in campos},
+        "g": _normalizar(feature.get("geometry"), decimales),
+    }
+    texto = json.dumps(contenido, sort_keys=True, separators=(",", ":"), ensure_ascii=False)
+    return hashlib.sha1(texto.encode("utf-8")).hexdigest()
+
+
+def _clave(feature, campos_clave, hash_feature):
+    """Clave natural (tupla de atributos) o, si no está configurada, el propio hash."""
+    if not campos_clave:
+        return hash_feature
+    atributos = feature.get("attributes") or {}
+    return tuple(_normalizar(atributos.get(c), DECIMALES_HASH) for c in campos_clave)
+
+
+def _sellar(feature, h, campo_hash):
+    """Copia de la feature con su hash en el campo de la capa (la original no se toca)."""
+    if not campo_hash:
+        return feature
+    return {"attributes": dict(feature.get("attributes") or {}, **{campo_hash: h}), "geometry": feature.get("geometry")}
+
+
+@etapa("encode")
+def features_desde_gdf(gdf):
+    """
+    Convierte un GeoDataFrame en una lista de dicts Esri JSON, por columnas y sin
+    pasar por GeoAccessor (ver utils/esri_encoder.py).
+    """
+    return features_esri(gdf)
+
+
+def indexar_remotas(features_remotas, oid_field="OBJECTID", campos_clave=None, campo_hash=CAMPO_HASH):
+    """
+    Indexa las features de la capa por clave, con el hash guardado en campo_hash
+    (None si la feature no lo tiene o la capa no tiene el campo: cuenta como cambiada).
+    Returns:
+        (remotas, duplicadas): dict {clave: [(oid, hash), ...]} y lista de OIDs
+        sobrantes cuando la clave natural está repetida en la capa.
+    """
+    remotas = {}
+    duplicadas = []
+    for feature in features_remotas:
+        feature = _como_dict(feature)
+        h = (feature.get("attributes") or {}).get(campo_hash) if campo_hash else None
+        clave = _clave(feature, campos_clave, h)
+        oid = (feature.get("attributes") or {}).get(oid_field)
+        if campos_clave and clave in remotas:
+            # Clave natural duplicada en la capa: se conserva la primera y se borra el resto
+            duplicadas.append(oid)
+            continue
+        # Sin clave natural, las copias idénticas se cuentan una a una
+        remotas.setdefault(clave, []).append((oid, h))
+    return remotas, duplicadas
+
+
+def clasificar_lote(features_locales, remotas, campos, oid_field="OBJECTID", campos_clave=None, vistas=None,
+                    emparejadas=None, campo_hash=CAMPO_HASH):
+    """
+    Clasifica un lote de features locales en altas, cambios o sin cambios.
+    Consume de 'remotas' las entradas emparejadas, de modo que lo que quede
+    al final del último lote son las bajas. Las altas y cambios salen con su
+    hash en campo_hash, para compararlas en la próxima sincronización.
+    Args:
+        vistas: Conjunto de claves naturales ya procesadas en lotes anteriores.
+        emparejadas: Lista a la que se agrega (clave, oid, hash) de cada feature
+            local, con oid None para las altas (en el mismo orden que 'adds').
+    Returns:
+        (adds, updates, sin_cambios)
+    """
+    vistas = set() if vistas is None else vistas
+    adds, updates = [], []
+    sin_cambios = 0
+    for feature in features_locales:
+        feature = _como_dict(feature)
+        h = calcular_hash_feature(feature, campos)
+        clave = _clave(feature, campos_clave, h)
+        if campos_clave:
+            if clave in vistas:
+                logging.warning(f"⚠️ Clave duplicada en los datos locales: {clave}")
+                continue
+            vistas.add(clave)
+
+        candidatas = remotas.get(clave)
+        if not candidatas:
+            adds.append(_sellar(feature, h, campo_hash))
+            if emparejadas is not None:
+                emparejadas.append((clave, None, h))
+            continue
+        oid, h_remoto = candidatas.pop()
+        if not candidatas:
+            del remotas[clave]
+        if emparejadas is not None:
+            emparejadas.append((clave, oid, h))
+        if h_remoto == h:
+            sin_cambios += 1
+        else:
+            actualizada = _sellar(feature, h, campo_hash)
+            updates.append({
+                "attributes": dict(actualizada.get("attributes") or {}, **{oid_field: oid}),
+                "geometry": actualizada.get("geometry"),
+            })
+    return adds, updates, sin_cambios
+
+
+def calcular_cambios(features_locales, features_remotas, campos, oid_field="OBJECTID", campos_clave=None,
+                     campo_hash=CAMPO_HASH):
+    """
+    Compara las features locales con las de la capa y devuelve las ediciones.
+    Args:
+        features_locales: Lista de dicts Esri JSON a publicar.
+        features_remotas: Lista de dicts Esri JSON leídos de la capa (con OID y campo_hash).
+        campos: Campos de atributos que participan en la comparación.
+        oid_field: Nombre del campo ObjectID de la capa.
+        campos_clave: Campos que forman la clave natural. Si es None, la clave es el hash.
+    Returns:
+        dict con 'adds', 'updates' y 'deletes' (lista de OIDs) y 'sin_cambios' (int).
+    """
+    remotas, deletes = indexar_remotas(features_remotas, oid_field, campos_clave, campo_hash)
+    adds, updates, sin_cambios = clasificar_lote(
+        features_locales, remotas, campos, oid_field, campos_clave, campo_hash=campo_hash
+    )
+    deletes.extend(oid for entradas in remotas.values() for oid, _ in entradas)
+    return {"adds": adds, "updates": updates, "deletes": deletes, "sin_cambios": sin_cambios}
+
+
+def _campos_comparables(propiedades, features, oid_field):
+    campos = {c for f in features for c in (f.get("attributes") or {})} - CAMPOS_SISTEMA - {oid_field, CAMPO_HASH}
+    campos_capa = {field["name"] for field in (getattr(propiedades, "fields", None) or [])}
+    if campos_capa:
+        # Los campos que no existen en la capa se ignoran al publicar, así que tampoco se comparan
+        campos &= campos_capa
+    return sorted(campos)
+
+
+def _nombres_campos(propiedades):
+    return {field["name"] for field in (getattr(propiedades, "fields", None) or [])}
+
+
+def tiene_campo_hash(layer, propiedades=None):
+    """
+    Comprueba que la capa tenga el campo CAMPO_HASH (se agrega una sola vez con
+    agregar_campo_hash o 'python -m utils.layer_sync agregar-campo-hash').
+    Returns:
+        CAMPO_HASH si la capa lo tiene; None si no.
+    """
+    if CAMPO_HASH in _nombres_campos(propiedades if propiedades is not None else layer.properties):
+        return CAMPO_HASH
+    if propiedades is not None and CAMPO_HASH in _nombres_campos(layer.properties):
+        # El esquema cacheado (utils.field_mapping) es anterior al campo
+        return CAMPO_HASH
+    return None
+
+
+def agregar_campo_hash(layer):
+    """
+    Migración única: agrega CAMPO_HASH al esquema de la capa (addToDefinition:
+    manager.add_to_definition en arcgis, agregar_campos en CapaREST y en las capas
+    de prueba). Las features existentes se sellan en la siguiente sincronización.
+    Returns:
+        True si la capa ya tenía el campo o se pudo agregar.
+    """
+    if tiene_campo_hash(layer):
+        logging.info(f"✅ La capa ya tiene el campo '{CAMPO_HASH}'")
+        return True
+    try:
+        manager = getattr(layer, "manager", None)
+        if manager is not None and hasattr(manager, "add_to_definition"):
+            resultado = manager.add_to_definition({"fields": [DEFINICION_CAMPO_HASH]})
+        elif hasattr(layer, "agregar_campos"):
+            resultado = layer.agregar_campos([DEFINICION_CAMPO_HASH])
+        else:
+            resultado = None
+        if not resultado or (isinstance(resultado, dict) and not resultado.get("success", True)):
+            raise RuntimeError(resultado or "la capa no permite agregar campos")
+    except Exception as e:
+        logging.error(f"❌ No se pudo agregar el campo '{CAMPO_HASH}': {e}")
+        return False
+    logging.info(f"🧷 Campo '{CAMPO_HASH}' agregado a la capa")
+    return True
+
+
+def sincronizar_capa(layer, features, campos_clave=None, dry_run=False, opciones_subida=None, esquema=None,
+                     journal=None, con_oids=False):
+    """
+    Sincroniza una capa con las features dadas enviando solo las diferencias
+    (altas, cambios y bajas) mediante el cargador por lotes.
+    Reemplaza el patrón delete_features(where='1=1') + edit_features(adds=...).
+    Args:
+        layer: FeatureLayer de arcgis (o cualquier objeto con query/edit_features).
+        features: Lista de dicts Esri JSON ({'attributes', 'geometry'}).
+        campos_clave: Campos que forman la clave natural (opcional).
+        dry_run: Si es True, solo informa lo que cambiaría sin editar la capa.
+        opciones_subida: kwargs para subir_por_lotes (tamaños, workers, reintentos).
+        esquema: objectIdField y fields ya conocidos (ver utils.field_mapping); evita
+            pedir las properties de la capa.
+        journal: Nombre del journal para publicar de forma transaccional (ver
+            utils.transactional_publish); None envía las ediciones con el cargador por lotes.
+            Con journal todas las ediciones se juntan en memoria antes de enviarlas.
+        con_oids: Si es True, el reporte incluye 'oids': el OBJECTID en que quedó cada
+            feature local, en orden (None si falló; con campos_clave, las de clave
+            repetida no cuentan).
+    Returns:
+        dict con el conteo de 'adds', 'updates', 'deletes', 'sin_cambios' y 'exito'.
+    """
+    return sincronizar_capa_por_lotes(
+        layer, [features], campos_clave, dry_run, opciones_subida, esquema, journal, con_oids
+    )
+
+
+def sincronizar_capa_por_lotes(layer, lotes, campos_clave=None, dry_run=False, opciones_subida=None, esquema=None,
+                               journal=None, con_oids=False):
+    """
+    Igual que sincronizar_capa, pero consume un iterable de lotes de features
+    (p. ej. generado mientras se parsea un KML en streaming). Las altas y
+    cambios de cada lote se envían en cuanto se calculan; las bajas se envían
+    al final, cuando ya se conocen todas las claves locales.
+    Si no llega ninguna feature local, no se borra nada y se devuelve exito=False.
+    La capa se consulta sin geometría: solo OID, claves y el hash guardado en
+    CAMPO_HASH (ver agregar_campo_hash). Si la capa no tiene ese campo no se edita nada
+    y se devuelve exito=False. Con recordar_indices() activo, la capa se
+    consulta solo si no hay un índice vigente de la sincronización anterior.
+    Con 'journal', primero se termina el plan que haya quedado a medias y las
+    ediciones se acumulan en memoria para publicarlas al final con
+    applyEdits(rollbackOnFailure): se pierde el streaming, y la atomicidad solo vale
+    dentro de cada bloque de utils.transactional_publish.TAMANO_BLOQUE ediciones.
+    """
+    opciones_subida = opciones_subida or {}
+    propiedades = esquema if esquema is not None else layer.properties
+    oid_field = getattr(propiedades, "objectIdField", None) or "OBJECTID"
+    reporte = {"adds": 0, "updates": 0, "deletes": 0, "sin_cambios": 0, "exito": True}
+    remotas = campos = None
+    deletes = []
+    vistas = set()
+    total_locales = 0
+    # (clave, oid, hash) del estado en que queda la capa, para recordar su índice
+    emparejadas = [] if INDICE_TTL_S or con_oids else None
+    consultado = time.monotonic()
+    campo_hash = tiene_campo_hash(layer, esquema)
+    if campo_hash is None:
+        # Sin el hash de lo publicado no se sabe qué cambió: se reescribiría la capa entera cada vez
+        if not dry_run:
+            logging.error(
+                f"❌ La capa no tiene el campo '{CAMPO_HASH}': no se sincroniza. Agréguelo una vez con "
+                f"'python -m utils.layer_sync agregar-campo-hash <item_id>'"
+            )
+            reporte["exito"] = False
+            registrar_reporte(reporte)
+            return reporte
+        logging.warning(f"⚠️ La capa no tiene el campo '{CAMPO_HASH}': al publicar la sincronización fallaría")
+    adds_pendientes, updates_pendientes = [], []
+    if journal and not dry_run:
+        if reanudar_plan(layer, journal) is not None:
+            olvidar_indice(layer)
+
+    for lote in lotes:
+        lote = [_como_dict(f) for f in lote]
+        if not lote:
+            continue
+        total_locales += len(lote)
+
+        if remotas is None:
+            # Los campos a comparar se deducen del primer lote (todos comparten esquema)
+            campos = _campos_comparables(propiedades, lote, oid_field)
+            recordado = _indice_recordado(layer, campos, campos_clave)
+            if recordado is not None:
+                remotas, consultado = recordado
+                logging.info(f"🧠 Índice de la capa en memoria ({sum(map(len, remotas.values()))} features), sin consultarla")
+            else:
+                out_fields = ",".join(dict.fromkeys([oid_field, *([campo_hash] if campo_hash else []), *(campos_clave or [])]))
+                logging.info(f"🔎 Consultando claves y hashes de la capa ({out_fields})...")
+                with etapa("query") as registro:
+                    consulta = layer.query(where="1=1", out_fields=out_fields, return_geometry=False)
+                    registrar_http()
+                    registro.filas += len(consulta.features)
+                with etapa("diff"):
+                    remotas, deletes = indexar_remotas(consulta.features, oid_field, campos_clave, campo_hash)
+                sin_hash = sum(h is None for entradas in remotas.values() for _, h in entradas)
+                if campo_hash and sin_hash:
+                    logging.info(f"🧷 {sin_hash} features de la capa aún sin '{campo_hash}': se reescriben una vez")
+
+        inicio = len(emparejadas) if emparejadas is not None else 0
+        with etapa("diff", filas=len(lote)):
+            adds, updates, sin_cambios = clasificar_lote(
+                lote, remotas, campos, oid_field, campos_clave, vistas, emparejadas, campo_hash
+            )
+        reporte["adds"] += len(adds)
+        reporte["updates"] += len(updates)
+        reporte["sin_cambios"] += sin_cambios
+        if journal:
+            # Modo transaccional: nada se envía hasta conocer todas las ediciones
+            adds_pendientes += adds
+            updates_pendientes += updates
+        elif not dry_run:
+            ids = _enviar(
+                layer, "adds", adds, reporte, opciones_subida, con_ids=emparejadas is not None,
+                campo_hash=campo_hash, oid_field=oid_field,
+            )
+            _enviar(layer, "updates", updates, reporte, opciones_subida)
+            if emparejadas is not None:
+                # Las altas quedaron con oid None en el orden de 'adds': se completan con los OID devueltos
+                altas = (i for i in range(inicio, len(emparejadas)) if emparejadas[i][1] is None)
+                for posicion, i in enumerate(altas):
+                    clave, _, h = emparejadas[i]
+                    emparejadas[i] = (clave, ids.get(posicion), h)
+
+    if remotas is None:
+        logging.warning("⚠️ No llegaron features locales: no se modifica la capa.")
+        reporte["exito"] = False
+        return reporte
+
+    deletes.extend(oid for entradas in remotas.values() for oid, _ in entradas)
+    reporte["deletes"] = len(deletes)
+    logging.info(
+        f"🧮 Diferencias: +{reporte['adds']} altas, ~{reporte['updates']} cambios, "
+        f"-{reporte['deletes']} bajas, ={reporte['sin_cambios']} sin cambios ({total_locales} locales)"
+    )
+
+    if dry_run:
+        logging.info("🧪 Modo dry-run: no se envían ediciones a ArcGIS.")
+        registrar_reporte(reporte)
+        return reporte
+
+    if journal:
+        resultado = publicar_transaccional(
+            layer, journal, adds_pendientes, updates_pendientes, deletes, campo_hash=campo_hash, oid_field=oid_field
+        )
+        reporte["exito"] = resultado["exito"]
+        if emparejadas is not None:
+            altas = (i for i, (_, oid, _) in enumerate(emparejadas) if oid is None)
+            for posicion, i in enumerate(altas):
+                clave, _, h = emparejadas[i]
+                emparejadas[i] = (clave, resultado["ids"].get(posicion), h)
+    elif deletes and not reporte["exito"]:
+        # Si fallaron altas o cambios, no se borra nada para no dejar la capa incompleta
+        logging.warning(f"⚠️ Se omiten {len(deletes)} bajas porque hubo fallos previos.")
+    else:
+        _enviar(layer, "deletes", deletes, reporte, opciones_subida)
+
+    if not (reporte["adds"] or reporte["updates"] or reporte["deletes"]):
+        logging.info("✅ La capa ya está al día, no hay ediciones que enviar.")
+    if con_oids:
+        reporte["oids"] = [oid for _, oid, _ in emparejadas]
+    if INDICE_TTL_S:
+        if reporte["exito"]:
+            _recordar_indice(layer, campos, campos_clave, emparejadas, consultado)
+        else:
+            olvidar_indice(layer)
+    registrar_reporte(reporte)
+    return reporte
+
+
+def registrar_reporte(reporte):
+    """Deja el reporte para el resumen del orquestador (ver iniciar_registro)."""
+    if hasattr(_registro, "reportes"):
+        _registro.reportes.append(dict(reporte))
+
+
+def _enviar(layer, tipo, items, reporte, opciones_subida, con_ids=False, campo_hash=None, oid_field="OBJECTID"):
+    """
+    Envía un tipo de edición con el cargador por lotes y actualiza el reporte.
+    Returns:
+        {posición: objectId} de las ediciones exitosas si con_ids, si no {}.
+    """
+    if not items:
+        return {}
+    with etapa("delete" if tipo == "deletes" else "upload", filas=len(items)):
+        resultado = subir_por_lotes(
+            layer, items, tipo=tipo, con_ids=con_ids, campo_hash=campo_hash, oid_field=oid_field, **opciones_subida
+        )
+    if resultado["fallidos"]:
+        reporte["exito"] = False
+        error = (resultado["errores"] or [{"error": "Sin detalles"}])[0]["error"]
+        logging.error(f"❌ {resultado['fallidos']} fallos en {tipo}: {error}")
+    return resultado.get("ids", {})
+
+
+def main():
+    sys.path.append(ROOT_DIR)
+    parser = argparse.ArgumentParser(description="Migraciones de las capas que sincronizan los pipelines.")
+    sub = parser.add_subparsers(dest="comando", required=True)
+    campo = sub.add_parser("agregar-campo-hash", help=f"Agrega el campo '{CAMPO_HASH}' a las capas indicadas")
+    campo.add_argument("item_ids", nargs="+")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+    from utils.arcgis_auth import autenticar_arcgis
+    from utils.rest_layer import obtener_capa
+
+    gis = autenticar_arcgis(diferido=True)
+    ok = bool(gis) and all([agregar_campo_hash(obtener_capa(gis, item_id)) for item_id in args.item_ids])
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()
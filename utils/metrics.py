@@ -0,0 +1,288 @@
+# utils/metrics.py
+import contextlib
+import functools
+import json
+import logging
+import os
+import sys
+import threading
+import time
+import uuid
+from datetime import datetime, timezone
+
+# Métricas por etapa en la carpeta 'output' de la raíz del proyecto
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+RUTA_METRICAS = os.path.join(ROOT_DIR, "output", "metricas.jsonl")
+# Carpeta del textfile collector de node_exporter (opcional)
+PROMETHEUS_DIR = os.getenv("METRICAS_PROMETHEUS_DIR")
+
+# Ejecución instrumentada y pila de etapas abiertas del hilo actual
+_actual = threading.local()
+_lock_escritura = threading.Lock()
+# Líneas de la última ejecución de cada pipeline (las consulta el estado del daemon)
+_ultimas = {}
+
+
+def rss_pico_mb():
+    """Pico de memoria residente del proceso en MB (None si no se puede medir)."""
+    try:
+        import resource
+    except ImportError:  # Windows
+        resource = None
+    if resource is not None:
+        pico = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # Linux lo da en KB y macOS en bytes
+        return round(pico / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+    try:
+        import psutil
+    except ImportError:
+        return None
+    memoria = psutil.Process().memory_info()
+    return round(getattr(memoria, "peak_wset", memoria.rss) / (1024 * 1024), 1)
+
+
+class Etapa:
+    """Acumulado de una etapa: tiempo propio, llamadas, filas, bytes y peticiones HTTP."""
+
+    def __init__(self, nombre):
+        self.nombre = nombre
+        self.duracion_s = 0.0
+        self.llamadas = 0
+        self.filas = 0
+        self.bytes = 0
+        self.http = 0
+        self.rss_pico_mb = None
+
+    def como_dict(self):
+        return {
+            "etapa": self.nombre,
+            "duracion_s": round(self.duracion_s, 4),
+            "llamadas": self.llamadas,
+            "filas": self.filas,
+            "bytes": self.bytes,
+            "http": self.http,
+            "rss_pico_mb": self.rss_pico_mb,
+        }
+
+
+class Metricas:
+    """Métricas de una ejecución de un pipeline."""
+
+    def __init__(self, pipeline):
+        self.pipeline = pipeline
+        self.id_ejecucion = uuid.uuid4().hex[:12]
+        self.fecha = datetime.now(timezone.utc).isoformat(timespec="seconds")
+        self.inicio = time.perf_counter()
+        self.etapas = {}
+        self.duracion_s = None
+        self.estado = None
+
+    def etapa(self, nombre):
+        if nombre not in self.etapas:
+            self.etapas[nombre] = Etapa(nombre)
+        return self.etapas[nombre]
+
+    def cerrar(self, estado):
+        self.duracion_s = time.perf_counter() - self.inicio
+        self.estado = estado
+
+    def lineas(self):
+        """Una línea por etapa más una línea 'total' (las filas no se suman: cada etapa ve las mismas)."""
+        base = {"fecha": self.fecha, "ejecucion": self.id_ejecucion, "pipeline": self.pipeline}
+        lineas = [dict(base, **e.como_dict()) for e in self.etapas.values()]
+        lineas.append(dict(
+            base, etapa="total", duracion_s=round(self.duracion_s or 0.0, 4), estado=self.estado,
+            bytes=sum(e.bytes for e in self.etapas.values()),
+            http=sum(e.http for e in self.etapas.values()),
+            rss_pico_mb=rss_pico_mb(),
+        ))
+        return lineas
+
+
+def metricas_actuales():
+    return getattr(_actual, "metricas", None)
+
+
+def ultimas_metricas():
+    """{pipeline: líneas por etapa + 'total'} de la última ejecución de cada pipeline en este proceso."""
+    with _lock_escritura:
+        return dict(_ultimas)
+
+
+@contextlib.contextmanager
+def etapa(nombre, filas=0):
+    """
+    Mide una etapa del pipeline en curso (fetch, parse, transform, validate, query, diff, delete, upload).
+    Las etapas anidadas pausan a la que las contiene: cada etapa acumula solo su
+    tiempo propio y la suma de todas es el tiempo instrumentado. Sin una ejecución
+    instrumentada (p. ej. en benchmarks) no registra nada.
+    Args:
+        nombre: Nombre de la etapa; varias entradas con el mismo nombre se acumulan.
+        filas: Filas procesadas (también se pueden sumar luego en el objeto devuelto).
+    Yields:
+        Etapa, para sumar filas o bytes desde dentro.
+    """
+    metricas = metricas_actuales()
+    if metricas is None:
+        yield Etapa(nombre)
+        return
+
+    registro = metricas.etapa(nombre)
+    registro.filas += filas
+    pila = _actual.pila
+    ahora = time.perf_counter()
+    if pila:
+        padre = pila[-1]
+        padre[0].duracion_s += ahora - padre[1]
+    marco = [registro, ahora]
+    pila.append(marco)
+    try:
+        yield registro
+    finally:
+        ahora = time.perf_counter()
+        pila.pop()
+        registro.duracion_s += ahora - marco[1]
+        registro.llamadas += 1
+        registro.rss_pico_mb = rss_pico_mb()
+        if pila:
+            pila[-1][1] = ahora
+
+
+@contextlib.contextmanager
+def etapas_de_proceso():
+    """
+    Mide las etapas de un trabajo que corre en un proceso del pool (utils.parallel_transform),
+    donde no hay ejecución instrumentada, para devolverlas junto con su resultado.
+    Si el trabajo corre en un hilo que ya tiene ejecución (el pool cayó a serie), las etapas
+    se registran ahí mismo y la lista queda vacía.
+    Yields:
+        Lista que al salir trae Etapa.como_dict() de cada etapa medida.
+    """
+    etapas = []
+    if metricas_actuales() is not None:
+        yield etapas
+        return
+    metricas = Metricas("proceso")
+    _actual.metricas, _actual.pila = metricas, []
+    try:
+        yield etapas
+        etapas.extend(e.como_dict() for e in metricas.etapas.values())
+    finally:
+        _actual.metricas, _actual.pila = None, []
+
+
+def sumar_etapas(etapas):
+    """Suma a la ejecución en curso las etapas medidas en otro proceso (ver etapas_de_proceso)."""
+    metricas = metricas_actuales()
+    if metricas is None:
+        return
+    for datos in etapas:
+        registro = metricas.etapa(datos["etapa"])
+        registro.duracion_s += datos["duracion_s"]
+        registro.llamadas += datos["llamadas"]
+        registro.filas += datos["filas"]
+        registro.bytes += datos["bytes"]
+        registro.http += datos["http"]
+        if datos["rss_pico_mb"] is not None:
+            registro.rss_pico_mb = max(registro.rss_pico_mb or 0, datos["rss_pico_mb"])
+
+
+def registrar_http(n_bytes=0, peticiones=1):
+    """Suma peticiones HTTP y bytes transferidos a la etapa abierta más interna."""
+    metricas = metricas_actuales()
+    if metricas is None:
+        return
+    pila = _actual.pila
+    registro = pila[-1][0] if pila else metricas.etapa("otros")
+    registro.http += peticiones
+    registro.bytes += n_bytes
+
+
+def escribir_metricas(metricas, ruta=None, prometheus_dir=None):
+    """Añade las líneas JSON de la ejecución y, si se configuró, exporta el textfile de Prometheus."""
+    ruta = ruta or RUTA_METRICAS
+    prometheus_dir = prometheus_dir or PROMETHEUS_DIR
+    lineas = metricas.lineas()
+    with _lock_escritura:
+        os.makedirs(os.path.dirname(ruta), exist_ok=True)
+        with open(ruta, "a", encoding="utf-8") as f:
+            for linea in lineas:
+                f.write(json.dumps(linea, ensure_ascii=False) + "\n")
+    if prometheus_dir:
+        _escribir_prometheus(metricas, lineas, prometheus_dir)
+
+
+def _escribir_prometheus(metricas, lineas, carpeta):
+    """Un archivo .prom por pipeline; se reemplaza de forma atómica en cada ejecución."""
+    series = {
+        "dashboards_etapa_duracion_segundos": "duracion_s",
+        "dashboards_etapa_filas": "filas",
+        "dashboards_etapa_bytes": "bytes",
+        "dashboards_etapa_http_peticiones": "http",
+        "dashboards_etapa_rss_pico_mb": "rss_pico_mb",
+    }
+    texto = []
+    for metrica, campo in series.items():
+        texto.append(f"# TYPE {metrica} gauge")
+        for linea in lineas:
+            if linea.get(campo) is not None:
+                texto.append(f'{metrica}{{pipeline="{metricas.pipeline}",etapa="{linea["etapa"]}"}} {linea[campo]}')
+    texto.append("# TYPE dashboards_ultima_ejecucion_exito gauge")
+    texto.append(f'dashboards_ultima_ejecucion_exito{{pipeline="{metricas.pipeline}"}} {int(metricas.estado == "ok")}')
+
+    os.makedirs(carpeta, exist_ok=True)
+    ruta = os.path.join(carpeta, f"dashboards_{metricas.pipeline}.prom")
+    tmp = ruta + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        f.write("\n".join(texto) + "\n")
+    os.replace(tmp, ruta)
+
+
+@contextlib.contextmanager
+def ejecucion(pipeline, escribir=True):
+    """
+    Abre una ejecución instrumentada en el hilo actual. Quien la usa puede fijar
+    metricas.estado ('ok'/'fallo'); si sale por una excepción queda 'error'.
+    Args:
+        escribir: Si es False, las métricas solo quedan en el objeto (p. ej. benchmarks).
+    Yields:
+        Metricas de la ejecución.
+    """
+    metricas = Metricas(pipeline)
+    _actual.metricas, _actual.pila = metricas, []
+    try:
+        yield metricas
+    finally:
+        _actual.metricas, _actual.pila = None, []
+        metricas.cerrar(metricas.estado or "error")
+        with _lock_escritura:
+            _ultimas[pipeline] = metricas.lineas()
+        if escribir:
+            try:
+                escribir_metricas(metricas)
+            except OSError as e:
+                logging.warning(f"⚠️ No se pudieron escribir las métricas: {e}")
+            lentas = sorted(metricas.etapas.values(), key=lambda e: -e.duracion_s)[:3]
+            logging.info(
+                f"⏱️ {pipeline}: {metricas.duracion_s:.2f}s; etapas más lentas: "
+                + ", ".join(f"{e.nombre}={e.duracion_s:.2f}s" for e in lentas)
+            )
+
+
+def instrumentar(pipeline):
+    """
+    Decorador para la función principal de un pipeline: abre una ejecución
+    instrumentada en el hilo actual y, al terminar, escribe sus métricas en
+    output/metricas.jsonl. Si ya hay una ejecución abierta, no abre otra.
+    """
+    def decorador(funcion):
+        @functools.wraps(funcion)
+        def envoltura(*args, **kwargs):
+            if metricas_actuales() is not None:
+                return funcion(*args, **kwargs)
+            with ejecucion(pipeline) as metricas:
+                ok = funcion(*args, **kwargs)
+                metricas.estado = "ok" if ok else "fallo"
+                return ok
+        return envoltura
+    return decorador
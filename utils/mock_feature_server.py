@@ -0,0 +1,350 @@
+# utils/mock_feature_server.py
+"""
+FeatureServer local para probar y medir la subida sin tocar capas de producción.
+
+Implementa sobre HTTP las operaciones que usan los pipelines (query, addFeatures,
+updateFeatures, deleteFeatures, applyEdits, las properties de la capa y
+addToDefinition en la administración) y un generateToken falso. Cada servicio
+se guarda en memoria en un FakeFeatureLayer.
+Se pueden configurar latencia, tamaño máximo de payload, límite de peticiones por
+segundo (429 con Retry-After) y fallos inyectados (errores 500, errores JSON,
+timeouts y features rechazadas una a una).
+
+Uso como proceso aparte:
+    python -m utils.mock_feature_server --puerto 8765 --latencia-ms 150 --prob-fallo 0.05
+    export ARCGIS_CAPAS_URL=http://127.0.0.1:8765/arcgis/rest/services
+    export ARCGIS_TOKEN_URL=http://127.0.0.1:8765/sharing/rest/generateToken
+"""
+import argparse
+import contextlib
+import gzip
+import json
+import logging
+import random
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+from utils.fake_layer import FakeFeatureLayer
+
+PREFIJO_SERVICIOS = "/arcgis/rest/services/"
+PREFIJO_ADMIN = "/arcgis/rest/admin/services/"
+MAX_REGISTROS = 2000  # maxRecordCount por defecto de ArcGIS Online
+
+
+class ConfigMock:
+    """Comportamiento del servidor; se puede cambiar en caliente entre pruebas."""
+
+    def __init__(self, latencia_ms=0, latencia_por_feature_ms=0.0, max_bytes=None, max_registros=MAX_REGISTROS,
+                 limite_por_s=None, prob_fallo=0.0, prob_timeout=0.0, duracion_timeout_s=30.0,
+                 prob_fallo_feature=0.0, semilla=None):
+        self.latencia_ms = latencia_ms
+        self.latencia_por_feature_ms = latencia_por_feature_ms
+        self.max_bytes = max_bytes
+        self.max_registros = max_registros
+        self.limite_por_s = limite_por_s
+        self.prob_fallo = prob_fallo
+        self.prob_timeout = prob_timeout
+        self.duracion_timeout_s = duracion_timeout_s
+        self.prob_fallo_feature = prob_fallo_feature
+        self.rng = random.Random(semilla)
+
+
+def _tipo_campo(valor):
+    if isinstance(valor, bool) or isinstance(valor, int):
+        return "esriFieldTypeInteger"
+    if isinstance(valor, float):
+        return "esriFieldTypeDouble"
+    return "esriFieldTypeString"
+
+
+def _filtrar_where(capa, where):
+    """'1=1', 'OBJECTID IN (...)', 'OBJECTID = n' y "<campo> IN (...)" (ver FakeFeatureLayer.filtrar)."""
+    return capa.filtrar(where)
+
+
+class ServidorMock(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, direccion=("127.0.0.1", 0), config=None, capas=None):
+        super().__init__(direccion, _Manejador)
+        self.config = config or ConfigMock()
+        self.capas = dict(capas or {})
+        self.lock = threading.Lock()
+        self.ventana = []  # instantes de las últimas peticiones (límite por segundo)
+        self.estadisticas = {"peticiones": {}, "rechazadas_429": 0, "rechazadas_tamano": 0,
+                             "fallos_inyectados": 0, "timeouts_inyectados": 0, "bytes_recibidos": 0}
+
+    @property
+    def url(self):
+        host, puerto = self.server_address[:2]
+        return f"http://{host}:{puerto}"
+
+    @property
+    def url_servicios(self):
+        return self.url + PREFIJO_SERVICIOS.rstrip("/")
+
+    def capa(self, nombre):
+        with self.lock:
+            if nombre not in self.capas:
+                self.capas[nombre] = FakeFeatureLayer()
+                self.capas[nombre].properties.name = nombre
+            return self.capas[nombre]
+
+    def contar(self, clave, operacion=None):
+        with self.lock:
+            if operacion:
+                self.estadisticas["peticiones"][operacion] = self.estadisticas["peticiones"].get(operacion, 0) + 1
+            else:
+                self.estadisticas[clave] += 1
+
+    def limitar(self):
+        """True si la petición supera el límite por segundo configurado."""
+        limite = self.config.limite_por_s
+        if not limite:
+            return False
+        ahora = time.monotonic()
+        with self.lock:
+            self.ventana = [t for t in self.ventana if ahora - t < 1.0]
+            if len(self.ventana) >= limite:
+                self.estadisticas["rechazadas_429"] += 1
+                return True
+            self.ventana.append(ahora)
+        return False
+
+
+class _Manejador(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, formato, *args):
+        logging.debug("mock %s - " + formato, self.address_string(), *args)
+
+    # --- Respuestas ---
+    def _responder(self, cuerpo, estado=200, encabezados=None):
+        datos = json.dumps(cuerpo).encode("utf-8")
+        self.send_response(estado)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(datos)))
+        for clave, valor in (encabezados or {}).items():
+            self.send_header(clave, valor)
+        self.end_headers()
+        self.wfile.write(datos)
+
+    def _error(self, codigo, mensaje):
+        # ArcGIS responde los errores de operación con HTTP 200 y un objeto 'error'
+        self._responder({"error": {"code": codigo, "message": mensaje, "details": []}})
+
+    # --- Entrada ---
+    def do_GET(self):
+        url = urlparse(self.path)
+        self._atender(url.path, {k: v[-1] for k, v in parse_qs(url.query).items()}, len(url.query))
+
+    def do_POST(self):
+        url = urlparse(self.path)
+        largo = int(self.headers.get("Content-Length") or 0)
+        cuerpo = self.rfile.read(largo)
+        if self.headers.get("Content-Encoding") == "gzip":
+            cuerpo = gzip.decompress(cuerpo)
+        cuerpo = cuerpo.decode("utf-8")
+        params = {k: v[-1] for k, v in parse_qs(url.query).items()}
+        params.update({k: v[-1] for k, v in parse_qs(cuerpo, keep_blank_values=True).items()})
+        self._atender(url.path, params, largo)
+
+    def _atender(self, ruta, params, n_bytes):
+        servidor = self.server
+        config = servidor.config
+        with servidor.lock:
+            servidor.estadisticas["bytes_recibidos"] += n_bytes
+
+        if ruta.rstrip("/").endswith("/sharing/rest/generateToken"):
+            servidor.contar(None, "generateToken")
+            minutos = int(params.get("expiration", 60))
+            return self._responder({"token": f"mock-{uuid.uuid4().hex}", "expires": int((time.time() + minutos * 60) * 1000), "ssl": False})
+        if ruta == "/estadisticas":
+            with servidor.lock:
+                return self._responder(json.loads(json.dumps(servidor.estadisticas)))
+        if ruta.startswith(PREFIJO_ADMIN):
+            # Solo addToDefinition (agregar campos), lo único que usan los pipelines de la administración
+            partes = ruta[len(PREFIJO_ADMIN):].strip("/").split("/")
+            if len(partes) < 4 or partes[3] != "addToDefinition":
+                return self._responder({"error": {"code": 400, "message": "Ruta inválida"}}, estado=400)
+            servidor.contar(None, "addToDefinition")
+            definicion = json.loads(params.get("addToDefinition") or "{}")
+            return self._responder(servidor.capa(partes[0]).agregar_campos(definicion.get("fields") or []))
+        if not ruta.startswith(PREFIJO_SERVICIOS):
+            return self._responder({"error": {"code": 404, "message": "Not found"}}, estado=404)
+
+        # /arcgis/rest/services/<servicio>/FeatureServer/<n>[/<operacion>]
+        partes = ruta[len(PREFIJO_SERVICIOS):].strip("/").split("/")
+        if len(partes) < 3 or partes[1] != "FeatureServer":
+            return self._responder({"error": {"code": 400, "message": "Ruta inválida"}}, estado=400)
+        operacion = partes[3] if len(partes) > 3 else "properties"
+        servidor.contar(None, operacion)
+
+        # Comportamiento configurado: límite de peticiones, tamaño, fallos y latencia
+        if servidor.limitar():
+            return self._responder({"error": {"code": 429, "message": "Too many requests"}}, estado=429, encabezados={"Retry-After": "1"})
+        if config.max_bytes and n_bytes > config.max_bytes:
+            servidor.contar("rechazadas_tamano")
+            return self._error(413, f"Payload de {n_bytes} bytes supera el máximo de {config.max_bytes}")
+        azar = config.rng.random()
+        if azar < config.prob_timeout:
+            servidor.contar("timeouts_inyectados")
+            time.sleep(config.duracion_timeout_s)
+        elif azar < config.prob_timeout + config.prob_fallo:
+            servidor.contar("fallos_inyectados")
+            if config.rng.random() < 0.5:
+                return self._responder({"error": {"code": 500, "message": "Internal server error"}}, estado=500)
+            return self._error(500, "Unable to complete operation.")
+
+        capa = servidor.capa(partes[0])
+        try:
+            resultado, n_features = self._operar(capa, operacion, params)
+        except (ValueError, KeyError) as e:
+            return self._error(400, str(e))
+        espera = config.latencia_ms + config.latencia_por_feature_ms * n_features
+        if espera:
+            time.sleep(espera / 1000)
+        self._responder(resultado)
+
+    # --- Operaciones sobre la capa en memoria ---
+    def _operar(self, capa, operacion, params):
+        config = self.server.config
+        if operacion == "properties":
+            p = capa.properties
+            return {"name": p.name, "objectIdField": p.objectIdField, "fields": p.fields,
+                    "capabilities": p.capabilities, "maxRecordCount": config.max_registros,
+                    "geometryType": "esriGeometryPolygon"}, 0
+        if operacion == "query":
+            return self._query(capa, params), 0
+
+        adds = json.loads(params.get("adds") or params.get("features") or "[]") if operacion in ("applyEdits", "addFeatures") else []
+        updates = json.loads(params.get("updates") or params.get("features") or "[]") if operacion in ("applyEdits", "updateFeatures") else []
+        if operacion == "applyEdits":
+            deletes = [int(o) for o in (params.get("deletes") or "").split(",") if o]
+        elif operacion == "deleteFeatures":
+            if params.get("objectIds"):
+                deletes = [int(o) for o in params["objectIds"].split(",") if o]
+            else:
+                deletes = _filtrar_where(capa, params.get("where"))
+        else:
+            deletes = []
+        if operacion not in ("applyEdits", "addFeatures", "updateFeatures", "deleteFeatures"):
+            raise ValueError(f"Operación no soportada: {operacion}")
+
+        with self.server.lock:
+            self._aprender_campos(capa, adds)
+        # Features rechazadas una a una (p. ej. geometría inválida en el servidor real)
+        rechazadas = {id(f) for f in adds + updates if config.rng.random() < config.prob_fallo_feature}
+        fallo = {"success": False, "error": {"code": 1000, "description": "Feature rechazada (inyectado)"}}
+        rollback = operacion == "applyEdits" and params.get("rollbackOnFailure", "true").lower() != "false"
+        if rollback and rechazadas:
+            # rollbackOnFailure: una sola feature rechazada revierte toda la petición
+            return {
+                "addResults": [dict(fallo, objectId=-1) for _ in adds],
+                "updateResults": [dict(fallo, objectId=f["attributes"].get(capa.oid_field)) for f in updates],
+                "deleteResults": [dict(fallo, objectId=o) for o in deletes],
+            }, len(adds) + len(updates) + len(deletes)
+        resultado = capa.edit_features(
+            adds=[f for f in adds if id(f) not in rechazadas],
+            updates=[f for f in updates if id(f) not in rechazadas],
+            deletes=deletes,
+            rollback_on_failure=rollback,
+        )
+        resultado["addResults"] += [dict(fallo, objectId=-1) for f in adds if id(f) in rechazadas]
+        resultado["updateResults"] += [dict(fallo, objectId=f["attributes"].get(capa.oid_field)) for f in updates if id(f) in rechazadas]
+        if operacion == "addFeatures":
+            return {"addResults": resultado["addResults"]}, len(adds)
+        if operacion == "updateFeatures":
+            return {"updateResults": resultado["updateResults"]}, len(updates)
+        if operacion == "deleteFeatures":
+            return {"deleteResults": resultado["deleteResults"]}, len(deletes)
+        return resultado, len(adds) + len(updates) + len(deletes)
+
+    def _query(self, capa, params):
+        config = self.server.config
+        oids = sorted(_filtrar_where(capa, params.get("where")))
+        inicio = int(params.get("resultOffset") or 0)
+        cantidad = min(int(params.get("resultRecordCount") or config.max_registros), config.max_registros)
+        pagina = oids[inicio:inicio + cantidad]
+        campos = params.get("outFields") or "*"
+        campos = None if campos == "*" else set(campos.split(","))
+        con_geometria = params.get("returnGeometry", "true").lower() != "false"
+        features = []
+        for oid in pagina:
+            feature = capa.features.get(oid)
+            if feature is None:
+                continue
+            atributos = feature["attributes"]
+            if campos is not None:
+                atributos = {k: v for k, v in atributos.items() if k in campos}
+            features.append({"attributes": atributos, "geometry": feature.get("geometry") if con_geometria else None})
+        return {"objectIdFieldName": capa.oid_field, "features": features,
+                "exceededTransferLimit": inicio + cantidad < len(oids)}
+
+    @staticmethod
+    def _aprender_campos(capa, features):
+        """Una capa creada sobre la marcha adopta los campos de las primeras altas."""
+        conocidos = {f["name"] for f in capa.properties.fields}
+        for feature in features:
+            for nombre, valor in (feature.get("attributes") or {}).items():
+                if nombre not in conocidos and valor is not None:
+                    capa.properties.fields.append({"name": nombre, "type": _tipo_campo(valor)})
+                    conocidos.add(nombre)
+
+
+@contextlib.contextmanager
+def servidor_mock(config=None, capas=None, puerto=0):
+    """
+    Levanta el servidor en un hilo del proceso actual.
+    Yields:
+        ServidorMock (url, url_servicios, config, capas, estadisticas).
+    """
+    servidor = ServidorMock(("127.0.0.1", puerto), config, capas)
+    hilo = threading.Thread(target=servidor.serve_forever, name="mock-feature-server", daemon=True)
+    hilo.start()
+    try:
+        yield servidor
+    finally:
+        servidor.shutdown()
+        servidor.server_close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="FeatureServer local para pruebas de carga de la subida.")
+    parser.add_argument("--puerto", type=int, default=8765)
+    parser.add_argument("--latencia-ms", type=float, default=0)
+    parser.add_argument("--latencia-por-feature-ms", type=float, default=0.0)
+    parser.add_argument("--max-bytes", type=int, default=None)
+    parser.add_argument("--max-registros", type=int, default=MAX_REGISTROS)
+    parser.add_argument("--limite-por-s", type=int, default=None)
+    parser.add_argument("--prob-fallo", type=float, default=0.0)
+    parser.add_argument("--prob-timeout", type=float, default=0.0)
+    parser.add_argument("--duracion-timeout-s", type=float, default=30.0)
+    parser.add_argument("--prob-fallo-feature", type=float, default=0.0)
+    parser.add_argument("--semilla", type=int, default=None)
+    args = parser.parse_args()
+
+    config = ConfigMock(
+        latencia_ms=args.latencia_ms, latencia_por_feature_ms=args.latencia_por_feature_ms,
+        max_bytes=args.max_bytes, max_registros=args.max_registros, limite_por_s=args.limite_por_s,
+        prob_fallo=args.prob_fallo, prob_timeout=args.prob_timeout, duracion_timeout_s=args.duracion_timeout_s,
+        prob_fallo_feature=args.prob_fallo_feature, semilla=args.semilla,
+    )
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    servidor = ServidorMock(("127.0.0.1", args.puerto), config)
+    logging.info(f"🧪 FeatureServer de prueba en {servidor.url_servicios}")
+    logging.info(f"   export ARCGIS_CAPAS_URL={servidor.url_servicios}")
+    logging.info(f"   export ARCGIS_TOKEN_URL={servidor.url}/sharing/rest/generateToken")
+    try:
+        servidor.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        servidor.server_close()
+
+
+if __name__ == "__main__":
+    main()
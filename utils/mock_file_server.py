@@ -0,0 +1,233 @@
+# utils/mock_file_server.py
+"""
+Servidor de archivos local que imita las carpetas fechadas de SIATA, para probar y
+medir utils.resumable_download sin depender de la red.
+
+Sirve un directorio tal cual (p. ej. geotecnia/COE_2025/modelos/20250519/AM/...),
+con ETag, Last-Modified, peticiones condicionales (304), Range / If-Range (206 y 416)
+y 404 para lo que no existe.
+Se pueden inyectar latencia, cortes de conexión a mitad de archivo y la falta de
+soporte de Range.
+
+Uso como proceso aparte:
+    python -m utils.mock_file_server data/siata_mock --puerto 8766 --corte-bytes 50000
+    export SIATA_BASE_URL=http://127.0.0.1:8766
+"""
+import argparse
+import contextlib
+import hashlib
+import logging
+import os
+import threading
+import time
+from email.utils import formatdate, parsedate_to_datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import unquote, urlparse
+
+TAMANO_BLOQUE = 64 * 1024
+
+
+class ConfigArchivos:
+    """Comportamiento del servidor; se puede cambiar en caliente entre pruebas."""
+
+    def __init__(self, latencia_ms=0, bytes_por_s=None, corte_bytes=None, cortes_por_archivo=1, con_range=True):
+        self.latencia_ms = latencia_ms
+        self.bytes_por_s = bytes_por_s                # Ancho de banda por conexión (None: sin límite)
+        self.corte_bytes = corte_bytes                # Cierra la conexión tras enviar tantos bytes
+        self.cortes_por_archivo = cortes_por_archivo  # ... las primeras N veces que se pide cada archivo
+        self.con_range = con_range
+
+
+class ServidorArchivos(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, directorio, direccion=("127.0.0.1", 0), config=None):
+        super().__init__(direccion, _Manejador)
+        self.directorio = os.path.abspath(directorio)
+        self.config = config or ConfigArchivos()
+        self.lock = threading.Lock()
+        self.cortes = {}
+        self.estadisticas = {"peticiones": 0, "bytes": 0, "parciales": 0, "cortes": 0, "no_encontrados": 0,
+                             "no_modificados": 0}
+
+    @property
+    def url(self):
+        host, puerto = self.server_address[:2]
+        return f"http://{host}:{puerto}"
+
+    def contar(self, clave, n=1):
+        with self.lock:
+            self.estadisticas[clave] += n
+
+    def cortar(self, ruta):
+        """True si a esta petición le toca cortarse a mitad de camino."""
+        if self.config.corte_bytes is None:
+            return False
+        with self.lock:
+            n = self.cortes.get(ruta, 0)
+            if n >= self.config.cortes_por_archivo:
+                return False
+            self.cortes[ruta] = n + 1
+            self.estadisticas["cortes"] += 1
+            return True
+
+
+def _etag(ruta):
+    estado = os.stat(ruta)
+    return '"' + hashlib.sha1(f"{estado.st_size}-{estado.st_mtime_ns}".encode()).hexdigest()[:16] + '"'
+
+
+def _rango(encabezado, tamano):
+    """'bytes=N-' o 'bytes=N-M' -> (inicio, fin) inclusivo; None si no se puede satisfacer."""
+    unidad, _, valor = encabezado.partition("=")
+    inicio, _, fin = valor.split(",")[0].strip().partition("-")
+    if unidad.strip() != "bytes" or not inicio:
+        return None
+    inicio = int(inicio)
+    fin = min(int(fin), tamano - 1) if fin else tamano - 1
+    if inicio >= tamano or fin < inicio:
+        return None
+    return inicio, fin
+
+
+def _sin_modificar(encabezados, etag, ruta):
+    """True si la petición condicional (If-None-Match / If-Modified-Since) merece un 304."""
+    si_no_coincide = encabezados.get("If-None-Match")
+    if si_no_coincide is not None:
+        return etag in [e.strip() for e in si_no_coincide.split(",")] or si_no_coincide.strip() == "*"
+    si_modificado = encabezados.get("If-Modified-Since")
+    if si_modificado:
+        try:
+            return int(os.path.getmtime(ruta)) <= parsedate_to_datetime(si_modificado).timestamp()
+        except (TypeError, ValueError):
+            return False
+    return False
+
+
+class _Manejador(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, formato, *args):
+        logging.debug("mock-archivos: " + formato % args)
+
+    def do_HEAD(self):
+        self._servir(cuerpo=False)
+
+    def do_GET(self):
+        self._servir(cuerpo=True)
+
+    def _servir(self, cuerpo):
+        servidor = self.server
+        config = servidor.config
+        servidor.contar("peticiones")
+        if config.latencia_ms:
+            time.sleep(config.latencia_ms / 1000)
+
+        relativa = unquote(urlparse(self.path).path).lstrip("/")
+        ruta = os.path.abspath(os.path.join(servidor.directorio, relativa))
+        if not ruta.startswith(servidor.directorio + os.sep) or not os.path.isfile(ruta):
+            servidor.contar("no_encontrados")
+            self.send_response(404)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+
+        tamano = os.path.getsize(ruta)
+        etag = _etag(ruta)
+        if _sin_modificar(self.headers, etag, ruta):
+            servidor.contar("no_modificados")
+            self.send_response(304)
+            self.send_header("ETag", etag)
+            self.end_headers()
+            return
+        inicio, fin, estado = 0, tamano - 1, 200
+        pedido = self.headers.get("Range")
+        si_rango = self.headers.get("If-Range")
+        if pedido and config.con_range and (si_rango is None or si_rango == etag):
+            rango = _rango(pedido, tamano)
+            if rango is None:
+                self.send_response(416)
+                self.send_header("Content-Range", f"bytes */{tamano}")
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+                return
+            (inicio, fin), estado = rango, 206
+            servidor.contar("parciales")
+
+        self.send_response(estado)
+        self.send_header("Content-Type", "application/octet-stream")
+        self.send_header("Content-Length", str(fin - inicio + 1))
+        self.send_header("ETag", etag)
+        self.send_header("Last-Modified", formatdate(os.path.getmtime(ruta), usegmt=True))
+        if config.con_range:
+            self.send_header("Accept-Ranges", "bytes")
+        if estado == 206:
+            self.send_header("Content-Range", f"bytes {inicio}-{fin}/{tamano}")
+        self.end_headers()
+        if not cuerpo:
+            return
+
+        limite = fin - inicio + 1
+        if servidor.cortar(relativa):
+            limite = min(limite, config.corte_bytes)
+            self.close_connection = True
+        enviados = 0
+        with open(ruta, "rb") as f:
+            f.seek(inicio)
+            while enviados < limite:
+                bloque = f.read(min(TAMANO_BLOQUE, limite - enviados))
+                if not bloque:
+                    break
+                self.wfile.write(bloque)
+                enviados += len(bloque)
+                if config.bytes_por_s:
+                    time.sleep(len(bloque) / config.bytes_por_s)
+        servidor.contar("bytes", enviados)
+
+
+@contextlib.contextmanager
+def servidor_archivos(directorio, config=None, puerto=0):
+    """
+    Levanta el servidor en un hilo del proceso actual.
+    Yields:
+        ServidorArchivos (url, config, estadisticas).
+    """
+    servidor = ServidorArchivos(directorio, ("127.0.0.1", puerto), config)
+    hilo = threading.Thread(target=servidor.serve_forever, name="mock-file-server", daemon=True)
+    hilo.start()
+    try:
+        yield servidor
+    finally:
+        servidor.shutdown()
+        servidor.server_close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Servidor de archivos fechados para probar descargas reanudables.")
+    parser.add_argument("directorio")
+    parser.add_argument("--puerto", type=int, default=8766)
+    parser.add_argument("--latencia-ms", type=float, default=0)
+    parser.add_argument("--bytes-por-s", type=int, default=None)
+    parser.add_argument("--corte-bytes", type=int, default=None)
+    parser.add_argument("--cortes-por-archivo", type=int, default=1)
+    parser.add_argument("--sin-range", action="store_true")
+    args = parser.parse_args()
+
+    config = ConfigArchivos(
+        latencia_ms=args.latencia_ms, bytes_por_s=args.bytes_por_s, corte_bytes=args.corte_bytes,
+        cortes_por_archivo=args.cortes_por_archivo, con_range=not args.sin_range,
+    )
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    servidor = ServidorArchivos(args.directorio, ("127.0.0.1", args.puerto), config)
+    logging.info(f"🧪 Sirviendo {servidor.directorio} en {servidor.url}")
+    logging.info(f"   export SIATA_BASE_URL={servidor.url}")
+    try:
+        servidor.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        servidor.server_close()
+
+
+if __name__ == "__main__":
+    main()
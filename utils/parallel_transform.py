@@ -0,0 +1,153 @@
+# utils/parallel_transform.py
+"""
+Transformación de lotes en varios procesos, con los resultados en el orden original.
+
+Los GeoDataFrames viajan entre procesos como atributos (DataFrame sin geometría)
+más la geometría en WKB (bytes), no como objetos shapely: picklear shapely
+serializa cada geometría por separado y es varias veces más lento.
+
+Si la entrada es pequeña (menos de 'min_tareas' lotes) o el pool no se puede
+crear o se rompe (un proceso muerto, algo que no se puede picklear), los lotes
+pendientes se procesan en el proceso actual: el resultado es el mismo, solo que
+en serie.
+"""
+import logging
+import multiprocessing
+import os
+import pickle
+from collections import deque
+from concurrent.futures import CancelledError, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+# Procesos por defecto: uno por núcleo, hasta 8 (más allá el parseo en serie del KML manda)
+MAX_PROCESOS = 8
+# Lotes en vuelo por proceso (acota la memoria: el lector no se adelanta sin límite)
+EN_VUELO_POR_PROCESO = 2
+# Módulos que el servidor de procesos importa una sola vez (los hijos nacen con ellos cargados)
+PRECARGA = ["geopandas", "shapely", "pyproj"]
+
+
+def procesos_disponibles(procesos=None):
+    """None/'auto' -> un proceso por núcleo (hasta MAX_PROCESOS); un entero se respeta."""
+    if procesos in (None, "auto"):
+        return max(1, min(MAX_PROCESOS, os.cpu_count() or 1))
+    return max(1, int(procesos))
+
+
+def empaquetar_gdf(gdf):
+    """GeoDataFrame -> dict picklable con la geometría en WKB."""
+    import shapely
+
+    return {
+        "atributos": gdf.drop(columns=[gdf.geometry.name]),
+        "wkb": shapely.to_wkb(gdf.geometry.array),
+        "geometria": gdf.geometry.name,
+        "crs": gdf.crs,
+    }
+
+
+def desempaquetar_gdf(paquete):
+    """Inverso de empaquetar_gdf (mismo índice, columnas y CRS)."""
+    import geopandas as gpd
+    import shapely
+
+    atributos = paquete["atributos"]
+    geometria = gpd.GeoSeries(shapely.from_wkb(paquete["wkb"]), index=atributos.index, crs=paquete["crs"])
+    return gpd.GeoDataFrame(atributos, geometry=geometria.rename(paquete["geometria"]), crs=paquete["crs"])
+
+
+def _contexto():
+    """
+    forkserver en POSIX: los pipelines corren en hilos (Run_todos, el daemon) y
+    hacer fork de un proceso con hilos puede dejar locks tomados en el hijo.
+    """
+    metodos = multiprocessing.get_all_start_methods()
+    if "forkserver" in metodos:
+        contexto = multiprocessing.get_context("forkserver")
+        contexto.set_forkserver_preload(PRECARGA)
+        return contexto
+    return multiprocessing.get_context("spawn")
+
+
+def mapear_en_orden(funcion, tareas, procesos=None, min_tareas=2, en_vuelo=None):
+    """
+    Aplica funcion(*args) a cada tupla de 'tareas' en un pool de procesos y
+    produce los resultados en el mismo orden en que llegaron las tareas.
+    Args:
+        funcion: Función de nivel de módulo (se picklea por referencia).
+        tareas: Iterable (puede ser un generador) de tuplas de argumentos.
+        procesos: Número de procesos (None: uno por núcleo, hasta MAX_PROCESOS).
+        min_tareas: Con menos tareas que esto todo corre en serie, sin crear el pool.
+        en_vuelo: Tareas enviadas sin recoger (por defecto 2 por proceso).
+    Yields:
+        funcion(*args) de cada tarea, en orden.
+    """
+    procesos = procesos_disponibles(procesos)
+    tareas = iter(tareas)
+    # Se miran las primeras tareas: si no alcanzan, no vale la pena arrancar procesos
+    primeras = []
+    for args in tareas:
+        primeras.append(args)
+        if len(primeras) >= min_tareas:
+            break
+    if procesos < 2 or len(primeras) < min_tareas:
+        for args in primeras:
+            yield funcion(*args)
+        for args in tareas:
+            yield funcion(*args)
+        return
+
+    en_vuelo = en_vuelo or procesos * EN_VUELO_POR_PROCESO
+    try:
+        pool = ProcessPoolExecutor(max_workers=procesos, mp_context=_contexto())
+    except (OSError, ValueError) as e:
+        logging.warning(f"⚠️ No se pudo crear el pool de procesos ({e}); se sigue en serie")
+        pool = None
+    pendientes = deque()
+    cola = _encadenar(primeras, tareas)
+    try:
+        if pool is not None:
+            logging.info(f"🧵 Transformación en {procesos} procesos")
+        for args in cola:
+            if pool is not None:
+                # Solo los fallos del pool pasan a serie; los errores de 'tareas' o de 'funcion' se propagan
+                try:
+                    pendientes.append((pool.submit(funcion, *args), args))
+                except (BrokenProcessPool, RuntimeError) as e:
+                    pool = _abandonar(pool, e)
+                    pendientes.append((None, args))
+            else:
+                pendientes.append((None, args))
+            while len(pendientes) >= (en_vuelo if pool is not None else 1):
+                resultado, pool = _recoger(pendientes.popleft(), funcion, pool)
+                yield resultado
+        while pendientes:
+            resultado, pool = _recoger(pendientes.popleft(), funcion, pool)
+            yield resultado
+    finally:
+        if pool is not None:
+            # Si el consumidor dejó de iterar (error aguas abajo), se cancelan los lotes que no empezaron
+            pool.shutdown(wait=True, cancel_futures=True)
+
+
+def _abandonar(pool, error):
+    logging.warning(f"⚠️ Pool de procesos no disponible ({error}); se sigue en serie")
+    pool.shutdown(wait=False, cancel_futures=True)
+    return None
+
+
+def _recoger(pendiente, funcion, pool):
+    """Resultado de una tarea enviada; si el pool se rompió, se rehace aquí. Returns: (resultado, pool)."""
+    futuro, args = pendiente
+    if futuro is not None:
+        try:
+            return futuro.result(), pool
+        except (BrokenProcessPool, CancelledError, pickle.PicklingError) as e:
+            if pool is not None:
+                pool = _abandonar(pool, e)
+    return funcion(*args), pool
+
+
+def _encadenar(primeras, resto):
+    yield from primeras
+    yield from resto
@@ -0,0 +1,128 @@
+# utils/rest_layer.py
+import gzip
+import os
+from types import SimpleNamespace
+from urllib.parse import urlencode
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from utils.esri_encoder import serializar
+
+# Si está definida, las capas se piden a este servidor en lugar de a ArcGIS Online,
+# p. ej. http://127.0.0.1:8765/arcgis/rest/services (ver utils/mock_feature_server.py)
+VARIABLE_CAPAS_URL = "ARCGIS_CAPAS_URL"
+
+
+class ErrorREST(RuntimeError):
+    """Respuesta de error del FeatureServer (HTTP 200 con {'error': ...})."""
+
+
+class CapaREST:
+    """
+    Cliente mínimo de la API REST de un FeatureLayer con la misma interfaz que
+    usan los pipelines de arcgis.features.FeatureLayer (properties, query,
+    edit_features, delete_features). No necesita tener arcgis instalado.
+
+    Con comprimir=True los POST van con Content-Encoding: gzip. El mock lo acepta;
+    ArcGIS Online/Enterprise no lo documenta, así que por defecto va sin comprimir.
+    """
+
+    def __init__(self, url, token=None, timeout=60, sesion=None, comprimir=False):
+        self.url = url.rstrip("/")
+        self.token = token
+        self.timeout = timeout
+        self.comprimir = comprimir
+        if sesion is None:
+            sesion = requests.Session()
+            adaptador = HTTPAdapter(pool_connections=8, pool_maxsize=8)
+            sesion.mount("http://", adaptador)
+            sesion.mount("https://", adaptador)
+        self.sesion = sesion
+        self._properties = None
+
+    def _pedir(self, operacion, datos=None, metodo="post"):
+        datos = dict(datos or {}, f="json")
+        if self.token:
+            datos["token"] = self.token
+        url = f"{self.url}/{operacion}" if operacion else self.url
+        if metodo == "get":
+            respuesta = self.sesion.get(url, params=datos, timeout=self.timeout)
+        elif self.comprimir:
+            encabezados = {"Content-Type": "application/x-www-form-urlencoded", "Content-Encoding": "gzip"}
+            cuerpo = gzip.compress(urlencode(datos).encode("utf-8"), compresslevel=5)
+            respuesta = self.sesion.post(url, data=cuerpo, headers=encabezados, timeout=self.timeout)
+        else:
+            respuesta = self.sesion.post(url, data=datos, timeout=self.timeout)
+        # 429 (límite de peticiones), 5xx, etc. llegan como HTTPError al cargador por lotes
+        respuesta.raise_for_status()
+        cuerpo = respuesta.json()
+        if isinstance(cuerpo, dict) and "error" in cuerpo:
+            error = cuerpo["error"]
+            raise ErrorREST(f"{error.get('code')}: {error.get('message')}")
+        return cuerpo
+
+    @property
+    def properties(self):
+        if self._properties is None:
+            self._properties = SimpleNamespace(**self._pedir("", metodo="get"))
+        return self._properties
+
+    def query(self, where="1=1", out_fields="*", return_geometry=True, out_sr=None, **kwargs):
+        """Consulta paginada: sigue pidiendo mientras el servidor indique exceededTransferLimit."""
+        datos = {"where": where, "outFields": out_fields, "returnGeometry": str(bool(return_geometry)).lower()}
+        if out_sr:
+            datos["outSR"] = out_sr
+        features = []
+        while True:
+            cuerpo = self._pedir("query", dict(datos, resultOffset=len(features)))
+            features.extend(cuerpo.get("features", []))
+            if not cuerpo.get("exceededTransferLimit") or not cuerpo.get("features"):
+                break
+        return SimpleNamespace(features=features)
+
+    def edit_features(self, adds=None, updates=None, deletes=None, rollback_on_failure=True, **kwargs):
+        datos = {"rollbackOnFailure": str(bool(rollback_on_failure)).lower()}
+        if adds:
+            datos["adds"] = adds if isinstance(adds, str) else serializar(adds).decode("utf-8")
+        if updates:
+            datos["updates"] = updates if isinstance(updates, str) else serializar(updates).decode("utf-8")
+        if deletes:
+            datos["deletes"] = deletes if isinstance(deletes, str) else ",".join(str(o) for o in deletes)
+        return self._pedir("applyEdits", datos)
+
+    def agregar_campos(self, campos):
+        """addToDefinition en el endpoint de administración del servicio (requiere permisos de dueño)."""
+        if "/rest/services/" not in self.url:
+            raise ErrorREST(f"No se conoce el endpoint de administración de {self.url}")
+        url_admin = self.url.replace("/rest/services/", "/rest/admin/services/", 1)
+        admin = CapaREST(url_admin, token=self.token, timeout=self.timeout, sesion=self.sesion)
+        resultado = admin._pedir("addToDefinition", {"addToDefinition": serializar({"fields": campos}).decode("utf-8")})
+        self._properties = None
+        return resultado
+
+    def delete_features(self, where=None, deletes=None, **kwargs):
+        datos = {}
+        if where:
+            datos["where"] = where
+        if deletes:
+            datos["objectIds"] = deletes if isinstance(deletes, str) else ",".join(str(o) for o in deletes)
+        return self._pedir("deleteFeatures", datos)
+
+
+def obtener_capa(gis, item_id, indice=0):
+    """
+    Capa de un ítem: gis.content.get(item_id).layers[indice], o la del servidor
+    configurado en ARCGIS_CAPAS_URL (servicio con el nombre del ítem).
+    Returns:
+        La capa, o None si el ítem no existe o no tiene capas.
+    """
+    base = os.getenv(VARIABLE_CAPAS_URL)
+    if base:
+        token = os.getenv("ARCGIS_CAPAS_TOKEN")
+        comprimir = os.getenv("ARCGIS_CAPAS_GZIP", "").lower() in ("1", "true", "si")
+        return CapaREST(f"{base.rstrip('/')}/{item_id}/FeatureServer/{indice}", token=token, comprimir=comprimir)
+    item = gis.content.get(item_id)
+    if not item or not item.layers:
+        return None
+    return item.layers[indice]
@@ -0,0 +1,246 @@
+# utils/resumable_download.py
+"""
+Descargas de archivos fechados que se pueden reanudar y rellenar hacia atrás.
+
+Cada archivo se baja a <ruta>.part; si la conexión se corta, el siguiente intento
+pide solo lo que falta con un encabezado Range (y If-Range con el ETag, para no
+pegar pedazos de dos versiones distintas). Al terminar se verifica el tamaño
+contra Content-Length / Content-Range y, si se conoce, el SHA-256, y solo entonces
+se renombra a <ruta>. Junto al archivo queda <ruta>.json con url, bytes y sha256:
+un archivo con ese registro ya está verificado y no se vuelve a pedir.
+"""
+import concurrent.futures
+import datetime
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+
+import requests
+
+from utils.metrics import etapa, registrar_http
+
+TAMANO_BLOQUE = 64 * 1024
+REINTENTOS = 3
+ESPERA_BASE_S = 1.0
+MAX_WORKERS = 4
+
+# Una sesión por hilo: requests.Session no garantiza ser segura entre hilos
+_sesiones = threading.local()
+
+
+class ErrorDescarga(Exception):
+    """El archivo no se pudo bajar completo o no pasó la verificación."""
+
+
+def _sesion():
+    if not hasattr(_sesiones, "sesion"):
+        _sesiones.sesion = requests.Session()
+    return _sesiones.sesion
+
+
+def _leer_json(ruta):
+    try:
+        with open(ruta, encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def _escribir_json(ruta, datos):
+    tmp = ruta + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(datos, f, ensure_ascii=False)
+    os.replace(tmp, ruta)
+
+
+def sha256_archivo(ruta):
+    hasher = hashlib.sha256()
+    with open(ruta, "rb") as f:
+        for bloque in iter(lambda: f.read(TAMANO_BLOQUE), b""):
+            hasher.update(bloque)
+    return hasher.hexdigest()
+
+
+def verificado(ruta, rehashear=False):
+    """
+    Registro de verificación de un archivo ya descargado, o None si no existe o no cuadra.
+    Args:
+        rehashear: Si es True, recalcula el SHA-256 además de comparar el tamaño.
+    """
+    registro = _leer_json(ruta + ".json")
+    if not registro or not os.path.exists(ruta) or os.path.getsize(ruta) != registro.get("bytes"):
+        return None
+    if rehashear and sha256_archivo(ruta) != registro.get("sha256"):
+        return None
+    return registro
+
+
+def _tamano_total(response, inicio):
+    """Tamaño completo del archivo según Content-Range (206) o Content-Length (200)."""
+    rango = response.headers.get("Content-Range", "")
+    if "/" in rango and not rango.endswith("/*"):
+        return int(rango.rsplit("/", 1)[1])
+    if response.headers.get("Content-Length") is not None:
+        return inicio + int(response.headers["Content-Length"])
+    return None
+
+
+def _intentar(url, parcial, meta, headers, timeout):
+    """
+    Un intento de descarga sobre el archivo parcial.
+    Returns:
+        (estado, total): estado 'ok', 'no_publicado' o 'incompleto'.
+    """
+    inicio = os.path.getsize(parcial) if os.path.exists(parcial) else 0
+    encabezados = dict(headers or {})
+    # Sin compresión: los rangos y Content-Length tienen que referirse a los bytes del archivo
+    encabezados["Accept-Encoding"] = "identity"
+    if inicio:
+        encabezados["Range"] = f"bytes={inicio}-"
+        if meta.get("etag") or meta.get("last_modified"):
+            encabezados["If-Range"] = meta.get("etag") or meta["last_modified"]
+
+    with _sesion().get(url, headers=encabezados, stream=True, timeout=timeout) as response:
+        registrar_http()
+        if response.status_code == 404:
+            return "no_publicado", None
+        if response.status_code == 416 and inicio:
+            # El parcial ya no corresponde al archivo del servidor: se empieza de cero
+            os.remove(parcial)
+            return "incompleto", None
+        response.raise_for_status()
+
+        if response.status_code == 200 and inicio:
+            # El servidor ignoró el Range (o el archivo cambió y If-Range no coincidió)
+            logging.info(f"↩️ El servidor no reanudó la descarga, se baja completa: {url}")
+            inicio = 0
+        total = _tamano_total(response, inicio)
+        meta.update({
+            "etag": response.headers.get("ETag"),
+            "last_modified": response.headers.get("Last-Modified"),
+            "total": total,
+        })
+        _escribir_json(parcial + ".json", meta)
+
+        n_bytes = 0
+        try:
+            with open(parcial, "ab" if inicio else "wb") as f:
+                for chunk in response.iter_content(chunk_size=TAMANO_BLOQUE):
+                    f.write(chunk)
+                    n_bytes += len(chunk)
+        finally:
+            registrar_http(n_bytes, peticiones=0)
+
+    if total is not None and os.path.getsize(parcial) < total:
+        return "incompleto", total
+    return "ok", total
+
+
+def descargar_reanudable(url, ruta, headers=None, timeout=60, reintentos=REINTENTOS,
+                         espera_base=ESPERA_BASE_S, sha256=None, tamano=None):
+    """
+    Descarga url en ruta reanudando lo que haya quedado de intentos anteriores.
+    Args:
+        url: URL del archivo.
+        ruta: Archivo local de destino.
+        headers: Encabezados HTTP adicionales.
+        reintentos: Intentos extra si la conexión se corta o el servidor falla.
+        sha256: Hash esperado (opcional); si no coincide, se borra y se lanza ErrorDescarga.
+        tamano: Tamaño esperado en bytes (opcional).
+    Returns:
+        dict {url, bytes, sha256} con la verificación, o None si el servidor
+        respondió 404 (el archivo todavía no está publicado).
+    """
+    registro = verificado(ruta)
+    if registro and registro.get("url") == url and sha256 in (None, registro.get("sha256")):
+        return registro
+
+    parcial = ruta + ".part"
+    meta = _leer_json(parcial + ".json")
+    if meta.get("url") != url and os.path.exists(parcial):
+        os.remove(parcial)
+    meta["url"] = url
+    os.makedirs(os.path.dirname(os.path.abspath(ruta)), exist_ok=True)
+
+    with etapa("fetch"):
+        for intento in range(reintentos + 1):
+            try:
+                estado, total = _intentar(url, parcial, meta, headers, timeout)
+            except (requests.ConnectionError, requests.Timeout, requests.exceptions.ChunkedEncodingError) as e:
+                estado, total = "incompleto", None
+                logging.warning(f"⚠️ Descarga interrumpida ({e.__class__.__name__}): {url}")
+            except requests.HTTPError as e:
+                if e.response is None or e.response.status_code < 500:
+                    raise ErrorDescarga(f"{url}: {e}") from e
+                estado, total = "incompleto", None
+                logging.warning(f"⚠️ Error {e.response.status_code} del servidor: {url}")
+            if estado == "no_publicado":
+                return None
+            if estado == "ok":
+                break
+            if intento < reintentos:
+                time.sleep(espera_base * 2 ** intento)
+        else:
+            raise ErrorDescarga(f"{url}: incompleto tras {reintentos + 1} intentos")
+
+        n_bytes = os.path.getsize(parcial)
+        calculado = sha256_archivo(parcial)
+        esperado = tamano if tamano is not None else total
+        if esperado is not None and n_bytes != esperado:
+            os.remove(parcial)
+            raise ErrorDescarga(f"{url}: {n_bytes} bytes, se esperaban {esperado}")
+        if sha256 is not None and calculado != sha256:
+            os.remove(parcial)
+            raise ErrorDescarga(f"{url}: el SHA-256 no coincide")
+
+    os.replace(parcial, ruta)
+    registro = {"url": url, "bytes": n_bytes, "sha256": calculado, "etag": meta.get("etag")}
+    _escribir_json(ruta + ".json", registro)
+    if os.path.exists(parcial + ".json"):
+        os.remove(parcial + ".json")
+    logging.info(f"⬇️ {n_bytes} bytes verificados: {url}")
+    return registro
+
+
+def rango_fechas(desde, hasta):
+    """Fechas de desde a hasta (incluidas), de la más reciente a la más antigua."""
+    dias = (hasta - desde).days
+    return [hasta - datetime.timedelta(days=i) for i in range(dias + 1)]
+
+
+def descargar_fechas(fechas, url_de, ruta_de, max_workers=MAX_WORKERS, **opciones):
+    """
+    Descarga en paralelo (como mucho max_workers a la vez) el archivo de cada fecha.
+    Los ya verificados no se vuelven a pedir y los cortados se reanudan.
+    Args:
+        fechas: Fechas a descargar.
+        url_de: Función fecha -> URL.
+        ruta_de: Función fecha -> ruta local.
+        opciones: kwargs para descargar_reanudable (headers, timeout, reintentos...).
+    Returns:
+        dict {fecha: registro | None (no publicado) | ErrorDescarga}.
+    """
+    resultados = {}
+    with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="descarga") as pool:
+        futuros = {
+            pool.submit(descargar_reanudable, url_de(fecha), ruta_de(fecha), **opciones): fecha
+            for fecha in fechas
+        }
+        for futuro in concurrent.futures.as_completed(futuros):
+            fecha = futuros[futuro]
+            try:
+                resultados[fecha] = futuro.result()
+            except (ErrorDescarga, requests.RequestException, OSError) as e:
+                logging.error(f"❌ {fecha}: {e}")
+                resultados[fecha] = e if isinstance(e, ErrorDescarga) else ErrorDescarga(str(e))
+
+    bajadas = sum(isinstance(r, dict) for r in resultados.values())
+    faltantes = sorted(f for f, r in resultados.items() if r is None)
+    fallidas = sorted(f for f, r in resultados.items() if isinstance(r, ErrorDescarga))
+    logging.info(f"📦 {bajadas}/{len(resultados)} fechas descargadas, {len(faltantes)} sin publicar, {len(fallidas)} con error")
+    if faltantes:
+        logging.info(f"   Sin publicar: {', '.join(map(str, faltantes))}")
+    return resultados
@@ -0,0 +1,224 @@
+# utils/sheet_watermark.py
+"""
+Carga incremental de pestañas de Google Sheets.
+
+La exportación CSV siempre trae la pestaña completa, así que la marca de agua
+es el conjunto de huellas (hash de la fila cruda) ya vistas, con el OBJECTID de
+cada una: un entero si se conoce, null si se publicó sin conocerlo y false si la
+limpieza la descartó y nunca llegó a la capa. En cada ejecución solo las filas
+con huella nueva pasan a pandas y a la capa, y las huellas que desaparecieron
+(filas borradas o editadas en la hoja) se borran por OBJECTID.
+
+Las cargas completas aprenden el OBJECTID de cada fila de la sincronización por
+diferencias. Si aun así desaparece una fila cuyo OBJECTID no se conoce, no hay
+forma barata de borrarla: esa ejecución pasa a modo completo (CSV entero +
+sincronización por diferencias), que además rehace la marca.
+
+Las cargas incrementales no guardan snapshot (solo tienen el delta): la marca
+anota cuándo fue la última, y un snapshot anterior ya no representa la capa
+(ver snapshot_vigente).
+"""
+import csv
+import hashlib
+import json
+import logging
+import os
+from datetime import datetime, timezone
+
+from utils.batch_upload import subir_por_lotes
+from utils.layer_sync import olvidar_indice, registrar_reporte
+from utils.metrics import etapa
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+RUTA_MARCAS = os.path.join(ROOT_DIR, "data", "incremental")
+# Columna que lleva la huella de cada fila por el procesamiento hasta la publicación
+COLUMNA_HUELLA = "_huella"
+
+
+def huella_fila(fila):
+    """Hash corto de una fila cruda del CSV (lista de textos)."""
+    return hashlib.blake2b("\x1f".join(fila).encode("utf-8"), digest_size=8).hexdigest()
+
+
+def huellas_filas(filas):
+    """Huella de cada fila; las repetidas se numeran (h, h-1, h-2...) para contarlas una a una."""
+    vistas = {}
+    huellas = []
+    for fila in filas:
+        h = huella_fila(fila)
+        n = vistas.get(h, 0)
+        vistas[h] = n + 1
+        huellas.append(f"{h}-{n}" if n else h)
+    return huellas
+
+
+class MarcaAgua:
+    """
+    Estado incremental de una pestaña, guardado en data/incremental/<nombre>.json
+    como {"huellas": {huella: OBJECTID, null o false}, "ultima_incremental": fecha o null}.
+    """
+
+    def __init__(self, nombre, directorio=None, completo=False):
+        self.nombre = nombre
+        self.ruta = os.path.join(directorio or RUTA_MARCAS, f"{nombre}.json")
+        self.huellas = {}
+        # Fecha (ISO, UTC) de la última carga incremental con cambios; None si la última fue completa
+        self.ultima_incremental = None
+        if os.path.exists(self.ruta):
+            with open(self.ruta, encoding="utf-8") as f:
+                datos = json.load(f)
+            self.huellas = datos["huellas"]
+            self.ultima_incremental = datos.get("ultima_incremental")
+        # Sin marca previa no se sabe qué hay en la capa: la primera carga es completa
+        self.modo = "completo" if completo or not os.path.exists(self.ruta) else "incremental"
+        self.actuales = []
+        self.nuevas = 0
+        self.eliminadas = []
+        self._oids = {}
+        self._borradas = set()
+
+    @property
+    def sin_cambios(self):
+        return self.modo == "incremental" and not self.nuevas and not self.eliminadas
+
+    def filtrar_csv(self, ruta_bruta, ruta_salida, filas_encabezado=1):
+        """
+        Copia a ruta_salida las filas de encabezado y, en modo incremental, solo las
+        filas nuevas; en modo completo, todas. Se agrega la columna _huella.
+        Args:
+            ruta_bruta: CSV tal como se exportó de la hoja.
+            ruta_salida: CSV filtrado que se le pasa al procesamiento de siempre.
+            filas_encabezado: Filas antes de los datos (títulos + encabezados).
+        Returns:
+            ruta_salida.
+        """
+        with etapa("watermark"):
+            with open(ruta_bruta, encoding="utf-8", newline="") as f:
+                filas = list(csv.reader(f))
+            encabezado, datos = filas[:filas_encabezado], filas[filas_encabezado:]
+            self.actuales = huellas_filas(datos)
+            vigentes = set(self.actuales)
+            self.eliminadas = [h for h in self.huellas if h not in vigentes]
+            nuevas = [i for i, h in enumerate(self.actuales) if h not in self.huellas]
+            self.nuevas = len(nuevas)
+
+            if self.modo == "incremental" and any(self.huellas[h] is None for h in self.eliminadas):
+                logging.info(f"🔁 {self.nombre}: cambiaron filas sin OBJECTID conocido, se hace una carga completa")
+                self.modo = "completo"
+            seleccion = range(len(datos)) if self.modo == "completo" else nuevas
+
+            with open(ruta_salida, "w", encoding="utf-8", newline="") as f:
+                escritor = csv.writer(f)
+                for i, fila in enumerate(encabezado):
+                    escritor.writerow(fila + [COLUMNA_HUELLA] if i == filas_encabezado - 1 else fila)
+                for i in seleccion:
+                    escritor.writerow(datos[i] + [self.actuales[i]])
+
+        logging.info(
+            f"💧 {self.nombre} ({self.modo}): {len(datos)} filas en la hoja, "
+            f"{self.nuevas} nuevas, {len(self.eliminadas)} eliminadas o editadas"
+        )
+        return ruta_salida
+
+    def publicar(self, layer, features, huellas, dry_run=False, opciones_subida=None):
+        """
+        Modo incremental: altas de las filas nuevas y bajas por OBJECTID de las que
+        desaparecieron, sin consultar la capa.
+        Args:
+            features: Features de las filas nuevas.
+            huellas: Huella de cada feature (misma posición).
+        Si algo falla, la marca guarda igualmente las altas y bajas que sí se aplicaron
+        (ver confirmar_parcial): la próxima ejecución solo reintenta las demás.
+        Returns:
+            dict con el mismo formato que layer_sync.sincronizar_capa.
+        """
+        opciones_subida = opciones_subida or {}
+        bajas = [self.huellas[h] for h in self.eliminadas if self.huellas[h]]
+        reporte = {"adds": len(features), "updates": 0, "deletes": len(bajas), "sin_cambios": 0, "exito": True}
+        logging.info(f"🧮 Incremental: +{len(features)} altas, -{len(bajas)} bajas")
+        if dry_run:
+            logging.info("🧪 Modo dry-run: no se envían ediciones a ArcGIS.")
+            registrar_reporte(reporte)
+            return reporte
+
+        # La capa cambia sin pasar por layer_sync: su índice en memoria (si lo hay) ya no sirve
+        olvidar_indice(layer)
+        if features:
+            with etapa("upload", filas=len(features)):
+                resultado = subir_por_lotes(layer, features, tipo="adds", con_ids=True, **opciones_subida)
+            self._oids = {huellas[i]: oid for i, oid in resultado["ids"].items()}
+            reporte["exito"] = not resultado["fallidos"]
+        if bajas and reporte["exito"]:
+            with etapa("delete", filas=len(bajas)):
+                resultado = subir_por_lotes(layer, bajas, tipo="deletes", con_ids=True, **opciones_subida)
+            self._borradas = {bajas[i] for i in resultado["ids"]}
+            reporte["exito"] = not resultado["fallidos"]
+        if not reporte["exito"]:
+            self.confirmar_parcial()
+        registrar_reporte(reporte)
+        return reporte
+
+    def confirmar_parcial(self):
+        """
+        Tras una publicación incremental con fallos: guarda la marca anterior más las altas
+        que llegaron a la capa (con su OBJECTID) y sin las bajas que se aplicaron. Las filas
+        que fallaron siguen pendientes y la próxima ejecución las vuelve a intentar.
+        """
+        marca = {h: oid for h, oid in self.huellas.items() if not (oid and oid in self._borradas)}
+        marca.update(self._oids)
+        logging.warning(
+            f"⚠️ {self.nombre}: publicación incompleta, la marca guarda {len(self._oids)} altas "
+            f"y {len(self._borradas)} bajas aplicadas"
+        )
+        self.huellas = marca
+        if self._oids or self._borradas:
+            self.ultima_incremental = datetime.now(timezone.utc).isoformat(timespec="seconds")
+        self._escribir()
+
+    def confirmar(self, publicadas, oids=None):
+        """
+        Guarda la nueva marca tras una publicación exitosa.
+        Args:
+            publicadas: Huellas que llegaron a la capa en esta ejecución (las demás
+                filas nuevas las descartó la limpieza).
+            oids: En modo completo, el OBJECTID de cada huella de 'publicadas' (misma
+                posición), p. ej. el 'oids' de layer_sync.sincronizar_capa(con_oids=True).
+                Sin ellos solo se conocen los de filas que ya estaban y siguen igual.
+        """
+        if oids is not None:
+            self._oids.update({h: oid for h, oid in zip(publicadas, oids) if oid is not None})
+        publicadas = set(publicadas)
+        marca = {}
+        for h in self.actuales:
+            if h in self._oids:
+                marca[h] = self._oids[h]
+            elif h in self.huellas and (self.modo == "incremental" or h not in publicadas or self.huellas[h]):
+                marca[h] = self.huellas[h]
+            else:
+                marca[h] = None if h in publicadas else False
+        self.huellas = marca
+        if self.modo == "completo":
+            self.ultima_incremental = None
+        elif self.nuevas or self.eliminadas:
+            self.ultima_incremental = datetime.now(timezone.utc).isoformat(timespec="seconds")
+        self._escribir()
+
+    def _escribir(self):
+        os.makedirs(os.path.dirname(self.ruta), exist_ok=True)
+        tmp = self.ruta + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump({"huellas": self.huellas, "ultima_incremental": self.ultima_incremental}, f)
+        os.replace(tmp, self.ruta)
+
+    def snapshot_vigente(self, entrada):
+        """
+        True si el snapshot (entrada del manifiesto de utils.snapshot_store) es posterior
+        a la última carga incremental, es decir, si todavía representa la capa.
+        """
+        return self.ultima_incremental is None or entrada["fecha"] >= self.ultima_incremental
+
+    def invalidar(self):
+        """Borra la marca (p. ej. tras republicar un snapshot): la próxima carga es completa."""
+        if os.path.exists(self.ruta):
+            os.remove(self.ruta)
+        self.huellas, self.ultima_incremental = {}, None
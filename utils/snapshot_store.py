@@ -0,0 +1,329 @@
+# utils/snapshot_store.py
+"""
+Copias en GeoParquet de lo que se publicó en cada capa.
+
+Cada ejecución que publica con éxito deja un snapshot en
+output/snapshots/<capa>/<id>/parte-NNNNN.parquet (una parte por lote, así
+que escribirlo no rompe el streaming) y una entrada en output/snapshots/manifest.json.
+Cada fila lleva su hash en la columna _hash: comparar dos snapshots es leer
+una sola columna, sin consultar la capa. Los snapshots viejos se podan según
+RETENCION.
+
+Uso:
+    python -m utils.snapshot_store listar [capa]
+    python -m utils.snapshot_store podar
+    python -m utils.snapshot_store republicar incendios [--id ID] [--dry-run]
+"""
+import argparse
+import json
+import logging
+import os
+import shutil
+import sys
+import threading
+from datetime import datetime, timedelta, timezone
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+RUTA_SNAPSHOTS = os.path.join(ROOT_DIR, "output", "snapshots")
+NOMBRE_MANIFIESTO = "manifest.json"
+COLUMNA_HASH = "_hash"
+# Se conservan los últimos max_por_capa snapshots de cada capa y ninguno de más de max_dias
+RETENCION = {"max_por_capa": 30, "max_dias": 90}
+
+# Los pipelines corren en hilos del mismo proceso y comparten el manifiesto
+_lock_manifiesto = threading.Lock()
+
+
+def _ruta_manifiesto(directorio):
+    return os.path.join(directorio, NOMBRE_MANIFIESTO)
+
+
+def cargar_manifiesto(directorio=None):
+    """Entradas de todos los snapshots confirmados, de la más vieja a la más nueva."""
+    ruta = _ruta_manifiesto(directorio or RUTA_SNAPSHOTS)
+    if not os.path.exists(ruta):
+        return []
+    with open(ruta, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def _guardar_manifiesto(entradas, directorio):
+    ruta = _ruta_manifiesto(directorio)
+    tmp = ruta + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(entradas, f, ensure_ascii=False, indent=1)
+    os.replace(tmp, ruta)
+
+
+def hash_filas(gdf):
+    """
+    Hash de 64 bits por fila (atributos + WKB de la geometría), vectorizado con pandas.
+    Returns:
+        numpy.ndarray de uint64.
+    """
+    import pandas as pd
+    import shapely
+
+    atributos = gdf.drop(columns=[gdf.geometry.name, COLUMNA_HASH], errors="ignore")
+    h = pd.util.hash_pandas_object(atributos.astype(str), index=False).to_numpy()
+    wkb = pd.Series(shapely.to_wkb(gdf.geometry.to_numpy(), hex=True))
+    return h * 31 + pd.util.hash_pandas_object(wkb, index=False).to_numpy()
+
+
+class Snapshot:
+    """
+    Snapshot en escritura. Se va llenando lote a lote con agregar() y solo
+    aparece en el manifiesto tras confirmar(); si no se confirma, descartar()
+    borra lo escrito.
+    """
+
+    def __init__(self, capa, directorio=None):
+        self.capa = capa
+        self.directorio = directorio or RUTA_SNAPSHOTS
+        self.id = datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%S%fZ")
+        self.ruta = os.path.join(self.directorio, capa, self.id)
+        self._tmp = self.ruta + ".tmp"
+        self.partes = 0
+        self.filas = 0
+        self.bytes = 0
+        self._suma = 0  # suma de los hashes de fila: no depende del orden
+        self.confirmado = False
+        self.fallido = False
+
+    def agregar(self, gdf):
+        """
+        Escribe un lote como una parte más del snapshot. Un error al escribir no
+        detiene la publicación: el snapshot queda marcado como fallido y no se confirma.
+        """
+        if gdf.empty or self.fallido:
+            return
+        try:
+            os.makedirs(self._tmp, exist_ok=True)
+            gdf = gdf.assign(**{COLUMNA_HASH: hash_filas(gdf)})
+            ruta = os.path.join(self._tmp, f"parte-{self.partes:05d}.parquet")
+            gdf.to_parquet(ruta, index=False)
+        except Exception as e:
+            logging.warning(f"⚠️ No se pudo escribir el snapshot de {self.capa}: {e}")
+            self.fallido = True
+            return
+        self.partes += 1
+        self.filas += len(gdf)
+        self.bytes += os.path.getsize(ruta)
+        self._suma = (self._suma + int(gdf[COLUMNA_HASH].to_numpy().sum(dtype="uint64"))) % 2**64
+
+    def envolver(self, lotes):
+        """Guarda cada lote de un iterable a medida que pasa hacia la subida."""
+        for gdf in lotes:
+            self.agregar(gdf)
+            yield gdf
+
+    def confirmar(self, **extra):
+        """
+        Publica el snapshot en el manifiesto y aplica la retención de su capa.
+        Args:
+            **extra: Datos adicionales para la entrada (p. ej. la URL de origen).
+        Returns:
+            La entrada del manifiesto, o None si no se escribió ninguna fila.
+        """
+        if not self.partes or self.fallido:
+            return None
+        os.replace(self._tmp, self.ruta)
+        entrada = {
+            "capa": self.capa,
+            "id": self.id,
+            "fecha": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            "ruta": os.path.relpath(self.ruta, self.directorio),
+            "filas": self.filas,
+            "partes": self.partes,
+            "bytes": self.bytes,
+            "hash": f"{self._suma:016x}",
+            **extra,
+        }
+        with _lock_manifiesto:
+            entradas = cargar_manifiesto(self.directorio)
+            entradas.append(entrada)
+            _guardar_manifiesto(entradas, self.directorio)
+        self.confirmado = True
+        podar_snapshots(self.capa, directorio=self.directorio)
+        logging.info(f"📸 Snapshot {self.capa}/{self.id}: {self.filas} filas, {self.bytes / 1e6:.1f} MB")
+        return entrada
+
+    def descartar(self):
+        if not self.confirmado:
+            shutil.rmtree(self._tmp, ignore_errors=True)
+
+
+def snapshots(capa, directorio=None):
+    return [e for e in cargar_manifiesto(directorio) if e["capa"] == capa]
+
+
+def buscar_snapshot(capa, id_snapshot=None, directorio=None):
+    """
+    Entrada de un snapshot de la capa: el de id_snapshot o, si es None o
+    'ultimo', el más reciente. Devuelve None si no hay ninguno.
+    """
+    entradas = snapshots(capa, directorio)
+    if id_snapshot in (None, "ultimo"):
+        return entradas[-1] if entradas else None
+    return next((e for e in entradas if e["id"] == id_snapshot), None)
+
+
+def _partes(entrada, directorio):
+    ruta = os.path.join(directorio or RUTA_SNAPSHOTS, entrada["ruta"])
+    return [os.path.join(ruta, p) for p in sorted(os.listdir(ruta)) if p.endswith(".parquet")]
+
+
+def iterar_snapshot(entrada, directorio=None, columnas=None):
+    """Lee un snapshot parte por parte (sin la columna _hash), listo para volver a publicarlo."""
+    import geopandas as gpd
+
+    for ruta in _partes(entrada, directorio):
+        yield gpd.read_parquet(ruta, columns=columnas).drop(columns=[COLUMNA_HASH], errors="ignore")
+
+
+def columnas_snapshot(entrada, directorio=None):
+    """Nombres de columna del snapshot (leídos del esquema de la primera parte)."""
+    import pyarrow.parquet as pq
+
+    partes = _partes(entrada, directorio)
+    return pq.read_schema(partes[0]).names if partes else []
+
+
+def leer_snapshot(entrada, directorio=None, columnas=None):
+    """Snapshot completo en un solo GeoDataFrame."""
+    import pandas as pd
+
+    partes = list(iterar_snapshot(entrada, directorio, columnas))
+    return pd.concat(partes, ignore_index=True) if partes else None
+
+
+def hashes_snapshot(entrada, directorio=None):
+    """Solo la columna _hash del snapshot (lectura columnar, sin geometrías)."""
+    import numpy as np
+    import pyarrow.parquet as pq
+
+    columnas = [pq.read_table(ruta, columns=[COLUMNA_HASH]).column(0).to_numpy() for ruta in _partes(entrada, directorio)]
+    return np.concatenate(columnas) if columnas else np.array([], dtype="uint64")
+
+
+def comparar_snapshots(anterior, actual, directorio=None):
+    """
+    Compara dos snapshots fila a fila por hash.
+    Returns:
+        dict con 'nuevas', 'eliminadas' e 'iguales' (conteos).
+    """
+    import numpy as np
+
+    if anterior is None:
+        return {"nuevas": actual["filas"], "eliminadas": 0, "iguales": 0}
+    if anterior["hash"] == actual["hash"] and anterior["filas"] == actual["filas"]:
+        return {"nuevas": 0, "eliminadas": 0, "iguales": actual["filas"]}
+    previos = hashes_snapshot(anterior, directorio)
+    nuevos = hashes_snapshot(actual, directorio)
+    iguales = int(np.isin(nuevos, previos).sum())
+    return {"nuevas": len(nuevos) - iguales, "eliminadas": int((~np.isin(previos, nuevos)).sum()), "iguales": iguales}
+
+
+def podar_snapshots(capa=None, max_por_capa=None, max_dias=None, directorio=None):
+    """
+    Borra los snapshots que exceden la retención (por cantidad y por antigüedad).
+    El más reciente de cada capa se conserva siempre.
+    Returns:
+        Lista de entradas eliminadas.
+    """
+    directorio = directorio or RUTA_SNAPSHOTS
+    max_por_capa = max_por_capa or RETENCION["max_por_capa"]
+    max_dias = max_dias or RETENCION["max_dias"]
+    limite = datetime.now(timezone.utc) - timedelta(days=max_dias)
+
+    with _lock_manifiesto:
+        entradas = cargar_manifiesto(directorio)
+        por_capa = {}
+        for e in entradas:
+            por_capa.setdefault(e["capa"], []).append(e)
+        eliminar = []
+        for nombre, lista in por_capa.items():
+            if capa and nombre != capa:
+                continue
+            viejas = lista[:-1]
+            eliminar += viejas[:max(len(lista) - max_por_capa, 0)]
+            eliminar += [e for e in viejas if datetime.fromisoformat(e["fecha"]) < limite and e not in eliminar]
+        if not eliminar:
+            return []
+        ids = {(e["capa"], e["id"]) for e in eliminar}
+        _guardar_manifiesto([e for e in entradas if (e["capa"], e["id"]) not in ids], directorio)
+
+    for e in eliminar:
+        shutil.rmtree(os.path.join(directorio, e["ruta"]), ignore_errors=True)
+    logging.info(f"🧹 {len(eliminar)} snapshots eliminados por retención")
+    return eliminar
+
+
+def registrar_snapshot(snapshot, **extra):
+    """Confirma el snapshot y deja en el log la diferencia con el anterior de la misma capa."""
+    anterior = buscar_snapshot(snapshot.capa, directorio=snapshot.directorio)
+    entrada = snapshot.confirmar(**extra)
+    if entrada is None:
+        return None
+    cambios = comparar_snapshots(anterior, entrada, snapshot.directorio)
+    logging.info(
+        f"📸 Respecto al snapshot anterior: +{cambios['nuevas']} nuevas, "
+        f"-{cambios['eliminadas']} eliminadas, ={cambios['iguales']} iguales"
+    )
+    return entrada
+
+
+def republicar_snapshot(layer, capa, id_snapshot=None, dry_run=False, opciones_subida=None):
+    """
+    Sincroniza la capa con un snapshot guardado (réplica o backfill sin descargar ni parsear).
+    Returns:
+        True si la capa quedó sincronizada.
+    """
+    from utils.layer_sync import features_desde_gdf, sincronizar_capa_por_lotes
+
+    entrada = buscar_snapshot(capa, id_snapshot)
+    if entrada is None:
+        logging.error(f"❌ No hay snapshot '{id_snapshot}' de {capa}")
+        return False
+    logging.info(f"⏪ Republicando snapshot {capa}/{entrada['id']} ({entrada['filas']} filas)")
+    lotes = (features_desde_gdf(gdf) for gdf in iterar_snapshot(entrada))
+    reporte = sincronizar_capa_por_lotes(layer, lotes, dry_run=dry_run, opciones_subida=opciones_subida)
+    return reporte["exito"]
+
+
+def main():
+    sys.path.append(ROOT_DIR)
+    parser = argparse.ArgumentParser(description="Snapshots GeoParquet de las capas publicadas.")
+    sub = parser.add_subparsers(dest="comando", required=True)
+    listar = sub.add_parser("listar", help="Lista los snapshots del manifiesto")
+    listar.add_argument("capa", nargs="?")
+    sub.add_parser("podar", help="Aplica la retención a todas las capas")
+    republicar = sub.add_parser("republicar", help="Vuelve a publicar un snapshot sin descargar ni parsear")
+    republicar.add_argument("pipeline")
+    republicar.add_argument(
+        "--id", default="ultimo",
+        help="ID del snapshot ('ultimo' por defecto); 'operacional' pide uno por pestaña: ID_PESTANA_3,ID_AUMENTOS",
+    )
+    republicar.add_argument("--dry-run", action="store_true")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+    if args.comando == "listar":
+        for e in cargar_manifiesto():
+            if args.capa in (None, e["capa"]):
+                print(f"{e['capa']:<14} {e['id']}  {e['filas']:>9} filas  {e['bytes'] / 1e6:>8.1f} MB  {e['hash']}")
+    elif args.comando == "podar":
+        podar_snapshots()
+    else:
+        from pipelines.pipelines import pipelines_registrados, resolver
+        from utils.arcgis_auth import autenticar_arcgis
+
+        modulo, funcion, _ = pipelines_registrados()[args.pipeline]
+        procesar = resolver(modulo, funcion)
+        gis = autenticar_arcgis(diferido=True)
+        ok = gis and procesar(gis, dry_run=args.dry_run, desde_snapshot=args.id)
+        sys.exit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,290 @@
+# utils/transactional_publish.py
+"""
+Publicación transaccional de un conjunto de ediciones (altas, cambios y bajas).
+
+Cada bloque se envía en un solo applyEdits con rollbackOnFailure: o se aplica
+entero o no se aplica nada. Si todas las ediciones caben en un bloque, la
+publicación es atómica; si no, los bloques van en orden (altas, cambios y por
+último bajas, para que la capa nunca quede vacía a mitad de camino) y cada bloque
+confirmado se anota en un journal local:
+
+    data/journal/<nombre>.plan.json   ediciones pendientes, partidas en bloques
+    data/journal/<nombre>.log         una línea JSON por bloque confirmado
+
+La atomicidad solo vale dentro de un bloque (TAMANO_BLOQUE ediciones o
+MAX_BYTES_BLOQUE bytes): un plan de varios bloques puede quedar aplicado a medias.
+
+Si el proceso muere a mitad, la siguiente ejecución retoma el plan desde el
+primer bloque sin confirmar en lugar de volver a empezar, siempre que el plan
+sea reciente (VIGENCIA_PLAN_S); uno más viejo se descarta y la sincronización
+por diferencias se calcula de nuevo contra la capa. Antes de reenviar un bloque
+con altas que pudo llegar al servidor sin anotarse (timeout, proceso muerto) se
+busca en la capa el hash de sus altas (ver ids_si_aplicado) para no duplicarlas.
+"""
+import hashlib
+import json
+import logging
+import os
+import random
+import time
+
+from utils.batch_upload import oids_por_hash
+from utils.esri_encoder import serializar
+from utils.metrics import etapa, registrar_http
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+RUTA_JOURNAL = os.path.join(ROOT_DIR, "data", "journal")
+# Ediciones y bytes por applyEdits; un plan que cabe en un bloque es atómico
+TAMANO_BLOQUE = 1000
+MAX_BYTES_BLOQUE = 8_000_000
+REINTENTOS = 3
+ESPERA_BASE_S = 1.0
+# Un plan más viejo que esto no se retoma (la capa pudo cambiar por otros medios):
+# se descarta y se vuelven a calcular las diferencias
+VIGENCIA_PLAN_S = 30 * 60
+
+CLAVES_RESULTADO = {"adds": "addResults", "updates": "updateResults", "deletes": "deleteResults"}
+
+
+class ErrorBloque(Exception):
+    """Un bloque no se pudo aplicar (y el servidor lo revirtió entero)."""
+
+
+def _rutas(nombre, directorio=None):
+    base = os.path.join(directorio or RUTA_JOURNAL, nombre)
+    return base + ".plan.json", base + ".log"
+
+
+def _bytes(item):
+    return len(serializar(item)) if isinstance(item, dict) else 12
+
+
+def partir_en_bloques(adds, updates, deletes, tamano=TAMANO_BLOQUE, max_bytes=MAX_BYTES_BLOQUE):
+    """
+    Parte las ediciones en bloques de como mucho 'tamano' ediciones y 'max_bytes'
+    bytes, respetando el orden altas -> cambios -> bajas.
+    Returns:
+        Lista de dicts {'adds', 'updates', 'deletes', 'inicio_adds'}; inicio_adds es
+        la posición de la primera alta del bloque dentro de 'adds'.
+    """
+    bloques = []
+    actual, n, n_bytes, vistas = None, 0, 0, 0
+    for tipo, items in (("adds", adds), ("updates", updates), ("deletes", deletes)):
+        for item in items:
+            tamano_item = _bytes(item)
+            if actual is None or n >= tamano or (n and n_bytes + tamano_item > max_bytes):
+                actual = {"adds": [], "updates": [], "deletes": [], "inicio_adds": vistas}
+                bloques.append(actual)
+                n, n_bytes = 0, 0
+            actual[tipo].append(item)
+            n += 1
+            n_bytes += tamano_item
+            if tipo == "adds":
+                vistas += 1
+    return bloques
+
+
+def ids_si_aplicado(layer, bloque, campo_hash=None, oid_field="OBJECTID"):
+    """
+    Averigua si un bloque con altas del que no llegó respuesta (timeout, conexión
+    cortada) quedó aplicado, buscando en la capa el hash guardado de sus altas.
+    Con rollbackOnFailure el bloque está entero o no está.
+    Returns:
+        OIDs de las altas (en orden) si ya está en la capa; None si no se aplicó
+        y se puede reenviar sin duplicar.
+    Raises:
+        ErrorBloque si no se puede saber (altas sin hash o solo algunas en la capa).
+    """
+    hashes = [(f.get("attributes") or {}).get(campo_hash) for f in bloque["adds"]] if campo_hash else [None]
+    if None in hashes:
+        raise ErrorBloque("sin hash en las altas no se puede saber si el bloque se aplicó; no se reenvía")
+    encontrados = oids_por_hash(layer, campo_hash, oid_field, hashes)
+    if not encontrados:
+        return None
+    necesarios = {h: hashes.count(h) for h in set(hashes)}
+    if any(len(encontrados.get(h, [])) < n for h, n in necesarios.items()):
+        raise ErrorBloque("solo algunas altas del bloque están en la capa; no se reenvía")
+    # Con hashes repetidos, las altas son las más recientes (OIDs mayores)
+    disponibles = {h: oids[-necesarios[h]:] for h, oids in encontrados.items() if h in necesarios}
+    return [disponibles[h].pop(0) for h in hashes]
+
+
+def _aplicar_bloque(layer, bloque, reintentos=REINTENTOS, espera_base=ESPERA_BASE_S, campo_hash=None,
+                    oid_field="OBJECTID"):
+    """
+    Aplica un bloque con un solo applyEdits(rollbackOnFailure=True).
+    Si la petición falla sin respuesta y el bloque tiene altas, antes de reintentar se
+    verifica con ids_si_aplicado que no haya quedado aplicado: reenviarlo duplicaría
+    las altas.
+    Returns:
+        Lista de OIDs de las altas del bloque (en orden).
+    Raises:
+        ErrorBloque si ArcGIS rechazó alguna edición o no respondió tras los reintentos.
+    """
+    deletes = ",".join(str(oid) for oid in bloque["deletes"]) or None
+    for intento in range(reintentos + 1):
+        try:
+            resultado = layer.edit_features(
+                adds=bloque["adds"] or None, updates=bloque["updates"] or None, deletes=deletes,
+                rollback_on_failure=True,
+            )
+            registrar_http(sum(_bytes(f) for f in bloque["adds"] + bloque["updates"]))
+            break
+        except Exception as e:
+            registrar_http()
+            if intento == reintentos:
+                raise ErrorBloque(f"Sin respuesta válida de ArcGIS: {e}") from e
+            time.sleep(espera_base * (2 ** intento) * (1 + random.random()))
+            if bloque["adds"]:
+                try:
+                    ids = ids_si_aplicado(layer, bloque, campo_hash, oid_field)
+                except ErrorBloque as duda:
+                    raise ErrorBloque(f"Sin respuesta de ArcGIS ({e}) y {duda}") from e
+                if ids is not None:
+                    logging.info(f"🔁 El bloque sin respuesta ya estaba aplicado ({len(ids)} altas), no se reenvía")
+                    return ids
+
+    fallos = []
+    for tipo, clave in CLAVES_RESULTADO.items():
+        resultados = (resultado or {}).get(clave) or []
+        if len(resultados) != len(bloque[tipo]):
+            fallos.append(f"{clave}: {len(resultados)} resultados para {len(bloque[tipo])} ediciones")
+        fallos += [str(r.get("error", "Sin detalles")) for r in resultados if not r.get("success", False)]
+    if fallos:
+        raise ErrorBloque(f"{len(fallos)} ediciones rechazadas (bloque revertido): {fallos[0]}")
+    return [r.get("objectId") for r in resultado.get("addResults") or []]
+
+
+def _confirmados(ruta_log):
+    """{índice de bloque: OIDs de sus altas} de los bloques ya confirmados."""
+    confirmados = {}
+    if os.path.exists(ruta_log):
+        with open(ruta_log, encoding="utf-8") as f:
+            for linea in f:
+                try:
+                    entrada = json.loads(linea)
+                except ValueError:
+                    break  # Línea a medio escribir: el proceso murió justo ahí
+                confirmados[entrada["bloque"]] = entrada["ids"]
+    return confirmados
+
+
+def descartar_plan(nombre, directorio=None):
+    for ruta in _rutas(nombre, directorio):
+        if os.path.exists(ruta):
+            os.remove(ruta)
+
+
+def _ejecutar_plan(layer, plan, ruta_log, confirmados, verificar=False):
+    """
+    Aplica en orden los bloques no confirmados.
+    Args:
+        verificar: Si es True, el primer bloque pendiente se busca en la capa antes de
+            enviarlo (al retomar, pudo aplicarse sin llegar a anotarse).
+    Returns:
+        (exito, ids de todas las altas)
+    """
+    ids = {}
+    total = len(plan["bloques"])
+    campo_hash, oid_field = plan.get("campo_hash"), plan.get("oid_field") or "OBJECTID"
+    with etapa("upload", filas=sum(len(b[t]) for b in plan["bloques"] for t in CLAVES_RESULTADO)), \
+            open(ruta_log, "a", encoding="utf-8") as log:
+        for i, bloque in enumerate(plan["bloques"]):
+            if i not in confirmados:
+                try:
+                    aplicado = None
+                    if verificar and bloque["adds"]:
+                        aplicado = ids_si_aplicado(layer, bloque, campo_hash, oid_field)
+                    verificar = False
+                    confirmados[i] = aplicado if aplicado is not None else _aplicar_bloque(
+                        layer, bloque, campo_hash=campo_hash, oid_field=oid_field
+                    )
+                except ErrorBloque as e:
+                    logging.error(f"❌ Bloque {i + 1}/{total} de {plan['nombre']} no aplicado: {e}")
+                    return False, ids
+                log.write(json.dumps({"bloque": i, "ids": confirmados[i]}) + "\n")
+                log.flush()
+                os.fsync(log.fileno())
+                logging.info(f"🧾 Bloque {i + 1}/{total} confirmado")
+            for j, oid in enumerate(confirmados[i]):
+                ids[bloque["inicio_adds"] + j] = oid
+    return True, ids
+
+
+def reanudar_plan(layer, nombre, directorio=None, vigencia_s=VIGENCIA_PLAN_S):
+    """
+    Termina el plan que haya quedado a medias de una ejecución anterior.
+    Returns:
+        None si no había plan pendiente; si no, dict con 'adds', 'updates',
+        'deletes' aplicados en esta llamada y 'exito'.
+    """
+    ruta_plan, ruta_log = _rutas(nombre, directorio)
+    if not os.path.exists(ruta_plan):
+        return None
+    with open(ruta_plan, encoding="utf-8") as f:
+        plan = json.load(f)
+    if time.time() - plan["creado"] > vigencia_s:
+        logging.warning(f"⚠️ Plan pendiente de {nombre} demasiado viejo: se descarta y se recalculan las diferencias")
+        descartar_plan(nombre, directorio)
+        return None
+
+    confirmados = _confirmados(ruta_log)
+    pendientes = [b for i, b in enumerate(plan["bloques"]) if i not in confirmados]
+    logging.info(f"⏯️ Retomando publicación de {nombre}: {len(pendientes)}/{len(plan['bloques'])} bloques pendientes")
+    exito, _ = _ejecutar_plan(layer, plan, ruta_log, confirmados, verificar=True)
+    # Exitoso o no, el plan se cierra: si falló, la sincronización por diferencias corrige lo que falte
+    descartar_plan(nombre, directorio)
+    reporte = {t: sum(len(b[t]) for b in pendientes) for t in CLAVES_RESULTADO}
+    reporte["exito"] = exito
+    return reporte
+
+
+def publicar_transaccional(layer, nombre, adds=(), updates=(), deletes=(), directorio=None,
+                           tamano_bloque=TAMANO_BLOQUE, max_bytes=MAX_BYTES_BLOQUE, campo_hash=None,
+                           oid_field="OBJECTID"):
+    """
+    Publica altas, cambios y bajas con applyEdits(rollbackOnFailure) por bloques,
+    anotando cada bloque confirmado en data/journal/<nombre>.
+    Args:
+        layer: FeatureLayer (o cualquier objeto con edit_features(..., rollback_on_failure)).
+        nombre: Nombre del journal (uno por capa).
+        adds, updates: Features Esri JSON; deletes: OIDs.
+        campo_hash: Campo con el hash de cada alta (ver layer_sync.CAMPO_HASH); sin él,
+            un bloque con altas que no tuvo respuesta no se reintenta.
+        oid_field: Campo OID de la capa.
+    Returns:
+        dict con 'exito', 'bloques' e 'ids' ({posición en adds: OID}).
+    """
+    adds, updates, deletes = list(adds), list(updates), list(deletes)
+    bloques = partir_en_bloques(adds, updates, deletes, tamano_bloque, max_bytes)
+    if not bloques:
+        return {"exito": True, "bloques": 0, "ids": {}}
+
+    ruta_plan, ruta_log = _rutas(nombre, directorio)
+    os.makedirs(os.path.dirname(ruta_plan), exist_ok=True)
+    contenido = json.dumps(bloques, default=str, sort_keys=True)
+    plan = {
+        "nombre": nombre,
+        "id": hashlib.sha1(contenido.encode("utf-8")).hexdigest()[:12],
+        "creado": time.time(),
+        "campo_hash": campo_hash,
+        "oid_field": oid_field,
+        "bloques": bloques,
+    }
+    if len(bloques) > 1:
+        # Un solo bloque es atómico y no necesita journal
+        tmp = ruta_plan + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(plan, f, default=str)
+        os.replace(tmp, ruta_plan)
+        if os.path.exists(ruta_log):
+            os.remove(ruta_log)
+        logging.info(f"🧾 Plan {plan['id']} de {nombre}: {len(bloques)} bloques en data/journal")
+    else:
+        logging.info(f"🔒 {len(adds) + len(updates) + len(deletes)} ediciones en un solo applyEdits atómico")
+
+    exito, ids = _ejecutar_plan(layer, plan, ruta_log, {})
+    if exito or len(bloques) == 1:
+        descartar_plan(nombre, directorio)
+    # Si falló, el plan queda en el journal y la próxima ejecución lo retoma
+    return {"exito": exito, "bloques": len(bloques), "ids": ids}